@@ -68,6 +68,7 @@ _DALGO = {'ref-sum':{'newcalc':False},
           # 'hybrid-simps': {'newcalc':True,  'minimize':'hybrid', 'method':'simps'},
           # 'hybrid-romb':  {'newcalc':True,  'minimize':'hybrid', 'method':'romb'},
           'memory-sum':   {'newcalc':True,  'minimize':'memory', 'method':'sum'},
+          'chunks-sum':   {'newcalc':True,  'minimize':'chunks', 'method':'sum'},
           # 'memory-simps': {'newcalc':True,  'minimize':'memory', 'method':'simps'},
           # 'memory-romb':  {'newcalc':True,  'minimize':'memory', 'method':'romb'},
          }
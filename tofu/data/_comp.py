@@ -2,18 +2,20 @@
 
 # Builtin
 import warnings
+import hashlib
+import collections
 
 # Common
 import numpy as np
 import scipy.signal as scpsig
-import scipy.interpolate as scpinterp
 import scipy.linalg as scplin
 import scipy.stats as scpstats
-from matplotlib.tri import LinearTriInterpolator as mplTriLinInterp
+import scipy.sparse as scpsp
 
 _fmin_coef = 5.
 _ANITYPE = 'sca'
 _FILLVALUE = np.nan
+_INTERPCACHE_MAXBYTES = 200e6
 
 
 #############################################
@@ -382,16 +384,299 @@ def filter_svd(data, lapack_driver='gesdd', modes=[]):
 #############################################
 
 
+def _get_bary_weights(xnodes, ynodes, faces, r, z, indpts):
+    """ Return the nodes and barycentric weights of pts (r, z)
+
+    indpts are the indices (in faces) of the triangles containing the pts
+    (-1 if outside of the mesh), as returned by a trifinder
+    Return the (npts, 3) nodes indices and barycentric weights
+    Points outside of the mesh get node 0 and nan weights, so that any
+    value interpolated with them is nan
+    """
+    indpts = np.asarray(indpts)
+    indok = (indpts > -1).nonzero()[0]
+    nodes = np.zeros((r.size, 3), dtype=int)
+    wgt = np.full((r.size, 3), np.nan)
+
+    tri = faces[indpts[indok], :]
+    xx, yy = xnodes[tri], ynodes[tri]
+    rr, zz = r[indok] - xx[:, 2], z[indok] - yy[:, 2]
+    det = ((yy[:, 1] - yy[:, 2])*(xx[:, 0] - xx[:, 2])
+           + (xx[:, 2] - xx[:, 1])*(yy[:, 0] - yy[:, 2]))
+    wgt[indok, 0] = ((yy[:, 1] - yy[:, 2])*rr
+                     + (xx[:, 2] - xx[:, 1])*zz) / det
+    wgt[indok, 1] = ((yy[:, 2] - yy[:, 0])*rr
+                     + (xx[:, 0] - xx[:, 2])*zz) / det
+    wgt[indok, 2] = 1. - wgt[indok, 0] - wgt[indok, 1]
+    nodes[indok, :] = tri
+    return nodes, wgt
+
+
+def _get_cubic_conv_weights(frac):
+    """ Return the (npts, 4) cubic convolution (Catmull-Rom) weights
+
+    Weights of the grid pts (i-1, i, i+1, i+2) for pts located at a
+    fraction frac in [0, 1] of interval [i, i+1]
+    """
+    return np.array([((-0.5*frac + 1.)*frac - 0.5)*frac,
+                     (1.5*frac - 2.5)*frac**2 + 1.,
+                     ((-1.5*frac + 2.)*frac + 0.5)*frac,
+                     (0.5*frac - 0.5)*frac**2]).T
+
+
+def _get_rect_weights(R, Z, shapeRZ, r, z, deg=1):
+    """ Return the grid pts indices and weights of pts (r, z) on a rect mesh
+
+    deg = 1: bilinear interpolation (4 grid pts per pt)
+    deg = 3: bicubic interpolation (16 grid pts per pt), cubic convolution
+             in index space (exact Catmull-Rom for regular grids), with
+             linearly extrapolated ghost values beyond the grid edges
+    Return the (npts, 4) or (npts, 16) indices (in the flattened grid,
+    consistently with shapeRZ) and weights
+    Points outside of the grid get index 0 and nan weights
+    """
+    nR, nZ = R.size, Z.size
+    iR = np.clip(np.searchsorted(R, r) - 1, 0, nR - 2)
+    iZ = np.clip(np.searchsorted(Z, z) - 1, 0, nZ - 2)
+    fR = (r - R[iR]) / (R[iR+1] - R[iR])
+    fZ = (z - Z[iZ]) / (Z[iZ+1] - Z[iZ])
+    if deg == 1:
+        off = np.r_[0, 1]
+        wR, wZ = np.array([1. - fR, fR]).T, np.array([1. - fZ, fZ]).T
+    else:
+        off = np.r_[-1, 0, 1, 2]
+        wR, wZ = _get_cubic_conv_weights(fR), _get_cubic_conv_weights(fZ)
+        # ghost values f[-1] = 2f[0] - f[1] and f[n] = 2f[n-1] - f[n-2]
+        for ii, ww, nn in [(iR, wR, nR), (iZ, wZ, nZ)]:
+            ind = ii == 0
+            ww[ind, 1:3] += ww[ind, 0:1]*np.r_[2., -1.]
+            ww[ind, 0] = 0.
+            ind = ii == nn - 2
+            ww[ind, 1:3] += ww[ind, 3:4]*np.r_[-1., 2.]
+            ww[ind, 3] = 0.
+    indR = np.clip(iR[:, None] + off[None, :], 0, nR - 1)
+    indZ = np.clip(iZ[:, None] + off[None, :], 0, nZ - 1)
+
+    if shapeRZ == ('R', 'Z'):
+        ind = indR[:, :, None]*nZ + indZ[:, None, :]
+    else:
+        ind = indZ[:, None, :]*nR + indR[:, :, None]
+    ind = ind.reshape((r.size, off.size**2))
+    wgt = (wR[:, :, None]*wZ[:, None, :]).reshape((r.size, off.size**2))
+
+    indout = ~((r >= R[0]) & (r <= R[-1]) & (z >= Z[0]) & (z <= Z[-1]))
+    ind[indout, :] = 0
+    wgt[indout, :] = np.nan
+    return ind, wgt
+
+
+def _get_fweights(mesh, interp_space, mpltri=None, trifind=None):
+    """ Return a function computing the interpolation weights of (r, z)
+
+    The returned function gives the (npts, nw) indices of the mesh values
+    and their weights:
+        - barycentric weights of the triangle nodes for 'tri' / 'quadtri'
+        - bilinear / bicubic weights of the grid pts for 'rect'
+    """
+    if mesh['type'] == 'rect':
+        def fweights(r, z, R=mesh['R'], Z=mesh['Z'],
+                     shapeRZ=mesh['shapeRZ'], deg=interp_space):
+            return _get_rect_weights(R, Z, shapeRZ, r, z, deg=deg)
+    else:
+        def fweights(r, z, mpltri=mpltri, trifind=trifind):
+            return _get_bary_weights(mpltri.x, mpltri.y, mpltri.triangles,
+                                     r, z, trifind(r, z))
+    return fweights
+
+
+def _interp_bary(vals, nodes, wgt):
+    """ Apply interpolation weights to all time steps at once
+
+    vals is (nt, nnodes), nodes and wgt are (npts, nw) (e.g.: nw = 3 for
+    barycentric weights in triangles)
+    Return the (nt, npts) interpolated values
+    """
+    return np.einsum('tij,ij->ti', vals[:, nodes], wgt)
+
+
+def _interp1d_batch(xref, yref, x, fill_value=np.nan):
+    """ Linear 1d interpolation of all time steps at once
+
+    xref, yref are (nt, nr) reference abscissas and values
+    x is the (nt, npts) array of abscissas to interpolate at
+    Each line of xref is sorted (if necessary) and all lines are stacked
+    into a single monotonous vector (with an offset per time step), so a
+    single searchsorted() locates all pts of all time steps
+    Pts outside of [xref.min(), xref.max()] (per time step) get fill_value,
+    nan pts get nan (like scipy.interpolate.interp1d(bounds_error=False))
+    Return the (nt, npts) interpolated values
+    """
+    nt, nr = xref.shape
+    if np.any(np.diff(xref, axis=1) < 0.):
+        inds = np.argsort(xref, axis=1)
+        xref = np.take_along_axis(xref, inds, axis=1)
+        yref = np.take_along_axis(yref, inds, axis=1)
+
+    # Stack all time steps with an offset larger than their range
+    x0 = xref[:, :1]
+    span = np.nanmax(xref[:, -1:] - x0) + 1.
+    off = span * np.arange(0, nt)[:, None]
+    ind = np.searchsorted((xref - x0 + off).ravel(),
+                          (x - x0 + off).ravel()).reshape(x.shape)
+
+    # Clip within each time step, and interpolate
+    indt = np.arange(0, nt)[:, None]*nr
+    ind = np.clip(ind, indt + 1, indt + nr - 1)
+    xa, xb = xref.ravel()[ind - 1], xref.ravel()[ind]
+    ya, yb = yref.ravel()[ind - 1], yref.ravel()[ind]
+    val = ya + (yb - ya) * (x - xa) / (xb - xa)
+    val[(x < x0) | (x > xref[:, -1:])] = fill_value
+    return val
+
+
+def _get_hash_pts(r, z):
+    """ Return a hash of the (r, z) pts, used as a key of cached slices """
+    hh = hashlib.sha1(np.ascontiguousarray(r).tobytes())
+    hh.update(np.ascontiguousarray(z).tobytes())
+    return hh.hexdigest()
+
+
+def _get_flocate_cached(floc, dcache, key):
+    """ Return floc(r, z), with its result for the last pts cached
+
+    floc locates pts (r, z) in a mesh (e.g.: trifinder, interpolation
+    weights), its last result is kept in dcache[key] with a hash of the pts,
+    so that several quantities interpolated on the same pts (e.g.: ne, Te,
+    zeff... on the same LOS samples) only locate them once
+    """
+    def func(r, z):
+        hh = _get_hash_pts(r, z)
+        if key not in dcache.keys() or dcache[key][0] != hh:
+            dcache[key] = (hh, floc(r, z))
+        return dcache[key][1]
+    return func
+
+
+class _InterpCache(collections.OrderedDict):
+    """ OrderedDict of interpolated slices, keeping track of their size
+
+    nbytes is the total size (bytes) of the stored arrays, updated as items
+    are set or removed, so that the LRU cache can be limited in size without
+    summing the sizes of all its items at each call
+    """
+
+    def __init__(self, *args, **kwdargs):
+        self.nbytes = 0
+        super(_InterpCache, self).__init__(*args, **kwdargs)
+
+    def __setitem__(self, key, val):
+        if key in self:
+            self.nbytes -= self[key].nbytes
+        super(_InterpCache, self).__setitem__(key, val)
+        self.nbytes += val.nbytes
+
+    def __delitem__(self, key):
+        # Also called by pop() and popitem()
+        self.nbytes -= self[key].nbytes
+        super(_InterpCache, self).__delitem__(key)
+
+    def clear(self):
+        super(_InterpCache, self).clear()
+        self.nbytes = 0
+
+    def __reduce__(self):
+        # nbytes is re-computed from the items (copy, pickle)
+        return (self.__class__, (list(self.items()),))
+
+
+def _interp_slices_cached(dcache, keyq, indslices, r, z, fslices,
+                          maxbytes=_INTERPCACHE_MAXBYTES):
+    """ Return the (nt, npts) values of the time slices indslices at (r, z)
+
+    indslices is a (nt, nk) int array, each line identifying a time slice
+    (i.e.: the time indices of the nk stored arrays it depends on)
+    Each unique line is only computed once, by fslices(indu) which returns
+    the (nu, npts) values of the nu unique lines indu missing in dcache
+    dcache is an _InterpCache used as a LRU cache of interpolated slices,
+    keyed on (keyq, line, pts hash) and limited to maxbytes
+    """
+    indu, inv = np.unique(indslices, axis=0, return_inverse=True)
+    hh = _get_hash_pts(r, z)
+    lkey = [(keyq, tuple(ii), hh) for ii in indu.tolist()]
+    lmiss = [ii for ii, kk in enumerate(lkey) if kk not in dcache.keys()]
+
+    valu = np.empty((indu.shape[0], r.size), dtype=float)
+    if len(lmiss) > 0:
+        valu[lmiss, :] = fslices(indu[lmiss, :])
+    for ii, kk in enumerate(lkey):
+        if kk in dcache.keys():
+            valu[ii, :] = dcache[kk]
+            dcache.move_to_end(kk)
+        elif valu[ii, :].nbytes <= maxbytes:
+            dcache[kk] = valu[ii, :].copy()
+
+    # Free least recently used slices
+    while dcache.nbytes > maxbytes:
+        dcache.popitem(last=False)
+    return valu[inv, :]
+
+
+def _get_tlin_weights(t, tX):
+    """ Return the slices of tX bracketing times t, and their weights
+
+    Used for linear interpolation in time (constant beyond tX)
+    Return the (nt, 2) indices of the bracketing slices and their weights
+    """
+    if tX.size == 1:
+        return (np.zeros((t.size, 2), dtype=int),
+                np.repeat([[1., 0.]], t.size, axis=0))
+    ind = np.clip(np.searchsorted(tX, t) - 1, 0, tX.size - 2)
+    wgt = np.clip((t - tX[ind]) / (tX[ind+1] - tX[ind]), 0., 1.)
+    return np.array([ind, ind + 1]).T, np.array([1. - wgt, wgt]).T
+
+
+def _interp_slices_tlin(dcache, keyq, ind, wgt, r, z, fslices):
+    """ Return the (nt, npts) values at (r, z), linearly interpolated in time
+
+    ind and wgt are the (nt, 2) bracketing slices and weights (from
+    _get_tlin_weights()), each slice is only computed once (see
+    _interp_slices_cached())
+    """
+    val = _interp_slices_cached(dcache, keyq, ind.reshape((-1, 1)),
+                                r, z, fslices)
+    val = val.reshape((ind.shape[0], 2, r.size))
+    return np.sum(wgt[:, :, None]*val, axis=1)
+
+
 def get_finterp_isotropic(plasma, idquant, idref1d, idref2d,
                           interp_t='nearest', interp_space=None,
                           fill_value=None,
                           idmesh=None, mpltri=None, vquant=None,
                           tall=None, tbinall=None, ntall=None,
                           indtq=None, indtr1=None, indtr2=None,
-                          trifind=None):
+                          trifind=None, dtlin=None):
+    """ Return the function interpolating a 2d quantity or 1d profile
+
+    Time interpolation (interp_t) can be:
+        - 'nearest': (tall, tbinall, indtq...) give the nearest slices
+        - 'linear': dtlin gives the time vectors of the quantity ('tq') and
+                    of its references ('tr1', 'tr2'), the 2 slices bracketing
+                    each time are blended (stored slices are spatially
+                    interpolated only once per call)
+    The interpolated slices are cached in plasma._dinterpcache, unless
+    func is given another dcache (e.g.: an empty _InterpCache for pts that
+    will not be interpolated again, such as chunks of streamed pts)
+    """
 
     if fill_value is None:
         fill_value = _FILLVALUE
+    if interp_space in [1, 3]:
+        fweights = _get_fweights(plasma._ddata[idmesh]['data'], interp_space,
+                                 mpltri=mpltri, trifind=trifind)
+        fweights = _get_flocate_cached(fweights, plasma._dlocatecache,
+                                       ('weights', idmesh, interp_space))
+    # key of cached slices (fill_value is applied afterwards)
+    keyq = (idquant, idref1d, idref2d, interp_space)
 
     # -----------------------------------
     # Interpolate directly on 2d quantity
@@ -399,39 +684,42 @@ def get_finterp_isotropic(plasma, idquant, idref1d, idref2d,
     if idref1d is None:
 
         # --------------------
-        # Linear interpolation
-        if interp_space == 1:
+        # Linear (or cubic) interpolation
+        if interp_space in [1, 3]:
 
             def func(pts, vect=None, t=None, ntall=ntall,
-                     mplTriLinInterp=mplTriLinInterp,
-                     mpltri=mpltri, trifind=trifind,
+                     fweights=fweights,
                      vquant=vquant, indtq=indtq,
                      tall=tall, tbinall=tbinall,
-                     idref1d=idref1d, idref2d=idref2d):
+                     idref1d=idref1d, idref2d=idref2d, dcache=None):
 
                 r, z = np.hypot(pts[0,:],pts[1,:]), pts[2,:]
-                shapeval = list(pts.shape)
-                shapeval[0] = ntall if t is None else t.size
-                val = np.full(tuple(shapeval), fill_value)
-
-                if t is None:
-                    for ii in range(0,ntall):
-                        val[ii,...] = mplTriLinInterp(mpltri,
-                                                      vquant[indtq[ii],:],
-                                                      trifinder=trifind)(r,z).filled(fill_value)
-                    t = tall
+                if dcache is None:
+                    dcache = plasma._dinterpcache
+
+                def fslices(ind):
+                    # Locate pts in the mesh only once for all time steps
+                    nodes, wgt = fweights(r, z)
+                    return _interp_bary(vquant[ind[:, 0], :], nodes, wgt)
+
+                if interp_t == 'linear':
+                    if t is None:
+                        t = tall
+                    ind, wgt = _get_tlin_weights(t, dtlin['tq'])
+                    val = _interp_slices_tlin(dcache, keyq,
+                                              ind, wgt, r, z, fslices)
                 else:
-                    ntall, indt, indtu = plasma._get_indtu(t=t, tall=tall,
-                                                           tbinall=tbinall,
-                                                           idref1d=idref1d,
-                                                           idref2d=idref2d)[1:-2]
-                    for ii in range(0, ntall):
-                        ind = indt == indtu[ii]
-                        val[ind, ...] = mplTriLinInterp(
-                            mpltri,
-                            vquant[indtq[indtu[ii]], :],
-                            trifinder=trifind
-                        )(r, z).filled(fill_value)
+                    if t is None:
+                        indslices = indtq[:, None]
+                        t = tall
+                    else:
+                        ntall, indt, indtu = plasma._get_indtu(
+                            t=t, tall=tall, tbinall=tbinall,
+                            idref1d=idref1d, idref2d=idref2d)[1:-2]
+                        indslices = indtq[indtu][np.searchsorted(indtu, indt),
+                                                 None]
+                    val = _interp_slices_cached(dcache, keyq,
+                                                indslices, r, z, fslices)
                 if np.any(np.isnan(val)) and not np.isnan(fill_value):
                     val[np.isnan(val)] = fill_value
                 return val, t
@@ -443,7 +731,7 @@ def get_finterp_isotropic(plasma, idquant, idref1d, idref2d,
                      trifind=trifind,
                      vquant=vquant, indtq=indtq,
                      tall=tall, tbinall=tbinall,
-                     idref1d=idref1d, idref2d=idref2d):
+                     idref1d=idref1d, idref2d=idref2d, dcache=None):
 
                 r, z = np.hypot(pts[0,:],pts[1,:]), pts[2,:]
                 shapeval = list(pts.shape)
@@ -452,19 +740,25 @@ def get_finterp_isotropic(plasma, idquant, idref1d, idref2d,
 
                 indpts = trifind(r,z)
                 indok = indpts > -1
-                if t is None:
-                    for ii in range(0, ntall):
-                        val[ii, indok] = vquant[indtq[ii], indpts[indok]]
-                    t = tall
+                if interp_t == 'linear':
+                    if t is None:
+                        t = tall
+                    ind, wgt = _get_tlin_weights(t, dtlin['tq'])
+                    val = np.full((t.size, r.size), fill_value)
+                    val[:, indok] = np.sum(
+                        wgt[:, :, None]*vquant[ind, :][:, :, indpts[indok]],
+                        axis=1)
                 else:
-                    ntall, indt, indtu = plasma._get_indtu(t=t, tall=tall,
-                                                           tbinall=tbinall,
-                                                           idref1d=idref1d,
-                                                           idref2d=idref2d)[1:-2]
-                    for ii in range(0, ntall):
-                        ind = indt == indtu[ii]
-                        val[ind, indok] = vquant[indtq[indtu[ii]],
-                                                 indpts[indok]]
+                    if t is None:
+                        indq = indtq
+                        t = tall
+                    else:
+                        ntall, indt, indtu = plasma._get_indtu(
+                            t=t, tall=tall, tbinall=tbinall,
+                            idref1d=idref1d, idref2d=idref2d)[1:-2]
+                        indq = indtq[indt]
+                    # Simple gather, for all times at once
+                    val[:, indok] = vquant[indq, :][:, indpts[indok]]
                 if np.any(np.isnan(val)) and not np.isnan(fill_value):
                     val[np.isnan(val)] = fill_value
                 return val, t
@@ -474,60 +768,68 @@ def get_finterp_isotropic(plasma, idquant, idref1d, idref2d,
         vr2 = plasma._ddata[idref2d]['data']
         vr1 = plasma._ddata[idref1d]['data']
 
-        if interp_space == 1:
+        if interp_space in [1, 3]:
 
             def func(pts, vect=None, t=None, ntall=ntall,
-                     mplTriLinInterp=mplTriLinInterp,
-                     mpltri=mpltri, trifind=trifind,
+                     fweights=fweights,
                      vquant=vquant, indtq=indtq,
                      interp_space=interp_space, fill_value=fill_value,
                      vr1=vr1, indtr1=indtr1, vr2=vr2, indtr2=indtr2,
                      tall=tall, tbinall=tbinall,
-                     idref1d=idref1d, idref2d=idref2d):
+                     idref1d=idref1d, idref2d=idref2d, dcache=None):
 
                 r, z = np.hypot(pts[0,:],pts[1,:]), pts[2,:]
-                shapeval = list(pts.shape)
-                shapeval[0] = ntall if t is None else t.size
-                val = np.full(tuple(shapeval), fill_value)
-                t0tri, t0int = 0., 0.
-                if t is None:
-                    for ii in range(0,ntall):
-                        # get ref values for mapping
-                        # this is the slowest step (~1.8 s)
-                        vii = mplTriLinInterp(mpltri,
-                                              vr2[indtr2[ii],:],
-                                              trifinder=trifind)(r,z)
-
-                        # interpolate 1d
-                        # This is reasonable (~0.15 s)
-                        val[ii, ...] = scpinterp.interp1d(
-                            vr1[indtr1[ii], :],
-                            vquant[indtq[ii], :],
-                            kind='linear',
-                            bounds_error=False,
-                            fill_value=fill_value
-                        )(np.asarray(vii))
-                    t = tall
+                if dcache is None:
+                    dcache = plasma._dinterpcache
+
+                def fslices2(ind):
+                    # Locate pts in the mesh only once for all time steps
+                    nodes, wgt = fweights(r, z)
+                    return _interp_bary(vr2[ind[:, 0], :], nodes, wgt)
+
+                def fslices(ind):
+                    # get ref values for mapping, for all times at once
+                    # (cached, shared by all quantities mapped on ref2d)
+                    vii = _interp_slices_cached(dcache,
+                                                (idref2d, None, None,
+                                                 interp_space),
+                                                ind[:, 2:3], r, z, fslices2)
+                    # interpolate 1d, for all times at once
+                    return _interp1d_batch(vr1[ind[:, 1], :],
+                                           vquant[ind[:, 0], :], vii)
+
+                if interp_t == 'linear':
+                    if t is None:
+                        t = tall
+
+                    # ref2d values at pts, blended in time
+                    ind, wgt = _get_tlin_weights(t, dtlin['tr2'])
+                    vii = _interp_slices_tlin(dcache,
+                                              (idref2d, None, None,
+                                               interp_space),
+                                              ind, wgt, r, z, fslices2)
+                    # ref1d and quant profiles, blended in time
+                    lv = []
+                    for vv, tt in [(vr1, dtlin['tr1']), (vquant, dtlin['tq'])]:
+                        ind, wgt = _get_tlin_weights(t, tt)
+                        lv.append(np.sum(wgt[:, :, None]*vv[ind, :], axis=1))
+                    val = _interp1d_batch(lv[0], lv[1], vii)
                 else:
-                    out = plasma._get_indtu(t=t, tall=tall, tbinall=tbinall,
-                                            idref1d=idref1d, idref2d=idref2d,
-                                            indtr1=indtr1, indtr2=indtr2)[1:]
-                    ntall, indt, indtu, indtr1, indtr2 = out
-                    for ii in range(0, ntall):
-                        # get ref values for mapping
-                        vii = mplTriLinInterp(mpltri,
-                                              vr2[indtr2[ii], :],
-                                              trifinder=trifind)(r, z)
-
-                        # interpolate 1d
-                        ind = indt == indtu[ii]
-                        val[ind, ...] = scpinterp.interp1d(
-                            vr1[indtr1[ii], :],
-                            vquant[indtq[indtu[ii]], :],
-                            kind='linear',
-                            bounds_error=False,
-                            fill_value=fill_value
-                        )(np.asarray(vii))
+                    if t is None:
+                        indslices = np.array([indtq, indtr1, indtr2]).T
+                        t = tall
+                    else:
+                        out = plasma._get_indtu(t=t, tall=tall,
+                                                tbinall=tbinall,
+                                                idref1d=idref1d,
+                                                idref2d=idref2d,
+                                                indtr1=indtr1,
+                                                indtr2=indtr2)[1:]
+                        ntall, indt, indtu, indtr1, indtr2 = out
+                        indslices = np.array([indtq[indtu], indtr1, indtr2]).T
+                        indslices = indslices[np.searchsorted(indtu, indt), :]
+                    val = _interp_slices_cached(dcache, keyq,
+                                                indslices, r, z, fslices)
                 val[np.isnan(val)] = fill_value
                 return val, t
 
@@ -538,40 +840,52 @@ def get_finterp_isotropic(plasma, idquant, idref1d, idref2d,
                      interp_space=interp_space, fill_value=fill_value,
                      vr1=vr1, indtr1=indtr1, vr2=vr2, indtr2=indtr2,
                      tall=tall, tbinall=tbinall,
-                     idref1d=idref1d, idref2d=idref2d):
+                     idref1d=idref1d, idref2d=idref2d, dcache=None):
 
                 r, z = np.hypot(pts[0,:],pts[1,:]), pts[2,:]
-                shapeval = list(pts.shape)
-                shapeval[0] = ntall if t is None else t.size
-                val = np.full(tuple(shapeval), fill_value)
-                indpts = trifind(r,z)
-                indok = indpts > -1
-                if t is None:
-                    for ii in range(0,ntall):
-                        # interpolate 1d
-                        val[ii, indok] = scpinterp.interp1d(
-                            vr1[indtr1[ii], :],
-                            vquant[indtq[ii], :],
-                            kind='linear',
-                            bounds_error=False,
-                            fill_value=fill_value
-                        )(vr2[indtr2[ii], indpts[indok]])
-                    t = tall
+                if dcache is None:
+                    dcache = plasma._dinterpcache
+
+                def fslices(ind):
+                    indpts = trifind(r,z)
+                    indok = indpts > -1
+                    val = np.full((ind.shape[0], r.size), np.nan)
+                    # interpolate 1d, for all times at once
+                    val[:, indok] = _interp1d_batch(
+                        vr1[ind[:, 1], :], vquant[ind[:, 0], :],
+                        vr2[ind[:, 2], :][:, indpts[indok]])
+                    return val
+
+                if interp_t == 'linear':
+                    if t is None:
+                        t = tall
+                    indpts = trifind(r,z)
+                    indok = indpts > -1
+                    lv = []
+                    for vv, tt in [(vr2, dtlin['tr2']), (vr1, dtlin['tr1']),
+                                   (vquant, dtlin['tq'])]:
+                        ind, wgt = _get_tlin_weights(t, tt)
+                        lv.append(np.sum(wgt[:, :, None]*vv[ind, :], axis=1))
+                    val = np.full((t.size, r.size), np.nan)
+                    # interpolate 1d, for all times at once
+                    val[:, indok] = _interp1d_batch(lv[1], lv[2],
+                                                    lv[0][:, indpts[indok]])
                 else:
-                    out = plasma._get_indtu(t=t, tall=tall, tbinall=tbinall,
-                                            idref1d=idref1d, idref2d=idref2d,
-                                            indtr1=indtr1, indtr2=indtr2)[1:]
-                    ntall, indt, indtu, indtr1, indtr2 = out
-                    for ii in range(0,ntall):
-                        # interpolate 1d
-                        ind = indt == indtu[ii]
-                        val[ind, indok] = scpinterp.interp1d(
-                            vr1[indtr1[ii], :],
-                            vquant[indtq[indtu[ii]], :],
-                            kind='linear',
-                            bounds_error=False,
-                            fill_value=fill_value
-                        )(vr2[indtr2[ii], indpts[indok]])
+                    if t is None:
+                        indslices = np.array([indtq, indtr1, indtr2]).T
+                        t = tall
+                    else:
+                        out = plasma._get_indtu(t=t, tall=tall,
+                                                tbinall=tbinall,
+                                                idref1d=idref1d,
+                                                idref2d=idref2d,
+                                                indtr1=indtr1,
+                                                indtr2=indtr2)[1:]
+                        ntall, indt, indtu, indtr1, indtr2 = out
+                        indslices = np.array([indtq[indtu], indtr1, indtr2]).T
+                        indslices = indslices[np.searchsorted(indtu, indt), :]
+                    val = _interp_slices_cached(dcache, keyq,
+                                                indslices, r, z, fslices)
 
                 # Double check nan in case vr2 is itself nan on parts of mesh
                 if np.any(np.isnan(val)) and not np.isnan(fill_value):
@@ -580,145 +894,254 @@ def get_finterp_isotropic(plasma, idquant, idref1d, idref2d,
     return func
 
 
+def _get_ani_proj_matrix(mesh, r, z, vR, vPhi, vZ, deg=None, trifind=None):
+    """ Return the sparse (npts, 3*mesh['size']) projection matrix
+
+    The spatial interpolation weights (see get_interp_matrix()) are
+    multiplied by the (R, Phi, Z) components of the projection vector at
+    each point, so that for a vector field stacked as
+        quant = [quantR, quantPhi, quantZ]     (3*mesh['size'],)
+    the projection of the interpolated field on the vector is:
+        val(pts) = M.dot(quant)
+    Points outside of the mesh have empty rows
+    """
+    mat = get_interp_matrix(mesh, r, z, trifind=trifind, deg=deg).tocoo()
+    nn = mat.shape[1]
+    rows = np.tile(mat.row, 3)
+    cols = np.r_[mat.col, mat.col + nn, mat.col + 2*nn]
+    data = np.r_[mat.data*vR[mat.row], mat.data*vPhi[mat.row],
+                 mat.data*vZ[mat.row]]
+    return scpsp.csr_matrix((data, (rows, cols)), shape=(r.size, 3*nn))
+
+
 def get_finterp_ani(plasma, idq2dR, idq2dPhi, idq2dZ,
                     interp_t='nearest', interp_space=None,
                     fill_value=None, mpltri=None,
                     idmesh=None, vq2dR=None,
                     vq2dPhi=None, vq2dZ=None,
                     tall=None, tbinall=None, ntall=None,
-                    indtq=None, trifind=None, Type=None):
+                    indtq=None, trifind=None, Type=None, dtlin=None):
+    """ Return the function interpolating the projection of a vector field
 
-    # -----------------------------------
-    # Interpolate directly on 2d quantity
-    # -----------------------------------
+    The (R, Phi, Z) components are interpolated and projected on vect in a
+    single sparse product per call (see _get_ani_proj_matrix()), for all
+    the required time slices at once
+    """
 
     if Type is None:
         Type = _ANITYPE
     if fill_value is None:
         fill_value = _FILLVALUE
-
-    # --------------------
-    # Linear interpolation
-    if interp_space == 1:
-
-        def func(pts, vect=None, t=None, ntall=ntall,
-                 mplTriLinInterp=mplTriLinInterp,
-                 mpltri=mpltri, trifind=trifind,
-                 vq2dR=vq2dR, vq2dPhi=vq2dPhi,
-                 vq2dZ=vq2dZ, indtq=indtq,
-                 tall=tall, tbinall=tbinall):
-
-            # Get pts in (r,z,phi)
-            r, z = np.hypot(pts[0,:],pts[1,:]), pts[2,:]
-            phi = np.arctan2(pts[1,:],pts[0,:])
-
-            # Deduce vect in (r,z,phi)
-            vR = np.cos(phi)*vect[0,:] + np.sin(phi)*vect[1,:]
-            vPhi = -np.sin(phi)*vect[0,:] + np.cos(phi)*vect[1,:]
-            vZ = vect[2,:]
-
-            # Prepare output
-            shapeval = list(pts.shape)
-            shapeval[0] = ntall if t is None else t.size
-            valR = np.full(tuple(shapeval), fill_value)
-            valPhi = np.full(tuple(shapeval), fill_value)
-            valZ = np.full(tuple(shapeval), fill_value)
-
-            # Interpolate
+    mesh = plasma._ddata[idmesh]['data']
+
+    def func(pts, vect=None, t=None, ntall=ntall,
+             trifind=trifind,
+             vq2dR=vq2dR, vq2dPhi=vq2dPhi,
+             vq2dZ=vq2dZ, indtq=indtq,
+             tall=tall, tbinall=tbinall, dcache=None):
+
+        # Get pts in (r,z,phi)
+        r, z = np.hypot(pts[0, :], pts[1, :]), pts[2, :]
+        phi = np.arctan2(pts[1, :], pts[0, :])
+
+        # Deduce vect in (r,z,phi)
+        vR = np.cos(phi)*vect[0, :] + np.sin(phi)*vect[1, :]
+        vPhi = -np.sin(phi)*vect[0, :] + np.cos(phi)*vect[1, :]
+        vZ = vect[2, :]
+
+        # Interpolation and projection matrix
+        mat = _get_ani_proj_matrix(mesh, r, z, vR, vPhi, vZ,
+                                   deg=interp_space, trifind=trifind)
+        indout = mat.getnnz(axis=1) == 0
+
+        # Stacked components of the required time slices
+        if interp_t == 'linear':
             if t is None:
-                for ii in range(0,ntall):
-                    valR[ii,...]   = mplTriLinInterp(mpltri,
-                                                     vq2dR[indtq[ii],:],
-                                                     trifinder=trifind)(r, z)
-                    valPhi[ii,...] = mplTriLinInterp(mpltri,
-                                                     vq2dPhi[indtq[ii],:],
-                                                     trifinder=trifind)(r, z)
-                    valZ[ii,...]   = mplTriLinInterp(mpltri,
-                                                     vq2dZ[indtq[ii],:],
-                                                     trifinder=trifind)(r, z)
                 t = tall
-            else:
-                ntall, indt, indtu = plasma._get_indtu(t=t, tall=tall,
-                                                       tbinall=tbinall)[1:4]
-                for ii in range(0,ntall):
-                    ind = indt == indtu[ii]
-                    valR[ind, ...] = mplTriLinInterp(
-                        mpltri,
-                        vq2dR[indtq[indtu[ii]], :],
-                        trifinder=trifind
-                    )(r, z)
-                    valPhi[ind, ...] = mplTriLinInterp(
-                        mpltri,
-                        vq2dPhi[indtq[indtu[ii]], :],
-                        trifinder=trifind
-                    )(r, z)
-                    valZ[ind, ...] = mplTriLinInterp(
-                        mpltri,
-                        vq2dZ[indtq[indtu[ii]], :],
-                        trifinder=trifind
-                    )(r, z)
-
-
-            if Type == 'sca':
-                val = (valR*vR[None, :] + valPhi*vPhi[None, :]
-                       + valZ*vZ[None, :])
-            elif Type == 'abs(sca)':
-                val = np.abs(valR*vR[None, :] + valPhi*vPhi[None, :]
-                             + valZ*vZ[None, :])
-
-            val[np.isnan(val)] = fill_value
-            return val, t
-
-    # --------------------
-    # Degree 0 interpolation
-    else:
-        def func(pts, vect=None, t=None, ntall=ntall,
-                 trifind=trifind,
-                 vq2dR=vq2dR, vq2dPhi=vq2dPhi,
-                 vq2dZ=vq2dZ, indtq=indtq,
-                 tall=tall, tbinall=tbinall):
-
-            # Get pts in (r,z,phi)
-            r, z = np.hypot(pts[0, :], pts[1, :]), pts[2, :]
-            phi = np.arctan2(pts[1, :], pts[0, :])
-
-            # Deduce vect in (r,z,phi)
-            vR = np.cos(phi)*vect[0, :] + np.sin(phi)*vect[1, :]
-            vPhi = -np.sin(phi)*vect[0, :] + np.cos(phi)*vect[1, :]
-            vZ = vect[2, :]
-
-            # Prepare output
-            shapeval = list(pts.shape)
-            shapeval[0] = ntall if t is None else t.size
-            valR = np.full(tuple(shapeval), fill_value)
-            valPhi = np.full(tuple(shapeval), fill_value)
-            valZ = np.full(tuple(shapeval), fill_value)
-
-            # Interpolate
-            indpts = trifind(r, z)
-            indok = indpts > -1
+            ind, wgt = _get_tlin_weights(t, dtlin['tq'])
+            vq = np.concatenate([np.sum(wgt[:, :, None]*vv[ind, :], axis=1)
+                                 for vv in [vq2dR, vq2dPhi, vq2dZ]], axis=1)
+            inv = np.arange(0, t.size)
+        else:
             if t is None:
-                for ii in range(0,ntall):
-                    valR[ii, ...] = vq2dR[indtq[ii], indpts]
-                    valPhi[ii, ...] = vq2dPhi[indtq[ii], indpts]
-                    valZ[ii, ...] = vq2dZ[indtq[ii], indpts]
+                indq = indtq
+                inv = np.arange(0, ntall)
                 t = tall
             else:
                 ntall, indt, indtu = plasma._get_indtu(t=t, tall=tall,
-                                                       tbinall=tbinall)[1:-2]
-
-                for ii in range(0, ntall):
-                    ind = indt == indtu[ii]
-                    valR[ind, ...] = vq2dR[indtq[indtu[ii]], indpts]
-                    valPhi[ind, ...] = vq2dPhi[indtq[indtu[ii]], indpts]
-                    valZ[ind, ...] = vq2dZ[indtq[indtu[ii]], indpts]
-
-            if Type == 'sca':
-                val = (valR*vR[None, :] + valPhi*vPhi[None, :]
-                       + valZ*vZ[None, :])
-            elif Type == 'abs(sca)':
-                val = np.abs(valR*vR[None, :] + valPhi*vPhi[None, :]
-                             + valZ*vZ[None, :])
-            val[np.isnan(val)] = fill_value
-            return val, t
+                                                       tbinall=tbinall)[1:4]
+                indq = indtq[indtu]
+                inv = np.searchsorted(indtu, indt)
+            vq = np.concatenate([vq2dR[indq, :], vq2dPhi[indq, :],
+                                 vq2dZ[indq, :]], axis=1)
+
+        # Interpolate and project, for all time slices at once
+        val = mat.dot(vq.T).T[inv, :]
+        if Type == 'abs(sca)':
+            val = np.abs(val)
+        val[:, indout] = fill_value
+        val[np.isnan(val)] = fill_value
+        return val, t
     return func
+
+
+def get_interp_matrix(mesh, r, z, trifind=None, deg=None):
+    """ Return the sparse (npts, mesh['size']) spatial interpolation matrix
+
+    Row ii holds the weights of the mesh values used to interpolate at point
+    (r[ii], z[ii]), consistently with get_finterp_isotropic():
+        - degree 0 (ftype = 0): 1 on the face / cell containing the point
+        - degree 1 (ftype = 1): barycentric weights of the triangle nodes
+                                (bilinear weights for 'rect' meshes)
+        - degree 3 (ftype = 3): bicubic weights ('rect' meshes only)
+    The degree is mesh['ftype'], unless deg is provided
+    Points outside of the mesh have empty rows (i.e.: fill_value = 0)
+
+    """
+    npts = r.size
+    if deg is None:
+        deg = mesh['ftype']
+    if trifind is None:
+        trifind = mesh['trifind']
+    indpts = np.asarray(trifind(r, z))
+    indok = (indpts > -1).nonzero()[0]
+    indpts = indpts[indok]
+
+    if mesh['type'] == 'rect' and deg in [1, 3]:
+        cols, wgt = _get_rect_weights(mesh['R'], mesh['Z'], mesh['shapeRZ'],
+                                      r[indok], z[indok], deg=deg)
+        rows = np.repeat(indok, cols.shape[1])
+        cols = cols.ravel()
+        wgt = wgt.ravel()
+    elif deg == 1:
+        # Barycentric coordinates in triangles
+        faces, wgt = _get_bary_weights(mesh['nodes'][:, 0],
+                                       mesh['nodes'][:, 1],
+                                       mesh['faces'], r[indok], z[indok],
+                                       indpts)
+        rows = np.repeat(indok, 3)
+        cols = faces.ravel()
+        wgt = wgt.ravel()
+    else:
+        rows = indok
+        if mesh['type'] == 'rect':
+            cols = indpts
+        else:
+            # values are given per quadrangle for 'quadtri' meshes
+            cols = indpts // mesh['ntri']
+        wgt = np.ones((indok.size,), dtype=float)
+
+    mat = scpsp.csr_matrix((wgt, (rows, cols)), shape=(npts, mesh['size']))
+    mat.eliminate_zeros()
+    return mat
+
+
+def _get_mesh_nodes_pts(mesh):
+    """ Return the (r, z) coordinates of the values of a node-based mesh
+
+    Ordered consistently with the mesh values, i.e.: the nodes of a tri
+    mesh, or the flattened grid pts of a rect mesh (according to shapeRZ)
+    """
+    if mesh['type'] == 'rect':
+        R, Z = mesh['R'], mesh['Z']
+        if mesh['shapeRZ'] == ('R', 'Z'):
+            return np.repeat(R, Z.size), np.tile(Z, R.size)
+        return np.tile(R, Z.size), np.repeat(Z, R.size)
+    return mesh['nodes'][:, 0], mesh['nodes'][:, 1]
+
+
+def _get_mesh_faces_subpts(mesh, nsub=None):
+    """ Return pts sub-sampling the faces (cells) of a face-based mesh
+
+    Each triangle is split in nsub**2 equal sub-triangles (sampled at their
+    centroids), each rect cell (centered on a grid pt, clipped to the grid)
+    in nsub**2 equal sub-rectangles (sampled at their centers)
+    Return the (r, z) pts, their volume weights (area x 2 pi r) and the
+    index of the mesh value they belong to
+    """
+    if nsub is None:
+        nsub = 4
+    if mesh['type'] == 'rect':
+        lsub = []
+        for xx in [mesh['R'], mesh['Z']]:
+            edges = np.r_[xx[0], 0.5*(xx[1:] + xx[:-1]), xx[-1]]
+            dx = np.diff(edges) / nsub
+            sub = edges[:-1, None] + dx[:, None]*(np.arange(0, nsub) + 0.5)
+            lsub.append((sub, np.repeat(dx[:, None], nsub, axis=1)))
+        (rs, dr), (zs, dz) = lsub
+        nR, nZ = mesh['R'].size, mesh['Z'].size
+        if mesh['shapeRZ'] == ('R', 'Z'):
+            shape = (nR, nsub, nZ, nsub)
+            r = np.broadcast_to(rs[:, :, None, None], shape).ravel()
+            z = np.broadcast_to(zs[None, None, :, :], shape).ravel()
+            area = (dr[:, :, None, None] * dz[None, None, :, :]).ravel()
+            ind = np.broadcast_to(
+                np.arange(0, nR*nZ).reshape((nR, 1, nZ, 1)), shape).ravel()
+        else:
+            shape = (nZ, nsub, nR, nsub)
+            r = np.broadcast_to(rs[None, None, :, :], shape).ravel()
+            z = np.broadcast_to(zs[:, :, None, None], shape).ravel()
+            area = (dz[:, :, None, None] * dr[None, None, :, :]).ravel()
+            ind = np.broadcast_to(
+                np.arange(0, nR*nZ).reshape((nZ, 1, nR, 1)), shape).ravel()
+    else:
+        # Barycentric coordinates of the centroids of the sub-triangles
+        ii, jj = np.meshgrid(np.arange(0, nsub), np.arange(0, nsub),
+                             indexing='ij')
+        ii, jj = ii.ravel(), jj.ravel()
+        up, down = ii + jj <= nsub - 1, ii + jj <= nsub - 2
+        b0 = np.r_[ii[up] + 1./3., ii[down] + 2./3.] / nsub
+        b1 = np.r_[jj[up] + 1./3., jj[down] + 2./3.] / nsub
+        bary = np.array([b0, b1, 1. - b0 - b1])
+
+        tri = mesh['faces']
+        xx, yy = mesh['nodes'][tri, 0], mesh['nodes'][tri, 1]
+        r = (xx.dot(bary)).ravel()
+        z = (yy.dot(bary)).ravel()
+        area = 0.5*np.abs((xx[:, 1] - xx[:, 0])*(yy[:, 2] - yy[:, 0])
+                          - (xx[:, 2] - xx[:, 0])*(yy[:, 1] - yy[:, 0]))
+        area = np.repeat(area / nsub**2, nsub**2)
+        ind = np.repeat(np.arange(0, tri.shape[0]), nsub**2)
+        if mesh['type'] == 'quadtri':
+            # values are given per quadrangle
+            ind = ind // mesh['ntri']
+    return r, z, area*2.*np.pi*r, ind
+
+
+def get_remap_matrix(mesh_src, mesh_dst, method=None, nsub=None):
+    """ Return the sparse (size_dst, size_src) mesh-to-mesh remapping matrix
+
+    Such that values on mesh_dst are obtained from values on mesh_src by:
+        val_dst = M.dot(val_src)        (or val_src.dot(M.T) for (nt, size))
+    method:
+        - 'linear': values of mesh_src interpolated at the values positions
+                    of mesh_dst (nodes, or grid pts), for node-based mesh_dst
+        - 'conservative': values of mesh_src averaged over the volume of each
+                          face of mesh_dst (sub-sampled in nsub**2 parts),
+                          for face-based mesh_dst (ftype = 0)
+    By default, method is 'conservative' if mesh_dst['ftype'] == 0 and
+    'linear' otherwise
+    Volume integrals are conserved for the part of mesh_dst covered by
+    mesh_src (faces of mesh_dst partially outside get a reduced average)
+    """
+    lok = ['linear', 'conservative']
+    if method is None:
+        method = 'conservative' if mesh_dst['ftype'] == 0 else 'linear'
+    if method not in lok or (method == 'conservative'
+                             and mesh_dst['ftype'] != 0):
+        msg = ("Arg method must be in {}\n".format(lok)
+               + "\t- 'conservative' only for face-based meshes (ftype=0)\n"
+               + "\t- Provided: {}".format(method))
+        raise Exception(msg)
+
+    if method == 'linear':
+        r, z = _get_mesh_nodes_pts(mesh_dst)
+        return get_interp_matrix(mesh_src, r, z)
+
+    r, z, vol, ind = _get_mesh_faces_subpts(mesh_dst, nsub=nsub)
+    volcell = np.bincount(ind, weights=vol, minlength=mesh_dst['size'])
+    avg = scpsp.csr_matrix((vol / volcell[ind], (ind, np.arange(0, r.size))),
+                           shape=(mesh_dst['size'], r.size))
+    mat = avg.dot(get_interp_matrix(mesh_src, r, z)).tocsr()
+    mat.eliminate_zeros()
+    return mat
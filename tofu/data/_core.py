@@ -26,12 +26,14 @@ try:
     import tofu.data._def as _def
     import tofu._physics as _physics
     import tofu.data._spectrafit2d as _spectrafit2d
+    import tofu.geom._GG as _GG
 except Exception:
     from . import _comp as _comp
     from . import _plot as _plot
     from . import _def as _def
     from .. import _physics as _physics
     from . import _spectrafit2d as _spectrafit2d
+    from ..geom import _GG as _GG
 
 __all__ = ['DataCam1D','DataCam2D',
            'DataCam1DSpectral','DataCam2DSpectral',
@@ -2316,6 +2318,9 @@ class Plasma2D(utils.ToFuObject):
         self._dindref = dict.fromkeys(self._get_keys_dindref())
         self._ddata = dict.fromkeys(self._get_keys_ddata())
         self._dgeom = dict.fromkeys(self._get_keys_dgeom())
+        self._dinterpcache = _comp._InterpCache()
+        self._dremapcache = {}
+        self._dlocatecache = {}
 
     @classmethod
     def _checkformat_inputs_Id(cls, Id=None, Name=None,
@@ -2402,7 +2407,8 @@ class Plasma2D(utils.ToFuObject):
         lkok = ['data', 'dim', 'quant', 'name', 'origin', 'units',
                 'depend']
         lkmeshmax = ['type', 'ftype', 'nodes', 'faces', 'R', 'Z', 'shapeRZ',
-                     'nfaces', 'nnodes', 'mpltri', 'size', 'ntri']
+                     'nfaces', 'nnodes', 'mpltri', 'trifind', 'size',
+                     'ntri']
         lkmeshmin = ['type', 'ftype']
         dkok = {'dtime': {'max':lkok, 'min':['data'], 'ndim':[1]},
                 'dradius':{'max':lkok, 'min':['data'], 'ndim':[1,2]},
@@ -2556,8 +2562,15 @@ class Plasma2D(utils.ToFuObject):
                         dd[dk][k0]['nR'] = R.size
                         dd[dk][k0]['nZ'] = Z.size
                         dd[dk][k0]['trifind'] = trifind
-                        if dd[dk][k0]['ftype'] != 0:
-                            msg = "Linear interpolation not handled yet !"
+                        lftype = [0, 1, 3]
+                        if dd[dk][k0]['ftype'] not in lftype:
+                            msg = ("Mesh['ftype'] of a 'rect' mesh should be"
+                                   + " in {}\n".format(lftype)
+                                   + "\t- 0: nearest grid point\n"
+                                   + "\t- 1: bilinear\n"
+                                   + "\t- 3: bicubic\n"
+                                   + "\t- Provided: {}".format(
+                                       dd[dk][k0]['ftype']))
                             raise Exception(msg)
                         dd[dk][k0]['size'] = R.size*Z.size
 
@@ -2631,6 +2644,17 @@ class Plasma2D(utils.ToFuObject):
                                     dd[dk][k0]['faces'])
                             assert isinstance(dd[dk][k0]['mpltri'], mplTri)
                             assert dd[dk][k0]['ftype'] in [0, 1]
+
+                            # Native (parallel) triangle locator
+                            mpltri = dd[dk][k0]['mpltri']
+                            dlocator = _GG.Tri_get_locator(
+                                np.array([mpltri.x, mpltri.y]).T,
+                                mpltri.triangles)
+
+                            def trifind(r, z, dlocator=dlocator):
+                                return _GG.Tri_locate_pts(r, z, dlocator)
+
+                            dd[dk][k0]['trifind'] = trifind
                             ntri = dd[dk][k0]['ntri']
                             if dd[dk][k0]['ftype'] == 1:
                                 dd[dk][k0]['size'] = dd[dk][k0]['nnodes']
@@ -2888,6 +2912,9 @@ class Plasma2D(utils.ToFuObject):
 
     def _complement(self):
 
+        # Cached interpolated slices may be outdated
+        self.clear_interp_cache()
+
         # --------------
         # ddata
         for k0, v0 in self.ddata.items():
@@ -3772,6 +3799,11 @@ class Plasma2D(utils.ToFuObject):
 
         if interp_t is None:
             interp_t = 'nearest'
+        linterp_t = ['nearest', 'linear']
+        if interp_t not in linterp_t:
+            msg = ("Arg interp_t should be in {}\n".format(linterp_t)
+                   + "\t- Provided: {}".format(interp_t))
+            raise Exception(msg)
 
         # Get idmesh
         if idquant is not None:
@@ -3789,17 +3821,27 @@ class Plasma2D(utils.ToFuObject):
         idmesh = lidmesh[0]
 
         # Get common time indices
-        if interp_t == 'nearest':
-            out = self._get_tcom(idquant, idref1d, idref2d, idq2dR)
-            tall, tbinall, ntall, indtq, indtr1, indtr2 = out
-
-        # Get mesh
+        out = self._get_tcom(idquant, idref1d, idref2d, idq2dR)
+        tall, tbinall, ntall, indtq, indtr1, indtr2 = out
+
+        # Get time vectors of each quantity (for interp_t='linear')
+        dtlin = None
+        if interp_t == 'linear':
+            idq = idq2dR if ani else idquant
+            dtlin = {'tq': self._ddata[self._ddata[idq]['depend'][0]]}
+            if idref1d is not None:
+                dtlin['tr1'] = self._ddata[self._ddata[idref1d]['depend'][0]]
+                dtlin['tr2'] = self._ddata[self._ddata[idref2d]['depend'][0]]
+            dtlin = {k0: v0['data'] for k0, v0 in dtlin.items()}
+
+        # Get mesh (locations of the last pts are shared by all quantities)
+        trifind = _comp._get_flocate_cached(
+            self._ddata[idmesh]['data']['trifind'], self._dlocatecache,
+            ('trifind', idmesh))
         if self._ddata[idmesh]['data']['type'] == 'rect':
             mpltri = None
-            trifind = self._ddata[idmesh]['data']['trifind']
         else:
             mpltri = self._ddata[idmesh]['data']['mpltri']
-            trifind = mpltri.get_trifinder()
 
         # # Prepare output
 
@@ -3807,11 +3849,13 @@ class Plasma2D(utils.ToFuObject):
         # Note : Maybe consider using scipy.LinearNDInterpolator ?
         if idquant is not None:
             vquant = self._ddata[idquant]['data']
+            # values per quadrangle => repeated for each of its triangles
             c0 = (self._ddata[idmesh]['data']['type'] == 'quadtri'
-                  and self._ddata[idmesh]['data']['ntri'] > 1)
+                  and self._ddata[idmesh]['data']['ntri'] > 1
+                  and self._ddata[idmesh]['data']['ftype'] == 0)
             if c0:
                 vquant = np.repeat(vquant,
-                                   self._ddata[idmesh]['data']['ntri'], axis=0)
+                                   self._ddata[idmesh]['data']['ntri'], axis=1)
         else:
             vq2dR   = self._ddata[idq2dR]['data']
             vq2dPhi = self._ddata[idq2dPhi]['data']
@@ -3819,6 +3863,15 @@ class Plasma2D(utils.ToFuObject):
 
         if interp_space is None:
             interp_space = self._ddata[idmesh]['data']['ftype']
+        if self._ddata[idmesh]['data']['type'] == 'rect':
+            linterp = [0, 1, 3]
+        else:
+            linterp = [0, 1]
+        if interp_space not in linterp:
+            msg = ("Arg interp_space should be in {}".format(linterp)
+                   + " for mesh {}\n".format(idmesh)
+                   + "\t- Provided: {}".format(interp_space))
+            raise Exception(msg)
 
         # get interpolation function
         if ani:
@@ -3832,7 +3885,8 @@ class Plasma2D(utils.ToFuObject):
                                          tall=tall, tbinall=tbinall,
                                          ntall=ntall,
                                          indtq=indtq, trifind=trifind,
-                                         Type=Type, mpltri=mpltri)
+                                         Type=Type, mpltri=mpltri,
+                                         dtlin=dtlin)
         else:
             func = _comp.get_finterp_isotropic(self, idquant, idref1d, idref2d,
                                                interp_t=interp_t,
@@ -3842,7 +3896,8 @@ class Plasma2D(utils.ToFuObject):
                                                tall=tall, tbinall=tbinall,
                                                ntall=ntall, mpltri=mpltri,
                                                indtq=indtq, indtr1=indtr1,
-                                               indtr2=indtr2, trifind=trifind)
+                                               indtr2=indtr2, trifind=trifind,
+                                               dtlin=dtlin)
 
         return func
 
@@ -3891,10 +3946,14 @@ class Plasma2D(utils.ToFuObject):
 
         Can be used as input for tf.geom.CamLOS1D/2D.calc_signal()
 
+        interp_t can be:
+            - 'nearest': value of the nearest time slice
+            - 'linear': linear interpolation between the 2 time slices
+                        bracketing each time (each stored slice is spatially
+                        interpolated only once per call)
+
         """
         # Check inputs
-        msg = "Only 'nearest' available so far for interp_t!"
-        assert interp_t == 'nearest', msg
         out = self._checkformat_qr12RPZ(quant=quant, ref1d=ref1d, ref2d=ref2d,
                                         q2dR=q2dR, q2dPhi=q2dPhi, q2dZ=q2dZ)
         idquant, idref1d, idref2d, idq2dR, idq2dPhi, idq2dZ, ani = out
@@ -3909,20 +3968,49 @@ class Plasma2D(utils.ToFuObject):
         return func
 
 
-    def interp_pts2profile(self, pts=None, vect=None, t=None,
-                           quant=None, ref1d=None, ref2d=None,
-                           q2dR=None, q2dPhi=None, q2dZ=None,
-                           interp_t=None, interp_space=None,
-                           fill_value=None, Type=None):
-        """ Return the value of the desired profiles_1d quantity
+    def _checkformat_pts2profile(self, pts=None, t=None,
+                                 quant=None, ref1d=None, ref2d=None,
+                                 q2dR=None, q2dPhi=None, q2dZ=None,
+                                 interp_t=None, interp_space=None,
+                                 fill_value=None, Type=None):
+        """ Return the interpolation function, pts and t of interp_pts2profile
 
-        For the desired inputs points (pts):
-            - pts are in (X,Y,Z) coordinates
-            - space interpolation is linear on the 1d profiles
-        At the desired input times (t):
-            - using a nearest-neighbourg approach for time
+        If quant is a list of quantities (sharing ref1d / ref2d and mesh),
+        the function returns a dict of values, the pts are only located in
+        the mesh (and mapped on ref2d) once for all quantities
+        All quantities are interpolated at the same times, by default the
+        union of their time vectors
 
         """
+        if type(quant) in [list, tuple]:
+            lidmesh, ltall = [], []
+            for qq in quant:
+                out = self._checkformat_qr12RPZ(quant=qq, ref1d=ref1d,
+                                                ref2d=ref2d)
+                lidmesh.append(self._get_idmesh(
+                    out[0] if out[1] is None else out[2]))
+                ltall.append(np.atleast_1d(self._get_tcom(*out[:4])[0]))
+            if len(set(lidmesh)) != 1:
+                msg = ("All quantities of list quant must share the same "
+                       + "mesh!\n"
+                       + "\t- Provided: {}\n".format(quant)
+                       + "\t- meshes: {}".format(lidmesh))
+                raise Exception(msg)
+            lout = [self._checkformat_pts2profile(
+                pts=pts, t=t, quant=qq, ref1d=ref1d, ref2d=ref2d,
+                interp_t=interp_t, interp_space=interp_space,
+                fill_value=fill_value, Type=Type) for qq in quant]
+
+            def func(pts, vect=None, t=None, lfunc=[oo[0] for oo in lout],
+                     tcom=np.unique(np.concatenate(ltall)), dcache=None):
+                if t is None:
+                    t = tcom
+                dval = {}
+                for qq, ff in zip(quant, lfunc):
+                    dval[qq], tout = ff(pts, vect=vect, t=t, dcache=dcache)
+                return dval, tout
+            return func, lout[0][1], lout[0][2]
+
         # Check inputs
         # msg = "Only 'nearest' available so far for interp_t!"
         # assert interp_t == 'nearest', msg
@@ -3984,10 +4072,257 @@ class Plasma2D(utils.ToFuObject):
                                  interp_t=interp_t, interp_space=interp_space,
                                  fill_value=fill_value, ani=ani, Type=Type)
 
-        # This is the slowest step (~1.8 s)
-        val, t = func(pts, vect=vect, t=t)
-        return val, t
+        return func, pts, t
+
+    def interp_pts2profile(self, pts=None, vect=None, t=None,
+                           quant=None, ref1d=None, ref2d=None,
+                           q2dR=None, q2dPhi=None, q2dZ=None,
+                           interp_t=None, interp_space=None,
+                           fill_value=None, Type=None,
+                           out=None, max_bytes=None):
+        """ Return the value of the desired profiles_1d quantity
+
+        For the desired inputs points (pts):
+            - pts are in (X,Y,Z) coordinates
+            - space interpolation is linear on the 1d profiles
+        At the desired input times (t):
+            - using a nearest-neighbourg approach for time (interp_t='nearest')
+            - or a linear interpolation in time (interp_t='linear')
 
+        If out is provided (e.g.: a np.memmap of shape (nt, npts)), the
+        values are written into it instead of a newly allocated array
+        If out or max_bytes is provided, the pts are streamed by chunks
+        (see iter_pts2profile()), so that the memory used by each chunk
+        stays bounded
+
+        quant can be a list of quantities sharing the same mesh (and ref1d /
+        ref2d), the pts are then located (and mapped on ref2d) only once,
+        and a dict of (nt, npts) values is returned (out is then a dict too)
+
+        """
+        func, pts, t = self._checkformat_pts2profile(
+            pts=pts, t=t, quant=quant, ref1d=ref1d, ref2d=ref2d,
+            q2dR=q2dR, q2dPhi=q2dPhi, q2dZ=q2dZ,
+            interp_t=interp_t, interp_space=interp_space,
+            fill_value=fill_value, Type=Type)
+
+        if out is None and max_bytes is None:
+            # This is the slowest step (~1.8 s)
+            val, t = func(pts, vect=vect, t=t)
+            return val, t
+
+        multi = type(quant) in [list, tuple]
+        if multi:
+            dout = {} if out is None else out
+        else:
+            dout = {None: out}
+        for ind, val, t in self._iter_pts2profile(
+            func, pts, vect=vect, t=t, max_bytes=max_bytes,
+            nquant=len(quant) if multi else 1,
+        ):
+            dval = val if multi else {None: val}
+            for kk, vv in dval.items():
+                if dout.get(kk) is None:
+                    dout[kk] = np.empty((t.size, pts.shape[1]), dtype=float)
+                if dout[kk].shape != (t.size, pts.shape[1]):
+                    msg = ("Arg out has wrong shape!\n"
+                           + "\t- Expected: {}\n".format((t.size,
+                                                           pts.shape[1]))
+                           + "\t- Provided: {}".format(dout[kk].shape))
+                    raise Exception(msg)
+                dout[kk][:, ind] = vv
+        return (dout if multi else dout[None]), t
+
+    def iter_pts2profile(self, pts=None, vect=None, t=None,
+                         quant=None, ref1d=None, ref2d=None,
+                         q2dR=None, q2dPhi=None, q2dZ=None,
+                         interp_t=None, interp_space=None,
+                         fill_value=None, Type=None,
+                         chunk='pts', chunk_size=None, max_bytes=1e8):
+        """ Iterate over the values of interp_pts2profile() by chunks
+
+        Same arguments as interp_pts2profile(), the values are computed
+        and yielded by chunks of pts (chunk='pts') or of times (chunk='t'):
+            for ind, val, t in plasma.iter_pts2profile(pts, quant=...):
+                ...
+        Where ind is the slice of pts (or times) of the chunk, val the
+        (nt, npts) values of the chunk and t the times of the chunk
+
+        The size of the chunks is chunk_size (nb. of pts or times), or if
+        None, such that each chunk of values holds at most max_bytes
+        (temporary arrays of the interpolation are proportional)
+        If quant is a list of quantities, val is a dict of values (max_bytes
+        is then shared by all quantities)
+        The interpolated slices of streamed pts are not cached (see
+        clear_interp_cache()), as each chunk is only interpolated once
+
+        """
+        func, pts, t = self._checkformat_pts2profile(
+            pts=pts, t=t, quant=quant, ref1d=ref1d, ref2d=ref2d,
+            q2dR=q2dR, q2dPhi=q2dPhi, q2dZ=q2dZ,
+            interp_t=interp_t, interp_space=interp_space,
+            fill_value=fill_value, Type=Type)
+        nquant = len(quant) if type(quant) in [list, tuple] else 1
+        return self._iter_pts2profile(func, pts, vect=vect, t=t, chunk=chunk,
+                                      chunk_size=chunk_size,
+                                      max_bytes=max_bytes, nquant=nquant)
+
+    @staticmethod
+    def _iter_pts2profile(func, pts, vect=None, t=None,
+                          chunk='pts', chunk_size=None, max_bytes=None,
+                          nquant=1):
+        lchunk = ['pts', 't']
+        if chunk not in lchunk:
+            msg = ("Arg chunk should be in {}\n".format(lchunk)
+                   + "\t- Provided: {}".format(chunk))
+            raise Exception(msg)
+        if pts.ndim != 2:
+            msg = "Streaming by chunks only available for (3, npts) pts!"
+            raise Exception(msg)
+
+        # Get times from a (cheap) call on a single point
+        # Streamed pts are only interpolated once => not cached (each call
+        # uses its own throwaway cache of interpolated slices)
+        t = func(pts[:, :1], vect=None if vect is None else vect[:, :1],
+                 t=t, dcache=_comp._InterpCache())[1]
+        nt, npts = t.size, pts.shape[1]
+        ntot = npts if chunk == 'pts' else nt
+        if chunk_size is None:
+            if max_bytes is None:
+                chunk_size = ntot
+            else:
+                # Each chunk holds the values of all nquant quantities
+                nper = 8*nt if chunk == 'pts' else 8*npts
+                chunk_size = int(max(1, max_bytes // (nper*nquant)))
+
+        for i0 in range(0, ntot, chunk_size):
+            ind = slice(i0, min(i0 + chunk_size, ntot))
+            if chunk == 'pts':
+                vv = None if vect is None else vect[:, ind]
+                val = func(pts[:, ind], vect=vv, t=t,
+                           dcache=_comp._InterpCache())[0]
+                yield ind, val, t
+            else:
+                val, tt = func(pts, vect=vect, t=t[ind],
+                               dcache=_comp._InterpCache())
+                yield ind, val, tt
+
+    def _get_idmesh(self, key):
+        """ Return the key of the mesh of a 2d quantity (or of a mesh) """
+        if key in self.dmesh.keys():
+            return key
+        idq, msg = self._get_keyingroup(key, 'mesh', msgstr='key',
+                                        raise_=True)
+        return [id_ for id_ in self._ddata[idq]['depend']
+                if self._dindref[id_]['group'] == 'mesh'][0]
+
+    def get_interp_matrix(self, pts=None, key=None, deg=None):
+        """ Return the sparse spatial interpolation matrix of pts on a mesh
+
+        The matrix has shape (npts, nmesh), where nmesh is the size of
+        quantities defined on the mesh (faces or nodes), such that:
+            val(pts, t) = M.dot(quant(t))
+        pts are (X,Y,Z) coordinates, key is a 2d quantity or a mesh key
+        deg is the degree of the spatial interpolation (cf. interp_space in
+        get_finterp2d()), the mesh ftype by default
+
+        """
+        pts = np.atleast_2d(pts)
+        if pts.shape[0] != 3:
+            msg = ("pts must be np.ndarray of (X,Y,Z) points coordinates\n"
+                   + "    - Expected shape : (3, npts)\n"
+                   + "    - Provided shape : {}".format(pts.shape))
+            raise Exception(msg)
+        idmesh = self._get_idmesh(key)
+        mesh = self._ddata[idmesh]['data']
+        if deg is None:
+            deg = mesh['ftype']
+        linterp = [0, 1, 3] if mesh['type'] == 'rect' else [0, 1]
+        if deg not in linterp:
+            msg = ("Arg deg should be in {}".format(linterp)
+                   + " for mesh {}\n".format(idmesh)
+                   + "\t- Provided: {}".format(deg))
+            raise Exception(msg)
+        r, z = np.hypot(pts[0, :], pts[1, :]), pts[2, :]
+        return _comp.get_interp_matrix(mesh, r, z, deg=deg)
+
+    def clear_interp_cache(self):
+        """ Remove all cached interpolated time slices
+
+        Interpolated time slices are cached (LRU, limited in size) per
+        quantity and set of points, so that repeated calls to the
+        interpolation functions (e.g.: calc_signal_from_Cam() over several
+        time windows) do not interpolate the same time slices again
+        Cached mesh-to-mesh remapping matrices and locations of the last
+        interpolated pts in each mesh are removed too
+        """
+        self._dinterpcache = _comp._InterpCache()
+        self._dremapcache = {}
+        self._dlocatecache = {}
+
+    def get_remap_matrix(self, key_src=None, key_dst=None,
+                         method=None, nsub=None):
+        """ Return the sparse remapping matrix from a mesh to another one
+
+        The matrix has shape (nmesh_dst, nmesh_src), such that:
+            quant_dst(t) = M.dot(quant_src(t))
+        key_src and key_dst are 2d quantities or mesh keys
+        method:
+            - 'linear': interpolation at the nodes / grid pts of mesh_dst
+                        (default for node-based mesh_dst)
+            - 'conservative': volume average over the faces / cells of
+                              mesh_dst, sub-sampled in nsub**2 parts
+                              (default for face-based mesh_dst, ftype=0)
+        Matrices are cached, see clear_interp_cache()
+
+        """
+        idsrc, iddst = self._get_idmesh(key_src), self._get_idmesh(key_dst)
+        mesh_dst = self._ddata[iddst]['data']
+        if method is None:
+            method = 'conservative' if mesh_dst['ftype'] == 0 else 'linear'
+        keyc = (idsrc, iddst, method, nsub)
+        if keyc not in self._dremapcache.keys():
+            self._dremapcache[keyc] = _comp.get_remap_matrix(
+                self._ddata[idsrc]['data'], mesh_dst,
+                method=method, nsub=nsub)
+        return self._dremapcache[keyc]
+
+    def remap_quantity(self, key=None, mesh=None, t=None, interp_t=None,
+                       method=None, nsub=None):
+        """ Return 2d quantity key remapped on another mesh
+
+        The whole time series (or the time slices t, see interp_t) is
+        remapped at once with the cached matrix of get_remap_matrix()
+        Return the (nt, nmesh) values and the corresponding times
+
+        """
+        if interp_t is None:
+            interp_t = 'nearest'
+        mat = self.get_remap_matrix(key_src=key, key_dst=mesh,
+                                    method=method, nsub=nsub)
+        val, t = self._get_quant_on_mesh(key, t=t, interp_t=interp_t)
+        return mat.dot(val.T).T, t
+
+    def _get_quant_on_mesh(self, key, t=None, interp_t=None):
+        """ Return values of 2d quantity key at times t
+
+        Either of the nearest time slice (interp_t='nearest', default) or
+        linearly interpolated between the bracketing ones ('linear')
+        """
+        idq, msg = self._get_keyingroup(key, 'mesh', msgstr='quant',
+                                        raise_=True)
+        tall, tbinall, ntall, indtq = self._get_indtmult(idquant=idq)[:4]
+        if t is None:
+            t = tall
+            indt = np.arange(0, ntall)
+        else:
+            indt = np.digitize(t, tbinall)
+        if interp_t == 'linear':
+            ind, wgt = _comp._get_tlin_weights(t, tall)
+            val = np.sum(wgt[:, :, None]*self._ddata[idq]['data'][ind, :],
+                         axis=1)
+            return val, t
+        return self._ddata[idq]['data'][indtq[indt], :], t
 
     def calc_signal_from_Cam(self, cam, t=None,
                              quant=None, ref1d=None, ref2d=None,
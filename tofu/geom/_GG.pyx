@@ -60,12 +60,16 @@ __all__ = ['CoordShift',
            '_Ves_Smesh_TorStruct_SubFromInd_cython',
            '_Ves_Smesh_Lin_SubFromD_cython',
            '_Ves_Smesh_Lin_SubFromInd_cython',
-           'LOS_Calc_PInOut_VesStruct',
+           '_Ves_Smesh_Tor_rows_cython',
+           'LOS_Calc_PInOut_VesStruct', 'LOS_get_struct_bvh',
+           'LOS_Calc_Reflections_VesStruct',
            "LOS_Calc_kMinkMax_VesStruct",
            "LOS_isVis_PtFromPts_VesStruct",
            "LOS_areVis_PtsFromPts_VesStruct",
            'check_ff', 'LOS_get_sample', 'LOS_calc_signal',
-           'LOS_sino','integrate1d',
+           'SamplingPlan', 'LOS_get_sampling_plan',
+           'LOS_sino', 'LOS_sino_multi', 'integrate1d',
+           'Tri_get_locator', 'Tri_locate_pts',
            "triangulate_by_earclipping",
            "vignetting",
            "Dust_calc_SolidAngle"]
@@ -1307,6 +1311,27 @@ def _getBoundsinter2AngSeg(bool Full, double Phi0, double Phi1,
     return inter, Bounds, Faces
 
 
+def _Ves_Smesh_Tor_cross(double[:,::1] VPoly, double dL, double dRPhi,
+                         double[::1] DPhiMinMax, double DIn=0., VIn=None,
+                         double margin=_VSMALL):
+    """ Return the discretized cross-section of a toroidal surface, and the
+    number of toroidal steps of each of its pts for each extent DPhiMinMax
+
+    Each pt ii of the discretized contour VPoly (cf. discretize_vpoly()) is
+    the center of a row of NRPhi[kk, ii] = ceil(DPhiMinMax[kk]*Rref[ii]/dRPhi)
+    toroidal steps. Shared by _Ves_Smesh_Tor_SubFromD_cython() and the
+    sampling of several Struct at once (cf. _Ves_Smesh_Tor_rows_cython())
+    Return PtsCross, dLr, indL, NL, Rref, VPbis and NRPhi
+    """
+    cdef int kk
+    cdef np.ndarray[double,ndim=2] NRPhi
+    PtsCross, dLr, indL, \
+      NL, Rref, VPbis = discretize_vpoly(VPoly, dL, D1=None, D2=None,
+                                         margin=margin, DIn=DIn, VIn=VIn)
+    NRPhi = np.empty((DPhiMinMax.shape[0], Rref.size))
+    for kk in range(0, DPhiMinMax.shape[0]):
+        NRPhi[kk, :] = np.ceil(DPhiMinMax[kk]*Rref/dRPhi)
+    return PtsCross, dLr, indL, NL, Rref, VPbis, NRPhi
 
 
 @cython.cdivision(True)
@@ -1326,7 +1351,7 @@ def _Ves_Smesh_Tor_SubFromD_cython(double dL, double dRPhi,
     cdef long[::1] indR0, indR, indZ, Phin, NRPhi0, Indin
     cdef int NR0, NR, NZ, Rn, Zn, nRPhi0, indR0ii, ii, jj0=0, jj, nPhi0, nPhi1
     cdef int zz, NP, NRPhi_int, Rratio, Ln
-    cdef np.ndarray[double,ndim=2] Pts, indI, PtsCross, VPbis
+    cdef np.ndarray[double,ndim=2] Pts, indI, PtsCross, VPbis, NRPhiAll
     cdef np.ndarray[double,ndim=1] R0, dS, ind, dLr, Rref, dRPhir, iii
     cdef np.ndarray[long,ndim=1] indL, NL, indok
 
@@ -1370,8 +1395,9 @@ def _Ves_Smesh_Tor_SubFromD_cython(double dL, double dRPhi,
 
         # Get the actual R and Z resolutions and mesh elements
         PtsCross, dLr, indL, \
-          NL, Rref, VPbis = discretize_vpoly(VPoly, dL, D1=None, D2=None,
-                                             margin=margin, DIn=DIn, VIn=VIn)
+          NL, Rref, VPbis, NRPhiAll = _Ves_Smesh_Tor_cross(
+              VPoly, dL, dRPhi, np.r_[DPhiMinMax], DIn=DIn, VIn=VIn,
+              margin=margin)
         R0 = np.copy(Rref)
         NR0 = R0.size
         indin = np.ones((PtsCross.shape[1],),dtype=bool)
@@ -1395,7 +1421,7 @@ def _Ves_Smesh_Tor_SubFromD_cython(double dL, double dRPhi,
         for ii in range(0,Ln):
             # Get the actual RPhi resolution and Phi mesh elements
             # (! depends on R!)
-            NRPhi[ii] = Cceil(DPhiMinMax*Rref[ii]/dRPhi)
+            NRPhi[ii] = NRPhiAll[0, Indin[ii]]
             NRPhi_int = int(NRPhi[ii])
             dPhir[ii] = DPhiMinMax/NRPhi[ii]
             dRPhir[ii] = dPhir[ii]*Rref[ii]
@@ -1405,7 +1431,7 @@ def _Ves_Smesh_Tor_SubFromD_cython(double dL, double dRPhi,
                     indR0ii = jj0
                     break
                 else:
-                    nRPhi0 += <long>Cceil(DPhiMinMax*R0[jj0]/dRPhi)
+                    nRPhi0 += <long>NRPhiAll[0, jj0]
                     NRPhi0[ii] = nRPhi0
             # Get indices of phi
             # Get the extreme indices of the mesh elements that really need to
@@ -1437,7 +1463,7 @@ def _Ves_Smesh_Tor_SubFromD_cython(double dL, double dRPhi,
         # Finish counting to get total number of points
         if jj0<=NR0-1:
             for jj0 in range(indR0ii,NR0):
-                nRPhi0 += <long>Cceil(DPhiMinMax*R0[jj0]/dRPhi)
+                nRPhi0 += <long>NRPhiAll[0, jj0]
 
         # Compute Pts, dV and ind
         Pts = np.nan*np.ones((3,NP))
@@ -1581,6 +1607,55 @@ def _Ves_Smesh_Tor_SubFromInd_cython(double dL, double dRPhi,
 ########################################################
 
 
+def _Ves_Smesh_TorStruct_faces(double[:,::1] VPoly, double dL,
+                               list DR=None, list DZ=None,
+                               double margin=_VSMALL):
+    """ Return the (R,Z) sample of the faces of a toroidally limited Struct
+
+    The bounding box of VPoly is discretized (resolution dL, limits DR, DZ)
+    and only the pts inside VPoly are kept. Shared by
+    _Ves_Smesh_TorStruct_SubFromD_cython() and the sampling of several
+    Struct at once
+    Return the (2, N) pts, their (N,) indices and surfaces, the number of
+    indices of a face (NR0*NZ0) and the actual resolutions dR0r, dZ0r
+    """
+    cdef double dR0r, dZ0r
+    cdef int NR0, NZ0, R0n, Z0n
+    cdef np.ndarray[double, ndim=1] R0, Z0
+    cdef np.ndarray[long,ndim=1] indR0, indZ0, iind
+    cdef np.ndarray[double,ndim=2] ptsrz
+    R0, dR0r, indR0,\
+      NR0 = discretize_line1d(np.array([np.min(VPoly[0,:]),
+                                        np.max(VPoly[0,:])]),
+                              dL, DL=DR, Lim=True, margin=margin)
+    Z0, dZ0r, indZ0,\
+      NZ0 = discretize_line1d(np.array([np.min(VPoly[1,:]),
+                                        np.max(VPoly[1,:])]),
+                              dL, DL=DZ, Lim=True, margin=margin)
+    R0n, Z0n = len(R0), len(Z0)
+    ptsrz = np.array([np.tile(R0,Z0n),np.repeat(Z0,R0n)])
+    iind = NR0*np.repeat(indZ0,R0n) + np.tile(indR0,Z0n)
+    indin = Path(np.asarray(VPoly).T).contains_points(ptsrz.T,
+                                                      transform=None,
+                                                      radius=0.0)
+    return ptsrz[:,indin], iind[indin], dR0r*dZ0r*np.ones((indin.sum(),)),\
+      NR0*NZ0, dR0r, dZ0r
+
+
+def _Ves_Smesh_TorStruct_face_pts(np.ndarray[double,ndim=2] ptsrz,
+                                  double phi, str Out='(X,Y,Z)'):
+    """ Return the (3, N) pts of a face, i.e.: the (R,Z) pts ptsrz (cf.
+    _Ves_Smesh_TorStruct_faces()) at toroidal angle phi
+    """
+    if Out.lower()=='(x,y,z)':
+        return np.array([ptsrz[0,:]*Ccos(phi),
+                         ptsrz[0,:]*Csin(phi),
+                         ptsrz[1,:]])
+    return np.array([ptsrz[0,:],
+                     ptsrz[1,:],
+                     phi*np.ones((ptsrz.shape[1],))])
+
+
 @cython.cdivision(True)
 @cython.wraparound(False)
 @cython.boundscheck(False)
@@ -1597,14 +1672,15 @@ def _Ves_Smesh_TorStruct_SubFromD_cython(double[::1] PhiMinMax, double dL,
     for the desired resolution (dR,dZ,dRphi)
     """
     cdef double Dphi, dR0r=0., dZ0r=0.
-    cdef int NR0=0, NZ0=0, R0n, Z0n, NRPhi0
+    cdef int NRPhi0
+    cdef long NRZ0=0
     cdef double[::1] phiMinMax = np.array([Catan2(Csin(PhiMinMax[0]),
                                                   Ccos(PhiMinMax[0])),
                                            Catan2(Csin(PhiMinMax[1]),
                                                   Ccos(PhiMinMax[1]))])
-    cdef np.ndarray[double, ndim=1] R0, Z0, dsF, dSM, dLr, Rref, dRPhir, dS
-    cdef np.ndarray[long,ndim=1] indR0, indZ0, iind, iindF, indM, NL, ind
-    cdef np.ndarray[double,ndim=2] ptsrz, pts, PtsM, VPbis, Pts
+    cdef np.ndarray[double, ndim=1] dsF, dSM, dLr, Rref, dRPhir, dS
+    cdef np.ndarray[long,ndim=1] iindF, indM, NL, ind
+    cdef np.ndarray[double,ndim=2] ptsrz, PtsM, VPbis, Pts
     cdef list LPts=[], LdS=[], Lind=[]
 
     # Pre-format input
@@ -1646,36 +1722,15 @@ def _Ves_Smesh_TorStruct_SubFromD_cython(double[::1] PhiMinMax, double dL,
 
         # Get the mesh for the faces
         if any(Faces) :
-            R0, dR0r, indR0,\
-              NR0 = discretize_line1d(np.array([np.min(VPoly[0,:]),
-                                                       np.max(VPoly[0,:])]),
-                                             dL, DL=DR, Lim=True, margin=margin)
-            Z0, dZ0r, indZ0,\
-              NZ0 = discretize_line1d(np.array([np.min(VPoly[1,:]),
-                                                       np.max(VPoly[1,:])]),
-                                             dL, DL=DZ, Lim=True, margin=margin)
-            R0n, Z0n = len(R0), len(Z0)
-            ptsrz = np.array([np.tile(R0,Z0n),np.repeat(Z0,R0n)])
-            iind = NR0*np.repeat(indZ0,R0n) + np.tile(indR0,Z0n)
-            indin = Path(VPoly.T).contains_points(ptsrz.T, transform=None,
-                                                  radius=0.0)
-            if np.any(indin):
-                ptsrz = ptsrz[:,indin] if indin.sum()>1 \
-                  else ptsrz[:,indin].reshape((2,1))
-                iindF = iind[indin]
-                dsF = dR0r*dZ0r*np.ones((indin.sum(),))
+            ptsrz, iindF, dsF,\
+              NRZ0, dR0r, dZ0r = _Ves_Smesh_TorStruct_faces(VPoly, dL,
+                                                            DR=DR, DZ=DZ,
+                                                            margin=margin)
 
         # First face
         if Faces[0]:
-            if Out.lower()=='(x,y,z)':
-                pts = np.array([ptsrz[0,:]*Ccos(phiMinMax[0]+Dphi),
-                                ptsrz[0,:]*Csin(phiMinMax[0]+Dphi),
-                                ptsrz[1,:]])
-            else:
-                pts = np.array([ptsrz[0,:],
-                                ptsrz[1,:],
-                                (phiMinMax[0]+Dphi)*np.ones((indin.sum(),))])
-            LPts.append( pts )
+            LPts.append( _Ves_Smesh_TorStruct_face_pts(
+                ptsrz, phiMinMax[0]+Dphi, Out=Out) )
             Lind.append( iindF )
             LdS.append( dsF )
 
@@ -1696,21 +1751,14 @@ def _Ves_Smesh_TorStruct_SubFromD_cython(double[::1] PhiMinMax, double dL,
                 LPts.append(PtsM.reshape((3,1)))
             else:
                 LPts.append(PtsM)
-            Lind.append( indM + NR0*NZ0 )
+            Lind.append( indM + NRZ0 )
             LdS.append( dSM )
 
         # Second face
         if Faces[1]:
-            if Out.lower()=='(x,y,z)':
-                pts = np.array([ptsrz[0,:]*Ccos(phiMinMax[1]-Dphi),
-                                ptsrz[0,:]*Csin(phiMinMax[1]-Dphi),
-                                ptsrz[1,:]])
-            else:
-                pts = np.array([ptsrz[0,:],
-                                ptsrz[1,:],
-                                (phiMinMax[1]-Dphi)*np.ones((indin.sum(),))])
-            LPts.append( pts )
-            Lind.append( iindF + NR0*NZ0 + nRPhi0 )
+            LPts.append( _Ves_Smesh_TorStruct_face_pts(
+                ptsrz, phiMinMax[1]-Dphi, Out=Out) )
+            Lind.append( iindF + NRZ0 + nRPhi0 )
             LdS.append( dsF )
 
         # Aggregate
@@ -2046,6 +2094,60 @@ def _Ves_Smesh_Lin_SubFromInd_cython(double[::1] XMinMax, double dL, double dX,
 
 
 
+@cython.cdivision(True)
+@cython.wraparound(False)
+@cython.boundscheck(False)
+def _Ves_Smesh_Tor_rows_cython(double[::1] rr, double[::1] zz,
+                               double[::1] rref, double[::1] dLr,
+                               double[::1] phi0, double[::1] dphi,
+                               long[::1] nphi, long[::1] ind0,
+                               str Out='(X,Y,Z)', int num_threads=16):
+    """ Return the surfacic sample of toroidal rows, computed in parallel
+
+    Each row is a point (rr, zz) of a discretized cross-section, repeated
+    nphi times toroidally from phi0 with step dphi (i.e.: the main body of
+    _Ves_Smesh_Tor_SubFromD_cython() without limits DR, DZ, DPhi). Rows of
+    several structures / toroidal occurrences can be stacked in a single
+    call, each sample gets index ind0[row] + (toroidal index), and the
+    surface dLr[row] * dphi[row] * rref[row]
+    Return the pts (3, N), dS (N,) and ind (N,) of all rows, in row order
+    """
+    cdef int nrows = rr.shape[0]
+    cdef int ii, kk
+    cdef long jj
+    cdef double phi, ds
+    cdef bint xyz = Out.lower() == '(x,y,z)'
+    cdef np.ndarray[long, ndim=1] offs = np.zeros((nrows + 1,), dtype=int)
+    offs[1:] = np.cumsum(nphi)
+    cdef long[::1] offs_view = offs
+    cdef long NP = offs[nrows]
+    cdef np.ndarray[double, ndim=2] pts = np.empty((3, NP))
+    cdef np.ndarray[double, ndim=1] dS = np.empty((NP,))
+    cdef np.ndarray[long, ndim=1] ind = np.empty((NP,), dtype=int)
+    cdef double[:, ::1] pts_view = pts
+    cdef double[::1] dS_view = dS
+    cdef long[::1] ind_view = ind
+
+    with nogil:
+        for ii in prange(nrows, num_threads=num_threads, schedule='dynamic'):
+            ds = dLr[ii]*(dphi[ii]*rref[ii])
+            for kk in range(nphi[ii]):
+                jj = offs_view[ii] + kk
+                phi = phi0[ii] + (0.5 + kk)*dphi[ii]
+                if xyz:
+                    pts_view[0, jj] = rr[ii]*Ccos(phi)
+                    pts_view[1, jj] = rr[ii]*Csin(phi)
+                    pts_view[2, jj] = zz[ii]
+                else:
+                    pts_view[0, jj] = rr[ii]
+                    pts_view[1, jj] = zz[ii]
+                    pts_view[2, jj] = phi
+                dS_view[jj] = ds
+                ind_view[jj] = ind0[ii] + kk
+    return pts, dS, ind
+
+
+
 
 """
 ########################################################
@@ -2087,7 +2189,8 @@ def LOS_Calc_PInOut_VesStruct(double[:, ::1] ray_orig,
                               double eps_uz=_SMALL, double eps_a=_VSMALL,
                               double eps_vz=_VSMALL, double eps_b=_VSMALL,
                               double eps_plane=_VSMALL, str ves_type='Tor',
-                              bint forbid=1, bint test=1, int num_threads=16):
+                              bint forbid=1, bint test=1, int num_threads=16,
+                              dict dbvh=None):
     """
     Computes the entry and exit point of all provided LOS for the provided
     vessel polygon (toroidal or linear) with its associated structures.
@@ -2132,6 +2235,10 @@ def LOS_Calc_PInOut_VesStruct(double[:, ::1] ray_orig,
        The num_threads argument indicates how many threads the team should
        consist of. If not given, OpenMP will decide how many threads to use.
        Typically this is the number of cores available on the machine.
+    dbvh : None / dict
+       Bounding boxes of the structures and their hierarchy, as returned by
+       LOS_get_struct_bvh() for the same structures (toroidal case only).
+       If None, it is computed on the fly.
     Returns
     ======
     coeff_inter_in : (nlos) array
@@ -2237,13 +2344,198 @@ def LOS_Calc_PInOut_VesStruct(double[:, ::1] ray_orig,
                           eps_plane, vt_lower,
                           forbid, num_threads,
                           coeff_inter_out, coeff_inter_in, vperp_out,
-                          ind_inter_out)
+                          ind_inter_out, dbvh)
     return np.asarray(coeff_inter_in), np.asarray(coeff_inter_out),\
            np.transpose(np.asarray(vperp_out).reshape(nlos,3)),\
            np.transpose(np.asarray(ind_inter_out,
                                    dtype=int).reshape(nlos, 3))
 
 
+def LOS_get_struct_bvh(long[::1] lstruct_nlim,
+                       double[::1] lstruct_polyx,
+                       double[::1] lstruct_polyy,
+                       list lstruct_lims,
+                       long[::1] lnvert,
+                       int nstruct_tot,
+                       int nstruct_lim,
+                       str ves_type='Tor'):
+    """
+    Computes the bounding boxes of the (limited) structures and the bounding
+    volume hierarchy (BVH) used to skip quickly the structures a LOS cannot
+    hit in LOS_Calc_PInOut_VesStruct().
+    It only depends on the structures, so it can be computed once and
+    re-used (dbvh keyword argument) for any number of calls and of LOS.
+
+    Params
+    ======
+    See LOS_Calc_PInOut_VesStruct
+
+    Returns
+    ======
+    dbvh : None / dict
+       The bounding boxes and their hierarchy (None if there is no structure
+       or if ves_type is 'Lin', where no BVH is used)
+    """
+    if ves_type.lower() != 'tor' or nstruct_tot == 0:
+        return None
+    return _rt.comp_struct_bvh_tor(lstruct_nlim, lstruct_polyx, lstruct_polyy,
+                                   lstruct_lims, lnvert,
+                                   nstruct_tot, nstruct_lim)
+
+
+def LOS_Calc_Reflections_VesStruct(double[:, ::1] ray_orig,
+                                   double[:, ::1] ray_vdir,
+                                   double[::1] coeff_out,
+                                   double[:, ::1] vperp,
+                                   long[:, ::1] ind_out,
+                                   double[:, ::1] ves_poly,
+                                   double[:, ::1] ves_norm,
+                                   long[::1] ltypes,
+                                   long[::1] ltypes_ind,
+                                   long[::1] lind_struct=None,
+                                   int nb=1,
+                                   int rtype=-1,
+                                   seed=None,
+                                   long[::1] lstruct_nlim=None,
+                                   double[::1] ves_lims=None,
+                                   double[::1] lstruct_polyx=None,
+                                   double[::1] lstruct_polyy=None,
+                                   list lstruct_lims=None,
+                                   double[::1] lstruct_normx=None,
+                                   double[::1] lstruct_normy=None,
+                                   long[::1] lnvert=None,
+                                   int nstruct_tot=0,
+                                   int nstruct_lim=0,
+                                   double rmin=-1,
+                                   double eps_uz=_SMALL, double eps_a=_VSMALL,
+                                   double eps_vz=_VSMALL, double eps_b=_VSMALL,
+                                   double eps_plane=_VSMALL, str ves_type='Tor',
+                                   bint forbid=1, bint test=1,
+                                   int num_threads=16,
+                                   dict dbvh=None):
+    """
+    Computes nb successive reflections of all provided LOS on the vessel and
+    its associated structures (toroidal case only), starting from their first
+    impact as returned by LOS_Calc_PInOut_VesStruct().
+    All reflections are computed natively, each of them being parallelized
+    over the LOS.
+
+    Params
+    ======
+    ray_orig, ray_vdir : (3, nlos) double arrays
+       LOS origin points coordinates and normalized direction vectors
+    coeff_out : (nlos) double array
+       kout of the LOS (first impact)
+    vperp : (3, nlos) double array
+       Normal vector at the first impact
+    ind_out : (3, nlos) long array
+       Index of the first impact (structure, sub-structure, segment), with
+       the structure index referring to ltypes_ind
+    ves_poly, ves_norm :
+       See LOS_Calc_PInOut_VesStruct
+    ltypes : (ntypes,) long array
+       Flattened types of reflection of each segment of each structure
+       (0: specular, 1: diffusive, 2: ccube), ltypes_ind[ii]:ltypes_ind[ii+1]
+       being the types of the segments of structure ii (negative segment
+       indices are counted from the end, as for numpy arrays)
+    ltypes_ind : (nstruct+1,) long array
+       Index of the first type of each structure in ltypes
+    lind_struct : None / (nstruct_lim+1,) long array
+       Index of the vessel (0) and of each structure (1+ii) for the
+       raytracer in ltypes_ind. If None, identity.
+    nb : int
+       Number of successive reflections
+    rtype : int
+       If >= 0, type of reflection forced for all LOS and impacts
+    seed : None / int
+       Seed used for the diffusive reflections (for reproducibility). Each
+       (LOS, reflection) has its own draw, independent of num_threads.
+       If None, a seed is drawn from numpy.random.
+    others :
+       See LOS_Calc_PInOut_VesStruct
+    Returns
+    ======
+    ds : (3, nlos, nb) array
+       Origins of the reflected LOS
+    us : (3, nlos, nb) array
+       Normalized direction vectors of the reflected LOS
+    kouts : (nlos, nb) array
+       kout of the reflected LOS
+    vperps : (3, nlos, nb) array
+       Normal vector at the impact of the reflected LOS
+    indouts : (3, nlos, nb) array
+       Index of the impact of the reflected LOS (see ind_out)
+    types : (nlos, nb) array
+       Type of each reflection
+    """
+    cdef str error_message
+    cdef int nlos = ray_orig.shape[1]
+    cdef int npts_poly = ves_norm.shape[1]
+    cdef int sz_ves_lims
+    cdef double min_poly_r
+    cdef unsigned long long useed
+    cdef np.ndarray[double, ndim=3] ds
+    cdef np.ndarray[double, ndim=3] us
+    cdef np.ndarray[double, ndim=2] kouts
+    cdef np.ndarray[double, ndim=3] vperps
+    cdef np.ndarray[int, ndim=3] indouts
+    cdef np.ndarray[int, ndim=2] types
+    # == Testing inputs ========================================================
+    if test:
+        error_message = "Reflections are only implemented for ves_type='Tor'!"
+        assert ves_type.lower() == 'tor', error_message
+        error_message = "ray_orig, ray_vdir, vperp, ind_out must be (3, nlos)!"
+        assert (tuple(ray_orig.shape) == tuple(ray_vdir.shape)
+                == tuple(vperp.shape) == tuple(ind_out.shape)
+                and ray_orig.shape[0] == 3
+                and coeff_out.shape[0] == nlos), error_message
+        error_message = "nb must be a strictly positive int!"
+        assert nb > 0, error_message
+        error_message = "rtype must be -1 (not forced), 0, 1 or 2!"
+        assert -1 <= rtype <= 2, error_message
+        error_message = "ltypes_ind must be increasing, ending with ltypes.size"
+        assert (ltypes_ind[ltypes_ind.shape[0]-1] == ltypes.shape[0]
+                and np.all(np.diff(ltypes_ind) > 0)), error_message
+    # ==========================================================================
+    if lind_struct is None:
+        lind_struct = np.arange(0, nstruct_lim + 1)
+    if seed is None:
+        seed = np.random.randint(np.iinfo(np.int64).max)
+    useed = seed
+    sz_ves_lims = np.size(ves_lims)
+    min_poly_r = _bgt.comp_min(ves_poly[0, ...], npts_poly-1)
+    ds = np.empty((nlos, nb, 3), dtype=float)
+    us = np.empty((nlos, nb, 3), dtype=float)
+    kouts = np.empty((nlos, nb), dtype=float)
+    vperps = np.empty((nlos, nb, 3), dtype=float)
+    indouts = np.empty((nlos, nb, 3), dtype=np.intc)
+    types = np.empty((nlos, nb), dtype=np.intc)
+    _rt.compute_reflections_tor(nlos, nb, npts_poly,
+                                np.ascontiguousarray(np.asarray(ray_orig).T),
+                                np.ascontiguousarray(np.asarray(ray_vdir).T),
+                                coeff_out,
+                                np.ascontiguousarray(np.asarray(vperp).T),
+                                np.ascontiguousarray(np.asarray(ind_out).T),
+                                ltypes, ltypes_ind, lind_struct,
+                                rtype, useed,
+                                ves_poly, ves_norm,
+                                lstruct_nlim, ves_lims,
+                                lstruct_polyx, lstruct_polyy,
+                                lstruct_lims, lstruct_normx,
+                                lstruct_normy, lnvert,
+                                nstruct_tot, nstruct_lim,
+                                sz_ves_lims, min_poly_r, rmin,
+                                eps_uz, eps_a, eps_vz, eps_b, eps_plane,
+                                forbid, num_threads,
+                                ds, us, kouts, vperps, indouts, types, dbvh)
+    return (np.ascontiguousarray(np.moveaxis(ds, -1, 0)),
+            np.ascontiguousarray(np.moveaxis(us, -1, 0)),
+            kouts,
+            np.ascontiguousarray(np.moveaxis(vperps, -1, 0)),
+            np.ascontiguousarray(np.moveaxis(indouts, -1, 0), dtype=int),
+            types.astype(int))
+
+
 # =============================================================================
 # = Ray tracing when we only want kMin / kMax
 # -   (useful when working with flux surfaces)
@@ -2448,7 +2740,8 @@ def LOS_areVis_PtsFromPts_VesStruct(np.ndarray[double, ndim=2,mode='c'] pts1,
                                     str ves_type='tor',
                                     bint forbid=True,
                                     bint test=True,
-                                    int num_threads=16):
+                                    int num_threads=16,
+                                    dict dbvh=None):
     """
     Return an array of booleans indicating whether each point in pts is
     visible from the point P = [pt0, pt1, pt2] considering vignetting a given
@@ -2456,6 +2749,8 @@ def LOS_areVis_PtsFromPts_VesStruct(np.ndarray[double, ndim=2,mode='c'] pts1,
         `k` optional argument : distance between points and P
         ray_orig = np.tile(np.r_[pt0,pt1,pt2], (npts,1)).T
         ray_vdir = (pts-ray_orig)/k
+        `dbvh` optional argument : bounding boxes of the structures and their
+            hierarchy, as returned by LOS_get_struct_bvh() (computed if None)
     """
     cdef str msg
     cdef int npts1=pts1.shape[1]
@@ -2494,7 +2789,7 @@ def LOS_areVis_PtsFromPts_VesStruct(np.ndarray[double, ndim=2,mode='c'] pts1,
                             lnvert, nstruct_tot, nstruct_lim,
                             rmin, eps_uz, eps_a, eps_vz, eps_b,
                             eps_plane, ves_type.lower(),
-                            forbid, test, num_threads)
+                            forbid, test, num_threads, dbvh)
     return ind
 
 
@@ -2519,7 +2814,8 @@ def LOS_isVis_PtFromPts_VesStruct(double pt0, double pt1, double pt2,
                                   double eps_plane=_VSMALL, str ves_type='Tor',
                                   bint forbid=True,
                                   bint test=True,
-                                  int num_threads=16):
+                                  int num_threads=16,
+                                  dict dbvh=None):
     """
     Return an array of booleans indicating whether each point in pts is
     visible from the point P = [pt0, pt1, pt2] considering vignetting a given
@@ -2527,6 +2823,8 @@ def LOS_isVis_PtFromPts_VesStruct(double pt0, double pt1, double pt2,
         `k` optional argument : distance between points and P
         ray_orig = np.tile(np.r_[pt0,pt1,pt2], (npts,1)).T
         ray_vdir = (pts-ray_orig)/k
+        `dbvh` optional argument : bounding boxes of the structures and their
+            hierarchy, as returned by LOS_get_struct_bvh() (computed if None)
     """
     cdef str msg
     cdef int npts=pts.shape[1]
@@ -2564,9 +2862,146 @@ def LOS_isVis_PtFromPts_VesStruct(double pt0, double pt1, double pt2,
                           lnvert, nstruct_tot, nstruct_lim,
                           rmin, eps_uz, eps_a, eps_vz, eps_b,
                           eps_plane, ves_type.lower(),
-                          forbid, test, num_threads)
+                          forbid, test, num_threads, dbvh)
     return ind
 
+# ==============================================================================
+#
+#                           TRIANGULAR MESHES
+#
+# ==============================================================================
+def Tri_get_locator(nodes, faces, double cells_per_face=1.):
+    """ Return a uniform-grid locator of the triangles of a 2d mesh
+
+    The bounding box of the mesh is split in a uniform grid of about
+    cells_per_face * nfaces cells, each holding the list of the faces whose
+    bounding box intersects it (stored as in a csr sparse matrix: the faces
+    of cell ii are cell_faces[cell_start[ii]:cell_start[ii+1]]).
+    The barycentric coefficients of all faces are pre-computed.
+
+    Params
+    ======
+    nodes : (nnodes, 2) array of (R, Z) coordinates of the nodes
+    faces : (nfaces, 3) array of the indices of the nodes of each face
+    cells_per_face : float
+        Average number of grid cells per face
+
+    Return
+    ======
+    dlocator : dict
+        To be passed to Tri_locate_pts()
+    """
+    nodes = np.ascontiguousarray(nodes, dtype=float)
+    faces = np.ascontiguousarray(faces, dtype=int)
+    nfaces = faces.shape[0]
+    xx, yy = nodes[faces, 0], nodes[faces, 1]
+
+    # Uniform grid over the bounding box
+    bbox = np.r_[xx.min(), xx.max(), yy.min(), yy.max()]
+    dR = max(bbox[1] - bbox[0], _VSMALL)
+    dZ = max(bbox[3] - bbox[2], _VSMALL)
+    ncells = max(1., cells_per_face*nfaces)
+    nR = int(max(1, min(ncells, Cceil(Csqrt(ncells*dR/dZ)))))
+    nZ = int(max(1, Cceil(ncells/nR)))
+    coefRZ = np.r_[nR/dR, nZ/dZ]
+
+    # Cells intersected by the bounding box of each face
+    i0 = np.clip(((xx.min(axis=1) - bbox[0])*coefRZ[0]).astype(int), 0, nR-1)
+    i1 = np.clip(((xx.max(axis=1) - bbox[0])*coefRZ[0]).astype(int), 0, nR-1)
+    j0 = np.clip(((yy.min(axis=1) - bbox[2])*coefRZ[1]).astype(int), 0, nZ-1)
+    j1 = np.clip(((yy.max(axis=1) - bbox[2])*coefRZ[1]).astype(int), 0, nZ-1)
+    nj = j1 - j0 + 1
+    nc = (i1 - i0 + 1)*nj
+    face = np.repeat(np.arange(0, nfaces), nc)
+    loc = np.arange(0, face.size) - np.repeat(np.cumsum(nc) - nc, nc)
+    cell = (i0[face] + loc // nj[face])*nZ + j0[face] + loc % nj[face]
+    cell_faces = np.ascontiguousarray(face[np.argsort(cell, kind='stable')])
+    cell_start = np.r_[0, np.cumsum(np.bincount(cell, minlength=nR*nZ))]
+
+    # Barycentric coefficients: (x2, y2, a0, b0, a1, b1) such that
+    # l0 = a0*(r - x2) + b0*(z - y2), l1 = a1*(r - x2) + b1*(z - y2)
+    det = ((yy[:, 1] - yy[:, 2])*(xx[:, 0] - xx[:, 2])
+           + (xx[:, 2] - xx[:, 1])*(yy[:, 0] - yy[:, 2]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coefs = np.array([xx[:, 2], yy[:, 2],
+                          (yy[:, 1] - yy[:, 2])/det,
+                          (xx[:, 2] - xx[:, 1])/det,
+                          (yy[:, 2] - yy[:, 0])/det,
+                          (xx[:, 0] - xx[:, 2])/det]).T
+    return {'bbox': bbox, 'shape': np.r_[nR, nZ], 'coefRZ': coefRZ,
+            'cell_start': cell_start.astype(int),
+            'cell_faces': cell_faces.astype(int),
+            'coefs': np.ascontiguousarray(coefs)}
+
+
+cdef inline long _tri_locate_pt(double r, double z,
+                                double[::1] bbox, double[::1] coefRZ,
+                                long nR, long nZ,
+                                long[::1] cell_start, long[::1] cell_faces,
+                                double[:, ::1] coefs, double eps) nogil:
+    cdef long ii, jj, kk, ff
+    cdef double dr, dz, l0, l1
+    # also excludes nan
+    if not (r >= bbox[0] and r <= bbox[1] and z >= bbox[2] and z <= bbox[3]):
+        return -1
+    ii = <long>((r - bbox[0])*coefRZ[0])
+    jj = <long>((z - bbox[2])*coefRZ[1])
+    if ii > nR - 1:
+        ii = nR - 1
+    if jj > nZ - 1:
+        jj = nZ - 1
+    for kk in range(cell_start[ii*nZ + jj], cell_start[ii*nZ + jj + 1]):
+        ff = cell_faces[kk]
+        dr = r - coefs[ff, 0]
+        dz = z - coefs[ff, 1]
+        l0 = coefs[ff, 2]*dr + coefs[ff, 3]*dz
+        l1 = coefs[ff, 4]*dr + coefs[ff, 5]*dz
+        if l0 >= -eps and l1 >= -eps and 1. - l0 - l1 >= -eps:
+            return ff
+    return -1
+
+
+def Tri_locate_pts(r, z, dict dlocator, double eps=1.e-10,
+                   int num_threads=16):
+    """ Return the index of the triangle containing each point (r, z)
+
+    Uses the uniform-grid locator returned by Tri_get_locator(), the points
+    are handled in parallel.
+    Same convention as matplotlib's TriFinder: -1 for points outside of
+    the mesh (and for nan points).
+
+    Params
+    ======
+    r, z : array-like
+        Coordinates of the points (flattened)
+    dlocator : dict
+        Locator returned by Tri_get_locator()
+    eps : double
+        Tolerance on the barycentric coordinates (pts on edges)
+    num_threads : int
+        Number of threads
+    """
+    cdef double[::1] rr = np.ascontiguousarray(r, dtype=float).ravel()
+    cdef double[::1] zz = np.ascontiguousarray(z, dtype=float).ravel()
+    cdef double[::1] bbox = dlocator['bbox']
+    cdef double[::1] coefRZ = dlocator['coefRZ']
+    cdef long nR = dlocator['shape'][0]
+    cdef long nZ = dlocator['shape'][1]
+    cdef long[::1] cell_start = dlocator['cell_start']
+    cdef long[::1] cell_faces = dlocator['cell_faces']
+    cdef double[:, ::1] coefs = dlocator['coefs']
+    cdef int npts = rr.shape[0]
+    cdef int ii
+    cdef np.ndarray[long, ndim=1] ind = np.empty((npts,), dtype=int)
+    cdef long[::1] ind_view = ind
+    with nogil:
+        for ii in prange(npts, num_threads=num_threads):
+            ind_view[ii] = _tri_locate_pt(rr[ii], zz[ii], bbox, coefRZ,
+                                          nR, nZ, cell_start, cell_faces,
+                                          coefs, eps)
+    return ind
+
+
 # ==============================================================================
 #
 #                                 VIGNETTING
@@ -2801,10 +3236,363 @@ def integrate1d(y, double dx, t=None, str method='sum'):
     return s
 
 
+class SamplingPlan(object):
+    """ Pre-computed sampling of a set of LOS, re-usable by LOS_calc_signal
+
+    Built by LOS_get_sampling_plan(), it stores everything LOS_calc_signal
+    needs to call func and integrate, so that the LOS discretization is not
+    re-computed at each call.
+
+    Attributes
+    ==========
+    pts: ndarray (3, npts)
+        coordinates (X, Y, Z) of the sampled points of all LOS
+    vect: None or ndarray (3, npts)
+        for anisotropic emissivities, the unit vectors of the emission
+        directions at each point (i.e.: -ray_vdir), else None
+    reseff: ndarray (nlos,)
+        effective resolution (absolute) of each LOS
+    los_ind: ndarray (nlos+1,)
+        points of LOS ii are pts[:, los_ind[ii]:los_ind[ii+1]]
+    method: str
+        quadrature method the LOS were sampled for ('sum', 'simps', 'romb')
+    """
+
+    def __init__(self, pts, reseff, los_ind, method='sum', vect=None):
+        self.pts = pts
+        self.vect = vect
+        self.reseff = reseff
+        self.los_ind = los_ind
+        self.method = method
+
+    @property
+    def nlos(self):
+        return self.reseff.size
+
+    @property
+    def npts(self):
+        return self.pts.shape[1]
+
+    @property
+    def ind(self):
+        """ Indices where to split the points of each LOS (cf. np.split) """
+        return self.los_ind[1:-1]
+
+    @property
+    def nbytes(self):
+        nbytes = self.pts.nbytes + self.reseff.nbytes + self.los_ind.nbytes
+        if self.vect is not None:
+            nbytes += self.vect.nbytes
+        return nbytes
+
+
+cdef tuple _los_sample_block(double[:,::1] ray_orig,
+                             double[:,::1] ray_vdir,
+                             double[:,::1] lims,
+                             double[::1] res_arr,
+                             int n_dmode, int n_imode,
+                             bint ani, int num_threads):
+    """ Sample a block of LOS
+
+    Utility function for LOS_calc_signal and LOS_get_sampling_plan
+    Returns the points, the emission directions (None if not ani), the
+    effective resolutions and the (nlos+1,) offsets of each LOS
+    """
+    cdef int nlos = ray_orig.shape[1]
+    cdef long sz_coeff
+    cdef double[:,::1] pts_mv
+    cdef double[:,::1] usbis_mv
+    cdef np.ndarray[double,ndim=2] pts
+    cdef np.ndarray[double,ndim=2] usbis = None
+    cdef np.ndarray[double,ndim=1] reseffs
+    cdef np.ndarray[long,ndim=1] indbis
+    cdef long* ind_arr = NULL
+    cdef double* reseff_arr = NULL
+    cdef double** coeff_ptr = NULL
+    # .. we sample lines of sight ..............................................
+    coeff_ptr = <double**>malloc(sizeof(double*))
+    coeff_ptr[0] = NULL
+    reseff_arr = <double*>malloc(nlos*sizeof(double))
+    ind_arr = <long*>malloc(nlos*sizeof(long))
+    _st.los_get_sample_core_var_res(nlos,
+                                    &lims[0, 0],
+                                    &lims[1, 0],
+                                    n_dmode, n_imode,
+                                    &res_arr[0],
+                                    &coeff_ptr[0],
+                                    &reseff_arr[0],
+                                    &ind_arr[0],
+                                    num_threads)
+    sz_coeff = ind_arr[nlos-1]
+    pts = np.empty((3, sz_coeff))
+    pts_mv = pts
+    if ani:
+        usbis = np.empty((3, sz_coeff))
+        usbis_mv = usbis
+        _st.los_get_sample_pts(nlos,
+                               &pts_mv[0,0], &pts_mv[1,0], &pts_mv[2,0],
+                               &usbis_mv[0,0], &usbis_mv[1,0], &usbis_mv[2,0],
+                               ray_orig, ray_vdir,
+                               coeff_ptr[0], ind_arr, num_threads)
+        # emission direction is opposite to the LOS direction
+        np.negative(usbis, out=usbis)
+    else:
+        _st.los_get_sample_pts(nlos,
+                               &pts_mv[0,0], &pts_mv[1,0], &pts_mv[2,0],
+                               NULL, NULL, NULL,
+                               ray_orig, ray_vdir,
+                               coeff_ptr[0], ind_arr, num_threads)
+    reseffs = np.copy(np.asarray(<double[:nlos]>reseff_arr))
+    indbis = np.r_[0, np.asarray(<long[:nlos]>ind_arr)].astype(int)
+    # Cleaning up...
+    free(coeff_ptr[0])
+    free(coeff_ptr)
+    free(reseff_arr)
+    free(ind_arr)
+    return pts, usbis, reseffs, indbis
+
+
+cdef np.ndarray[double, ndim=2] _los_integrate_block(val_2d,
+                                                    double[::1] reseffs,
+                                                    long[::1] indbis,
+                                                    int n_imode,
+                                                    int num_threads):
+    """ Integrate the (nt, npts) values sampled on a block of LOS
+
+    Utility function for LOS_calc_signal
+    Returns the (nt, nlos) signal of the block of LOS
+    """
+    cdef int nlos = reseffs.shape[0]
+    cdef int nt
+    cdef long npts = indbis[nlos]
+    cdef double[:,::1] val_mv
+    cdef double[:,::1] sig_mv
+    cdef np.ndarray[double,ndim=2] sig
+    # ...
+    if n_imode == 0:  # "sum" integration mode
+        sig = (np.add.reduceat(val_2d, np.asarray(indbis[:nlos]), axis=-1)
+               * np.asarray(reseffs)[None, :])
+    else:  # "simpson" or "romberg" integration modes, parallel over LOS
+        val_mv = np.ascontiguousarray(np.reshape(val_2d, (-1, npts)),
+                                      dtype=float)
+        nt = val_mv.shape[0]
+        sig = np.empty((nt, nlos), dtype=float)
+        sig_mv = sig
+        _st.los_integrate_values(nlos, nt, npts, n_imode,
+                                 &val_mv[0, 0], &indbis[0], &reseffs[0],
+                                 &sig_mv[0, 0], num_threads)
+    return sig
+
+
+cdef np.ndarray[double, ndim=2] _los_calc_signal_block(func,
+                                                      double[:,::1] ray_orig,
+                                                      double[:,::1] ray_vdir,
+                                                      double[:,::1] lims,
+                                                      double[::1] res_arr,
+                                                      int n_dmode, int n_imode,
+                                                      bint ani, t, fkwdargs,
+                                                      int num_threads):
+    """ Sample a block of LOS, call func once on all points and integrate
+
+    Utility function for LOS_calc_signal (minimize='calls' or 'chunks')
+    Returns the (nt, nlos) signal of the block of LOS
+    """
+    pts, vect, reseffs, indbis = _los_sample_block(ray_orig, ray_vdir,
+                                                   lims, res_arr,
+                                                   n_dmode, n_imode,
+                                                   ani, num_threads)
+    if ani:
+        val_2d = func(pts, t=t, vect=vect, **fkwdargs)
+    else:
+        val_2d = func(pts, t=t, **fkwdargs)
+    return _los_integrate_block(val_2d, reseffs, indbis, n_imode, num_threads)
+
+
+cdef np.ndarray[double, ndim=2] _los_sum_orders(double[:, :] sig,
+                                                double[:, ::1] coefs,
+                                                int num_threads):
+    """ Weighted sum of the signals of stacked reflection orders
+
+    Utility function for LOS_calc_signal
+    sig is (nt, norders*nlos), with the LOS of order kk in columns
+    kk*nlos:(kk+1)*nlos, returns the (nt, nlos) sum of coefs[kk, ii]*sig_kk
+    """
+    cdef int nt = sig.shape[0]
+    cdef int nord = coefs.shape[0]
+    cdef int nlos = sig.shape[1] // nord
+    cdef int ii, jj, kk
+    cdef np.ndarray[double, ndim=2, mode='fortran'] out
+    cdef double[::1, :] out_mv
+    # ...
+    out = np.zeros((nt, nlos), dtype=float, order='F')
+    out_mv = out
+    with nogil, parallel(num_threads=num_threads):
+        for ii in prange(nlos):
+            for kk in range(nord):
+                for jj in range(nt):
+                    out_mv[jj, ii] += coefs[kk, ii] * sig[jj, kk*nlos + ii]
+    return out
+
+
+def LOS_get_sampling_plan(double[:,::1] ray_orig, double[:,::1] ray_vdir, res,
+                          double[:,::1] lims, str dmethod='abs',
+                          str method='sum', bint ani=False,
+                          bint Test=True, int num_threads=16):
+    """ Sample all LOS once and return a SamplingPlan
+
+    The returned SamplingPlan can be passed to LOS_calc_signal (plan=...)
+    to compute signals for several emissivities / times without
+    re-discretizing the LOS.
+    Params
+    =====
+    ray_orig: ndarray (3, nlos) LOS origins
+    ray_vdir: ndarray (3, nlos) LOS directional vector
+    res: double or list of doubles
+        If res is a single double: discretization step for all LOS.
+        Else res should be a list of size nlos with the discretization
+        step for each nlos.
+    lims: (2, nlos) double array
+        For each nlos, it given the maximum and minimum limits of the ray
+    dmethod: string
+        type of discretization step: 'abs' for absolute or 'rel' for relative
+    method: string
+        method of quadrature on the LOS
+    ani : bool
+        to indicate if the emission directions should be stored as well
+    Test : bool
+        we test if the inputs are giving in a proper way.
+    num_threads: int
+        number of threads if we want to parallelize the code.
+    """
+    cdef str error_message
+    cdef str dmode = dmethod.lower()
+    cdef str imode = method.lower()
+    cdef int nlos = ray_orig.shape[1]
+    cdef np.ndarray[double,ndim=1] res_arr
+    # .. verifying arguments ...................................................
+    if Test:
+        assert ray_orig.shape[0] == 3, "Dim 0 of arg ray_orig should be 3"
+        assert ray_vdir.shape[0] == 3, "Dim 0 of arg ray_vdir should be 3"
+        assert lims.shape[0] == 2, "Dim 0 of arg lims should be 2"
+        error_message = ("Args ray_orig, ray_vdir, and lims "
+                         + "should have same dimension 1")
+        assert nlos == ray_vdir.shape[1] == lims.shape[1], error_message
+        error_message = "Argument dmethod (discretization method) should be in"\
+                        +" ['abs','rel'], for absolute or relative."
+        assert dmode in ['abs','rel'], error_message
+        error_message = "Wrong method of integration." \
+                        + " Options are: ['sum','simps','romb']"
+        assert imode in ['sum','simps','romb'], error_message
+    if hasattr(res, '__iter__'):
+        res_arr = np.ascontiguousarray(res, dtype=float)
+    else:
+        res_arr = np.full((nlos,), res, dtype=float)
+    if Test:
+        error_message = "Arg res must be a double or a List, and all res >0.!"
+        assert res_arr.size == nlos and np.all(res_arr > 0.), error_message
+    pts, vect, reseffs, indbis = _los_sample_block(ray_orig, ray_vdir,
+                                                   lims, res_arr,
+                                                   _st.get_nb_dmode(dmode),
+                                                   _st.get_nb_imode(imode),
+                                                   ani, num_threads)
+    return SamplingPlan(pts, reseffs, indbis, method=imode, vect=vect)
+
+
+def _los_calc_signal_adaptive(func, ray_orig, ray_vdir, lims, res_arr,
+                              bint res_rel, bint ani, t, fkwdargs,
+                              double rtol, double atol, int max_iter,
+                              long max_neval):
+    """ Integrate func along all LOS with an adaptive Simpson quadrature
+
+    Utility function for LOS_calc_signal (method='adaptive')
+    Each LOS is first split in intervals of length <= res, then each
+    interval [a, b] is refined (split in 2) until the difference between
+    the Simpson rules on [a, b] and on its 2 halves is below the tolerance
+    of the LOS (max(atol, rtol*|integral|)) times (b-a)/length, or until
+    max_iter refinements, or until the LOS has used max_neval evaluations.
+    The new points of all refined intervals of all LOS are evaluated in a
+    single call to func per refinement level.
+    Intervals with non-finite values are accepted as they are (the nan
+    propagates to the signal, as for fixed-step methods) and the tolerance
+    only uses the finite part of the integral
+    Returns the (nt, nlos) signal and the (nlos,) nb. of evaluations per LOS
+    """
+    nlos = lims.shape[1]
+    kmin, kmax = lims[0, :], lims[1, :]
+    length = kmax - kmin
+    res_abs = res_arr * length if res_rel else res_arr
+    nint = np.ones((nlos,), dtype=int)
+    indl = length > 0.
+    nint[indl] = np.ceil(length[indl] / res_abs[indl])
+    lengthbis = np.where(indl, length, 1.)
+
+    def _call(kpts, ilos):
+        pts = ray_orig[:, ilos] + kpts[None, :] * ray_vdir[:, ilos]
+        if ani:
+            val = func(pts, t=t, vect=-ray_vdir[:, ilos], **fkwdargs)
+        else:
+            val = func(pts, t=t, **fkwdargs)
+        return np.reshape(val, (-1, kpts.size))
+
+    # Initial intervals: edges, quarters and middles, in one call
+    los = np.repeat(np.arange(0, nlos), nint)
+    start = np.r_[0, np.cumsum(nint)[:-1]]
+    hh = (length / nint)[los]
+    aa = kmin[los] + (np.arange(0, los.size) - start[los]) * hh
+    kk = aa[None, :] + hh[None, :] * np.r_[0., 0.25, 0.5, 0.75, 1.][:, None]
+    val = _call(kk.ravel(), np.tile(los, 5))
+    nt = val.shape[0]
+    val = val.reshape((nt, 5, los.size))
+    fa, fl, fm, fr, fb = [val[:, ii, :] for ii in range(5)]
+    neval = 5 * nint
+
+    sig = np.zeros((nt, nlos), dtype=float)
+    sigfin = np.zeros((nt, nlos), dtype=float)
+    for it in range(0, max_iter + 1):
+        s1 = hh / 6. * (fa + 4.*fm + fb)
+        s2 = hh / 12. * (fa + 4.*fl + 2.*fm + 4.*fr + fb)
+        err = np.abs(s2 - s1) / 15.
+        # Current estimate of the (finite part of the) integral of each LOS
+        # => tolerance
+        s2fin = np.where(np.isfinite(s2), s2, 0.)
+        sest = sigfin + np.array([np.bincount(los, weights=s2fin[jj, :],
+                                              minlength=nlos)
+                                  for jj in range(nt)])
+        tol = np.maximum(atol, rtol * np.abs(sest))
+        tol = tol[:, los] * (hh / lengthbis[los])[None, :]
+        ok = (np.all((err <= tol) | ~np.isfinite(err), axis=0)
+              | (it == max_iter) | (neval[los] >= max_neval))
+        # Accepted intervals (with Richardson extrapolation)
+        acc = s2[:, ok] + (s2[:, ok] - s1[:, ok]) / 15.
+        accfin = np.where(np.isfinite(acc), acc, 0.)
+        for jj in range(nt):
+            sig[jj, :] += np.bincount(los[ok], weights=acc[jj, :],
+                                      minlength=nlos)
+            sigfin[jj, :] += np.bincount(los[ok], weights=accfin[jj, :],
+                                         minlength=nlos)
+        if np.all(ok):
+            break
+        # Refined intervals: [a, m] and [m, b], new points at quarters
+        ref = ~ok
+        los = np.r_[los[ref], los[ref]]
+        hh = np.r_[hh[ref], hh[ref]] / 2.
+        aa = np.r_[aa[ref], aa[ref] + hh[:hh.size//2]]
+        kk = aa[None, :] + hh[None, :] * np.r_[0.25, 0.75][:, None]
+        val = _call(kk.ravel(), np.tile(los, 2)).reshape((nt, 2, los.size))
+        fa, fl, fm, fr, fb = (np.c_[fa[:, ref], fm[:, ref]], val[:, 0, :],
+                              np.c_[fl[:, ref], fr[:, ref]], val[:, 1, :],
+                              np.c_[fm[:, ref], fb[:, ref]])
+        neval = neval + 2 * np.bincount(los, minlength=nlos)
+    return sig, neval
+
+
 def LOS_calc_signal(func, double[:,::1] ray_orig, double[:,::1] ray_vdir, res,
                     double[:,::1] lims, str dmethod='abs',
                     str method='sum', bint ani=False,
                     t=None, fkwdargs={}, str minimize='calls',
+                    max_bytes=1e8, plan=None, coefs_reflect=None,
+                    double rtol=1.e-3, double atol=0., int max_iter=20,
+                    long max_neval=100000, bint return_neval=False,
                     bint Test=True, int num_threads=16):
     """ Compute the synthetic signal, minimizing either function calls or memory
     Params
@@ -2827,7 +3615,12 @@ def LOS_calc_signal(func, double[:,::1] ray_orig, double[:,::1] ray_vdir, res,
     dmethod: string
         type of discretization step: 'abs' for absolute or 'rel' for relative
     method: string
-        method of quadrature on the LOS
+        method of quadrature on the LOS: 'sum', 'simps', 'romb' (fixed
+        step res) or 'adaptive': each LOS is split in intervals of length
+        <= res, which are refined (adaptive Simpson) until the estimated
+        error is below max(atol, rtol*|signal|) for each LOS (and time).
+        The points of all refined intervals of all LOS are evaluated in a
+        single call to func per refinement level (minimize is ignored).
     ani : bool
         to indicate if emission is anisotropic or not
     t : None or array-like
@@ -2836,6 +3629,36 @@ def LOS_calc_signal(func, double[:,::1] ray_orig, double[:,::1] ray_vdir, res,
         "calls" : we use algorithm to minimize the calls to 'func' (default)
         "memory": we use algorithm to minimize memory used
         "hybrid": a mix of both methods
+        "chunks": LOS are streamed through 'func' by blocks, such that
+                  the memory used by each block stays below max_bytes
+    max_bytes: float
+        Only used if minimize="chunks": memory budget (in bytes) of each
+        block of LOS (points, direction vectors and values of 'func').
+        A block always contains at least one LOS.
+    plan: None or SamplingPlan
+        If provided (cf. LOS_get_sampling_plan()), the LOS are not sampled
+        again: func is called once on the points of the plan, and
+        ray_orig, ray_vdir, res, lims, dmethod and minimize are ignored.
+    coefs_reflect: None or array-like (norders,) or (norders, nlos)
+        If provided, the LOS are stacked reflection orders: ray_orig,
+        ray_vdir and lims (and the plan) hold norders*nlos LOS, with the
+        LOS of order kk (0 for the primary LOS) in columns
+        kk*nlos:(kk+1)*nlos. All orders share the sampling and a single
+        call to func, and the returned (nt, nlos) signal is the sum of the
+        signals of each order weighted by coefs_reflect[kk] (or by
+        coefs_reflect[kk, ii] for LOS ii). The same applies to any stacked
+        groups of LOS, e.g. the sub-rays of finite etendue bundles.
+    rtol, atol: double
+        Only used if method='adaptive': relative and absolute tolerance of
+        the signal of each LOS
+    max_iter: int
+        Only used if method='adaptive': maximum number of refinements
+    max_neval: int
+        Only used if method='adaptive': the intervals of a LOS are not
+        refined anymore once it has used max_neval evaluations of func
+    return_neval: bool
+        Only used if method='adaptive': if True, also return the (nlos,)
+        number of evaluations of func per LOS (summed over stacked orders)
     Test : bool
         we test if the inputs are giving in a proper way.
     num_threads: int
@@ -2845,36 +3668,67 @@ def LOS_calc_signal(func, double[:,::1] ray_orig, double[:,::1] ray_vdir, res,
     cdef str dmode = dmethod.lower()
     cdef str imode = method.lower()
     cdef str minim = minimize.lower()
-    cdef int jjp1
     cdef int sz1_ds
     cdef int sz1_us, sz2_us
     cdef int sz1_dls, sz2_dls
     cdef int n_imode, n_dmode
     cdef int nlos
     cdef int nt=0, ii, jj
+    cdef long nb0, max_pts, nbytes_pt
     cdef bint res_is_list
     cdef bint C0, C1
     cdef list ltime
-    cdef double loc_r
     cdef long[1] nb_rows
-    cdef long[::1] indbis
     cdef double[1] loc_eff_res
-    cdef double[::1] reseff_mv
     cdef double[::1] res_mv
-    cdef double[:,::1] val_mv
-    cdef double[:,::1] pts_mv
-    cdef double[:,::1] usbis_mv
     cdef double[:,::1] val_2d
     cdef np.ndarray[double,ndim=2] usbis
     cdef np.ndarray[double,ndim=2] pts
     cdef np.ndarray[double,ndim=2, mode='fortran'] sig
     cdef np.ndarray[double,ndim=1] reseff
-    cdef np.ndarray[double,ndim=1] k
     cdef np.ndarray[double,ndim=1] res_arr
-    cdef np.ndarray[long,ndim=1] ind
-    cdef long* ind_arr = NULL
-    cdef double* reseff_arr = NULL
-    cdef double** coeff_ptr = NULL
+    cdef np.ndarray[long,ndim=1] los_nb
+    cdef np.ndarray[double,ndim=2] coefs
+    # -- Stacked reflection orders ---------------------------------------------
+    if coefs_reflect is not None:
+        coefs_arr = np.atleast_1d(coefs_reflect).astype(float)
+        nlos = ray_orig.shape[1] if plan is None else plan.nlos
+        if Test:
+            error_message = ("Nb. of LOS (%s) should be a multiple of the "
+                             % nlos
+                             + "nb. of reflection orders (coefs_reflect)")
+            assert (coefs_arr.ndim in [1, 2] and coefs_arr.shape[0] > 0
+                    and nlos % coefs_arr.shape[0] == 0), error_message
+            error_message = ("Arg coefs_reflect should be (norders,) or "
+                             + "(norders, nlos/norders)")
+            assert (coefs_arr.ndim == 1
+                    or coefs_arr.shape[1] == nlos // coefs_arr.shape[0]), \
+                error_message
+        if coefs_arr.ndim == 1:
+            coefs_arr = np.repeat(coefs_arr[:, None],
+                                  nlos // coefs_arr.shape[0], axis=1)
+        coefs = np.ascontiguousarray(coefs_arr)
+    # -- Pre-computed sampling: call (once) and integrate ----------------------
+    if plan is not None:
+        if Test:
+            error_message = "Arg plan must be a SamplingPlan instance!"
+            assert isinstance(plan, SamplingPlan), error_message
+            error_message = ("Arg plan was sampled for method '%s' !"
+                             % plan.method)
+            assert imode == plan.method, error_message
+            error_message = ("Arg plan has no emission directions "
+                             + "(build it with ani=True) !")
+            assert not ani or plan.vect is not None, error_message
+        if ani:
+            val = func(plan.pts, t=t, vect=plan.vect, **fkwdargs)
+        else:
+            val = func(plan.pts, t=t, **fkwdargs)
+        sig = np.asfortranarray(
+            _los_integrate_block(val, plan.reseff, plan.los_ind,
+                                 _st.get_nb_imode(imode), num_threads))
+        if coefs_reflect is not None:
+            sig = _los_sum_orders(sig, coefs, num_threads)
+        return sig
     # .. ray_orig shape needed for testing and in algo .........................
     sz1_ds = ray_orig.shape[0]
     nlos = ray_orig.shape[1]
@@ -2898,11 +3752,36 @@ def LOS_calc_signal(func, double[:,::1] ray_orig, double[:,::1] ray_vdir, res,
                         +" ['abs','rel'], for absolute or relative."
         assert dmode in ['abs','rel'], error_message
         error_message = "Wrong method of integration." \
-                        + " Options are: ['sum','simps','romb']"
-        assert imode in ['sum','simps','romb'], error_message
+                        + " Options are: ['sum','simps','romb','adaptive']"
+        assert imode in ['sum','simps','romb','adaptive'], error_message
+        error_message = ("Args rtol, atol must be >= 0, max_iter >= 0 and"
+                         + " max_neval > 0!")
+        assert (rtol >= 0. and atol >= 0. and max_iter >= 0
+                and max_neval > 0), error_message
         error_message = "Wrong minimize optimization."\
-                        + " Options are: ['calls','memory','hybrid']"
-        assert minim in ['calls','memory','hybrid'], error_message
+                        + " Options are: ['calls','memory','hybrid','chunks']"
+        assert minim in ['calls','memory','hybrid','chunks'], error_message
+        error_message = "Arg max_bytes must be a strictly positive number!"
+        assert minim != 'chunks' or max_bytes > 0, error_message
+    # -- Adaptive quadrature ---------------------------------------------------
+    if imode == 'adaptive':
+        if res_is_list:
+            res_arr = np.asarray(res, dtype=float)
+        else:
+            res_arr = np.full((nlos,), res, dtype=float)
+        val, neval = _los_calc_signal_adaptive(func, np.asarray(ray_orig),
+                                               np.asarray(ray_vdir),
+                                               np.asarray(lims), res_arr,
+                                               dmode == 'rel', ani, t,
+                                               fkwdargs, rtol, atol, max_iter,
+                                               max_neval)
+        sig = np.asfortranarray(val)
+        if coefs_reflect is not None:
+            sig = _los_sum_orders(sig, coefs, num_threads)
+            neval = neval.reshape((coefs.shape[0], -1)).sum(axis=0)
+        if return_neval:
+            return sig, neval
+        return sig
     # -- Preformat output signal -----------------------------------------------
     if t is None:
         if minim == 'memory':
@@ -2937,82 +3816,47 @@ def LOS_calc_signal(func, double[:,::1] ray_orig, double[:,::1] ray_vdir, res,
     # --------------------------------------------------------------------------
     # Minimize function calls: sample (vect), call (once) and integrate
     if minim == 'calls':
-        if n_imode != 0:
-            # Integration mode is Simpson or Romberg
-            # Discretize all LOS
-            k, reseff, ind = LOS_get_sample(nlos, res_arr, lims,
-                                            dmethod=dmode, method=imode,
-                                            num_threads=num_threads, Test=Test)
-            nbrep = np.r_[ind[0], np.diff(ind), k.size - ind[nlos-2]]
-            # get pts and values
-            usbis = np.repeat(ray_vdir, nbrep, axis=1)
-            pts = np.repeat(ray_orig, nbrep, axis=1) + k[None, :]*usbis
-            # memory view:
-            reseff_mv = reseff
-            indbis = np.concatenate(([0],ind,[k.size]))
-        else:
-            coeff_ptr = <double**>malloc(sizeof(double*))
-            coeff_ptr[0] = NULL
-            reseff_arr = <double*>malloc(nlos*sizeof(double))
-            ind_arr = <long*>malloc(nlos*sizeof(long))
-            # .. we sample lines of sight ......................................
-            _st.los_get_sample_core_var_res(nlos,
-                                            &lims[0, 0],
-                                            &lims[1, 0],
-                                            n_dmode, n_imode,
-                                            &res_arr[0],
-                                            &coeff_ptr[0],
-                                            &reseff_arr[0],
-                                            &ind_arr[0],
-                                            num_threads)
-            sz_coeff = ind_arr[nlos-1]
-            pts = np.empty((3,sz_coeff))
-            usbis = np.empty((3,sz_coeff))
-            usbis_mv = usbis
-            pts_mv = pts
-            _st.los_get_sample_pts(nlos,
-                                   &pts_mv[0,0],
-                                   &pts_mv[1,0],
-                                   &pts_mv[2,0],
-                                   &usbis_mv[0,0],
-                                   &usbis_mv[1,0],
-                                   &usbis_mv[2,0],
-                                   ray_orig, ray_vdir,
-                                   coeff_ptr[0],
-                                   ind_arr,
-                                   num_threads)
-            # ..................................................................
-        if ani:
-            val_2d = func(pts, t=t, vect=-usbis, **fkwdargs)
-        else:
-            val_2d = func(pts, t=t, **fkwdargs)
-
-        # Integrate
-        if n_imode == 0:  # "sum" integration mode
-            # .. integrating function ..........................................
-            reseffs = np.copy(np.asarray(<double[:nlos]>reseff_arr))
-            indices = np.copy(np.asarray(<long[:nlos-1]>ind_arr).astype(int))
-            sig = np.asfortranarray(np.add.reduceat(val_2d,
-                                                    np.r_[0, indices],
-                                                    axis=-1)
-                                    * reseffs[None, :])
-            # Cleaning up...
-            free(coeff_ptr[0])
-            free(coeff_ptr)
-            free(reseff_arr)
-            free(ind_arr)
-        elif n_imode == 1:  # "simpson" integration mode
-            for ii in range(nlos):
-                jj = indbis[ii]
-                jjp1 = indbis[ii+1]
-                val_mv = val_2d[:,jj:jjp1]
-                loc_r = reseff_mv[ii]
-                sig[:,ii] = scpintg.simps(val_mv,
-                                             x=None, dx=loc_r, axis=-1)
-        else:  # Romberg integration mode
-            for ii in range(nlos):
-                sig[:,ii] = scpintg.romb(val_2d[:,indbis[ii]:indbis[ii+1]],
-                                         dx=reseff_mv[ii], axis=1, show=False)
+        sig = np.asfortranarray(_los_calc_signal_block(func, ray_orig,
+                                                       ray_vdir, lims, res_mv,
+                                                       n_dmode, n_imode, ani,
+                                                       t, fkwdargs,
+                                                       num_threads))
+    # --------------------------------------------------------------------------
+    # Bounded memory: LOS are grouped in blocks (sample, call once and
+    # integrate per block) such that each block fits in max_bytes
+    elif minim == 'chunks':
+        # Number of samples per LOS, without computing them
+        los_nb = np.empty((nlos,), dtype=int)
+        reseff = np.empty((nlos,), dtype=float)
+        _st.los_get_sample_core_nb_var_res(nlos,
+                                           &lims[0, 0],
+                                           &lims[1, 0],
+                                           n_dmode, n_imode,
+                                           &res_mv[0],
+                                           &reseff[0],
+                                           &los_nb[0],
+                                           num_threads)
+        # Bytes per sample: coeff + pts (+ direction vectors) + values
+        nbytes_pt = 8 * (4 + 6*ani + nt)
+        max_pts = max(1, <long>(max_bytes // nbytes_pt))
+        lims_arr = np.asarray(lims)
+        orig_arr = np.asarray(ray_orig)
+        vdir_arr = np.asarray(ray_vdir)
+        ii, nb0 = 0, 0
+        while ii < nlos:
+            jj = max(ii + 1, np.searchsorted(los_nb, nb0 + max_pts,
+                                             side='right'))
+            sig[:, ii:jj] = _los_calc_signal_block(
+                func,
+                np.ascontiguousarray(orig_arr[:, ii:jj]),
+                np.ascontiguousarray(vdir_arr[:, ii:jj]),
+                np.ascontiguousarray(lims_arr[:, ii:jj]),
+                res_arr[ii:jj],
+                n_dmode, n_imode, ani,
+                t, fkwdargs,
+                num_threads)
+            nb0 = los_nb[jj-1]
+            ii = jj
     # --------------------------------------------------------------------------
     # Minimize memory use: loop everything, starting with LOS
     # then pts then time
@@ -3198,6 +4042,8 @@ def LOS_calc_signal(func, double[:,::1] ray_orig, double[:,::1] ray_vdir, res,
                     val = func(pts, t=t, **fkwdargs)
                     sig[:, ii] = scpintg.romb(val, show=False, axis=1,
                                               dx=loc_eff_res[0])
+    if coefs_reflect is not None:
+        sig = _los_sum_orders(sig, coefs, num_threads)
     return sig
 
 
@@ -3451,8 +4297,76 @@ cdef LOS_sino_Lin(double D0, double D1, double D2, double u0, double u1, double
     return (PMin0,PMin1,PMin2), kPMin, RMin, Theta, p0, ImpTheta, phi
 
 
+@cython.cdivision(True)
+@cython.wraparound(False)
+@cython.boundscheck(False)
+cdef inline void NEW_los_sino_lin_vec(int nlos,
+                                      double[:,::1] origins,
+                                      double[:,::1] directions,
+                                      double ref_y,
+                                      double ref_z,
+                                      double[:,::1] los_closest_coords,
+                                      double[::1] los_closest_coeffs,
+                                      double[::1] line_closest_rmin,
+                                      double[::1] line_closest_theta,
+                                      double[::1] line_closest_p,
+                                      double[::1] line_closest_imptheta,
+                                      double[::1] line_closest_phi,
+                                      bint is_LOS_Mode,
+                                      double[::1] kOut,
+                                      int num_threads) nogil:
+    """ Vectorized (over LOS) version of LOS_sino_Lin()
+
+    The reference is the line parallel to X passing by (Y, Z) = (ref_y, ref_z)
+    """
+    cdef int ind_los
+    cdef double u0, u1, u2
+    cdef double kPMin, Theta, normu
+    cdef double PMin0, PMin1, PMin2
+    cdef double vP0, vP1
+    cdef bint has_kout = kOut is not None
+
+    for ind_los in prange(nlos, num_threads=num_threads):
+        u0 = directions[0, ind_los]
+        u1 = directions[1, ind_los]
+        u2 = directions[2, ind_los]
+        # Computing coeff of closest on line....................................
+        if u0*u0 == 1.:
+            kPMin = 0.
+        else:
+            kPMin = ((ref_y - origins[1, ind_los])*u1
+                     + (ref_z - origins[2, ind_los])*u2) / (1. - u0*u0)
+        if is_LOS_Mode and has_kout and kPMin > kOut[ind_los]:
+            kPMin = kOut[ind_los]
+        los_closest_coeffs[ind_los] = kPMin
+
+        # Computing the info of the closest point on LOS & line.................
+        PMin0 = origins[0, ind_los] + kPMin * u0
+        PMin1 = origins[1, ind_los] + kPMin * u1
+        PMin2 = origins[2, ind_los] + kPMin * u2
+        los_closest_coords[0, ind_los] = PMin0
+        los_closest_coords[1, ind_los] = PMin1
+        los_closest_coords[2, ind_los] = PMin2
+        vP0 = PMin1 - ref_y
+        vP1 = PMin2 - ref_z
+        line_closest_rmin[ind_los] = Csqrt(vP0*vP0 + vP1*vP1)
+        # Theta and ImpTheta:
+        Theta = Catan2(vP1, vP0)
+        line_closest_theta[ind_los] = Theta
+        if Theta < 0:
+            Theta = Theta + Cpi
+        line_closest_imptheta[ind_los] = Theta
+        line_closest_p[ind_los] = vP0 * Ccos(Theta) + vP1 * Csin(Theta)
+        # Phi:
+        normu = Csqrt(u0*u0 + u1*u1 + u2*u2)
+        line_closest_phi[ind_los] = Catan2(u0/normu,
+                                           Csqrt(u1*u1 + u2*u2)/normu)
+    return
+
+
 def LOS_sino(double[:,::1] D, double[:,::1] u, double[::1] RZ, double[::1] kOut,
-             str Mode='LOS', str VType='Tor', bint try_new_algo=True):
+             str Mode='LOS', str VType='Tor', bint try_new_algo=True,
+             int num_threads=16):
     cdef unsigned int nL = D.shape[1], ii
     cdef tuple out
     cdef np.ndarray[double,ndim=2] PMin = np.empty((3,nL))
@@ -3478,14 +4392,131 @@ def LOS_sino(double[:,::1] D, double[:,::1] u, double[::1] RZ, double[::1] kOut,
                                  is_LOS_Mode=is_LOS_Mode,
                                  kOut=kOut)
     else:
-        for ii in range(0,nL):
-            out = LOS_sino_Lin(D[0,ii],D[1,ii],D[2,ii],u[0,ii],u[1,ii],u[2,ii],
-                               RZ[0],RZ[1], Mode=Mode, kOut=kOut[ii])
-            ((PMin[0,ii],PMin[1,ii],PMin[2,ii]),
-             kPMin[ii], RMin[ii], Theta[ii], p[ii], ImpTheta[ii], phi[ii]) = out
+        if not try_new_algo:
+            for ii in range(0,nL):
+                out = LOS_sino_Lin(D[0,ii],D[1,ii],D[2,ii],
+                                   u[0,ii],u[1,ii],u[2,ii],
+                                   RZ[0],RZ[1], Mode=Mode, kOut=kOut[ii])
+                ((PMin[0,ii],PMin[1,ii],PMin[2,ii]),
+                 kPMin[ii], RMin[ii], Theta[ii],
+                 p[ii], ImpTheta[ii], phi[ii]) = out
+        else:
+            is_LOS_Mode = Mode.lower() == 'los'
+            NEW_los_sino_lin_vec(nL, D, u, RZ[0], RZ[1],
+                                 PMin, kPMin, RMin, Theta, p,
+                                 ImpTheta, phi, is_LOS_Mode, kOut,
+                                 num_threads)
     return PMin, kPMin, RMin, Theta, p, ImpTheta, phi
 
 
+@cython.cdivision(True)
+@cython.wraparound(False)
+@cython.boundscheck(False)
+def LOS_sino_multi(double[:,::1] D, double[:,::1] u, double[:,::1] RZ,
+                   double[::1] kOut, str Mode='LOS', str VType='Tor',
+                   int num_threads=16):
+    """ Sinogram of all LOS for several reference points at once
+
+    Same as LOS_sino(), but for a (2, nt) array RZ of reference points
+    (e.g.: the magnetic axis vs time), in a single call parallelized over
+    all (reference point, LOS) pairs
+
+    Return PMin as a (3, nt, nLOS) array and kPMin, RMin, Theta, p,
+    ImpTheta, phi as (nt, nLOS) arrays
+    """
+    cdef int nL = D.shape[1]
+    cdef int nt = RZ.shape[1]
+    cdef int ii, it, il
+    cdef bint is_tor = VType.lower() == 'tor'
+    cdef bint is_LOS_Mode = Mode.lower() == 'los'
+    cdef bint has_kout = kOut is not None
+    cdef double* dirv
+    cdef double* orig
+    cdef double* res
+    cdef double u0, u1, u2, ref_r, ref_z
+    cdef double normu, normu_sq, kPMin, Theta, PMin2norm
+    cdef double PMin0, PMin1, PMin2, vP0, vP1
+    cdef double[:,:,::1] PMin = np.empty((3, nt, nL))
+    cdef double[:,::1] kPMin_v = np.empty((nt, nL))
+    cdef double[:,::1] RMin = np.empty((nt, nL))
+    cdef double[:,::1] Theta_v = np.empty((nt, nL))
+    cdef double[:,::1] p = np.empty((nt, nL))
+    cdef double[:,::1] ImpTheta = np.empty((nt, nL))
+    cdef double[:,::1] phi = np.empty((nt, nL))
+
+    with nogil, parallel(num_threads=num_threads):
+        dirv = <double*>malloc(3*sizeof(double))
+        orig = <double*>malloc(3*sizeof(double))
+        res = <double*>malloc(2*sizeof(double))
+        for ii in prange(nt*nL):
+            it = ii // nL
+            il = ii % nL
+            ref_r = RZ[0, it]
+            ref_z = RZ[1, it]
+            u0 = u[0, il]
+            u1 = u[1, il]
+            u2 = u[2, il]
+            normu_sq = u0*u0 + u1*u1 + u2*u2
+            normu = Csqrt(normu_sq)
+            # Computing coeff of closest on line................................
+            if is_tor:
+                if u0 == 0. and u1 == 0.:
+                    kPMin = (ref_z - D[2, il])/u2
+                else:
+                    dirv[0] = u0
+                    dirv[1] = u1
+                    dirv[2] = u2
+                    orig[0] = D[0, il]
+                    orig[1] = D[1, il]
+                    orig[2] = D[2, il]
+                    _dt.dist_los_circle_core(dirv, orig, ref_r, ref_z,
+                                             normu_sq, res)
+                    kPMin = res[0]
+            else:
+                if u0*u0 == 1.:
+                    kPMin = 0.
+                else:
+                    kPMin = ((ref_r - D[1, il])*u1
+                             + (ref_z - D[2, il])*u2) / (1. - u0*u0)
+            if is_LOS_Mode and has_kout and kPMin > kOut[il]:
+                kPMin = kOut[il]
+            kPMin_v[it, il] = kPMin
+
+            # Computing the info of the closest point on LOS & reference........
+            PMin0 = D[0, il] + kPMin * u0
+            PMin1 = D[1, il] + kPMin * u1
+            PMin2 = D[2, il] + kPMin * u2
+            PMin[0, it, il] = PMin0
+            PMin[1, it, il] = PMin1
+            PMin[2, it, il] = PMin2
+            PMin2norm = Csqrt(PMin0*PMin0 + PMin1*PMin1)
+            if is_tor:
+                vP0 = PMin2norm - ref_r
+            else:
+                vP0 = PMin1 - ref_r
+            vP1 = PMin2 - ref_z
+            RMin[it, il] = Csqrt(vP0*vP0 + vP1*vP1)
+            # Theta and ImpTheta:
+            Theta = Catan2(vP1, vP0)
+            Theta_v[it, il] = Theta
+            if Theta < 0:
+                Theta = Theta + Cpi
+            ImpTheta[it, il] = Theta
+            p[it, il] = vP0 * Ccos(Theta) + vP1 * Csin(Theta)
+            # Phi:
+            if is_tor:
+                phi[it, il] = Casin((u0/normu) * (PMin1/PMin2norm)
+                                    - (u1/normu) * (PMin0/PMin2norm))
+            else:
+                phi[it, il] = Catan2(u0/normu, Csqrt(u1*u1 + u2*u2)/normu)
+        free(dirv)
+        free(orig)
+        free(res)
+    return (np.asarray(PMin), np.asarray(kPMin_v), np.asarray(RMin),
+            np.asarray(Theta_v), np.asarray(p), np.asarray(ImpTheta),
+            np.asarray(phi))
+
+
 
 
 
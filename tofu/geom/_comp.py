@@ -9,7 +9,9 @@ import warnings
 import numpy as np
 import scipy.interpolate as scpinterp
 import scipy.integrate as scpintg
+import scipy.sparse as scpsp
 from inspect import signature as insp
+from matplotlib.path import Path
 
 # ToFu-specific
 try:
@@ -20,6 +22,9 @@ except Exception:
     from . import _GG as _GG
 
 
+_SAMPLEV_BLOCKSIZE = int(1e6)
+
+
 ###############################################################################
 #                            Ves functions
 ###############################################################################
@@ -453,6 +458,187 @@ def _Ves_get_sampleV(
     return Pts, dV, ind, dVr
 
 
+def _Ves_iter_sampleV(
+    VPoly,
+    Min1,
+    Max1,
+    Min2,
+    Max2,
+    dV,
+    block_size=None,
+    VType="Tor",
+    VLim=None,
+    Out="(X,Y,Z)",
+    margin=1.0e-9,
+):
+    """ Iterate over spatially coherent blocks of _Ves_get_sampleV()
+
+    Blocks are bands of R cells (X cells for 'Lin'), split in toroidal
+    sectors (Y bands for 'Lin') if a band of a single cell holds more than
+    block_size pts. Each block holds at most ~block_size pts (before removal
+    of the pts outside VPoly) and is computed natively on demand, using the
+    DV limits of _Ves_get_sampleV(). Cells straddling the limits of a block
+    are only kept in the block containing their center, so that the blocks
+    are a partition of the whole sampling (same pts, dV and ind)
+    Yields (pts, dV, ind, reseff) for each non-empty block
+    """
+    if block_size is None:
+        block_size = _SAMPLEV_BLOCKSIZE
+    if not hasattr(dV, "__iter__"):
+        dV = [float(dV), float(dV), float(dV)]
+    dV = [float(dd) for dd in dV]
+    tor = VType.lower() == "tor"
+    xyz = Out.lower() == "(x,y,z)"
+
+    # Cells along axis 1 (R or X) and nb. of pts per cell
+    if tor:
+        L1, d1 = np.array([Min1, Max1], dtype=float), dV[0]
+        NZ = _GG.discretize_line1d(np.array([Min2, Max2], dtype=float),
+                                   dV[1], None, Lim=True, margin=margin)[3]
+    else:
+        L1, d1 = np.array(VLim, dtype=float).ravel()[:2], dV[0]
+        NY = _GG.discretize_line1d(np.array([Min1, Max1], dtype=float),
+                                   dV[1], None, Lim=True, margin=margin)[3]
+        NZ = _GG.discretize_line1d(np.array([Min2, Max2], dtype=float),
+                                   dV[2], None, Lim=True, margin=margin)[3]
+    X1, d1r = _GG.discretize_line1d(L1, d1, None, Lim=True, margin=margin)[:2]
+    X1 = np.asarray(X1)
+    if tor:
+        n1 = NZ*np.ceil(2.*np.pi*X1/dV[2])
+        L2 = np.r_[-np.pi, np.pi]
+    else:
+        n1 = np.full((X1.size,), NY*NZ)
+        L2 = np.r_[Min1, Max1]
+
+    i0 = 0
+    while i0 < X1.size:
+        # Band of cells along axis 1, split along axis 2 if necessary
+        nc = np.searchsorted(np.cumsum(n1[i0:]), block_size, side="right")
+        i1 = i0 + max(1, nc)
+        nsec = int(np.ceil(np.sum(n1[i0:i1]) / block_size))
+        lim1 = np.r_[X1[i0] - 0.5*d1r, X1[i1-1] + 0.5*d1r]
+        edges2 = np.linspace(L2[0], L2[1], nsec + 1)
+        DV1 = np.r_[lim1[0] - 0.25*d1r, lim1[1] + 0.25*d1r]
+        for jj in range(0, nsec):
+            lim2 = edges2[jj:jj+2]
+            if nsec == 1:
+                DV2 = None
+            elif tor:
+                DV2 = lim2
+            else:
+                DV2 = np.r_[lim2[0] - dV[1], lim2[1] + dV[1]]
+            DV = [DV1, None, DV2] if tor else [DV1, DV2, None]
+            pts, dVi, ind, reseff = _Ves_get_sampleV(
+                VPoly, Min1, Max1, Min2, Max2, dV, DV=DV, VType=VType,
+                VLim=VLim, Out=Out, margin=margin,
+            )
+
+            # Only keep the cells whose center is in the block
+            if tor and xyz:
+                x1 = np.hypot(pts[0, :], pts[1, :])
+                x2 = np.arctan2(pts[1, :], pts[0, :])
+            else:
+                x1, x2 = pts[0, :], pts[2 if tor else 1, :]
+            indok = (x1 >= lim1[0]) & (x1 < lim1[1])
+            if nsec > 1:
+                indok &= (x2 >= lim2[0]) & (x2 < lim2[1])
+            if not np.any(indok):
+                continue
+            if hasattr(dVi, "__iter__"):
+                dVi = dVi[indok]
+            yield pts[:, indok], dVi, ind[indok], reseff
+        i0 = i1
+
+
+def _get_phi_extent(Lim=None, DPhi=None):
+    """ Return the total toroidal extent (rad) of Lim, restricted to DPhi
+
+    Lim is a (noccur, 2) array of toroidal limits (None or empty for the
+    whole torus), DPhi optional [phi0, phi1] limits (an interval with
+    phi0 > phi1 crosses pi)
+    """
+    if Lim is None or np.size(Lim) == 0:
+        arcs = np.array([[-np.pi, 2.*np.pi]])
+    else:
+        Lim = np.atleast_2d(Lim)
+        arcs = np.array([Lim[:, 0],
+                         np.mod(Lim[:, 1] - Lim[:, 0], 2.*np.pi)]).T
+        arcs[arcs[:, 1] == 0., 1] = 2.*np.pi
+    if DPhi is None:
+        return float(np.sum(arcs[:, 1]))
+
+    # Overlap of each arc with the DPhi arc (on the circle)
+    Lc = np.mod(DPhi[1] - DPhi[0], 2.*np.pi)
+    if Lc == 0.:
+        Lc = 2.*np.pi
+    d0 = np.mod(DPhi[0] - arcs[:, 0], 2.*np.pi)
+    ext = 0.
+    for dd in [d0, d0 - 2.*np.pi]:
+        ext += np.sum(np.clip(np.minimum(arcs[:, 1], dd + Lc)
+                              - np.maximum(0., dd), 0., None))
+    return float(ext)
+
+
+def _Ves_get_sampleV_axisym(
+    VPoly,
+    Min1,
+    Max1,
+    Min2,
+    Max2,
+    dV,
+    DV=None,
+    ind=None,
+    VLim=None,
+    margin=1.0e-9,
+):
+    """ Sample the (R,Z) cross-section of an axisymmetric volume
+
+    Only the (R, Z) mesh is returned, with the analytic volume of each
+    toroidal ring (2 pi R dR dZ, or R dR dZ times the toroidal extent of
+    VLim / DV[2] for limited structures), so that volume integrals of
+    axisymmetric quantities cost O(nR*nZ) instead of O(nR*nZ*nPhi)
+    ind are the indices of the pts in the whole (R, Z) mesh (indR*NZ + indZ)
+    Return pts (2, N) in (R, Z), dV, ind and reseff = [dR, dZ, phi extent]
+    """
+    if not hasattr(dV, "__iter__"):
+        dV = [float(dV), float(dV)]
+    if DV is None:
+        DV = [None, None, None]
+    DR, DZ, DPhi = [None if dd is None or all([ss is None for ss in dd])
+                    else dd for dd in DV]
+    lDL = [None if dd is None else np.array(dd, dtype=float)
+           for dd in [DR, DZ]]
+
+    # Get the actual R and Z resolutions and mesh elements
+    if ind is None:
+        R, dRr, indR, NR = _GG.discretize_line1d(
+            np.array([Min1, Max1], dtype=float), float(dV[0]), lDL[0],
+            Lim=True, margin=margin)
+        Z, dZr, indZ, NZ = _GG.discretize_line1d(
+            np.array([Min2, Max2], dtype=float), float(dV[1]), lDL[1],
+            Lim=True, margin=margin)
+        R, Z = np.asarray(R), np.asarray(Z)
+        pts = np.array([np.repeat(R, Z.size), np.tile(Z, R.size)])
+        ind = (np.repeat(np.asarray(indR), Z.size)*NZ
+               + np.tile(np.asarray(indZ), R.size))
+        if VPoly is not None:
+            # Same test as the 3d sampling (_Ves_Vmesh_Tor_SubFromD_cython)
+            indin = Path(VPoly.T).contains_points(pts.T, transform=None,
+                                                  radius=0.0)
+            pts, ind = pts[:, indin], ind[indin]
+    else:
+        R, dRr, indR, NR = _GG.discretize_line1d(
+            np.array([Min1, Max1], dtype=float), float(dV[0]), None,
+            Lim=True, margin=margin)
+        Z, dZr, indZ, NZ = _GG.discretize_line1d(
+            np.array([Min2, Max2], dtype=float), float(dV[1]), None,
+            Lim=True, margin=margin)
+        pts = np.array([np.asarray(R)[ind // NZ], np.asarray(Z)[ind % NZ]])
+
+    phiext = _get_phi_extent(VLim, DPhi)
+    return pts, pts[0, :]*dRr*dZr*phiext, ind, [dRr, dZr, phiext]
+
+
 def _Ves_get_sampleS(
     VPoly,
     dS,
@@ -660,6 +846,131 @@ def _Ves_get_sampleS(
     return Pts, dS, ind, dSr
 
 
+def _Config_get_sampleS(
+    lPoly,
+    lVIn,
+    lType,
+    lLim,
+    dS,
+    DIn=0.0,
+    Out="(X,Y,Z)",
+    margin=1.0e-9,
+    num_threads=16,
+):
+    """ Sample the surfaces of several Struct at once
+
+    Same sampling as _Ves_get_sampleS() (without DS / ind) for each Struct
+    (and each of its toroidal occurrences), but the main bodies of all
+    toroidal Struct (cross-section pts x toroidal steps, i.e.: most of the
+    pts) are computed in a single native call, parallelized over all
+    cross-section pts of all Struct and occurrences
+    The cross-sections, numbers of toroidal steps and faces are computed
+    per Struct by the same routines as for a single Struct
+    'Lin' Struct are sampled per occurrence (already vectorized)
+    Return the concatenated pts, dS and ind, and the (nStruct+1,) offsets
+    such that the samples of Struct ii are [offsets[ii]:offsets[ii+1]]
+    (occurrences of a Struct are concatenated in order)
+    """
+    if not hasattr(dS, "__iter__"):
+        dS = [float(dS), float(dS)]
+    dL, dRPhi = float(dS[0]), float(dS[1])
+
+    # Pieces of the sample, in order: per Struct, per occurrence
+    # (first face, main body, second face for limited toroidal Struct)
+    lpieces, lrows, nrows = [], [], 0
+    for ii in range(0, len(lPoly)):
+        lim = np.asarray(lLim[ii], dtype=float).reshape((-1, 2))
+        nocc = lim.shape[0]
+        if lType[ii].lower() != "tor":
+            for jj in range(0, nocc):
+                out = _GG._Ves_Smesh_Lin_SubFromD_cython(
+                    np.ascontiguousarray(lim[jj, :]), dL, dRPhi,
+                    np.ascontiguousarray(lPoly[ii]),
+                    DX=None, DY=None, DZ=None, DIn=DIn, VIn=lVIn[ii],
+                    margin=margin,
+                )
+                lpieces.append((ii, out[0], out[1], out[2]))
+            continue
+
+        VPoly = np.ascontiguousarray(lPoly[ii])
+        if nocc == 0:
+            phiMM = np.array([[-np.pi, np.pi]])
+            DPhiMM = np.r_[2.*np.pi]
+            NRZ0 = 0
+        else:
+            phiMM = np.arctan2(np.sin(lim), np.cos(lim))
+            DPhiMM = phiMM[:, 1] - phiMM[:, 0]
+            DPhiMM[DPhiMM < 0.] += 2.*np.pi
+
+            # Mesh of the faces (at both toroidal ends of each occurrence)
+            ptsrz, iindF, dsF, NRZ0 = _GG._Ves_Smesh_TorStruct_faces(
+                VPoly, dL, margin=margin,
+            )[:4]
+            Dphi = DIn/np.max(VPoly[0, :]) if DIn != 0. else 0.
+
+        # Cross-section and number of toroidal steps of each occurrence
+        out = _GG._Ves_Smesh_Tor_cross(
+            VPoly, dL, dRPhi, np.ascontiguousarray(DPhiMM), DIn=DIn,
+            VIn=lVIn[ii], margin=margin,
+        )
+        PtsCross, dLr, Rref, NRPhi = out[0], out[1], out[4], out[6]
+
+        for jj in range(0, phiMM.shape[0]):
+            nphi = NRPhi[jj, :].astype(int)
+            lrows.append((Rref.size, PtsCross, Rref, dLr,
+                          phiMM[jj, 0], DPhiMM[jj]/NRPhi[jj, :], nphi,
+                          NRZ0 + np.r_[0, np.cumsum(nphi)[:-1]]))
+            lface = []
+            if nocc > 0 and ptsrz.shape[1] > 0:
+                for kk, phi in enumerate([phiMM[jj, 0] + Dphi,
+                                          phiMM[jj, 1] - Dphi]):
+                    pts = _GG._Ves_Smesh_TorStruct_face_pts(ptsrz, phi,
+                                                            Out=Out)
+                    lface.append((ii, pts, dsF,
+                                  iindF + kk*(NRZ0 + np.sum(nphi))))
+            lpieces += lface[:1]
+            lpieces.append((ii, (nrows, nrows + Rref.size), None, None))
+            lpieces += lface[1:]
+            nrows += Rref.size
+
+    # Main bodies of all toroidal Struct, in a single native call
+    if nrows > 0:
+        lrr = [rr[1][0, :] for rr in lrows]
+        lzz = [rr[1][1, :] for rr in lrows]
+        lrref = [rr[2] for rr in lrows]
+        ldLr = [rr[3] for rr in lrows]
+        lphi0 = [np.full((rr[0],), rr[4]) for rr in lrows]
+        ldphi = [rr[5] for rr in lrows]
+        lnphi = [rr[6] for rr in lrows]
+        lind0 = [rr[7] for rr in lrows]
+        nphi = np.concatenate(lnphi).astype(int)
+        ptsM, dSM, indM = _GG._Ves_Smesh_Tor_rows_cython(
+            np.concatenate(lrr), np.concatenate(lzz),
+            np.concatenate(lrref), np.concatenate(ldLr),
+            np.concatenate(lphi0), np.concatenate(ldphi),
+            nphi, np.concatenate(lind0).astype(int),
+            Out=Out, num_threads=num_threads,
+        )
+        offs = np.r_[0, np.cumsum(nphi)]
+        for ii, pp in enumerate(lpieces):
+            if pp[2] is None:
+                i0, i1 = offs[pp[1][0]], offs[pp[1][1]]
+                lpieces[ii] = (pp[0], ptsM[:, i0:i1], dSM[i0:i1],
+                               indM[i0:i1])
+
+    # Aggregate
+    nS = np.zeros((len(lPoly),), dtype=int)
+    for pp in lpieces:
+        nS[pp[0]] += pp[3].size
+    if len(lpieces) == 0:
+        return np.zeros((3, 0)), np.zeros((0,)), np.zeros((0,), dtype=int), \
+            np.r_[0, np.cumsum(nS)]
+    pts = np.concatenate([pp[1] for pp in lpieces], axis=1)
+    dS = np.concatenate([pp[2]*np.ones((pp[3].size,)) for pp in lpieces])
+    ind = np.concatenate([pp[3] for pp in lpieces]).astype(int)
+    return pts, dS, ind, np.r_[0, np.cumsum(nS)]
+
+
 # ==============================================================================
 # =  phi / theta projections for magfieldlines
 # ==============================================================================
@@ -817,6 +1128,36 @@ def LOS_PRMin(Ds, us, kOut=None, Eps=1.0e-12, squeeze=True, Test=True):
     return kRMin
 
 
+def LOS_get_sino_extra(Ds, us, k, RefPt):
+    """ Return the sinogram pts, p, theta, phi from the LOS coefs k
+
+    k is either (nlos,) with RefPt (2,)
+    or (nref, nlos) with RefPt (2, nref), then pts is (3, nref, nlos)
+    """
+    if k.ndim == 2:
+        Ds, us = Ds[:, None, :], us[:, None, :]
+        RefPt = RefPt[:, :, None]
+    pts = Ds + k[None, ...] * us
+    R = np.hypot(pts[0, ...], pts[1, ...])
+    DR = R - RefPt[0, ...]
+    DZ = pts[2, ...] - RefPt[1, ...]
+    p = np.hypot(DR, DZ)
+    theta = np.arctan2(DZ, DR)
+    ind = theta < 0
+    p[ind] = -p[ind]
+    theta[ind] = -theta[ind]
+    phipts = np.arctan2(pts[1, ...], pts[0, ...])
+    etheta = np.array(
+        [
+            np.cos(phipts) * np.cos(theta),
+            np.sin(phipts) * np.cos(theta),
+            np.sin(theta),
+        ]
+    )
+    phi = np.arccos(np.abs(np.sum(etheta * us, axis=0)))
+    return pts, p, theta, phi
+
+
 def LOS_CrossProj(
     VType,
     Ds,
@@ -1059,6 +1400,200 @@ def LOS_calc_signal(
     return Int
 
 
+def _get_simps_weights(npts):
+    """ Weights of scipy.integrate.simps for npts points and dx=1 """
+    if npts < 2:
+        return np.zeros((npts,))
+    if npts % 2 == 0:
+        return scpintg.simps(np.eye(npts), dx=1., axis=-1)
+    wgt = np.full((npts,), 2.)
+    wgt[1::2] = 4.
+    wgt[0] = wgt[-1] = 1.
+    return wgt / 3.
+
+
+def _get_romb_weights(npts):
+    """ Weights of scipy.integrate.romb for npts = 2**k + 1 points, dx=1
+
+    Built with the same Richardson extrapolation of the trapezoidal rule,
+    without any (npts, npts) intermediate array
+    """
+    if npts < 2:
+        return np.zeros((npts,))
+    ninterv = npts - 1
+    kk = int(np.round(np.log2(ninterv)))
+    assert 2**kk == ninterv, "romb needs 2**k + 1 points!"
+    lprev = []
+    for ii in range(0, kk + 1):
+        step = ninterv // 2**ii
+        trap = np.zeros((npts,))
+        trap[::step] = step
+        trap[0] = trap[-1] = 0.5*step
+        lcurr = [trap]
+        for jj in range(1, ii + 1):
+            lcurr.append(lcurr[jj-1]
+                         + (lcurr[jj-1] - lprev[jj-1]) / (4.**jj - 1.))
+        lprev = lcurr
+    return lprev[-1]
+
+
+def LOS_get_integration_matrix(los_ind, reseff, method="sum"):
+    """ Return the sparse (nlos, npts) LOS integration matrix
+
+    The LOS are sampled as returned by _GG.LOS_get_sampling_plan()
+    (points of LOS ii are los_ind[ii]:los_ind[ii+1]), so that the
+    integrals of values val (npts,) along all LOS are M.dot(val)
+    The quadrature weights are the ones of np.sum, scipy.integrate.simps
+    and scipy.integrate.romb (for 'sum', 'simps' and 'romb')
+    """
+    nlos = reseff.size
+    nbpts = np.diff(los_ind)
+    npts = los_ind[-1]
+    rows = np.repeat(np.arange(0, nlos), nbpts)
+    if method == "sum":
+        wgt = np.ones((npts,), dtype=float)
+    else:
+        # Weights only depend on the number of points of each LOS
+        # => computed once per number of points, then gathered
+        fwgt = _get_simps_weights if method == "simps" else _get_romb_weights
+        nbu, indu = np.unique(nbpts, return_inverse=True)
+        lwgt = [fwgt(nn) for nn in nbu]
+        offset = np.r_[0, np.cumsum(nbu)[:-1]]
+        indpts = np.arange(0, npts) - np.repeat(los_ind[:-1], nbpts)
+        wgt = np.concatenate(lwgt)[offset[indu][rows] + indpts]
+    wgt = wgt * reseff[rows]
+    return scpsp.csr_matrix((wgt, (rows, np.arange(0, npts))),
+                            shape=(nlos, npts))
+
+
+# ==============================================================================
+# =  Finite etendue LOS bundles
+# ==============================================================================
+
+
+# Sobol direction numbers (Joe & Kuo) of dimensions 2 to 4: (s, a, m)
+_SOBOL_DIRNUM = [(1, 0, [1]), (2, 1, [1, 3]), (3, 1, [1, 3, 1])]
+
+
+def _get_sobol_pts(npts, ndim=4, shift=None):
+    """ Return the first npts points of the Sobol sequence in [0, 1)^ndim
+
+    Gray-code construction (ndim <= 4), optionally randomized by a digital
+    shift (shift: (ndim,) uint64 array of 32-bits ints xor-ed to all points)
+    """
+    assert ndim <= len(_SOBOL_DIRNUM) + 1
+    nbits = 32
+    vv = np.zeros((ndim, nbits), dtype=np.uint64)
+    vv[0, :] = [1 << (nbits - 1 - kk) for kk in range(nbits)]
+    for dd, (ss, aa, mm) in enumerate(_SOBOL_DIRNUM[:ndim-1]):
+        lv = [mm[kk] << (nbits - 1 - kk) for kk in range(ss)]
+        for kk in range(ss, nbits):
+            vk = lv[kk-ss] ^ (lv[kk-ss] >> ss)
+            for jj in range(1, ss):
+                vk ^= ((aa >> (ss - 1 - jj)) & 1) * lv[kk-jj]
+            lv.append(vk)
+        vv[dd+1, :] = lv
+
+    pts = np.zeros((npts, ndim), dtype=np.uint64)
+    for ii in range(1, npts):
+        # index of the rightmost zero bit of ii-1
+        cc, jj = 0, ii - 1
+        while jj & 1:
+            jj >>= 1
+            cc += 1
+        pts[ii, :] = pts[ii-1, :] ^ vv[:, cc]
+    if shift is not None:
+        pts = pts ^ shift
+    return pts / 2.**nbits
+
+
+def _get_bundle_unitpts(nsub, nlos, method="stratified", seed=None):
+    """ Return (nlos, nsub, 4) samples in [0, 1)^4 for LOS bundles
+
+    The 4 dimensions are the 2 coordinates on the detector and the 2
+    coordinates on the aperture, sampled with:
+        - 'stratified': latin hypercube (each dimension stratified into
+                        nsub strata), drawn independently for each LOS
+        - 'sobol':      Sobol sequence (same for all LOS), with a random
+                        digital shift if seed is provided
+    """
+    rng = np.random.RandomState(seed)
+    if method == "stratified":
+        strata = np.argsort(rng.random_sample((nlos, nsub, 4)), axis=1)
+        return (strata + rng.random_sample((nlos, nsub, 4))) / nsub
+    elif method == "sobol":
+        shift = None
+        if seed is not None:
+            shift = rng.randint(0, 2**32, size=(4,), dtype=np.uint64)
+        pts = _get_sobol_pts(nsub, ndim=4, shift=shift)
+        return np.broadcast_to(pts[None, :, :], (nlos, nsub, 4))
+    else:
+        msg = ("Arg method must be in ['stratified', 'sobol']\n"
+               + "\t- Provided: {}".format(method))
+        raise Exception(msg)
+
+
+def LOS_get_bundle(Ds, us, dap, ddet, rap, nsub=16,
+                   method="stratified", seed=None):
+    """ Return nsub sub-rays per LOS, sampling its finite etendue
+
+    Each LOS (Ds[:, ii], us[:, ii]) is the line joining the centre of a
+    detector (at Ds, rectangle of sides ddet normal to us) to the centre of
+    a circular aperture (radius rap, normal to us, at distance dap[ii]
+    from Ds along us).
+    Each sub-ray joins a sampled point of the detector to a sampled point
+    of the aperture (cf. _get_bundle_unitpts()), its Monte-Carlo
+    contribution to the etendue being:
+        cos(theta_det) * cos(theta_ap) / dist**2 * S_det * S_ap / nsub
+
+    Returns
+    -------
+    Db:     np.ndarray
+        (3, nsub*nlos) origins (on the detector) of the sub-rays, sub-ray
+        jj of LOS ii being in column jj*nlos + ii
+    ub:     np.ndarray
+        (3, nsub*nlos) unit vectors of the sub-rays
+    etend:  np.ndarray
+        (nsub, nlos) etendue of each sub-ray (in m2.sr), etend.sum(axis=0)
+        being the etendue of each LOS
+    """
+    nlos = Ds.shape[1]
+    dap = np.broadcast_to(np.asarray(dap, dtype=float).ravel(), (nlos,))
+    ddet = np.broadcast_to(np.asarray(ddet, dtype=float).ravel(), (2,))
+    assert np.all(dap > 0.) and np.all(ddet > 0.) and rap > 0.
+
+    # Local basis (e1, e2) normal to each LOS
+    e1 = np.array([us[1, :], -us[0, :], np.zeros((nlos,))])
+    norm = np.sqrt(np.sum(e1**2, axis=0))
+    indv = norm < 1.e-12
+    e1[:, indv] = np.array([[1.], [0.], [0.]])
+    norm[indv] = 1.
+    e1 = e1 / norm[None, :]
+    e2 = np.array([us[1, :]*e1[2, :] - us[2, :]*e1[1, :],
+                   us[2, :]*e1[0, :] - us[0, :]*e1[2, :],
+                   us[0, :]*e1[1, :] - us[1, :]*e1[0, :]])
+
+    # Points on the detector and on the aperture, (3, nsub, nlos)
+    xx = np.transpose(_get_bundle_unitpts(nsub, nlos, method=method,
+                                          seed=seed), (2, 1, 0))
+    rr = rap * np.sqrt(xx[2, ...])
+    theta = 2.*np.pi*xx[3, ...]
+    pdet = (Ds[:, None, :]
+            + ((xx[0, ...] - 0.5) * ddet[0])[None, ...] * e1[:, None, :]
+            + ((xx[1, ...] - 0.5) * ddet[1])[None, ...] * e2[:, None, :])
+    pap = (Ds[:, None, :] + (dap[None, :] * us)[:, None, :]
+           + (rr * np.cos(theta))[None, ...] * e1[:, None, :]
+           + (rr * np.sin(theta))[None, ...] * e2[:, None, :])
+
+    # Sub-rays and their etendue
+    vect = pap - pdet
+    dist = np.sqrt(np.sum(vect**2, axis=0))
+    vect = vect / dist[None, ...]
+    cos = np.sum(vect * us[:, None, :], axis=0)
+    etend = (cos**2 / dist**2) * (ddet[0]*ddet[1] * np.pi*rap**2 / nsub)
+    return pdet.reshape((3, -1)), vect.reshape((3, -1)), etend
+
+
 # ==============================================================================
 # =  Solid Angle particle
 # ==============================================================================
@@ -1140,19 +1675,24 @@ def calc_solidangle_particle(
 
     # Solid angle
     if approx:
-        sang = np.pi * r[None, :] ** 2 / len_v ** 2
+        sang = np.pi * r[:, None] ** 2 / len_v ** 2
     else:
-        sang = 2.0 * np.pi * (1 - np.sqrt(1.0 - r ** 2[None, :] / len_v ** 2))
+        sang = 2.0 * np.pi * (1 - np.sqrt(1.0 - r[:, None] ** 2 / len_v ** 2))
 
     # block
     if block:
+        # Geometry (flattened polygons, bounding boxes...) cached in config
         kwdargs = config._get_kwdargs_LOS_isVis()
         # TODO : modify this function along issue #102
-        indnan = _GG.LOS_areVis_PtsFromPts_VesStruct(
-            traj, pts, k=len_v, vis=False, **kwdargs
-        )
+        indnan = np.array([
+            _GG.LOS_isVis_PtFromPts_VesStruct(
+                traj[0, ii], traj[1, ii], traj[2, ii], pts,
+                k=np.ascontiguousarray(len_v[ii, :]), **kwdargs
+            ) == 0.
+            for ii in range(npart)
+        ])
         sang[indnan] = 0.0
-        vect[indnan, :] = np.nan
+        vect[:, indnan] = np.nan
 
     ################
     # Return
@@ -9,9 +9,12 @@ import os
 import warnings
 import copy
 import inspect
+import hashlib
+import collections
 
 # Common
 import numpy as np
+import scipy.sparse as scpsp
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 
@@ -58,6 +61,9 @@ _NUM_THREADS = 10
 _PHITHETAPROJ_NPHI = 2000
 _PHITHETAPROJ_NTHETA = 1000
 _RES = 0.005
+_MAX_BYTES = 1.e8
+# Max. memory of each cache of Rays (sampling plans, bundles, operators)
+_CACHE_MAXBYTES = 200e6
 _DREFLECT = {"specular": 0, "diffusive": 1, "ccube": 2}
 
 
@@ -1326,9 +1332,34 @@ class Struct(utils.ToFuObject):
         return pts, dS, ind, reseff
 
     def get_sampleV(
-        self, res, DV=None, resMode="abs", ind=None, Out="(X,Y,Z)"
+        self, res, DV=None, resMode="abs", ind=None, Out="(X,Y,Z)",
+        axisym=False,
     ):
-        """ Sample, with resolution res, the volume defined by DV or ind """
+        """ Sample, with resolution res, the volume defined by DV or ind
+
+        If axisym=True (toroidal structures only), only the (R, Z)
+        cross-section is sampled (Out is ignored, pts are (2, N) in (R, Z)),
+        with the analytic volume of each toroidal ring (2 pi R dR dZ, or
+        R dR dZ times the exact toroidal extent of Lim and DV[2]), for
+        volume integrals of axisymmetric quantities
+        """
+
+        if axisym:
+            if self.Id.Type != "Tor":
+                msg = "axisym=True only available for toroidal structures!"
+                raise Exception(msg)
+            return _comp._Ves_get_sampleV_axisym(
+                self.Poly,
+                self.dgeom["P1Min"][0],
+                self.dgeom["P1Max"][0],
+                self.dgeom["P2Min"][1],
+                self.dgeom["P2Max"][1],
+                res,
+                DV=DV,
+                ind=ind,
+                VLim=self.Lim if self.noccur > 0 else None,
+                margin=1.0e-9,
+            )
 
         args = [
             self.Poly,
@@ -1350,6 +1381,34 @@ class Struct(utils.ToFuObject):
         pts, dV, ind, reseff = _comp._Ves_get_sampleV(*args, **kwdargs)
         return pts, dV, ind, reseff
 
+    def iter_sampleV(self, res, block_size=None, Out="(X,Y,Z)"):
+        """ Iterate over blocks of the volume sampled with resolution res
+
+        Same sampling as get_sampleV(), but computed (natively) on demand by
+        spatially coherent blocks of at most ~block_size pts (bands of R,
+        split in toroidal sectors if necessary), so that volume integrals
+        can be streamed with bounded memory:
+            for pts, dV, ind, reseff in struct.iter_sampleV(0.005):
+                ...
+        The blocks are a partition of the whole sampling (same ind)
+        """
+        args = [
+            self.Poly,
+            self.dgeom["P1Min"][0],
+            self.dgeom["P1Max"][0],
+            self.dgeom["P2Min"][1],
+            self.dgeom["P2Max"][1],
+            res,
+        ]
+        kwdargs = dict(
+            block_size=block_size,
+            VType=self.Id.Type,
+            VLim=self.Lim,
+            Out=Out,
+            margin=1.0e-9,
+        )
+        return _comp._Ves_iter_sampleV(*args, **kwdargs)
+
     def _get_phithetaproj(self, refpt=None):
         # Prepare ax
         if refpt is None:
@@ -1424,7 +1483,9 @@ class Struct(utils.ToFuObject):
         return dist, nDphi, Dphi, nDtheta, Dtheta
 
     @staticmethod
-    def _get_reflections_ufromTypes(u, vperp, Types):
+    def _get_reflections_ufromTypes(u, vperp, Types, rng=None):
+        if rng is None:
+            rng = np.random
         indspec = Types == 0
         inddiff = Types == 1
         indcorn = Types == 2
@@ -1464,7 +1525,7 @@ class Struct(utils.ToFuObject):
 
             if np.any(inddiff):
                 # Compute u2 for diffusive
-                sca = 2.0 * (np.random.random((1, inddiff.sum())) - 0.5)
+                sca = 2.0 * (rng.random((1, inddiff.sum())) - 0.5)
                 u2[:, inddiff] = (
                     np.sqrt(1.0 - sca**2) * vperp[:, inddiff]
                     + sca * vpar[:, inddiff]
@@ -2014,6 +2075,10 @@ class StructOut(Struct):
         msg = "StructOut subclasses cannot use get_sampleV()!"
         raise Exception(msg)
 
+    def iter_sampleV(self, *args, **kwdargs):
+        msg = "StructOut subclasses cannot use iter_sampleV()!"
+        raise Exception(msg)
+
 
 class PlasmaDomain(StructIn):
     _color = (0.8, 0.8, 0.8, 1.0)
@@ -2238,6 +2303,7 @@ class Config(utils.ToFuObject):
         self._dStruct = dict.fromkeys(self._get_keys_dStruct())
         self._dextraprop = dict.fromkeys(self._get_keys_dextraprop())
         self._dsino = dict.fromkeys(self._get_keys_dsino())
+        self._dgeomcache = {}
 
     @classmethod
     def _checkformat_inputs_Id(
@@ -2514,6 +2580,8 @@ class Config(utils.ToFuObject):
         )
         self._dStruct.update({"Lim": Lim, "nLim": nLim})
         self._set_dlObj(lStruct, din=self._dStruct)
+        # Cached ray-tracing geometry is obsolete
+        self.clear_geometry_cache()
 
     def _set_dextraprop(self, dextraprop=None):
         dextraprop, dC = self._checkformat_inputs_dextraprop(dextraprop)
@@ -2685,6 +2753,140 @@ class Config(utils.ToFuObject):
                 self._dStruct["dObj"][k][kk].set_dsino(RefPt=RefPt, nP=nP)
         self._dsino = {"RefPt": RefPt, "nP": nP}
 
+    def _get_indStruct_computeInOut(self):
+        """ Return the indices of the structures used for ray-tracing
+
+        StructIn first, then StructOut, among those with compute=True
+        (all if the extraprop compute is not set)
+        """
+        lS = self.lStruct
+        if "compute" in self._dextraprop["lprop"]:
+            compute = self.get_compute()
+        else:
+            compute = np.ones((len(lS),), dtype=bool)
+        iI, iO = [], []
+        for ii in range(0, len(lS)):
+            if compute[ii]:
+                if lS[ii]._InOut == "in":
+                    iI.append(ii)
+                elif lS[ii]._InOut == "out":
+                    iO.append(ii)
+        return np.r_[iI + iO]
+
+    def clear_geometry_cache(self):
+        """ Clear the cached geometry used for ray-tracing """
+        self._dgeomcache = {}
+
+    def _get_geometry_cache(self, indStruct=None):
+        """ Return the (cached) geometry of the structures for ray-tracing
+
+        The polygons, normals and limits of the selected structures
+        (indStruct, default: all structures with compute=True) are flattened
+        into the arrays expected by the ray-tracing routines of _GG, and the
+        bounding boxes of the StructOut and their hierarchy are computed
+        (see _GG.LOS_get_struct_bvh()).
+
+        This is only done once: the result is cached and re-used as long as
+        the structures are unchanged (a moved Struct or a modified Config
+        triggers a new computation).
+
+        Returns
+        -------
+        dkwd:   dict
+            The geometry, as keyword arguments of
+            _GG.LOS_Calc_PInOut_VesStruct(), with the addition of ves_poly
+            and ves_norm (the reference StructIn) and dbvh
+        """
+        if indStruct is None:
+            indStruct = self._get_indStruct_computeInOut()
+        lS = [ss for ii, ss in enumerate(self.lStruct) if ii in indStruct]
+
+        # Re-use if the structures (and their geometry) are unchanged
+        lobj = [
+            ss._dgeom[kk]
+            for ss in lS
+            for kk in ["Poly", "VIn", "pos", "extent"]
+        ]
+        key = tuple(indStruct)
+        if key in self._dgeomcache.keys():
+            lobj0 = self._dgeomcache[key]["lobj"]
+            if len(lobj0) == len(lobj) and all(
+                [o0 is o1 for o0, o1 in zip(lobj0, lobj)]
+            ):
+                return self._dgeomcache[key]["dkwd"]
+
+        # Reference StructIn
+        lSIn = [ss for ss in lS if ss._InOut == "in"]
+        if len(lSIn) == 0:
+            msg = "self.config must have at least a StructIn subclass !"
+            assert len(lSIn) > 0, msg
+        iref = np.argmin([ss.dgeom["Surf"] for ss in lSIn])
+        S = lSIn[iref]
+        if np.size(np.shape(S.Lim)) > 1:
+            Lim = np.asarray([S.Lim[0][0], S.Lim[0][1]])
+        else:
+            Lim = S.Lim
+        VType = self.Id.Type
+
+        # Flattened StructOut
+        lS = [ss for ss in lS if ss._InOut == "out"]
+        lSLim = [ss.Lim for ss in lS]
+        nstruct_tot = int(
+            np.sum([1 if ll is None or len(ll) == 0 else len(ll)
+                    for ll in lSLim])
+        )
+        if len(lS) > 0:
+            lSPolyx = np.concatenate([ss.Poly_closed[0] for ss in lS])
+            lSPolyy = np.concatenate([ss.Poly_closed[1] for ss in lS])
+            lSVInx = np.concatenate([ss.dgeom["VIn"][0] for ss in lS])
+            lSVIny = np.concatenate([ss.dgeom["VIn"][1] for ss in lS])
+        else:
+            lSPolyx, lSPolyy = np.array([]), np.array([])
+            lSVInx, lSVIny = np.array([]), np.array([])
+        lsnvert = np.cumsum(
+            [ss.Poly_closed.shape[1] for ss in lS], dtype=np.long
+        )
+        lSnLim = np.asarray([ss.noccur for ss in lS], dtype=np.long)
+        dkwd = dict(
+            ves_poly=S.Poly_closed,
+            ves_norm=S.dgeom["VIn"],
+            ves_lims=Lim,
+            nstruct_tot=nstruct_tot,
+            nstruct_lim=len(lS),
+            lstruct_polyx=np.ascontiguousarray(lSPolyx, dtype=float),
+            lstruct_polyy=np.ascontiguousarray(lSPolyy, dtype=float),
+            lstruct_lims=lSLim,
+            lstruct_nlim=lSnLim,
+            lstruct_normx=np.ascontiguousarray(lSVInx, dtype=float),
+            lstruct_normy=np.ascontiguousarray(lSVIny, dtype=float),
+            lnvert=lsnvert,
+            ves_type=VType,
+        )
+        # Bounding volume hierarchy of the StructOut
+        dkwd["dbvh"] = _GG.LOS_get_struct_bvh(
+            lSnLim,
+            dkwd["lstruct_polyx"],
+            dkwd["lstruct_polyy"],
+            lSLim,
+            lsnvert,
+            nstruct_tot,
+            len(lS),
+            ves_type=VType,
+        )
+        self._dgeomcache[key] = {"lobj": lobj, "dkwd": dkwd}
+        return dkwd
+
+    def _get_kwdargs_LOS_isVis(self, indStruct=None):
+        """ Return the (cached) geometry as kwdargs of visibility routines
+
+        To be passed to _GG.LOS_isVis_PtFromPts_VesStruct() and
+        _GG.LOS_areVis_PtsFromPts_VesStruct()
+        """
+        dkwd = dict(self._get_geometry_cache(indStruct=indStruct))
+        dkwd.update(rmin=-1, forbid=True, eps_uz=1.e-6, eps_vz=1.e-9,
+                    eps_a=1.e-9, eps_b=1.e-9, eps_plane=1.e-9, test=True)
+        return dkwd
+
     ###########
     # strip dictionaries
     ###########
@@ -3296,6 +3498,53 @@ class Config(utils.ToFuObject):
             ind[ii, :] = indi
         return ind
 
+    def get_sampleS(self, res=None, offsetIn=0.0, Out="(X,Y,Z)",
+                    num_threads=16):
+        """ Sample the surfaces of all Struct at once, with resolution res
+
+        Equivalent to concatenating lStruct[ii].get_sampleS(res) for all
+        Struct (and all their occurrences), but the main bodies of all
+        toroidal Struct are sampled in a single native (parallel) call
+        Check self.lStruct[0].get_sampleS? for details on res and offsetIn
+
+        Parameters
+        ----------
+        res     :   float / list of 2 floats
+            Desired resolution of the surfacic sample (dl, dXPhi)
+        offsetIn:   float
+            Offset distance from the actual surface
+        Out     :   str
+            Flag indicating the coordinate system of returned points
+        num_threads :   int
+            Number of threads used for the native sampling
+
+        Return
+        ------
+        pts     :   np.ndarray
+            (3, N) array of sample points coordinates
+        dS      :   np.ndarray
+            (N,) array of surface elements
+        ind     :   np.ndarray
+            (N,) array of point indices, relative to each Struct occurrence
+        offsets :   np.ndarray
+            (nStruct+1,) array, the points of self.lStruct[ii] are
+            pts[:, offsets[ii]:offsets[ii+1]]
+        """
+        if res is None:
+            res = _RES
+        lStruct = self.lStruct
+        return _comp._Config_get_sampleS(
+            [ss.Poly for ss in lStruct],
+            [ss.dgeom["VIn"] for ss in lStruct],
+            [ss.Id.Type for ss in lStruct],
+            [ss.Lim if ss.noccur > 0 else np.zeros((0, 2)) for ss in lStruct],
+            res,
+            DIn=offsetIn,
+            Out=Out,
+            margin=1.0e-9,
+            num_threads=num_threads,
+        )
+
     # TBF
     def fdistfromwall(self, r, z, phi):
         """ Return a callable (function) for detecting trajectory collisions
@@ -3350,7 +3599,8 @@ class Config(utils.ToFuObject):
             Types = self.get_reflections(indout)[0]
         return Types
 
-    def _reflect_geom(self, u=None, vperp=None, indout=None, Type=None):
+    def _reflect_geom(self, u=None, vperp=None, indout=None, Type=None,
+                      rng=None):
         assert u.shape == vperp.shape and u.shape[0] == 3
         if indout is not None:
             assert indout.shape == (3, u.shape[1])
@@ -3359,7 +3609,7 @@ class Config(utils.ToFuObject):
         Types = self._reflect_Types(indout=indout, Type=Type, nRays=u.shape[1])
 
         # Deduce u2
-        u2 = Struct._get_reflections_ufromTypes(u, vperp, Types)
+        u2 = Struct._get_reflections_ufromTypes(u, vperp, Types, rng=rng)
         return u2, Types
 
     def plot(
@@ -3727,6 +3977,9 @@ class Rays(utils.ToFuObject):
         self._dsino = dict.fromkeys(self._get_keys_dsino())
         self._dchans = dict.fromkeys(self._get_keys_dchans())
         self._dmisc = dict.fromkeys(self._get_keys_dmisc())
+        self._dplans = collections.OrderedDict()
+        self._dprojop = collections.OrderedDict()
+        self._dbundles = collections.OrderedDict()
         # self._dplot = copy.deepcopy(self.__class__._ddef['dplot'])
 
     @classmethod
@@ -4470,61 +4723,10 @@ class Rays(utils.ToFuObject):
 
         elif self._method == "optimized":
 
-            if np.size(np.shape(S.Lim)) > 1:
-                Lim = np.asarray([S.Lim[0][0], S.Lim[0][1]])
-            else:
-                Lim = S.Lim
-            nLim = S.noccur
-            VType = self.config.Id.Type
-
-            lS = [ss for ss in lS if ss._InOut == "out"]
-            lSPolyx, lSVInx = [], []
-            lSPolyy, lSVIny = [], []
-            lSLim, lSnLim = [], []
-            lsnvert = []
-            num_tot_structs = 0
-            num_lim_structs = 0
-            for ss in lS:
-                lp = ss.Poly_closed[0]
-                [lSPolyx.append(item) for item in lp]
-                lp = ss.Poly_closed[1]
-                [lSPolyy.append(item) for item in lp]
-                lp = ss.dgeom["VIn"][0]
-                [lSVInx.append(item) for item in lp]
-                lp = ss.dgeom["VIn"][1]
-                [lSVIny.append(item) for item in lp]
-                lSLim.append(ss.Lim)
-                lSnLim.append(ss.noccur)
-                if len(lsnvert) == 0:
-                    lsnvert.append(len(ss.Poly_closed[0]))
-                else:
-                    lsnvert.append(
-                        len(ss.Poly_closed[0]) + lsnvert[num_lim_structs - 1]
-                    )
-                num_lim_structs += 1
-                if ss.Lim is None or len(ss.Lim) == 0:
-                    num_tot_structs += 1
-                else:
-                    num_tot_structs += len(ss.Lim)
-
-            lsnvert = np.asarray(lsnvert, dtype=np.long)
-            lSPolyx = np.asarray(lSPolyx)
-            lSPolyy = np.asarray(lSPolyy)
-            lSVInx = np.asarray(lSVInx)
-            lSVIny = np.asarray(lSVIny)
-
-            dkwd = dict(ves_lims=Lim,
-                        nstruct_tot=num_tot_structs,
-                        nstruct_lim=num_lim_structs,
-                        lstruct_polyx=lSPolyx,
-                        lstruct_polyy=lSPolyy,
-                        lstruct_lims=lSLim,
-                        lstruct_nlim=np.asarray(lSnLim, dtype=np.long),
-                        lstruct_normx=lSVInx,
-                        lstruct_normy=lSVIny,
-                        lnvert=lsnvert,
-                        ves_type=VType,
-                        rmin=-1, forbid=True, eps_uz=1.e-6, eps_vz=1.e-9,
+            # Flattened geometry and bounding boxes, cached in the Config
+            dkwd = dict(self.config._get_geometry_cache(indStruct=indStruct))
+            del dkwd["ves_poly"], dkwd["ves_norm"]
+            dkwd.update(rmin=-1, forbid=True, eps_uz=1.e-6, eps_vz=1.e-9,
                         eps_a=1.e-9, eps_b=1.e-9, eps_plane=1.e-9, test=True)
 
         return indStruct, largs, dkwd
@@ -4568,6 +4770,11 @@ class Rays(utils.ToFuObject):
             their indices and if show_debug_plot is True, try to plot a 3d
             figure to help understand why these los have no visibility
         """
+        # Cached sampling plans, projection operators and bundles are obsolete
+        self.clear_sampling_plans()
+        self.clear_projection_operators()
+        self.clear_bundles()
+
         # Can only be computed if config if provided
         if self._dconfig["Config"] is None:
             msg = "Attribute dgeom cannot be computed without a config!"
@@ -4737,24 +4944,9 @@ class Rays(utils.ToFuObject):
 
     def _compute_dsino_extra(self):
         if self._dsino["k"] is not None:
-            pts = self.D + self._dsino["k"][np.newaxis, :] * self.u
-            R = np.hypot(pts[0, :], pts[1, :])
-            DR = R - self._dsino["RefPt"][0]
-            DZ = pts[2, :] - self._dsino["RefPt"][1]
-            p = np.hypot(DR, DZ)
-            theta = np.arctan2(DZ, DR)
-            ind = theta < 0
-            p[ind] = -p[ind]
-            theta[ind] = -theta[ind]
-            phipts = np.arctan2(pts[1, :], pts[0, :])
-            etheta = np.array(
-                [
-                    np.cos(phipts) * np.cos(theta),
-                    np.sin(phipts) * np.cos(theta),
-                    np.sin(theta),
-                ]
+            pts, p, theta, phi = _comp.LOS_get_sino_extra(
+                self.D, self.u, self._dsino["k"], self._dsino["RefPt"]
             )
-            phi = np.arccos(np.abs(np.sum(etheta * self.u, axis=0)))
             dd = {"pts": pts, "p": p, "theta": theta, "phi": phi}
             self._dsino.update(dd)
 
@@ -4779,6 +4971,45 @@ class Rays(utils.ToFuObject):
         if extra:
             self._compute_dsino_extra()
 
+    def calc_sino(self, RefPt=None, num_threads=16):
+        """ Return the sinogram for several reference points at once
+
+        Same quantities as set_dsino() (stored in self.dsino), but for a
+        (2, nt) array of reference points (R, Z), e.g.: the magnetic axis
+        at nt time steps, computed in a single native call
+        The sinogram stored in self.dsino is not modified
+
+        Return
+        ------
+        dsino:  dict
+            Contains 'RefPt' (2, nt), 'pts' (3, nt, nRays) and
+            'k', 'p', 'theta', 'phi' (nt, nRays)
+        """
+        if RefPt is None:
+            RefPt = self._dsino["RefPt"]
+        RefPt = np.asarray(RefPt, dtype=float)
+        if RefPt.ndim == 1:
+            RefPt = RefPt.reshape((2, 1))
+        if RefPt.ndim != 2 or RefPt.shape[0] != 2:
+            msg = (
+                "Arg RefPt must be a (2, nt) array of (R, Z) coordinates!\n"
+                + "\t- Provided: {}".format(RefPt.shape)
+            )
+            raise Exception(msg)
+        RefPt = np.ascontiguousarray(RefPt)
+
+        kOut = np.copy(self._dgeom["kOut"])
+        kOut[np.isnan(kOut)] = np.inf
+        k = _GG.LOS_sino_multi(
+            self.D, self.u, RefPt, kOut, Mode="LOS",
+            VType=self.config.Id.Type, num_threads=num_threads,
+        )[1]
+        pts, p, theta, phi = _comp.LOS_get_sino_extra(
+            self.D, self.u, k, RefPt
+        )
+        return {"RefPt": RefPt, "k": k, "pts": pts,
+                "p": p, "theta": theta, "phi": phi}
+
     def _set_dOptics(self, lOptics=None):
         lOptics = self._checkformat_dOptics(lOptics=lOptics)
         self._set_dlObj(lOptics, din=self._dOptics)
@@ -4876,7 +5107,44 @@ class Rays(utils.ToFuObject):
             )
         return lcam, Types
 
-    def add_reflections(self, Type=None, nb=None):
+    def _compute_reflections(self, Type=None, nb=None, seed=None):
+        """ Compute all nb reflections natively (toroidal config only)
+
+        The reflections types of all structures are flattened so that all
+        reflections of all LOS are computed in compiled code, each reflection
+        being parallelized over the LOS
+
+        """
+        indStruct = self._dgeom["indStruct"]
+        dkwd = dict(self.config._get_geometry_cache(indStruct=indStruct))
+        ves_poly, ves_norm = dkwd.pop("ves_poly"), dkwd.pop("ves_norm")
+
+        # Flattened reflection Types of all Struct (indexed as indout[0])
+        lTypes = [ss._dreflect["Types"] for ss in self.config.lStruct]
+        ltypes = np.concatenate(lTypes).astype(np.int_)
+        ltypes_ind = np.r_[0, np.cumsum([tt.size for tt in lTypes])]
+        if Type is None:
+            rtype = -1
+        else:
+            assert Type in ["specular", "diffusive", "ccube"]
+            rtype = _DREFLECT[Type]
+
+        return _GG.LOS_Calc_Reflections_VesStruct(
+            np.ascontiguousarray(self.D),
+            np.ascontiguousarray(self.u),
+            np.ascontiguousarray(self._dgeom["kOut"]),
+            np.ascontiguousarray(self._dgeom["vperp"]),
+            np.ascontiguousarray(self._dgeom["indout"], dtype=np.int_),
+            ves_poly, ves_norm,
+            ltypes, ltypes_ind.astype(np.int_),
+            lind_struct=np.asarray(indStruct, dtype=np.int_),
+            nb=nb, rtype=rtype, seed=seed,
+            rmin=-1, forbid=True, eps_uz=1.e-6, eps_vz=1.e-9,
+            eps_a=1.e-9, eps_b=1.e-9, eps_plane=1.e-9, test=True,
+            **dkwd
+        )
+
+    def add_reflections(self, Type=None, nb=None, seed=None):
         """ Add relfected LOS to the camera
 
         Reflected LOS can be of 3 types:
@@ -4887,6 +5155,12 @@ class Rays(utils.ToFuObject):
         As opposed to self.get_reflections_as_cam(), the reflected rays are
         stored in the camera object
 
+        For a toroidal config with the 'optimized' method, all nb reflections
+        are computed natively (in parallel over the LOS)
+
+        seed (int) can be provided to make the diffusive reflections
+        reproducible
+
         """
 
         # Check inputs
@@ -4895,6 +5169,22 @@ class Rays(utils.ToFuObject):
         nb = int(nb)
         assert nb > 0
 
+        if self.config.Id.Type == "Tor" and self._method == "optimized":
+            out = self._compute_reflections(Type=Type, nb=nb, seed=seed)
+            Ds, us, kouts, vperps, indouts, Types = out
+            self._dgeom["dreflect"] = {
+                "nb": nb,
+                "Type": Type,
+                "Types": Types,
+                "Ds": Ds,
+                "us": us,
+                "kouts": kouts,
+                "indouts": indouts,
+            }
+            return
+
+        rng = None if seed is None else np.random.RandomState(seed)
+
         # Prepare output
         nRays = self.nRays
         Types = np.full((nRays, nb), 0, dtype=int)
@@ -4913,6 +5203,7 @@ class Rays(utils.ToFuObject):
             vperp=self._dgeom["vperp"],
             indout=self._dgeom["indout"],
             Type=Type,
+            rng=rng,
         )
         indStruct, largs, dkwd = self._prepare_inputs_kInOut(
             D=Ds[:, :, 0], u=us[:, :, 0], indStruct=self._dgeom["indStruct"]
@@ -4933,6 +5224,7 @@ class Rays(utils.ToFuObject):
                 vperp=vperps[:, :, ii - 1],
                 indout=indouts[:, :, ii - 1],
                 Type=Type,
+                rng=rng,
             )
             outi = self._compute_kInOut(
                 largs=[Dsi, usi, largs[2], largs[3]],
@@ -5211,16 +5503,7 @@ class Rays(utils.ToFuObject):
 
     @property
     def indStruct_computeInOut(self):
-        compute = self.config.get_compute()
-        lS = self.config.lStruct
-        iI, iO = [], []
-        for ii in range(0, len(lS)):
-            if compute[ii]:
-                if lS[ii]._InOut == "in":
-                    iI.append(ii)
-                elif lS[ii]._InOut == "out":
-                    iO.append(ii)
-        return np.r_[iI + iO]
+        return self.config._get_indStruct_computeInOut()
 
     @property
     def Etendues(self):
@@ -5864,6 +6147,455 @@ class Rays(utils.ToFuObject):
             k = np.split(k, lind, axis=-1)
         return k, reseff, lind
 
+    @staticmethod
+    def _get_cache_nbytes(val):
+        """ Return the memory (bytes) of a cached plan, bundle or operator """
+        if isinstance(val, dict):
+            return int(np.sum([vv.nbytes for vv in val.values()
+                               if isinstance(vv, np.ndarray)]))
+        elif scpsp.issparse(val):
+            return val.data.nbytes + val.indices.nbytes + val.indptr.nbytes
+        return val.nbytes
+
+    @classmethod
+    def _set_cache(cls, dcache, key, val, maxbytes=_CACHE_MAXBYTES):
+        """ Store val in dcache, an OrderedDict used as a LRU cache
+
+        The least recently used items are freed so that dcache holds at most
+        maxbytes (val is not stored if larger than maxbytes)
+        """
+        if cls._get_cache_nbytes(val) > maxbytes:
+            return
+        dcache[key] = val
+        dcache.move_to_end(key)
+        nbytes = np.sum([cls._get_cache_nbytes(vv) for vv in dcache.values()])
+        while nbytes > maxbytes:
+            nbytes -= cls._get_cache_nbytes(dcache.popitem(last=False)[1])
+
+    @staticmethod
+    def _check_use_plan(use_plan=None, method=None, minimize=None):
+        """ Return True if a cached SamplingPlan is to be used
+
+        A plan holds the sampling of all LOS at once, so it is incompatible
+        with minimize="chunks" (bounded memory), and ignored for adaptive
+        quadrature (the sampling depends on the integrand)
+        """
+        if use_plan and minimize == "chunks":
+            msg = (
+                "Arg use_plan cannot be used with minimize='chunks'!\n"
+                + "  (a SamplingPlan holds the sampling of all LOS at once)\n"
+                + "\t- Provided: use_plan = {}, minimize = {}".format(
+                    use_plan, minimize)
+            )
+            raise Exception(msg)
+        return bool(use_plan) and method != "adaptive"
+
+    def _get_sampling_plan(
+        self,
+        Ds,
+        us,
+        DL,
+        res=None,
+        resMode="abs",
+        method="sum",
+        ani=False,
+        num_threads=_NUM_THREADS,
+        cache=True,
+    ):
+        """ Return the (cached if possible) SamplingPlan of LOS (Ds, us, DL)
+
+        Plans are cached with a key made of a hash of the sampled geometry
+        and of the sampling parameters, in a LRU cache limited to
+        _CACHE_MAXBYTES
+        """
+        if res is None:
+            res = _RES
+        hh = hashlib.sha1()
+        for arr in [Ds, us, DL, np.atleast_1d(res)]:
+            hh.update(np.ascontiguousarray(arr, dtype=float).tobytes())
+        key = (hh.hexdigest(), resMode, method)
+
+        # A plan with emission directions can also serve isotropic cases
+        lani = [True] if ani else [False, True]
+        for aa in lani:
+            if key + (aa,) in self._dplans.keys():
+                self._dplans.move_to_end(key + (aa,))
+                return self._dplans[key + (aa,)]
+
+        plan = _GG.LOS_get_sampling_plan(
+            Ds,
+            us,
+            res,
+            DL,
+            dmethod=resMode,
+            method=method,
+            ani=ani,
+            num_threads=num_threads,
+            Test=True,
+        )
+        if cache:
+            self._set_cache(self._dplans, key + (ani,), plan)
+        return plan
+
+    def get_sampling_plan(
+        self,
+        res=None,
+        resMode="abs",
+        DL=None,
+        method="sum",
+        ani=False,
+        ind=None,
+        num_threads=_NUM_THREADS,
+        cache=True,
+    ):
+        """ Return a SamplingPlan of the LOS, re-usable by calc_signal
+
+        The LOS are sampled once (points, effective resolutions, indices of
+        each LOS and, if ani=True, emission directions) and the result can
+        be passed to _GG.LOS_calc_signal(plan=...) to avoid re-sampling.
+        If cache=True, the plan is stored and re-used by calc_signal() and
+        calc_signal_from_Plasma2D() (with use_plan=True) as long as the
+        geometry and the sampling parameters are unchanged.
+
+        Arguments res, resMode, DL, method and ind are the same as for
+        :meth:`~tofu.geom.Rays.calc_signal`
+
+        Returns
+        -------
+        plan:   None / _GG.SamplingPlan
+            The sampling of the LOS that can be sampled (None if none)
+        indok:  np.ndarray
+            A (nlos,) bool array, True for LOS included in the plan
+
+        """
+        indok, Ds, us, DL, _ = self._calc_signal_preformat(ind=ind, DL=DL)
+        if Ds is None:
+            return None, indok
+        plan = self._get_sampling_plan(
+            Ds,
+            us,
+            DL,
+            res=res,
+            resMode=resMode,
+            method=method,
+            ani=ani,
+            num_threads=num_threads,
+            cache=cache,
+        )
+        return plan, indok
+
+    def clear_sampling_plans(self):
+        """ Remove all cached SamplingPlans (cf. get_sampling_plan()) """
+        self._dplans = collections.OrderedDict()
+
+    def get_bundle(
+        self,
+        nsub=None,
+        ddet=None,
+        rap=None,
+        dap=None,
+        method="stratified",
+        seed=None,
+        cache=True,
+    ):
+        """ Return a bundle of sub-rays sampling the finite etendue of each LOS
+
+        Each LOS is considered as the line joining the centre of a detector
+        (at D, rectangle of sides ddet normal to u) to the centre of a
+        circular aperture (radius rap, normal to u, at distance dap along u).
+        nsub sub-rays are sampled per LOS (joining a point of the detector to
+        a point of the aperture), all traced in a single call and weighted by
+        their contribution to the etendue of the LOS.
+        The bundle can then be passed to calc_signal(bundle=...).
+
+        Parameters
+        ----------
+        nsub:       None / int
+            Number of sub-rays per LOS (default: 16)
+        ddet:       float / iterable of 2 floats
+            Side(s) of the detector, in m
+        rap:        float
+            Radius of the aperture, in m
+        dap:        None / float / iterable of nRays floats
+            Distance from the detector to the aperture, in m
+            If None, the distance to the pinhole (pinhole cameras only)
+        method:     str
+            Flag indicating how sub-rays are sampled:
+                - 'stratified': latin hypercube over the detector and the
+                                aperture, independent for each LOS
+                - 'sobol':      Sobol sequence (randomly shifted if seed)
+        seed:       None / int
+            Seed of the random draws, for reproducibility
+        cache:      bool
+            If True, the bundle is stored and re-used as long as the geometry
+            and the parameters are unchanged (only if it is reproducible,
+            i.e.: if seed is provided or method='sobol')
+
+        Returns
+        -------
+        dbundle:    dict
+            With keys:
+                - 'nsub':       number of sub-rays per LOS
+                - 'Ds', 'us':   (3, nsub*nRays) sub-rays, sub-ray jj of LOS
+                                ii being in column jj*nRays + ii
+                - 'kIn','kOut': (nsub*nRays,) limits of each sub-ray
+                - 'etend':      (nsub, nRays) etendue of each sub-ray
+                - 'Etendues':   (nRays,) etendue of each LOS (sum of etend)
+                - 'indok':      (nRays,) bool, True for LOS with at least
+                                one sub-ray seeing the plasma
+
+        """
+        # Check inputs
+        if nsub is None:
+            nsub = 16
+        nsub = int(nsub)
+        assert nsub > 0
+        if ddet is None or rap is None:
+            msg = "Args ddet and rap must be provided to sample a bundle!"
+            raise Exception(msg)
+        if dap is None:
+            if not self.isPinhole:
+                msg = "Arg dap must be provided if not a pinhole camera!"
+                raise Exception(msg)
+            dap = np.sqrt(np.sum(
+                (self.pinhole[:, None] - self.D)**2, axis=0))
+        dap = np.broadcast_to(np.asarray(dap, dtype=float).ravel(),
+                              (self.nRays,))
+        ddet = np.broadcast_to(np.asarray(ddet, dtype=float).ravel(), (2,))
+
+        cache = cache and (seed is not None or method == "sobol")
+        if cache:
+            hh = hashlib.sha1()
+            for arr in [self.D, self.u, dap, ddet, np.atleast_1d(rap)]:
+                hh.update(np.ascontiguousarray(arr, dtype=float).tobytes())
+            key = (hh.hexdigest(), nsub, method, seed)
+            if key in self._dbundles.keys():
+                self._dbundles.move_to_end(key)
+                return self._dbundles[key]
+
+        # Sample and trace all sub-rays in one call
+        Ds, us, etend = _comp.LOS_get_bundle(
+            self.D, self.u, dap, ddet, float(rap),
+            nsub=nsub, method=method, seed=seed,
+        )
+        indStruct, largs, dkwd = self._prepare_inputs_kInOut(D=Ds, u=us)
+        kIn, kOut = self._compute_kInOut(
+            largs=largs, dkwd=dkwd, indStruct=indStruct
+        )[:2]
+        kIn[np.isnan(kIn)] = 0.
+        indout = ~((kOut > kIn) & np.isfinite(kOut))
+
+        # Sub-rays not seeing the plasma do not contribute: they are
+        # replaced by a valid sub-ray of the same LOS with a zero etendue
+        etend[indout.reshape((nsub, self.nRays))] = 0.
+        indok = np.any(etend > 0., axis=0)
+        ivalid = np.argmax(etend > 0., axis=0)
+        indsub = np.where(indout.reshape((nsub, self.nRays)),
+                          ivalid[None, :], np.arange(0, nsub)[:, None])
+        indcol = (indsub * self.nRays
+                  + np.arange(0, self.nRays)[None, :]).ravel()
+        dbundle = {
+            "nsub": nsub,
+            "Ds": np.ascontiguousarray(Ds[:, indcol]),
+            "us": np.ascontiguousarray(us[:, indcol]),
+            "kIn": kIn[indcol],
+            "kOut": kOut[indcol],
+            "etend": etend,
+            "Etendues": etend.sum(axis=0),
+            "indok": indok,
+        }
+        if cache:
+            self._set_cache(self._dbundles, key, dbundle)
+        return dbundle
+
+    def clear_bundles(self):
+        """ Remove all cached bundles of sub-rays (cf. get_bundle()) """
+        self._dbundles = collections.OrderedDict()
+
+    def _get_reflect_stacked(
+        self, Ds, us, DL, res, indok, ind=None,
+        reflections=True, coefs_reflect=None,
+    ):
+        """ Stack the LOS of all reflection orders (if any)
+
+        Returns Ds, us, DL, res of the primary LOS followed by those of each
+        reflection order (sharing the same DL), and the (norders,) weights
+        of each order (None if there are no reflections)
+        """
+        c0 = (
+            reflections
+            and self._dgeom["dreflect"] is not None
+            and self._dgeom["dreflect"].get("nb", 0) > 0
+        )
+        if not c0:
+            return Ds, us, DL, res, None
+
+        nb = self._dgeom["dreflect"]["nb"]
+        if coefs_reflect is None:
+            coefs_reflect = 1.0
+        coefs_reflect = np.atleast_1d(coefs_reflect).astype(float).ravel()
+        if coefs_reflect.size not in [1, nb]:
+            msg = ("Arg coefs_reflect must be a float or an iterable of "
+                   + "{} floats (one per reflection)\n".format(nb)
+                   + "\t- Provided: {}".format(coefs_reflect))
+            raise Exception(msg)
+        coefs = np.r_[1., np.broadcast_to(coefs_reflect, (nb,))]
+
+        # (3, nlos, nb) => (3, nb*nlos), order by order
+        indch = self._check_indch(ind)[indok]
+        Dsr = self._dgeom["dreflect"]["Ds"][:, indch, :]
+        usr = self._dgeom["dreflect"]["us"][:, indch, :]
+        Ds = np.concatenate((Ds, Dsr.T.reshape((-1, 3)).T), axis=1)
+        us = np.concatenate((us, usr.T.reshape((-1, 3)).T), axis=1)
+        DL = np.tile(DL, nb + 1)
+        if hasattr(res, "__iter__"):
+            res = np.tile(res, nb + 1)
+        return (np.ascontiguousarray(Ds), np.ascontiguousarray(us),
+                np.ascontiguousarray(DL), res, coefs)
+
+    def _get_bundle_stacked(self, dbundle, res, ind=None):
+        """ Stack the sub-rays of a bundle (cf. get_bundle())
+
+        Returns indok, Ds, us, DL, res of the sub-rays of the LOS ind (the
+        nsub sub-rays of each LOS ok, sub-ray by sub-ray) and the
+        (nsub, nlosok) weights of each sub-ray (summing to 1 for each LOS)
+        """
+        ind = self._check_indch(ind)
+        nsub = dbundle["nsub"]
+        indok = dbundle["indok"][ind]
+        if not np.any(indok):
+            return indok, None, None, None, res, None
+        indl = ind[indok]
+        indcol = (np.arange(0, nsub)[:, None] * self.nRays
+                  + indl[None, :]).ravel()
+        Ds = dbundle["Ds"][:, indcol]
+        us = dbundle["us"][:, indcol]
+        DL = np.array([dbundle["kIn"][indcol], dbundle["kOut"][indcol]])
+        etend = dbundle["etend"][:, indl]
+        coefs = etend / np.sum(etend, axis=0)[None, :]
+        if hasattr(res, "__iter__"):
+            res = np.tile(res, nsub)
+        return (indok, np.ascontiguousarray(Ds), np.ascontiguousarray(us),
+                np.ascontiguousarray(DL), res, coefs)
+
+    def get_projection_operator(
+        self,
+        plasma2d,
+        key=None,
+        interp_space=None,
+        res=None,
+        resMode="abs",
+        DL=None,
+        method="sum",
+        ind=None,
+        reflections=True,
+        coefs_reflect=None,
+        num_threads=_NUM_THREADS,
+        cache=True,
+    ):
+        """ Return the sparse LOS-to-mesh projection operator
+
+        The operator G is a scipy.sparse.csr_matrix of shape (nlos, nmesh)
+        combining the LOS sampling, the quadrature weights and the spatial
+        interpolation weights on the mesh of a 2d quantity of plasma2d, so
+        that the LOS-integrated signal of a quantity q defined on that mesh
+        (faces or nodes, shape (nt, nmesh)) is, for all time steps at once:
+            sig = G.dot(q.T).T      (shape (nt, nlos))
+        Points outside of the mesh do not contribute (fill_value=0)
+
+        If cache=True, G is stored and re-used as long as the geometry, the
+        mesh and the sampling parameters are unchanged (LRU cache limited to
+        _CACHE_MAXBYTES).
+        It can be saved / loaded with save_projection_operator() and
+        load_projection_operator()
+
+        Parameters
+        ----------
+        plasma2d:   tofu.data.Plasma2D
+            Plasma2D instance providing the mesh
+        key:        str
+            key of a 2d quantity (or of a mesh) of plasma2d
+        interp_space:   None / int
+            degree of the spatial interpolation on the mesh (cf.
+            plasma2d.get_interp_matrix()), the mesh ftype by default
+        res, resMode, DL, method, ind, reflections, coefs_reflect:
+            Same as for :meth:`~tofu.geom.Rays.calc_signal`
+
+        Returns
+        -------
+        G:      scipy.sparse.csr_matrix
+            The (indok.sum(), nmesh) operator (None if no LOS is valid)
+        indok:  np.ndarray
+            A (nlos,) bool array, True for LOS included in G
+
+        """
+        indok, Ds, us, DL, _ = self._calc_signal_preformat(ind=ind, DL=DL)
+        if Ds is None:
+            return None, indok
+        if res is None:
+            res = _RES
+        idmesh = plasma2d._get_idmesh(key)
+        mesh = plasma2d._ddata[idmesh]['data']
+        if interp_space is None:
+            interp_space = mesh['ftype']
+
+        # Stack reflections (if any)
+        Ds, us, DL, res, coefs_orders = self._get_reflect_stacked(
+            Ds, us, DL, res, indok, ind=ind,
+            reflections=reflections, coefs_reflect=coefs_reflect,
+        )
+
+        # Get key from geometry, mesh and sampling
+        hh = hashlib.sha1()
+        lmesh = ['R', 'Z'] if mesh['type'] == 'rect' else ['nodes', 'faces']
+        larr = [Ds, us, DL, np.atleast_1d(res)] + [mesh[kk] for kk in lmesh]
+        if coefs_orders is not None:
+            larr.append(coefs_orders)
+        for arr in larr:
+            hh.update(np.ascontiguousarray(arr, dtype=float).tobytes())
+        keyop = (hh.hexdigest(), mesh['type'], mesh['ftype'], interp_space,
+                 resMode, method)
+        if keyop in self._dprojop.keys():
+            self._dprojop.move_to_end(keyop)
+            return self._dprojop[keyop], indok
+
+        # Build operator: integration x interpolation (x sum of orders)
+        # (the plan is not cached, the operator is)
+        plan = self._get_sampling_plan(
+            Ds, us, DL, res=res, resMode=resMode, method=method,
+            num_threads=num_threads, cache=False,
+        )
+        G = _comp.LOS_get_integration_matrix(
+            plan.los_ind, plan.reseff, method=method,
+        ).dot(plasma2d.get_interp_matrix(pts=plan.pts, key=idmesh,
+                                         deg=interp_space))
+        if coefs_orders is not None:
+            nlos = indok.sum()
+            G = scpsp.hstack(
+                [cc*scpsp.identity(nlos, format='csr') for cc in coefs_orders]
+            ).dot(G)
+        G = G.tocsr()
+        if cache:
+            self._set_cache(self._dprojop, keyop, G)
+        return G, indok
+
+    def clear_projection_operators(self):
+        """ Remove all cached projection operators """
+        self._dprojop = collections.OrderedDict()
+
+    @staticmethod
+    def save_projection_operator(G, pfe):
+        """ Save a projection operator (cf. get_projection_operator())
+
+        pfe is the path, file name and extension ('.npz') of the file
+        """
+        scpsp.save_npz(pfe, G)
+
+    @staticmethod
+    def load_projection_operator(pfe):
+        """ Load a projection operator saved by save_projection_operator() """
+        return scpsp.load_npz(pfe)
+
     def _kInOut_Isoflux_inputs(self, lPoly, lVIn=None):
 
         if self._method == "ref":
@@ -6375,6 +7107,44 @@ class Rays(utils.ToFuObject):
         else:
             return sig, units
 
+    def _calc_signal_postformat_lquant(
+        self,
+        dsig,
+        plot=True,
+        out=object,
+        fs=None,
+        dmargin=None,
+        wintit=None,
+        invert=True,
+        draw=True,
+        connect=True,
+        **kwdargs
+    ):
+        """ Format the signals of several quantities (dict), plotted together
+
+        kwdargs are passed to _calc_signal_postformat()
+        Return a dict of outputs (one per quantity)
+        """
+        dout = {
+            qq: self._calc_signal_postformat(ss, plot=False, out=out,
+                                             **kwdargs)
+            for qq, ss in dsig.items()
+        }
+        if plot:
+            if out in [object, "object"]:
+                lobj = [dout[qq][0] for qq in dsig.keys()]
+            else:
+                lobj = [self._calc_signal_postformat(ss, plot=False,
+                                                     out=object, **kwdargs)[0]
+                        for ss in dsig.values()]
+            kwdplot = dict(fs=fs, dmargin=dmargin, wintit=wintit,
+                           invert=invert, draw=draw, connect=connect)
+            if len(lobj) == 1:
+                lobj[0].plot(**kwdplot)
+            else:
+                lobj[0].plot_combine(lobj[1:], **kwdplot)
+        return dout
+
     def calc_signal(
         self,
         func,
@@ -6387,10 +7157,17 @@ class Rays(utils.ToFuObject):
         resMode="abs",
         method="sum",
         minimize="calls",
+        max_bytes=_MAX_BYTES,
+        rtol=1.e-3,
+        atol=0.,
+        max_iter=20,
+        return_neval=False,
+        use_plan=False,
         num_threads=16,
         reflections=True,
         coefs=None,
         coefs_reflect=None,
+        bundle=None,
         ind=None,
         returnas=object,
         plot=True,
@@ -6430,14 +7207,44 @@ class Rays(utils.ToFuObject):
                 - vect: None / (3,N) np.ndarray, unit direction vectors (X,Y,Z)
             Should return at least:
                 - val : (N,) np.ndarray, local emissivity values
-        method : string, the integral can be computed using 3 different methods
+        method : string, the integral can be computed using 4 different methods
             - 'sum':    A numpy.sum() on the local values (x segments) DEFAULT
             - 'simps':  using :meth:`scipy.integrate.simps`
             - 'romb':   using :meth:`scipy.integrate.romb`
+            - 'adaptive': adaptive Simpson quadrature, starting from
+                        segments of length res, refined where needed until
+                        the error on each LOS is below max(atol, rtol*|sig|)
         minimize : string, method to minimize for computation optimization
             - "calls": minimal number of calls to `func` (default)
             - "memory": slowest method, to use only if "out of memory" error
             - "hybrid": mix of before-mentioned methods.
+            - "chunks": LOS are sampled, evaluated and integrated by blocks
+                        so that each block uses at most max_bytes of memory
+        max_bytes : float
+            Memory budget (in bytes) per block of LOS, used only if
+            minimize="chunks"
+        rtol, atol : float
+            Relative and absolute tolerance on the signal of each LOS, used
+            only if method="adaptive"
+        max_iter : int
+            Maximum number of refinements, used only if method="adaptive"
+        return_neval : bool
+            If True, also return the (nlos,) number of evaluations of func
+            per LOS (0 for LOS not seeing the plasma), only available if
+            method="adaptive" (None otherwise)
+        use_plan : bool
+            If True, the LOS sampling is computed once, cached and re-used
+            by later calls with the same geometry and sampling parameters
+            (see :meth:`~tofu.geom.Rays.get_sampling_plan`), minimize is
+            then ignored (use_plan is ignored if method="adaptive" and
+            cannot be used with minimize="chunks").
+        bundle : None / dict
+            If provided (see :meth:`~tofu.geom.Rays.get_bundle`), each LOS is
+            replaced by its bundle of sub-rays (finite etendue), all sampled
+            and integrated at once, and the signal is the etendue-weighted
+            average of the sub-rays signals. DL and reflections are then
+            ignored, and if Brightness=False the etendues of the bundle are
+            used.
 
 
         Returns
@@ -6447,24 +7254,47 @@ class Rays(utils.ToFuObject):
             vector was provided.
         units:  str
             Units of the result
+        neval:  None / np.ndarray
+            Only if return_neval=True, see above
 
         """
 
         # Format input
-
-        indok, Ds, us, DL, E = self._calc_signal_preformat(
-            ind=ind, DL=DL, out=returnas, Brightness=Brightness
-        )
+        if res is None:
+            res = _RES
+        if bundle is None:
+            indok, Ds, us, DL, E = self._calc_signal_preformat(
+                ind=ind, DL=DL, out=returnas, Brightness=Brightness
+            )
+        else:
+            assert newcalc, "Arg bundle is only available with newcalc=True"
+            # The sub-rays (and their etendues) replace the LOS
+            indok, Ds, us, DL, res, coefs_orders = self._get_bundle_stacked(
+                bundle, res, ind=ind
+            )
+            E = None
+            if Brightness is False:
+                E = bundle["Etendues"][self._check_indch(ind)]
 
         if Ds is None:
             return None
-        if res is None:
-            res = _RES
 
         # Launch    # NB : find a way to exclude cases with DL[0,:]>=DL[1,:] !!
         # Exclude Rays not seeing the plasma
         if newcalc:
             ani, func = self.check_ff(func, t=t, ani=ani)
+            # All reflection orders share sampling and calls to func
+            if bundle is None:
+                Ds, us, DL, res, coefs_orders = self._get_reflect_stacked(
+                    Ds, us, DL, res, indok, ind=ind,
+                    reflections=reflections, coefs_reflect=coefs_reflect,
+                )
+            plan = None
+            if self._check_use_plan(use_plan, method, minimize):
+                plan = self._get_sampling_plan(
+                    Ds, us, DL, res=res, resMode=resMode, method=method,
+                    ani=ani, num_threads=num_threads,
+                )
             s = _GG.LOS_calc_signal(
                 func,
                 Ds,
@@ -6477,52 +7307,34 @@ class Rays(utils.ToFuObject):
                 t=t,
                 fkwdargs=fkwdargs,
                 minimize=minimize,
+                max_bytes=max_bytes,
+                plan=plan,
+                coefs_reflect=coefs_orders,
+                rtol=rtol,
+                atol=atol,
+                max_iter=max_iter,
+                return_neval=return_neval,
                 num_threads=num_threads,
                 Test=True,
             )
-
-            c0 = (
-                reflections
-                and self._dgeom["dreflect"] is not None
-                and self._dgeom["dreflect"].get("nb", 0) > 0
-            )
-            if c0:
-                if coefs_reflect is None:
-                    coefs_reflect = 1.0
-                for ii in range(self._dgeom["dreflect"]["nb"]):
-                    Dsi = np.ascontiguousarray(
-                        self._dgeom["dreflect"]["Ds"][:, :, ii]
-                    )
-                    usi = np.ascontiguousarray(
-                        self._dgeom["dreflect"]["us"][:, :, ii]
-                    )
-                    s += coefs_reflect * _GG.LOS_calc_signal(
-                        func,
-                        Dsi,
-                        usi,
-                        res,
-                        DL,
-                        dmethod=resMode,
-                        method=method,
-                        ani=ani,
-                        t=t,
-                        fkwdargs=fkwdargs,
-                        minimize=minimize,
-                        num_threads=num_threads,
-                        Test=True,
-                    )
+            neval = None
+            if return_neval and method == "adaptive":
+                s, nn = s
+                neval = np.zeros((indok.size,), dtype=int)
+                neval[indok] = nn
 
             # Integrate
             # Creating the arrays with null everywhere..........
             if s.ndim == 2:
-                sig = np.full((s.shape[0], self.nRays), np.nan)
+                sig = np.full((s.shape[0], indok.size), np.nan)
             else:
-                sig = np.full((1, self.nRays), np.nan)
+                sig = np.full((1, indok.size), np.nan)
             if t is None or len(t) == 1:
                 sig[0, indok] = s
             else:
                 sig[:, indok] = s
         else:
+            neval = None
             # Get ptsRZ along LOS // Which to choose ???
             pts, reseff, indpts = self.get_sample(
                 res,
@@ -6560,7 +7372,7 @@ class Rays(utils.ToFuObject):
             sig *= coefs
 
         # Format output
-        return self._calc_signal_postformat(
+        out = self._calc_signal_postformat(
             sig,
             Brightness=Brightness,
             dataname=dataname,
@@ -6576,6 +7388,9 @@ class Rays(utils.ToFuObject):
             draw=draw,
             connect=connect,
         )
+        if return_neval:
+            return out, neval
+        return out
 
     def calc_signal_from_Plasma2D(
         self,
@@ -6598,6 +7413,13 @@ class Rays(utils.ToFuObject):
         resMode="abs",
         method="sum",
         minimize="calls",
+        max_bytes=_MAX_BYTES,
+        rtol=1.e-3,
+        atol=0.,
+        max_iter=20,
+        return_neval=False,
+        use_plan=False,
+        projection=False,
         num_threads=16,
         reflections=True,
         coefs=None,
@@ -6614,8 +7436,35 @@ class Rays(utils.ToFuObject):
         draw=True,
         connect=True,
     ):
+        """ Return the line-integrated emissivity of a Plasma2D quantity
+
+        Most arguments are the same as for
+        :meth:`~tofu.geom.Rays.calc_signal`
+
+        If projection=True, the signal is computed for all time steps at once
+        with the sparse projection operator returned by
+        :meth:`~tofu.geom.Rays.get_projection_operator` (cached), only
+        available for isotropic 2d quantities, with fill_value = 0 (or None)
+        The operator embeds the LOS sampling, so use_plan is irrelevant and
+        minimize="chunks" is not available
+
+        With method="adaptive", rtol, atol and max_iter control the
+        quadrature and, if return_neval=True, (out, neval) is returned (neval
+        is None for other methods)
+
+        quant can be a list of quantities sharing the same mesh (and ref1d /
+        ref2d), a dict of outputs (one per quantity) is then returned, all
+        computed at the same times (by default the union of the time vectors
+        of the quantities) and plotted in a single figure
+        The LOS are then sampled once and each call to the interpolation
+        function returns all quantities (with minimize='calls' or 'chunks',
+        or method='adaptive', the quantities sharing the memory budget),
+        otherwise each quantity is computed separately
+        """
+        kwdargs = dict(locals())
 
         # Format input
+        DLin = DL
         indok, Ds, us, DL, E = self._calc_signal_preformat(
             ind=ind, out=returnas, t=t, Brightness=Brightness
         )
@@ -6624,6 +7473,46 @@ class Rays(utils.ToFuObject):
             return None
         if res is None:
             res = _RES
+        neval = None
+
+        # List of quantities: common times
+        lquant = None
+        if type(quant) in [list, tuple]:
+            lquant = list(quant)
+            if t is None:
+                lt = []
+                for qq in lquant:
+                    out = plasma2d._checkformat_qr12RPZ(quant=qq, ref1d=ref1d,
+                                                        ref2d=ref2d)
+                    lt.append(np.atleast_1d(plasma2d._get_tcom(*out[:4])[0]))
+                t = np.unique(np.concatenate(lt))
+            elif type(t) is str:
+                t = plasma2d._ddata[t]['data']
+            t = np.atleast_1d(t).ravel()
+
+            c0 = (newcalc and not projection
+                  and (method == "adaptive"
+                       or minimize.lower() in ["calls", "chunks"]))
+            if not c0:
+                # Each quantity computed separately, formatted together
+                for kk in ['self', 'plasma2d', 'quant', 'return_neval']:
+                    del kwdargs[kk]
+                kwdargs.update(t=t, Brightness=True, returnas=np.ndarray,
+                               plot=False)
+                dsig = {
+                    qq: self.calc_signal_from_Plasma2D(plasma2d, quant=qq,
+                                                       **kwdargs)[0]
+                    for qq in lquant
+                }
+                out = self._calc_signal_postformat_lquant(
+                    dsig, Brightness=Brightness, dataname=dataname, t=t, E=E,
+                    units=units, plot=plot, out=returnas, fs=fs,
+                    dmargin=dmargin, wintit=wintit, invert=invert, draw=draw,
+                    connect=connect,
+                )
+                if return_neval:
+                    return out, neval
+                return out
 
         if newcalc:
             # Get time vector
@@ -6647,21 +7536,72 @@ class Rays(utils.ToFuObject):
             if fill_value is None:
                 fill_value = 0.0
 
-            func = plasma2d.get_finterp2d(
-                quant=quant,
-                ref1d=ref1d,
-                ref2d=ref2d,
-                q2dR=q2dR,
-                q2dPhi=q2dPhi,
-                q2dZ=q2dZ,
-                interp_t=interp_t,
-                interp_space=interp_space,
-                fill_value=fill_value,
-                Type=Type,
+        if newcalc and projection:
+            out = plasma2d._checkformat_qr12RPZ(
+                 quant=quant,
+                 ref1d=ref1d,
+                 ref2d=ref2d,
+                 q2dR=q2dR,
+                 q2dPhi=q2dPhi,
+                 q2dZ=q2dZ,
             )
-
-            def funcbis(*args, **kwdargs):
-                return func(*args, **kwdargs)[0]
+            if out[1] is not None or out[-1] is True:
+                msg = ("projection=True only available for isotropic "
+                       + "quantities defined on a 2d mesh (quant)")
+                raise Exception(msg)
+            if fill_value != 0.:
+                msg = ("projection=True only available with fill_value = 0"
+                       + " (pts outside of the mesh do not contribute)\n"
+                       + "\t- Provided: {}".format(fill_value))
+                raise Exception(msg)
+            if minimize == "chunks":
+                msg = ("projection=True not available with minimize='chunks'"
+                       + " (the operator holds all LOS at once)")
+                raise Exception(msg)
+            G = self.get_projection_operator(
+                plasma2d,
+                key=out[0],
+                interp_space=interp_space,
+                res=res,
+                resMode=resMode,
+                DL=DLin,
+                method=method,
+                ind=ind,
+                reflections=reflections,
+                coefs_reflect=coefs_reflect,
+                num_threads=num_threads,
+            )[0]
+            val, t = plasma2d._get_quant_on_mesh(out[0], t=t,
+                                                 interp_t=interp_t)
+            sig = G.dot(val.T).T
+
+        elif newcalc:
+            if lquant is None:
+                func = plasma2d.get_finterp2d(
+                    quant=quant,
+                    ref1d=ref1d,
+                    ref2d=ref2d,
+                    q2dR=q2dR,
+                    q2dPhi=q2dPhi,
+                    q2dZ=q2dZ,
+                    interp_t=interp_t,
+                    interp_space=interp_space,
+                    fill_value=fill_value,
+                    Type=Type,
+                )
+            else:
+                # Returns a dict of values (all quantities at once)
+                func = plasma2d._checkformat_pts2profile(
+                    pts=np.zeros((3, 1)),
+                    t=t,
+                    quant=lquant,
+                    ref1d=ref1d,
+                    ref2d=ref2d,
+                    interp_t=interp_t,
+                    interp_space=interp_space,
+                    fill_value=fill_value,
+                    Type=Type,
+                )[0]
 
             if DL is None:
                 # set to [kIn,kOut]
@@ -6670,57 +7610,59 @@ class Rays(utils.ToFuObject):
             if num_threads is None:
                 num_threads = _NUM_THREADS
 
-            if np.all(indok):
-                D, u = self.D, self.u
-            else:
-                D = np.ascontiguousarray(self.D[:, indok])
-                u = np.ascontiguousarray(self.u[:, indok])
+            # All reflection orders share sampling and calls to func
+            Ds, us, DL, res, coefs_orders = self._get_reflect_stacked(
+                Ds, us, DL, res, indok, ind=ind,
+                reflections=reflections, coefs_reflect=coefs_reflect,
+            )
+            plan = None
+            if self._check_use_plan(use_plan, method, minimize):
+                plan = self._get_sampling_plan(
+                    Ds, us, DL, res=res, resMode=resMode, method=method,
+                    ani=ani, num_threads=num_threads,
+                )
+
+            # Chunks of LOS samples are only interpolated once => they
+            # bypass the interpolation cache of plasma2d
+            cache = plan is not None or minimize.lower() == "calls"
+            import tofu.data._comp as _comp_data
+
+            def funcbis(*args, **kwdargs):
+                if not cache:
+                    kwdargs['dcache'] = _comp_data._InterpCache()
+                if lquant is None:
+                    return func(*args, **kwdargs)[0]
+                # All quantities, stacked along the time axis
+                kwdargs['t'] = t
+                dval = func(*args, **kwdargs)[0]
+                return np.concatenate([dval[qq] for qq in lquant], axis=0)
 
             sig = _GG.LOS_calc_signal(
                 funcbis,
-                D,
-                u,
+                Ds,
+                us,
                 res,
                 DL,
                 dmethod=resMode,
                 method=method,
                 ani=ani,
-                t=t,
+                t=t if lquant is None else np.tile(t, len(lquant)),
                 fkwdargs={},
                 minimize=minimize,
+                max_bytes=max_bytes,
+                plan=plan,
+                coefs_reflect=coefs_orders,
+                rtol=rtol,
+                atol=atol,
+                max_iter=max_iter,
+                return_neval=return_neval,
                 Test=True,
                 num_threads=num_threads,
             )
-            c0 = (
-                reflections
-                and self._dgeom["dreflect"] is not None
-                and self._dgeom["dreflect"].get("nb", 0) > 0
-            )
-            if c0:
-                if coefs_reflect is None:
-                    coefs_reflect = 1.0
-                for ii in range(self._dgeom["dreflect"]["nb"]):
-                    Dsi = np.ascontiguousarray(
-                        self._dgeom["dreflect"]["Ds"][:, :, ii]
-                    )
-                    usi = np.ascontiguousarray(
-                        self._dgeom["dreflect"]["us"][:, :, ii]
-                    )
-                    sig += coefs_reflect * _GG.LOS_calc_signal(
-                        funcbis,
-                        Dsi,
-                        usi,
-                        res,
-                        DL,
-                        dmethod=resMode,
-                        method=method,
-                        ani=ani,
-                        t=t,
-                        fkwdargs={},
-                        minimize=minimize,
-                        num_threads=num_threads,
-                        Test=True,
-                    )
+            if return_neval and method == "adaptive":
+                sig, nn = sig
+                neval = np.zeros((indok.size,), dtype=int)
+                neval[indok] = nn
         else:
             # Get ptsRZ along LOS // Which to choose ???
             pts, reseff, indpts = self.get_sample(
@@ -6777,22 +7719,44 @@ class Rays(utils.ToFuObject):
 
         # Format output
         # this is the secod slowest step (~0.75 s)
-        out = self._calc_signal_postformat(
-            sig,
-            Brightness=Brightness,
-            dataname=dataname,
-            t=t,
-            E=E,
-            units=units,
-            plot=plot,
-            out=returnas,
-            fs=fs,
-            dmargin=dmargin,
-            wintit=wintit,
-            invert=invert,
-            draw=draw,
-            connect=connect,
-        )
+        if lquant is None:
+            out = self._calc_signal_postformat(
+                sig,
+                Brightness=Brightness,
+                dataname=dataname,
+                t=t,
+                E=E,
+                units=units,
+                plot=plot,
+                out=returnas,
+                fs=fs,
+                dmargin=dmargin,
+                wintit=wintit,
+                invert=invert,
+                draw=draw,
+                connect=connect,
+            )
+        else:
+            # Quantities were stacked along the time axis
+            dsig = dict(zip(lquant, np.split(sig, len(lquant), axis=0)))
+            out = self._calc_signal_postformat_lquant(
+                dsig,
+                Brightness=Brightness,
+                dataname=dataname,
+                t=t,
+                E=E,
+                units=units,
+                plot=plot,
+                out=returnas,
+                fs=fs,
+                dmargin=dmargin,
+                wintit=wintit,
+                invert=invert,
+                draw=draw,
+                connect=connect,
+            )
+        if return_neval:
+            return out, neval
         return out
 
     def plot(
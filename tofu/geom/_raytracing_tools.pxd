@@ -35,6 +35,36 @@ cdef void comp_bbox_poly_tor_lim(const int nvert,
                                  const double lmin,
                                  const double lmax) nogil
 
+# ==============================================================================
+# =  Bounding volume hierarchy of the structures (in toroidal configuration)
+# ==============================================================================
+cdef dict comp_struct_bvh_tor(const long[::1] lstruct_nlim_org,
+                              const double[::1] lstruct_polyx,
+                              const double[::1] lstruct_polyy,
+                              list lstruct_lims,
+                              const long[::1] lnvert,
+                              const int nstruct_tot,
+                              const int nstruct_lim)
+
+cdef int comp_bvh_node(const int ind_first,
+                       const int ind_last,
+                       const int inode,
+                       const double* lbounds,
+                       const int* lind_struct,
+                       double* bvh_bounds,
+                       int* bvh_skip,
+                       int* bvh_struct) nogil
+
+cdef int comp_seg_bvh_node(const int jfirst,
+                           const int jlast,
+                           const int inode,
+                           const int inode0,
+                           const double* polyx,
+                           const double* polyy,
+                           double* seg_bounds,
+                           int* seg_skip,
+                           int* seg_range) nogil
+
 cdef void coordshift_simple1d(double[3] pts, bint in_is_cartesian,
                               double CrossRef, double cos_phi,
                               double sin_phi) nogil
@@ -54,6 +84,31 @@ cdef bint inter_ray_aabb_box(const int[3] sign,
                              const double[3] ds,
                              const bint countin) nogil
 
+cdef bint inter_ray_ring_box(const double* ray_orig,
+                             const double* ray_vdir,
+                             const double upscaDp,
+                             const double upar2,
+                             const double dpar2,
+                             const double invuz,
+                             const bint is_horiz,
+                             const double* bounds) nogil
+
+cdef bint get_next_seg_leaf(int* inode,
+                            int* jfirst,
+                            int* jlast,
+                            const int nvert,
+                            const int seg_nnodes,
+                            const double* seg_bounds,
+                            const int* seg_skip,
+                            const int* seg_range,
+                            const double* ray_orig,
+                            const double* ray_vdir,
+                            const double upscaDp,
+                            const double upar2,
+                            const double dpar2,
+                            const double invuz,
+                            const bint is_horiz) nogil
+
 # ==============================================================================
 # =  Raytracing basic tools: intersection ray and triangle (in 3d space)
 # ==============================================================================
@@ -72,7 +127,6 @@ cdef void raytracing_inout_struct_tor(const int num_los,
                                       double[::1] coeff_inter_out,
                                       double[::1] coeff_inter_in,
                                       double[::1] vperp_out,
-                                      const long[::1] lstruct_nlim,
                                       int[::1] ind_inter_out,
                                       const bint forbid0,
                                       const bint forbidbis,
@@ -80,11 +134,18 @@ cdef void raytracing_inout_struct_tor(const int num_los,
                                       const double rmin2,
                                       const double crit2_base,
                                       const int nstruct_lim,
-                                      const double* lbounds,
                                       const double* langles,
                                       const int* lis_limited,
                                       const long* lnvert,
                                       const long* lsz_lim,
+                                      const int nnodes,
+                                      const double* bvh_bounds,
+                                      const int* bvh_skip,
+                                      const int* bvh_struct,
+                                      const int* seg_start,
+                                      const double* seg_bounds,
+                                      const int* seg_skip,
+                                      const int* seg_range,
                                       const double* lstruct_polyx,
                                       const double* lstruct_polyy,
                                       const double* lstruct_normx,
@@ -97,6 +158,48 @@ cdef void raytracing_inout_struct_tor(const int num_los,
                                       const int num_threads,
                                       const bint is_out_struct) nogil
 
+cdef void raytracing_inout_los_tor(const double* loc_org,
+                                   const double* loc_dir,
+                                   double* coeff_in,
+                                   double* coeff_out,
+                                   double* vperp,
+                                   int* ind_out,
+                                   const bint forbid0,
+                                   const bint forbidbis_org,
+                                   const double rmin,
+                                   const double rmin2,
+                                   const double crit2_base,
+                                   const int nstruct_lim,
+                                   const double* langles,
+                                   const int* lis_limited,
+                                   const long* lnvert,
+                                   const long* lsz_lim,
+                                   const int nnodes,
+                                   const double* bvh_bounds,
+                                   const int* bvh_skip,
+                                   const int* bvh_struct,
+                                   const int* seg_start,
+                                   const double* seg_bounds,
+                                   const int* seg_skip,
+                                   const int* seg_range,
+                                   const double* lstruct_polyx,
+                                   const double* lstruct_polyy,
+                                   const double* lstruct_normx,
+                                   const double* lstruct_normy,
+                                   const double eps_uz,
+                                   const double eps_vz,
+                                   const double eps_a,
+                                   const double eps_b,
+                                   const double eps_plane,
+                                   const bint is_out_struct,
+                                   double* loc_vp,
+                                   double* kpin_loc,
+                                   double* kpout_loc,
+                                   int* ind_loc,
+                                   double* last_pout,
+                                   double* invr_ray,
+                                   int* sign_ray) nogil
+
 # ------------------------------------------------------------------
 cdef bint comp_inter_los_vpoly(const double[3] ray_orig,
                                const double[3] ray_vdir,
@@ -105,6 +208,10 @@ cdef bint comp_inter_los_vpoly(const double[3] ray_orig,
                                const double* normx,
                                const double* normy,
                                const int nvert,
+                               const int seg_nnodes,
+                               const double* seg_bounds,
+                               const int* seg_skip,
+                               const int* seg_range,
                                const bint lim_is_none,
                                const double lim_min,
                                const double lim_max,
@@ -165,7 +272,61 @@ cdef void compute_inout_tot(const int nl, const int np,
                             double[::1] coeff_inter_out,
                             double[::1] coeff_inter_in,
                             double[::1] vperp_out,
-                            int[::1] ind_inter_out)
+                            int[::1] ind_inter_out,
+                            dict dbvh)
+
+# ==============================================================================
+# =  Multiple reflections on a Torus
+# ==============================================================================
+cdef double rand_uniform_counter(const unsigned long long seed,
+                                 const unsigned long long counter) nogil
+
+cdef void reflect_ray(const double* u, const double* vperp,
+                      const int rtype, const double rand,
+                      double* u2) nogil
+
+cdef void compute_reflections_tor(const int num_los,
+                                  const int nb,
+                                  const int npts_poly,
+                                  const double[:, ::1] ray_orig,
+                                  const double[:, ::1] ray_vdir,
+                                  const double[::1] coeff_out0,
+                                  const double[:, ::1] vperp0,
+                                  const long[:, ::1] ind_out0,
+                                  const long[::1] ltypes,
+                                  const long[::1] ltypes_ind,
+                                  const long[::1] lind_struct,
+                                  const int rtype,
+                                  const unsigned long long seed,
+                                  const double[:, ::1] ves_poly,
+                                  const double[:, ::1] ves_norm,
+                                  const long[::1] lstruct_nlim_org,
+                                  const double[::1] ves_lims,
+                                  const double[::1] lstruct_polyx,
+                                  const double[::1] lstruct_polyy,
+                                  list lstruct_lims,
+                                  const double[::1] lstruct_normx,
+                                  const double[::1] lstruct_normy,
+                                  const long[::1] lnvert,
+                                  const int nstruct_tot,
+                                  const int nstruct_lim,
+                                  const int sz_ves_lims,
+                                  const double min_poly_r,
+                                  const double rmin_org,
+                                  const double eps_uz,
+                                  const double eps_a,
+                                  const double eps_vz,
+                                  const double eps_b,
+                                  const double eps_plane,
+                                  const bint forbid,
+                                  const int num_threads,
+                                  double[:, :, ::1] ds,
+                                  double[:, :, ::1] us,
+                                  double[:, ::1] kouts,
+                                  double[:, :, ::1] vperps,
+                                  int[:, :, ::1] indouts,
+                                  int[:, ::1] types,
+                                  dict dbvh)
 
 # ==============================================================================
 # =  Raytracing on a Torus only KMin and KMax
@@ -235,7 +396,8 @@ cdef void is_visible_pt_vec(double pt0, double pt1, double pt2,
                                    double eps_vz, double eps_b,
                                    double eps_plane, str ves_type,
                                    bint forbid,
-                                   bint test, int num_threads)
+                                   bint test, int num_threads,
+                                   dict dbvh)
 
 cdef void is_vis_mask(double[::1] ind, double* k,
                       double[::1] coeff_inter_out,
@@ -262,4 +424,5 @@ cdef void are_visible_vec_vec(double[:, ::1] pts1, int npts1,
                                      double eps_vz, double eps_b,
                                      double eps_plane, str ves_type,
                                      bint forbid,
-                                     bint test, int num_threads)
+                                     bint test, int num_threads,
+                                     dict dbvh)
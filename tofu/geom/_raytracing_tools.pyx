@@ -26,6 +26,11 @@ from _basic_geom_tools cimport is_point_in_path_vec
 from _basic_geom_tools cimport compute_inv_and_sign
 cimport _basic_geom_tools as _bgt
 
+# Max. number of segments in a leaf of the hierarchy of a polygon's segments
+cdef int _SEG_LEAF = 4
+# Relative enlargement of the boxes of the segments (robust to rounding)
+cdef double _SEG_PAD = 1.e-6
+
 # ==============================================================================
 # =  3D Bounding box (not Toroidal)
 # ==============================================================================
@@ -263,6 +268,260 @@ cdef inline void comp_bbox_poly_tor_lim(const int nvert,
     bounds[5] = zmax
     return
 
+# ==============================================================================
+# =  Bounding volume hierarchy of the structures (in toroidal configuration)
+# ==============================================================================
+cdef dict comp_struct_bvh_tor(const long[::1] lstruct_nlim_org,
+                              const double[::1] lstruct_polyx,
+                              const double[::1] lstruct_polyy,
+                              list lstruct_lims,
+                              const long[::1] lnvert,
+                              const int nstruct_tot,
+                              const int nstruct_lim):
+    """
+    Computes, once for a set of "OUT" structures, everything the ray-tracing
+    needs to know about them independently of the LOS: the bounding box,
+    angular limits and type of each (limited) sub-structure, and a bounding
+    volume hierarchy (BVH) built on top of the bounding boxes.
+    The BVH is a binary tree whose leaves are the sub-structures in their
+    original order. It is stored depth-first, such that the tree can be
+    traversed without a stack: if the bounding box of node i is not hit,
+    the next node to visit is bvh_skip[i], else it is i+1.
+    Since the leaves keep their order, traversing the BVH gives exactly the
+    same intersections as looping over all the sub-structures.
+    Params
+    =====
+    See compute_inout_tot
+    Returns
+    =======
+    dbvh : dict
+       Dictionary with keys:
+          - 'lstruct_nlim' : (nstruct_lim) number of sub-structures per struct
+          - 'lsz_lim' : (nstruct_lim) index of first sub-struct of each struct
+          - 'lbounds' : (6*nstruct_tot) bounding boxes of the sub-structures
+          - 'langles' : (2*nstruct_tot) angular limits of the sub-structures
+          - 'llimits' : (nstruct_tot) 1 if sub-structure is continous, else 0
+          - 'nnodes' : number of nodes of the BVH (2*nstruct_tot - 1)
+          - 'bvh_bounds' : (6*nnodes) bounding boxes of the nodes
+          - 'bvh_skip' : (nnodes) next node to visit if the box is not hit
+          - 'bvh_struct' : (2*nnodes) (ii, jj) indices of the structure and of
+            its limit for leaves, (-1, -1) for inner nodes
+          - 'seg_start' : (nstruct_lim+1) index of the first node of the
+            hierarchy of the segments of each struct's polygon
+          - 'seg_bounds' : (4*nnodes_seg) (rmin, rmax, zmin, zmax) boxes of
+            the nodes of the hierarchies of segments
+          - 'seg_skip' : (nnodes_seg) next node to visit if the box is not
+            hit (relative to the first node of the struct)
+          - 'seg_range' : (2*nnodes_seg) first and last (excluded) segments
+            of the leaves, (-1, -1) for inner nodes
+    """
+    cdef int ii, jj
+    cdef int ind_struct = 0
+    cdef int len_lim
+    cdef int ind_min
+    cdef int nvert
+    cdef int nnodes = 2*nstruct_tot - 1
+    cdef double lim_min = 0.
+    cdef double lim_max = 0.
+    cdef double[2] lim_ves
+    cdef long[::1] lstruct_nlim = np.array(lstruct_nlim_org, dtype=np.int_)
+    cdef long[::1] lsz_lim = np.zeros((nstruct_lim,), dtype=np.int_)
+    cdef double[::1] lbounds = np.empty((nstruct_tot*6,), dtype=float)
+    cdef double[::1] langles = np.empty((nstruct_tot*2,), dtype=float)
+    cdef int[::1] llimits = np.empty((nstruct_tot,), dtype=np.intc)
+    cdef int[::1] lind_struct = np.empty((nstruct_tot*2,), dtype=np.intc)
+    cdef double[::1] bvh_bounds = np.empty((nnodes*6,), dtype=float)
+    cdef int[::1] bvh_skip = np.empty((nnodes,), dtype=np.intc)
+    cdef int[::1] bvh_struct = np.empty((nnodes*2,), dtype=np.intc)
+    cdef int nnodes_seg = 2*(lnvert[nstruct_lim-1] - nstruct_lim) + 1
+    cdef int[::1] seg_start = np.empty((nstruct_lim + 1,), dtype=np.intc)
+    cdef double[::1] seg_bounds = np.empty((nnodes_seg*4,), dtype=float)
+    cdef int[::1] seg_skip = np.empty((nnodes_seg,), dtype=np.intc)
+    cdef int[::1] seg_range = np.empty((nnodes_seg*2,), dtype=np.intc)
+    # ...
+    for ii in range(nstruct_lim):
+        # For fast accessing
+        len_lim = lstruct_nlim[ii]
+        # We get the limits if any
+        if len_lim == 0:
+            lslim = [None]
+            lstruct_nlim[ii] = lstruct_nlim[ii] + 1
+        elif len_lim == 1:
+            lslim = [[lstruct_lims[ii][0, 0], lstruct_lims[ii][0, 1]]]
+        else:
+            lslim = lstruct_lims[ii]
+        # We get the number of vertices and limits of the struct's poly
+        if ii == 0:
+            lsz_lim[0] = 0
+            nvert = lnvert[0]
+            ind_min = 0
+        else:
+            nvert = lnvert[ii] - lnvert[ii - 1]
+            lsz_lim[ii] = lstruct_nlim[ii-1] + lsz_lim[ii-1]
+            ind_min = lnvert[ii-1]
+        # and loop over the limits (one continous structure)
+        for jj in range(max(len_lim,1)):
+            # We compute the structure's bounding box:
+            if lslim[jj] is not None:
+                lim_ves[0] = lslim[jj][0]
+                lim_ves[1] = lslim[jj][1]
+                llimits[ind_struct] = 0 # False : struct is limited
+                lim_min = Catan2(Csin(lim_ves[0]), Ccos(lim_ves[0]))
+                lim_max = Catan2(Csin(lim_ves[1]), Ccos(lim_ves[1]))
+                comp_bbox_poly_tor_lim(nvert,
+                                       &lstruct_polyx[ind_min],
+                                       &lstruct_polyy[ind_min],
+                                       &lbounds[ind_struct*6],
+                                       lim_min, lim_max)
+            else:
+                llimits[ind_struct] = 1 # True : is continous
+                comp_bbox_poly_tor(nvert,
+                                   &lstruct_polyx[ind_min],
+                                   &lstruct_polyy[ind_min],
+                                   &lbounds[ind_struct*6])
+                lim_min = 0.
+                lim_max = 0.
+            langles[ind_struct*2] = lim_min
+            langles[ind_struct*2 + 1] = lim_max
+            lind_struct[ind_struct*2] = ii
+            lind_struct[ind_struct*2 + 1] = jj
+            ind_struct = 1 + ind_struct
+    # end loops over structures
+    # -- Building the hierarchy of bounding boxes ------------------------------
+    comp_bvh_node(0, nstruct_tot, 0, &lbounds[0], &lind_struct[0],
+                  &bvh_bounds[0], &bvh_skip[0], &bvh_struct[0])
+    # -- Building the hierarchy of the segments of each polygon ----------------
+    seg_start[0] = 0
+    for ii in range(nstruct_lim):
+        if ii == 0:
+            nvert = lnvert[0]
+            ind_min = 0
+        else:
+            nvert = lnvert[ii] - lnvert[ii - 1]
+            ind_min = lnvert[ii-1]
+        seg_start[ii+1] = comp_seg_bvh_node(0, nvert - 1, seg_start[ii],
+                                            seg_start[ii],
+                                            &lstruct_polyx[ind_min],
+                                            &lstruct_polyy[ind_min],
+                                            &seg_bounds[0], &seg_skip[0],
+                                            &seg_range[0])
+    nnodes_seg = seg_start[nstruct_lim]
+    return {'lstruct_nlim': np.asarray(lstruct_nlim),
+            'lsz_lim': np.asarray(lsz_lim),
+            'lbounds': np.asarray(lbounds),
+            'langles': np.asarray(langles),
+            'llimits': np.asarray(llimits),
+            'nnodes': nnodes,
+            'bvh_bounds': np.asarray(bvh_bounds),
+            'bvh_skip': np.asarray(bvh_skip),
+            'bvh_struct': np.asarray(bvh_struct),
+            'seg_start': np.asarray(seg_start),
+            'seg_bounds': np.asarray(seg_bounds)[:nnodes_seg*4],
+            'seg_skip': np.asarray(seg_skip)[:nnodes_seg],
+            'seg_range': np.asarray(seg_range)[:nnodes_seg*2]}
+
+cdef inline int comp_bvh_node(const int ind_first,
+                              const int ind_last,
+                              const int inode,
+                              const double* lbounds,
+                              const int* lind_struct,
+                              double* bvh_bounds,
+                              int* bvh_skip,
+                              int* bvh_struct) nogil:
+    """
+    Recursively fills the node number inode of the BVH, containing the
+    bounding boxes ind_first to ind_last (excluded), and its children.
+    Returns the index of the first node after the sub-tree of inode, ie. the
+    node to visit if the bounding box of inode is not hit.
+    """
+    cdef int ii, jj
+    cdef int ind_mid
+    cdef int inext
+    # The box of the node is the union of the boxes of its leaves
+    for jj in range(6):
+        bvh_bounds[inode*6 + jj] = lbounds[ind_first*6 + jj]
+    for ii in range(ind_first + 1, ind_last):
+        for jj in range(3):
+            if lbounds[ii*6 + jj] < bvh_bounds[inode*6 + jj]:
+                bvh_bounds[inode*6 + jj] = lbounds[ii*6 + jj]
+            if lbounds[ii*6 + 3 + jj] > bvh_bounds[inode*6 + 3 + jj]:
+                bvh_bounds[inode*6 + 3 + jj] = lbounds[ii*6 + 3 + jj]
+    if ind_last - ind_first == 1:
+        # Leaf: a single sub-structure
+        bvh_struct[inode*2] = lind_struct[ind_first*2]
+        bvh_struct[inode*2 + 1] = lind_struct[ind_first*2 + 1]
+        bvh_skip[inode] = inode + 1
+        return inode + 1
+    bvh_struct[inode*2] = -1
+    bvh_struct[inode*2 + 1] = -1
+    ind_mid = (ind_first + ind_last) // 2
+    inext = comp_bvh_node(ind_first, ind_mid, inode + 1, lbounds, lind_struct,
+                          bvh_bounds, bvh_skip, bvh_struct)
+    inext = comp_bvh_node(ind_mid, ind_last, inext, lbounds, lind_struct,
+                          bvh_bounds, bvh_skip, bvh_struct)
+    bvh_skip[inode] = inext
+    return inext
+
+cdef inline int comp_seg_bvh_node(const int jfirst,
+                                  const int jlast,
+                                  const int inode,
+                                  const int inode0,
+                                  const double* polyx,
+                                  const double* polyy,
+                                  double* seg_bounds,
+                                  int* seg_skip,
+                                  int* seg_range) nogil:
+    """
+    Recursively fills the node number inode of the hierarchy of the segments
+    jfirst to jlast (excluded) of a polygon (segment jj goes from vertex jj to
+    vertex jj+1), and its children.
+    The box of a node is (rmin, rmax, zmin, zmax) in the poloidal plane,
+    slightly enlarged (_SEG_PAD) to be robust to rounding errors.
+    A leaf holds at most _SEG_LEAF segments, their range is stored in
+    seg_range ((-1, -1) for inner nodes). As for comp_bvh_node, the tree is
+    stored depth-first, seg_skip being relative to the first node inode0.
+    Returns the index of the first node after the sub-tree of inode.
+    """
+    cdef int jj
+    cdef int jmid
+    cdef int inext
+    cdef double pad
+    cdef double* bounds = &seg_bounds[inode*4]
+    # The box of the node contains all the vertices of its segments
+    bounds[0] = polyx[jfirst]
+    bounds[1] = polyx[jfirst]
+    bounds[2] = polyy[jfirst]
+    bounds[3] = polyy[jfirst]
+    for jj in range(jfirst + 1, jlast + 1):
+        if polyx[jj] < bounds[0]:
+            bounds[0] = polyx[jj]
+        if polyx[jj] > bounds[1]:
+            bounds[1] = polyx[jj]
+        if polyy[jj] < bounds[2]:
+            bounds[2] = polyy[jj]
+        if polyy[jj] > bounds[3]:
+            bounds[3] = polyy[jj]
+    pad = _SEG_PAD * (1. + bounds[1] + Cabs(bounds[2]) + Cabs(bounds[3]))
+    bounds[0] = max(bounds[0] - pad, 0.)
+    bounds[1] = bounds[1] + pad
+    bounds[2] = bounds[2] - pad
+    bounds[3] = bounds[3] + pad
+    if jlast - jfirst <= _SEG_LEAF:
+        # Leaf: a few consecutive segments
+        seg_range[inode*2] = jfirst
+        seg_range[inode*2 + 1] = jlast
+        seg_skip[inode] = inode + 1 - inode0
+        return inode + 1
+    seg_range[inode*2] = -1
+    seg_range[inode*2 + 1] = -1
+    jmid = (jfirst + jlast) // 2
+    inext = comp_seg_bvh_node(jfirst, jmid, inode + 1, inode0, polyx, polyy,
+                              seg_bounds, seg_skip, seg_range)
+    inext = comp_seg_bvh_node(jmid, jlast, inext, inode0, polyx, polyy,
+                              seg_bounds, seg_skip, seg_range)
+    seg_skip[inode] = inext - inode0
+    return inext
+
 cdef inline void coordshift_simple1d(double[3] pts, bint in_is_cartesian,
                                      double CrossRef, double cos_phi,
                                      double sin_phi) nogil:
@@ -532,6 +791,106 @@ cdef inline bint inter_ray_aabb_box(const int[3] sign,
 # ==============================================================================
 # =  Raytracing basic tools: intersection ray and triangle (in 3d space)
 # ==============================================================================
+cdef inline bint inter_ray_ring_box(const double* ray_orig,
+                                    const double* ray_vdir,
+                                    const double upscaDp,
+                                    const double upar2,
+                                    const double dpar2,
+                                    const double invuz,
+                                    const bint is_horiz,
+                                    const double* bounds) nogil:
+    """
+    Returns True if the semi-line (k >= 0) may cross the toroidal ring
+    rmin <= R <= rmax, zmin <= Z <= zmax, with bounds = (rmin, rmax, zmin,
+    zmax). The interval of k where Z is in [zmin, zmax] is computed first
+    (for horizontal LOS, see comp_inter_los_vpoly, Z is taken constant), then
+    the extrema of R^2 (a convex function of k) on this interval.
+    """
+    cdef double k0, k1, kk
+    cdef double r2min, r2max, r2
+    if is_horiz:
+        if ray_orig[2] < bounds[2] or ray_orig[2] > bounds[3]:
+            return False
+        k0 = 0.
+        k1 = -1.
+    else:
+        k0 = (bounds[2] - ray_orig[2]) * invuz
+        k1 = (bounds[3] - ray_orig[2]) * invuz
+        if k0 > k1:
+            kk = k0
+            k0 = k1
+            k1 = kk
+        if k1 < 0.:
+            return False
+        if k0 < 0.:
+            k0 = 0.
+    # Minimum of R^2 on [k0, k1] (k1 < 0 meaning infinity)
+    if upar2 > 0.:
+        kk = -upscaDp / upar2
+        if kk < k0:
+            kk = k0
+        elif k1 >= 0. and kk > k1:
+            kk = k1
+    else:
+        kk = k0
+    r2min = upar2 * kk * kk + 2. * upscaDp * kk + dpar2
+    if r2min > bounds[1] * bounds[1]:
+        return False
+    if k1 < 0. and upar2 > 0.:
+        return True
+    # Maximum of R^2 on [k0, k1]: at one of the ends
+    r2max = upar2 * k0 * k0 + 2. * upscaDp * k0 + dpar2
+    if k1 >= 0.:
+        r2 = upar2 * k1 * k1 + 2. * upscaDp * k1 + dpar2
+        if r2 > r2max:
+            r2max = r2
+    return r2max >= bounds[0] * bounds[0]
+
+
+cdef inline bint get_next_seg_leaf(int* inode,
+                                   int* jfirst,
+                                   int* jlast,
+                                   const int nvert,
+                                   const int seg_nnodes,
+                                   const double* seg_bounds,
+                                   const int* seg_skip,
+                                   const int* seg_range,
+                                   const double* ray_orig,
+                                   const double* ray_vdir,
+                                   const double upscaDp,
+                                   const double upar2,
+                                   const double dpar2,
+                                   const double invuz,
+                                   const bint is_horiz) nogil:
+    """
+    Traverses the hierarchy of the segments of a polygon (see
+    comp_seg_bvh_node) from node inode[0], up to the next leaf whose box may
+    be crossed by the LOS (see inter_ray_ring_box).
+    Returns False if there is none, else True with the segments of the leaf
+    in [jfirst[0], jlast[0]) and inode[0] set to the next node to visit.
+    Without hierarchy (seg_nnodes = 0), all the segments are returned once.
+    Leaves are visited in the order of the segments.
+    """
+    if seg_nnodes == 0:
+        if inode[0] > 0:
+            return False
+        inode[0] = 1
+        jfirst[0] = 0
+        jlast[0] = nvert
+        return True
+    while inode[0] < seg_nnodes:
+        if not inter_ray_ring_box(ray_orig, ray_vdir, upscaDp, upar2, dpar2,
+                                  invuz, is_horiz, &seg_bounds[inode[0]*4]):
+            inode[0] = seg_skip[inode[0]]
+            continue
+        jfirst[0] = seg_range[inode[0]*2]
+        jlast[0] = seg_range[inode[0]*2 + 1]
+        inode[0] = inode[0] + 1
+        if jfirst[0] >= 0:
+            return True
+    return False
+
+
 cdef inline bint inter_ray_triangle(const double[3] ray_orig,
                                     const double[3] ray_vdir,
                                     const double* vert0,
@@ -576,7 +935,6 @@ cdef inline void raytracing_inout_struct_tor(const int num_los,
                                              double[::1] coeff_inter_out,
                                              double[::1] coeff_inter_in,
                                              double[::1] vperp_out,
-                                             const long[::1] lstruct_nlim,
                                              int[::1] ind_inter_out,
                                              const bint forbid0,
                                              const bint forbidbis_org,
@@ -584,11 +942,18 @@ cdef inline void raytracing_inout_struct_tor(const int num_los,
                                              const double rmin2,
                                              const double crit2_base,
                                              const int nstruct_lim,
-                                             const double* lbounds,
                                              const double* langles,
                                              const int* lis_limited,
                                              const long* lnvert,
                                              const long* lsz_lim,
+                                             const int nnodes,
+                                             const double* bvh_bounds,
+                                             const int* bvh_skip,
+                                             const int* bvh_struct,
+                                             const int* seg_start,
+                                             const double* seg_bounds,
+                                             const int* seg_skip,
+                                             const int* seg_range,
                                              const double* lstruct_polyx,
                                              const double* lstruct_polyy,
                                              const double* lstruct_normx,
@@ -629,8 +994,6 @@ cdef inline void raytracing_inout_struct_tor(const int num_los,
     vperp_out : (3*num_los) double array <INOUT>
        Coordinates of the normal vector of impact of the LOS (0 if none). It is
        stored in the following way [v_{0,x}, v_{0,y}, v_{0,z}, ..., v_{n-1,z}]
-    lstruct_nlim : array of ints
-       List of number of limits for all structures
     ind_inter_out : (3 * num_los)  <INOUT>
        Index of structure impacted by LOS such that:
                 ind_inter_out[ind_los*3:ind_los*3+3]=(i,j,k)
@@ -651,10 +1014,6 @@ cdef inline void raytracing_inout_struct_tor(const int num_los,
     nstruct_lim : int
        Number of OUT structures (not counting the limited versions).
        If not is_out_struct then length of vpoly.
-    lbounds : (6 * nstruct) double array
-       Coordinates of lower and upper edges of the bounding box for each
-       structures (nstruct = sum_i(nstruct_lim * lsz_lim[i])
-       If not is_out_struct then NULL
     langles : (2 * nstruct) double array
        Minimum and maximum angles where the structure lives. If the structure
        number 'i' is toroidally continous then langles[i:i+2] = [0, 0].
@@ -667,6 +1026,23 @@ cdef inline void raytracing_inout_struct_tor(const int num_los,
        List of the total number of structures before the ith structure. First
        element is always 0, else lsz_lim[i] = sum_j(lstruct_nlim[j], j=0..i-1)
        If not is_out_struct then NULL
+    nnodes : int
+       Number of nodes of the hierarchy of bounding boxes (BVH) of the
+       structures. If not is_out_struct then 0
+    bvh_bounds : (6 * nnodes) double array
+       Coordinates of lower and upper edges of the bounding box of each node
+       of the BVH. The bounding box of a leaf is the one of a structure (see
+       comp_struct_bvh_tor). If not is_out_struct then NULL
+    bvh_skip : (nnodes) int array
+       Index of the next node to visit if the bounding box of the node is not
+       intersected. If not is_out_struct then NULL
+    bvh_struct : (2 * nnodes) int array
+       Index of the structure and of its limit for each leaf of the BVH,
+       -1 for inner nodes. If not is_out_struct then NULL
+    seg_start, seg_bounds, seg_skip, seg_range : int/double arrays
+       Hierarchies of the segments of the polygon of each structure (see
+       comp_struct_bvh_tor), such that only the segments whose box may be
+       crossed by a LOS are tested. If not is_out_struct then NULL
     lstruct_polyx : (ntotnvert)
        List of "x" coordinates of the polygon's vertices of all structures on
        the poloidal plane
@@ -690,24 +1066,13 @@ cdef inline void raytracing_inout_struct_tor(const int num_los,
        cannot be penetrated whereas an "IN" structure can. The latter is
        typically a vessel and are toroidally continous.
     """
-    cdef double upscaDp=0., upar2=0., dpar2=0., crit2=0., idpar2=0.
-    cdef double dist = 0., s1x = 0., s1y = 0., s2x = 0., s2y = 0.
-    cdef double lim_min=0., lim_max=0., invuz=0.
-    cdef int totnvert=0
-    cdef int nvert
-    cdef int ind_struct, ind_bounds
-    cdef int ind_los, ii, jj, kk
-    cdef bint lim_is_none
-    cdef bint found_new_kout
-    cdef bint inter_bbox
-    cdef bint forbidbis = forbidbis_org
+    cdef int ind_los
     cdef double* last_pout = NULL
     cdef double* kpout_loc = NULL
     cdef double* kpin_loc = NULL
     cdef double* invr_ray = NULL
     cdef double* loc_org = NULL
     cdef double* loc_dir = NULL
-    cdef double* lim_ves = NULL
     cdef double* loc_vp = NULL
     cdef int* sign_ray = NULL
     cdef int* ind_loc = NULL
@@ -725,168 +1090,34 @@ cdef inline void raytracing_inout_struct_tor(const int num_los,
             # if the structure is "out" (solid) we need more arrays
             last_pout = <double *> malloc(sizeof(double) * 3)
             invr_ray  = <double *> malloc(sizeof(double) * 3)
-            lim_ves   = <double *> malloc(sizeof(double) * 2)
             sign_ray  = <int *> malloc(sizeof(int) * 3)
 
         # == The parallelization over the LOS ==================================
         for ind_los in prange(num_los, schedule='dynamic'):
-            ind_struct = 0
             loc_org[0] = ray_orig[0, ind_los]
             loc_org[1] = ray_orig[1, ind_los]
             loc_org[2] = ray_orig[2, ind_los]
             loc_dir[0] = ray_vdir[0, ind_los]
             loc_dir[1] = ray_vdir[1, ind_los]
             loc_dir[2] = ray_vdir[2, ind_los]
-            loc_vp[0] = 0.
-            loc_vp[1] = 0.
-            loc_vp[2] = 0.
-            if is_out_struct:
-                # if structure is of "Out" type, then we compute the last
-                # point where it went out of a structure.
-                ind_loc[0] = ind_inter_out[2+3*ind_los]
-                kpin_loc[0] = coeff_inter_out[ind_los]
-                last_pout[0] = kpin_loc[0] * loc_dir[0] + loc_org[0]
-                last_pout[1] = kpin_loc[0] * loc_dir[1] + loc_org[1]
-                last_pout[2] = kpin_loc[0] * loc_dir[2] + loc_org[2]
-                compute_inv_and_sign(loc_dir, sign_ray, invr_ray)
-            else:
-                kpout_loc[0] = 0
-                kpin_loc[0] = 0
-                ind_loc[0] = 0
-
-            # -- Computing values that depend on the LOS/ray -------------------
-            upscaDp = loc_dir[0]*loc_org[0] + loc_dir[1]*loc_org[1]
-            upar2   = loc_dir[0]*loc_dir[0] + loc_dir[1]*loc_dir[1]
-            dpar2   = loc_org[0]*loc_org[0] + loc_org[1]*loc_org[1]
-            idpar2 = 1./dpar2
-            invuz = 1./loc_dir[2]
-            crit2 = upar2*crit2_base
-
-            # -- Prepare in case forbid is True --------------------------------
-            if forbid0 and not dpar2>0:
-                forbidbis = 0
-            if forbidbis:
-                # Compute coordinates of the 2 points where the tangents touch
-                # the inner circle
-                dist = Csqrt(dpar2-rmin2)
-                s1x = (rmin2 * loc_org[0] + rmin * loc_org[1] * dist) * idpar2
-                s1y = (rmin2 * loc_org[1] - rmin * loc_org[0] * dist) * idpar2
-                s2x = (rmin2 * loc_org[0] - rmin * loc_org[1] * dist) * idpar2
-                s2y = (rmin2 * loc_org[1] + rmin * loc_org[0] * dist) * idpar2
-
-            # == Case "OUT" structure ==========================================
-            if is_out_struct:
-                # We work on each structure
-                for ii in range(nstruct_lim):
-                    # -- Getting structure's data ------------------------------
-                    if ii == 0:
-                        nvert = lnvert[0]
-                        totnvert = 0
-                    else:
-                        totnvert = lnvert[ii-1]
-                        nvert = lnvert[ii] - totnvert
-                    ind_struct = lsz_lim[ii]
-                    # -- Working on the structure limited ----------------------
-                    for jj in range(lstruct_nlim[ii]):
-                        lim_min = langles[(ind_struct+jj)*2]
-                        lim_max = langles[(ind_struct+jj)*2 + 1]
-                        lim_is_none = lis_limited[ind_struct+jj] == 1
-                        # We test if it is really necessary to compute the inter
-                        # ie. we check if the ray intersects the bounding box
-
-                        inter_bbox = inter_ray_aabb_box(sign_ray, invr_ray,
-                                                        &lbounds[(ind_struct
-                                                                  + jj)*6],
-                                                        loc_org,
-                                                        True)
-                        if not inter_bbox:
-                            continue
-                        # We check that the bounding box is not "behind"
-                        # the last POut encountered
-                        inter_bbox = inter_ray_aabb_box(sign_ray, invr_ray,
-                                                        &lbounds[(ind_struct
-                                                                  + jj)*6],
-                                                        last_pout, False)
-                        if inter_bbox:
-                            continue
-                         # Else, we compute the new values
-                        found_new_kout \
-                            = comp_inter_los_vpoly(loc_org,
-                                                   loc_dir,
-                                                   &lstruct_polyx[totnvert],
-                                                   &lstruct_polyy[totnvert],
-                                                   &lstruct_normx[totnvert-ii],
-                                                   &lstruct_normy[totnvert-ii],
-                                                   nvert-1,
-                                                   lim_is_none,
-                                                   lim_min, lim_max,
-                                                   forbidbis,
-                                                   upscaDp, upar2,
-                                                   dpar2, invuz,
-                                                   s1x, s1y,
-                                                   s2x, s2y,
-                                                   crit2, eps_uz,
-                                                   eps_vz, eps_a,
-                                                   eps_b, eps_plane,
-                                                   False,
-                                                   kpin_loc,
-                                                   kpout_loc,
-                                                   ind_loc,
-                                                   loc_vp)
-                        if found_new_kout :
-                            coeff_inter_out[ind_los] = kpin_loc[0]
-                            vperp_out[0+3*ind_los] = loc_vp[0]
-                            vperp_out[1+3*ind_los] = loc_vp[1]
-                            vperp_out[2+3*ind_los] = loc_vp[2]
-                            ind_inter_out[2+3*ind_los] = ind_loc[0]
-                            ind_inter_out[0+3*ind_los] = 1+ii
-                            ind_inter_out[1+3*ind_los] = jj
-                            last_pout[0] = (coeff_inter_out[ind_los] *
-                                            loc_dir[0]) + loc_org[0]
-                            last_pout[1] = (coeff_inter_out[ind_los] *
-                                            loc_dir[1]) + loc_org[1]
-                            last_pout[2] = (coeff_inter_out[ind_los] *
-                                            loc_dir[2]) + loc_org[2]
-            else:
-                # == Case "IN" structure =======================================
-                # Nothing to do but compute intersection between vessel and LOS
-                found_new_kout = comp_inter_los_vpoly(loc_org, loc_dir,
-                                                      lstruct_polyx,
-                                                      lstruct_polyy,
-                                                      lstruct_normx,
-                                                      lstruct_normy,
-                                                      nstruct_lim,
-                                                      lis_limited[0],
-                                                      langles[0], langles[1],
-                                                      forbidbis,
-                                                      upscaDp, upar2,
-                                                      dpar2, invuz,
-                                                      s1x, s1y, s2x, s2y,
-                                                      crit2, eps_uz, eps_vz,
-                                                      eps_a,eps_b, eps_plane,
-                                                      True,
-                                                      kpin_loc, kpout_loc,
-                                                      ind_loc, loc_vp)
-                if found_new_kout:
-                    coeff_inter_in[ind_los]  = kpin_loc[0]
-                    coeff_inter_out[ind_los] = kpout_loc[0]
-                    ind_inter_out[2+3*ind_los] = ind_loc[0]
-                    ind_inter_out[0+3*ind_los] = 0
-                    ind_inter_out[1+3*ind_los] = 0
-                    vperp_out[0+3*ind_los] = loc_vp[0]
-                    vperp_out[1+3*ind_los] = loc_vp[1]
-                    vperp_out[2+3*ind_los] = loc_vp[2]
-
-                else:
-                    coeff_inter_in[ind_los]  = Cnan
-                    coeff_inter_out[ind_los] = Cnan
-                    ind_inter_out[2+3*ind_los] = 0
-                    ind_inter_out[0+3*ind_los] = 0
-                    ind_inter_out[1+3*ind_los] = 0
-                    vperp_out[0+3*ind_los] = 0.
-                    vperp_out[1+3*ind_los] = 0.
-                    vperp_out[2+3*ind_los] = 0.
-            # end case IN/OUT
+            raytracing_inout_los_tor(loc_org, loc_dir,
+                                     &coeff_inter_in[ind_los],
+                                     &coeff_inter_out[ind_los],
+                                     &vperp_out[3*ind_los],
+                                     &ind_inter_out[3*ind_los],
+                                     forbid0, forbidbis_org,
+                                     rmin, rmin2, crit2_base,
+                                     nstruct_lim, langles, lis_limited,
+                                     lnvert, lsz_lim,
+                                     nnodes, bvh_bounds, bvh_skip, bvh_struct,
+                                     seg_start, seg_bounds, seg_skip,
+                                     seg_range,
+                                     lstruct_polyx, lstruct_polyy,
+                                     lstruct_normx, lstruct_normy,
+                                     eps_uz, eps_vz, eps_a, eps_b, eps_plane,
+                                     is_out_struct,
+                                     loc_vp, kpin_loc, kpout_loc, ind_loc,
+                                     last_pout, invr_ray, sign_ray)
         free(loc_org)
         free(loc_dir)
         free(loc_vp)
@@ -895,12 +1126,238 @@ cdef inline void raytracing_inout_struct_tor(const int num_los,
         free(ind_loc)
         if is_out_struct:
             free(last_pout)
-            free(lim_ves)
             free(invr_ray)
             free(sign_ray)
     return
 
 
+cdef inline void raytracing_inout_los_tor(const double* loc_org,
+                                          const double* loc_dir,
+                                          double* coeff_in,
+                                          double* coeff_out,
+                                          double* vperp,
+                                          int* ind_out,
+                                          const bint forbid0,
+                                          const bint forbidbis_org,
+                                          const double rmin,
+                                          const double rmin2,
+                                          const double crit2_base,
+                                          const int nstruct_lim,
+                                          const double* langles,
+                                          const int* lis_limited,
+                                          const long* lnvert,
+                                          const long* lsz_lim,
+                                          const int nnodes,
+                                          const double* bvh_bounds,
+                                          const int* bvh_skip,
+                                          const int* bvh_struct,
+                                          const int* seg_start,
+                                          const double* seg_bounds,
+                                          const int* seg_skip,
+                                          const int* seg_range,
+                                          const double* lstruct_polyx,
+                                          const double* lstruct_polyy,
+                                          const double* lstruct_normx,
+                                          const double* lstruct_normy,
+                                          const double eps_uz,
+                                          const double eps_vz,
+                                          const double eps_a,
+                                          const double eps_b,
+                                          const double eps_plane,
+                                          const bint is_out_struct,
+                                          double* loc_vp,
+                                          double* kpin_loc,
+                                          double* kpout_loc,
+                                          int* ind_loc,
+                                          double* last_pout,
+                                          double* invr_ray,
+                                          int* sign_ray) nogil:
+    """
+    Computes the entry and exit point of a single LOS (loc_org, loc_dir) for
+    a set of structures of type "OUT" or "IN" in a TORE, see
+    raytracing_inout_struct_tor for the description of the arguments.
+    The results are written in coeff_in[0], coeff_out[0], vperp[0:3] and
+    ind_out[0:3] (for "OUT" structures the values of the vessel must already
+    be there). loc_vp, kpin_loc, kpout_loc, ind_loc, and for "OUT" structures
+    last_pout, invr_ray and sign_ray, are work arrays (local to the thread).
+    """
+    cdef double upscaDp=0., upar2=0., dpar2=0., crit2=0., idpar2=0.
+    cdef double dist = 0., s1x = 0., s1y = 0., s2x = 0., s2y = 0.
+    cdef double lim_min=0., lim_max=0., invuz=0.
+    cdef int totnvert=0
+    cdef int nvert
+    cdef int ind_struct
+    cdef int ii, jj
+    cdef int inode
+    cdef int seg_nnodes = 0
+    cdef const double* pseg_bounds = NULL
+    cdef const int* pseg_skip = NULL
+    cdef const int* pseg_range = NULL
+    cdef bint lim_is_none
+    cdef bint found_new_kout
+    cdef bint inter_bbox
+    cdef bint forbidbis = forbidbis_org
+
+    loc_vp[0] = 0.
+    loc_vp[1] = 0.
+    loc_vp[2] = 0.
+    if is_out_struct:
+        # if structure is of "Out" type, then we compute the last
+        # point where it went out of a structure.
+        ind_loc[0] = ind_out[2]
+        kpin_loc[0] = coeff_out[0]
+        last_pout[0] = kpin_loc[0] * loc_dir[0] + loc_org[0]
+        last_pout[1] = kpin_loc[0] * loc_dir[1] + loc_org[1]
+        last_pout[2] = kpin_loc[0] * loc_dir[2] + loc_org[2]
+        compute_inv_and_sign(loc_dir, sign_ray, invr_ray)
+    else:
+        kpout_loc[0] = 0
+        kpin_loc[0] = 0
+        ind_loc[0] = 0
+
+    # -- Computing values that depend on the LOS/ray ---------------------------
+    upscaDp = loc_dir[0]*loc_org[0] + loc_dir[1]*loc_org[1]
+    upar2   = loc_dir[0]*loc_dir[0] + loc_dir[1]*loc_dir[1]
+    dpar2   = loc_org[0]*loc_org[0] + loc_org[1]*loc_org[1]
+    idpar2 = 1./dpar2
+    invuz = 1./loc_dir[2]
+    crit2 = upar2*crit2_base
+
+    # -- Prepare in case forbid is True ----------------------------------------
+    if forbid0 and not dpar2>0:
+        forbidbis = 0
+    if forbidbis:
+        # Compute coordinates of the 2 points where the tangents touch
+        # the inner circle
+        dist = Csqrt(dpar2-rmin2)
+        s1x = (rmin2 * loc_org[0] + rmin * loc_org[1] * dist) * idpar2
+        s1y = (rmin2 * loc_org[1] - rmin * loc_org[0] * dist) * idpar2
+        s2x = (rmin2 * loc_org[0] - rmin * loc_org[1] * dist) * idpar2
+        s2y = (rmin2 * loc_org[1] + rmin * loc_org[0] * dist) * idpar2
+
+    # == Case "OUT" structure ==================================================
+    if is_out_struct:
+        # We traverse the hierarchy of bounding boxes of the
+        # sub-structures (stored depth-first, leaves in order)
+        inode = 0
+        while inode < nnodes:
+            # We test if it is really necessary to go down the node
+            # ie. we check if the ray intersects the bounding box
+            inter_bbox = inter_ray_aabb_box(sign_ray, invr_ray,
+                                            &bvh_bounds[inode*6],
+                                            loc_org,
+                                            True)
+            if inter_bbox:
+                # We check that the bounding box is not "behind"
+                # the last POut encountered
+                inter_bbox = not inter_ray_aabb_box(sign_ray, invr_ray,
+                                                    &bvh_bounds[inode*6],
+                                                    last_pout, False)
+            if not inter_bbox:
+                inode = bvh_skip[inode]
+                continue
+            ii = bvh_struct[inode*2]
+            jj = bvh_struct[inode*2 + 1]
+            inode = inode + 1
+            if ii < 0:
+                # inner node: we go down to its children
+                continue
+            # -- Getting structure's data --------------------------------------
+            if ii == 0:
+                nvert = lnvert[0]
+                totnvert = 0
+            else:
+                totnvert = lnvert[ii-1]
+                nvert = lnvert[ii] - totnvert
+            ind_struct = lsz_lim[ii]
+            # -- Working on the structure limited ------------------------------
+            lim_min = langles[(ind_struct+jj)*2]
+            lim_max = langles[(ind_struct+jj)*2 + 1]
+            lim_is_none = lis_limited[ind_struct+jj] == 1
+            # -- Hierarchy of the segments of the structure's polygon ----------
+            if seg_start != NULL:
+                seg_nnodes = seg_start[ii+1] - seg_start[ii]
+                pseg_bounds = &seg_bounds[seg_start[ii]*4]
+                pseg_skip = &seg_skip[seg_start[ii]]
+                pseg_range = &seg_range[seg_start[ii]*2]
+            # We compute the new values
+            found_new_kout = comp_inter_los_vpoly(loc_org,
+                                                  loc_dir,
+                                                  &lstruct_polyx[totnvert],
+                                                  &lstruct_polyy[totnvert],
+                                                  &lstruct_normx[totnvert-ii],
+                                                  &lstruct_normy[totnvert-ii],
+                                                  nvert-1,
+                                                  seg_nnodes, pseg_bounds,
+                                                  pseg_skip, pseg_range,
+                                                  lim_is_none,
+                                                  lim_min, lim_max,
+                                                  forbidbis,
+                                                  upscaDp, upar2,
+                                                  dpar2, invuz,
+                                                  s1x, s1y,
+                                                  s2x, s2y,
+                                                  crit2, eps_uz,
+                                                  eps_vz, eps_a,
+                                                  eps_b, eps_plane,
+                                                  False,
+                                                  kpin_loc,
+                                                  kpout_loc,
+                                                  ind_loc,
+                                                  loc_vp)
+            if found_new_kout :
+                coeff_out[0] = kpin_loc[0]
+                vperp[0] = loc_vp[0]
+                vperp[1] = loc_vp[1]
+                vperp[2] = loc_vp[2]
+                ind_out[2] = ind_loc[0]
+                ind_out[0] = 1+ii
+                ind_out[1] = jj
+                last_pout[0] = coeff_out[0] * loc_dir[0] + loc_org[0]
+                last_pout[1] = coeff_out[0] * loc_dir[1] + loc_org[1]
+                last_pout[2] = coeff_out[0] * loc_dir[2] + loc_org[2]
+    else:
+        # == Case "IN" structure ===============================================
+        # Nothing to do but compute intersection between vessel and LOS
+        found_new_kout = comp_inter_los_vpoly(loc_org, loc_dir,
+                                              lstruct_polyx,
+                                              lstruct_polyy,
+                                              lstruct_normx,
+                                              lstruct_normy,
+                                              nstruct_lim,
+                                              0, NULL, NULL, NULL,
+                                              lis_limited[0],
+                                              langles[0], langles[1],
+                                              forbidbis,
+                                              upscaDp, upar2,
+                                              dpar2, invuz,
+                                              s1x, s1y, s2x, s2y,
+                                              crit2, eps_uz, eps_vz,
+                                              eps_a,eps_b, eps_plane,
+                                              True,
+                                              kpin_loc, kpout_loc,
+                                              ind_loc, loc_vp)
+        if found_new_kout:
+            coeff_in[0]  = kpin_loc[0]
+            coeff_out[0] = kpout_loc[0]
+            ind_out[2] = ind_loc[0]
+            ind_out[0] = 0
+            ind_out[1] = 0
+            vperp[0] = loc_vp[0]
+            vperp[1] = loc_vp[1]
+            vperp[2] = loc_vp[2]
+        else:
+            coeff_in[0]  = Cnan
+            coeff_out[0] = Cnan
+            ind_out[2] = 0
+            ind_out[0] = 0
+            ind_out[1] = 0
+            vperp[0] = 0.
+            vperp[1] = 0.
+            vperp[2] = 0.
+    return
+
+
 # ------------------------------------------------------------------
 cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
                                       const double[3] ray_vdir,
@@ -909,6 +1366,10 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
                                       const double* normx,
                                       const double* normy,
                                       const int nvert,
+                                      const int seg_nnodes,
+                                      const double* seg_bounds,
+                                      const int* seg_skip,
+                                      const int* seg_range,
                                       const bint lim_is_none,
                                       const double lim_min,
                                       const double lim_max,
@@ -953,6 +1414,11 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
         edges of the Polygon defined by lpolyxy
     nvert : int
        Number of vertices on the polygon
+    seg_nnodes : int
+       Number of nodes of the hierarchy of the segments of the polygon (see
+       comp_seg_bvh_node), 0 if none (all segments are then tested)
+    seg_bounds, seg_skip, seg_range : double/int arrays
+       Boxes, skip indices and segments ranges of the nodes of the hierarchy
     lim_is_none : bint
        Bool to know if the structures (or the vessel) is limited or not.
     lim_min : double
@@ -997,6 +1463,10 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
            If false, no intersection between LOS and structure
     """
     cdef int jj
+    cdef int inode_seg = 0
+    cdef int jfirst = 0
+    cdef int jlast = 0
+    cdef bint is_horiz
     cdef int done=0
     cdef int indin=0
     cdef int indout=0
@@ -1023,25 +1493,125 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
     # Set tolerance value for ray_vdir[2,ii]
     # eps_uz is the tolerated DZ across 20m (max Tokamak size)
     kout, kin, done = 1.e12, 1.e12, 0
-    if ray_vdir[2] * ray_vdir[2] < crit2:
+    is_horiz = ray_vdir[2] * ray_vdir[2] < crit2
+    if is_horiz:
         # -- Case with horizontal semi-line ------------------------------------
-        for jj in range(nvert):
-            # Solutions exist only in the case with non-horizontal
-            # segment (i.e.: cone, not plane)
-            if (lpolyy[jj+1] - lpolyy[jj])**2 > eps_vz * eps_vz:
-                q = (ray_orig[2] - lpolyy[jj]) / (lpolyy[jj+1] - lpolyy[jj])
-                # The intersection must stand on the segment
-                if q>=0 and q<1:
-                    coeff = q * q * (lpolyx[jj+1]-lpolyx[jj])**2 + \
-                        2. * q * lpolyx[jj] * (lpolyx[jj+1] - lpolyx[jj]) + \
-                        lpolyx[jj] * lpolyx[jj]
-                    delta = upscaDp * upscaDp - upar2 * (dpar2 - coeff)
-                    if delta>0.:
-                        sqd = Csqrt(delta)
-                        # The intersection must be on the semi-line (i.e.: k>=0)
-                        # First solution
-                        if -upscaDp - sqd >= 0:
-                            k = (-upscaDp - sqd) * invupar2
+        inode_seg = 0
+        while get_next_seg_leaf(&inode_seg, &jfirst, &jlast, nvert,
+                                seg_nnodes, seg_bounds, seg_skip,
+                                seg_range, ray_orig, ray_vdir,
+                                upscaDp, upar2, dpar2, invuz,
+                                is_horiz):
+            for jj in range(jfirst, jlast):
+                # Solutions exist only in the case with non-horizontal
+                # segment (i.e.: cone, not plane)
+                if (lpolyy[jj+1] - lpolyy[jj])**2 > eps_vz * eps_vz:
+                    q = (ray_orig[2] - lpolyy[jj]) / (lpolyy[jj+1] - lpolyy[jj])
+                    # The intersection must stand on the segment
+                    if q>=0 and q<1:
+                        coeff = q * q * (lpolyx[jj+1]-lpolyx[jj])**2 + \
+                            2. * q * lpolyx[jj] * (lpolyx[jj+1] - lpolyx[jj]) + \
+                            lpolyx[jj] * lpolyx[jj]
+                        delta = upscaDp * upscaDp - upar2 * (dpar2 - coeff)
+                        if delta>0.:
+                            sqd = Csqrt(delta)
+                            # The intersection must be on the semi-line (i.e.: k>=0)
+                            # First solution
+                            if -upscaDp - sqd >= 0:
+                                k = (-upscaDp - sqd) * invupar2
+                                sol0 = ray_orig[0] + k * ray_vdir[0]
+                                sol1 = ray_orig[1] + k * ray_vdir[1]
+                                if forbidbis:
+                                    sca0 = (sol0-s1x)*ray_orig[0] + \
+                                           (sol1-s1y)*ray_orig[1]
+                                    sca1 = (sol0-s1x)*s1x + (sol1-s1y)*s1y
+                                    sca2 = (sol0-s2x)*s2x + (sol1-s2y)*s2y
+                                if not forbidbis or (forbidbis and not
+                                                     (sca0<0 and sca1<0 and
+                                                      sca2<0)):
+                                    # Get the normalized perpendicular vector
+                                    # at intersection
+                                    phi = Catan2(sol1, sol0)
+                                    # Check sol inside the Lim
+                                    if lim_is_none or (not lim_is_none and
+                                                       ((lim_min<lim_max and
+                                                         lim_min<=phi and
+                                                         phi<=lim_max)
+                                                        or (lim_min>lim_max and
+                                                            (phi>=lim_min or
+                                                             phi<=lim_max)))):
+                                        # Get the scalar product to determine
+                                        # entry or exit point
+                                        sca = Ccos(phi)*normx[jj]*ray_vdir[0] + \
+                                              Csin(phi)*normx[jj]*ray_vdir[1] + \
+                                              normy[jj]*ray_vdir[2]
+                                        if sca<=0 and k<kout:
+                                            kout = k
+                                            done = 1
+                                            indout = jj
+                                        elif sca>=0 and k<min(kin,kout):
+                                            kin = k
+                                            indin = jj
+
+                            # Second solution
+                            if -upscaDp + sqd >=0:
+                                k = (-upscaDp + sqd)*invupar2
+                                sol0 = ray_orig[0] + k * ray_vdir[0]
+                                sol1 = ray_orig[1] + k * ray_vdir[1]
+                                if forbidbis:
+                                    sca0 = (sol0-s1x) * ray_orig[0] + \
+                                           (sol1-s1y) * ray_orig[1]
+                                    sca1 = (sol0-s1x) * s1x + (sol1-s1y) * s1y
+                                    sca2 = (sol0-s2x) * s2x + (sol1-s2y) * s2y
+                                if not forbidbis or (forbidbis and not
+                                                     (sca0<0 and sca1<0 and
+                                                      sca2<0)):
+                                    # Get the normalized perpendicular vector
+                                    # at intersection
+                                    phi = Catan2(sol1,sol0)
+                                    if lim_is_none or (not lim_is_none and
+                                                       ((lim_min<lim_max and
+                                                         lim_min<=phi and
+                                                         phi<=lim_max) or
+                                                        (lim_min>lim_max and
+                                                         (phi>=lim_min or
+                                                          phi<=lim_max))
+                                                       )):
+                                        # Get the scalar product to determine
+                                        # entry or exit point
+                                        sca = Ccos(phi)*normx[jj]*ray_vdir[0] + \
+                                              Csin(phi)*normx[jj]*ray_vdir[1] + \
+                                              normy[jj]*ray_vdir[2]
+                                        if sca<=0 and k<kout:
+                                            kout = k
+                                            done = 1
+                                            indout = jj
+                                        elif sca>=0 and k<min(kin,kout):
+                                            kin = k
+                                            indin = jj
+    else:
+        # == More general non-horizontal semi-line case ========================
+        inode_seg = 0
+        while get_next_seg_leaf(&inode_seg, &jfirst, &jlast, nvert,
+                                seg_nnodes, seg_bounds, seg_skip,
+                                seg_range, ray_orig, ray_vdir,
+                                upscaDp, upar2, dpar2, invuz,
+                                is_horiz):
+            for jj in range(jfirst, jlast):
+                v0 = lpolyx[jj+1]-lpolyx[jj]
+                v1 = lpolyy[jj+1]-lpolyy[jj]
+                val_a = v0 * v0 - upar2 * v1 * invuz * v1 * invuz
+                val_b = lpolyx[jj] * v0 + v1 * (ray_orig[2] - lpolyy[jj]) * upar2 *\
+                        invuz * invuz - upscaDp * v1 * invuz
+                coeff = - upar2 * (ray_orig[2] - lpolyy[jj])**2 * invuz * invuz +\
+                        2. * upscaDp * (ray_orig[2]-lpolyy[jj]) * invuz -\
+                        dpar2 + lpolyx[jj] * lpolyx[jj]
+                if ((val_a * val_a < eps_a * eps_a) and
+                    (val_b * val_b > eps_b * eps_b)):
+                    q = -coeff / (2. * val_b)
+                    if q >= 0. and q < 1.:
+                        k = (q * v1 - (ray_orig[2] - lpolyy[jj])) * invuz
+                        if k >= 0:
                             sol0 = ray_orig[0] + k * ray_vdir[0]
                             sol1 = ray_orig[1] + k * ray_vdir[1]
                             if forbidbis:
@@ -1049,25 +1619,59 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
                                        (sol1-s1y)*ray_orig[1]
                                 sca1 = (sol0-s1x)*s1x + (sol1-s1y)*s1y
                                 sca2 = (sol0-s2x)*s2x + (sol1-s2y)*s2y
-                            if not forbidbis or (forbidbis and not
-                                                 (sca0<0 and sca1<0 and
-                                                  sca2<0)):
-                                # Get the normalized perpendicular vector
-                                # at intersection
+                                if sca0<0 and sca1<0 and sca2<0:
+                                    continue
+                            # Get the normalized perpendicular vect at intersection
+                            phi = Catan2(sol1,sol0)
+                            if lim_is_none or (not lim_is_none and
+                                               ((lim_min < lim_max and
+                                                 lim_min <= phi and
+                                                 phi <= lim_max) or
+                                                (lim_min > lim_max and
+                                                 (phi >= lim_min or
+                                                  phi <= lim_max)))):
+                                # Get the scal prod to determine entry or exit point
+                                sca = Ccos(phi) * normx[jj] * ray_vdir[0] + \
+                                      Csin(phi) * normx[jj] * ray_vdir[1] + \
+                                      normy[jj] * ray_vdir[2]
+                                if sca<=0 and k<kout:
+                                    kout = k
+                                    done = 1
+                                    indout = jj
+                                elif sca>=0 and k<min(kin,kout):
+                                    kin = k
+                                    indin = jj
+                elif ((val_a * val_a >= eps_a * eps_a) and
+                      (val_b * val_b > val_a * coeff)):
+                    sqd = Csqrt(val_b * val_b - val_a * coeff)
+                    # First solution
+                    q = (-val_b + sqd) / val_a
+                    if q >= 0. and q < 1.:
+                        k = (q * v1 - (ray_orig[2] - lpolyy[jj])) * invuz
+                        if k >= 0.:
+                            sol0 = ray_orig[0] + k * ray_vdir[0]
+                            sol1 = ray_orig[1] + k * ray_vdir[1]
+                            if forbidbis:
+                                sca0 = (sol0-s1x) * ray_orig[0] + \
+                                       (sol1-s1y) * ray_orig[1]
+                                sca1 = (sol0-s1x) * s1x + (sol1-s1y) * s1y
+                                sca2 = (sol0-s2x) * s2x + (sol1-s2y) * s2y
+                            if not forbidbis or (forbidbis and
+                                                 not (sca0<0 and sca1<0 and
+                                                      sca2<0)):
+                                # Get the normalized perpendicular vector at inter
                                 phi = Catan2(sol1, sol0)
-                                # Check sol inside the Lim
                                 if lim_is_none or (not lim_is_none and
-                                                   ((lim_min<lim_max and
-                                                     lim_min<=phi and
-                                                     phi<=lim_max)
-                                                    or (lim_min>lim_max and
-                                                        (phi>=lim_min or
-                                                         phi<=lim_max)))):
-                                    # Get the scalar product to determine
-                                    # entry or exit point
-                                    sca = Ccos(phi)*normx[jj]*ray_vdir[0] + \
-                                          Csin(phi)*normx[jj]*ray_vdir[1] + \
-                                          normy[jj]*ray_vdir[2]
+                                                   ((lim_min < lim_max and
+                                                     lim_min <= phi and
+                                                     phi <= lim_max) or
+                                                    (lim_min > lim_max and
+                                                     (phi >= lim_min or
+                                                      phi <= lim_max)))):
+                                    # Get the scal prod to determine in or out point
+                                    sca = Ccos(phi) * normx[jj] * ray_vdir[0] + \
+                                          Csin(phi) * normx[jj] * ray_vdir[1] + \
+                                          normy[jj] * ray_vdir[2]
                                     if sca<=0 and k<kout:
                                         kout = k
                                         done = 1
@@ -1076,9 +1680,11 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
                                         kin = k
                                         indin = jj
 
-                        # Second solution
-                        if -upscaDp + sqd >=0:
-                            k = (-upscaDp + sqd)*invupar2
+                    # == Second solution ===========================================
+                    q = (-val_b - sqd) / val_a
+                    if q >= 0. and q < 1.:
+                        k = (q * v1 - (ray_orig[2] - lpolyy[jj])) * invuz
+                        if k>=0.:
                             sol0 = ray_orig[0] + k * ray_vdir[0]
                             sol1 = ray_orig[1] + k * ray_vdir[1]
                             if forbidbis:
@@ -1086,25 +1692,22 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
                                        (sol1-s1y) * ray_orig[1]
                                 sca1 = (sol0-s1x) * s1x + (sol1-s1y) * s1y
                                 sca2 = (sol0-s2x) * s2x + (sol1-s2y) * s2y
-                            if not forbidbis or (forbidbis and not
-                                                 (sca0<0 and sca1<0 and
-                                                  sca2<0)):
-                                # Get the normalized perpendicular vector
-                                # at intersection
+                            if not forbidbis or (forbidbis and
+                                                 not (sca0<0 and sca1<0 and
+                                                      sca2<0)):
+                                # Get the normalized perpendicular vector at inter
                                 phi = Catan2(sol1,sol0)
                                 if lim_is_none or (not lim_is_none and
-                                                   ((lim_min<lim_max and
-                                                     lim_min<=phi and
-                                                     phi<=lim_max) or
+                                                   ((lim_min < lim_max and
+                                                     lim_min <= phi and
+                                                     phi <= lim_max) or
                                                     (lim_min>lim_max and
                                                      (phi>=lim_min or
-                                                      phi<=lim_max))
-                                                   )):
-                                    # Get the scalar product to determine
-                                    # entry or exit point
-                                    sca = Ccos(phi)*normx[jj]*ray_vdir[0] + \
-                                          Csin(phi)*normx[jj]*ray_vdir[1] + \
-                                          normy[jj]*ray_vdir[2]
+                                                      phi<=lim_max)))):
+                                    # Get the scal prod to determine if in or out
+                                    sca = Ccos(phi) * normx[jj] * ray_vdir[0] + \
+                                          Csin(phi) * normx[jj] * ray_vdir[1] + \
+                                          normy[jj] * ray_vdir[2]
                                     if sca<=0 and k<kout:
                                         kout = k
                                         done = 1
@@ -1112,126 +1715,6 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
                                     elif sca>=0 and k<min(kin,kout):
                                         kin = k
                                         indin = jj
-    else:
-        # == More general non-horizontal semi-line case ========================
-        for jj in range(nvert):
-            v0 = lpolyx[jj+1]-lpolyx[jj]
-            v1 = lpolyy[jj+1]-lpolyy[jj]
-            val_a = v0 * v0 - upar2 * v1 * invuz * v1 * invuz
-            val_b = lpolyx[jj] * v0 + v1 * (ray_orig[2] - lpolyy[jj]) * upar2 *\
-                    invuz * invuz - upscaDp * v1 * invuz
-            coeff = - upar2 * (ray_orig[2] - lpolyy[jj])**2 * invuz * invuz +\
-                    2. * upscaDp * (ray_orig[2]-lpolyy[jj]) * invuz -\
-                    dpar2 + lpolyx[jj] * lpolyx[jj]
-            if ((val_a * val_a < eps_a * eps_a) and
-                (val_b * val_b > eps_b * eps_b)):
-                q = -coeff / (2. * val_b)
-                if q >= 0. and q < 1.:
-                    k = (q * v1 - (ray_orig[2] - lpolyy[jj])) * invuz
-                    if k >= 0:
-                        sol0 = ray_orig[0] + k * ray_vdir[0]
-                        sol1 = ray_orig[1] + k * ray_vdir[1]
-                        if forbidbis:
-                            sca0 = (sol0-s1x)*ray_orig[0] + \
-                                   (sol1-s1y)*ray_orig[1]
-                            sca1 = (sol0-s1x)*s1x + (sol1-s1y)*s1y
-                            sca2 = (sol0-s2x)*s2x + (sol1-s2y)*s2y
-                            if sca0<0 and sca1<0 and sca2<0:
-                                continue
-                        # Get the normalized perpendicular vect at intersection
-                        phi = Catan2(sol1,sol0)
-                        if lim_is_none or (not lim_is_none and
-                                           ((lim_min < lim_max and
-                                             lim_min <= phi and
-                                             phi <= lim_max) or
-                                            (lim_min > lim_max and
-                                             (phi >= lim_min or
-                                              phi <= lim_max)))):
-                            # Get the scal prod to determine entry or exit point
-                            sca = Ccos(phi) * normx[jj] * ray_vdir[0] + \
-                                  Csin(phi) * normx[jj] * ray_vdir[1] + \
-                                  normy[jj] * ray_vdir[2]
-                            if sca<=0 and k<kout:
-                                kout = k
-                                done = 1
-                                indout = jj
-                            elif sca>=0 and k<min(kin,kout):
-                                kin = k
-                                indin = jj
-            elif ((val_a * val_a >= eps_a * eps_a) and
-                  (val_b * val_b > val_a * coeff)):
-                sqd = Csqrt(val_b * val_b - val_a * coeff)
-                # First solution
-                q = (-val_b + sqd) / val_a
-                if q >= 0. and q < 1.:
-                    k = (q * v1 - (ray_orig[2] - lpolyy[jj])) * invuz
-                    if k >= 0.:
-                        sol0 = ray_orig[0] + k * ray_vdir[0]
-                        sol1 = ray_orig[1] + k * ray_vdir[1]
-                        if forbidbis:
-                            sca0 = (sol0-s1x) * ray_orig[0] + \
-                                   (sol1-s1y) * ray_orig[1]
-                            sca1 = (sol0-s1x) * s1x + (sol1-s1y) * s1y
-                            sca2 = (sol0-s2x) * s2x + (sol1-s2y) * s2y
-                        if not forbidbis or (forbidbis and
-                                             not (sca0<0 and sca1<0 and
-                                                  sca2<0)):
-                            # Get the normalized perpendicular vector at inter
-                            phi = Catan2(sol1, sol0)
-                            if lim_is_none or (not lim_is_none and
-                                               ((lim_min < lim_max and
-                                                 lim_min <= phi and
-                                                 phi <= lim_max) or
-                                                (lim_min > lim_max and
-                                                 (phi >= lim_min or
-                                                  phi <= lim_max)))):
-                                # Get the scal prod to determine in or out point
-                                sca = Ccos(phi) * normx[jj] * ray_vdir[0] + \
-                                      Csin(phi) * normx[jj] * ray_vdir[1] + \
-                                      normy[jj] * ray_vdir[2]
-                                if sca<=0 and k<kout:
-                                    kout = k
-                                    done = 1
-                                    indout = jj
-                                elif sca>=0 and k<min(kin,kout):
-                                    kin = k
-                                    indin = jj
-
-                # == Second solution ===========================================
-                q = (-val_b - sqd) / val_a
-                if q >= 0. and q < 1.:
-                    k = (q * v1 - (ray_orig[2] - lpolyy[jj])) * invuz
-                    if k>=0.:
-                        sol0 = ray_orig[0] + k * ray_vdir[0]
-                        sol1 = ray_orig[1] + k * ray_vdir[1]
-                        if forbidbis:
-                            sca0 = (sol0-s1x) * ray_orig[0] + \
-                                   (sol1-s1y) * ray_orig[1]
-                            sca1 = (sol0-s1x) * s1x + (sol1-s1y) * s1y
-                            sca2 = (sol0-s2x) * s2x + (sol1-s2y) * s2y
-                        if not forbidbis or (forbidbis and
-                                             not (sca0<0 and sca1<0 and
-                                                  sca2<0)):
-                            # Get the normalized perpendicular vector at inter
-                            phi = Catan2(sol1,sol0)
-                            if lim_is_none or (not lim_is_none and
-                                               ((lim_min < lim_max and
-                                                 lim_min <= phi and
-                                                 phi <= lim_max) or
-                                                (lim_min>lim_max and
-                                                 (phi>=lim_min or
-                                                  phi<=lim_max)))):
-                                # Get the scal prod to determine if in or out
-                                sca = Ccos(phi) * normx[jj] * ray_vdir[0] + \
-                                      Csin(phi) * normx[jj] * ray_vdir[1] + \
-                                      normy[jj] * ray_vdir[2]
-                                if sca<=0 and k<kout:
-                                    kout = k
-                                    done = 1
-                                    indout = jj
-                                elif sca>=0 and k<min(kin,kout):
-                                    kin = k
-                                    indin = jj
 
     if not lim_is_none:
         ephi_in0 = -sinl0
@@ -1244,7 +1727,12 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
                 sol0 = (ray_orig[0] + k * ray_vdir[0]) * cosl0 + \
                        (ray_orig[1] + k * ray_vdir[1]) * sinl0
                 sol1 =  ray_orig[2] + k * ray_vdir[2]
-                inter_bbox = is_point_in_path(nvert, lpolyx, lpolyy, sol0, sol1)
+                inter_bbox = seg_nnodes == 0 or (
+                    seg_bounds[0] <= sol0 and sol0 <= seg_bounds[1]
+                    and seg_bounds[2] <= sol1 and sol1 <= seg_bounds[3])
+                if inter_bbox:
+                    inter_bbox = is_point_in_path(nvert, lpolyx, lpolyy,
+                                                  sol0, sol1)
                 if inter_bbox:
                     # Check PIn (POut not possible for limited torus)
                     sca = ray_vdir[0] * ephi_in0 + ray_vdir[1] * ephi_in1
@@ -1266,7 +1754,12 @@ cdef inline bint comp_inter_los_vpoly(const double[3] ray_orig,
                        (ray_orig[1] + k * ray_vdir[1]) * sinl1
                 sol1 =  ray_orig[2] + k * ray_vdir[2]
                 # Check if in ves_poly
-                inter_bbox = is_point_in_path(nvert, lpolyx, lpolyy, sol0, sol1)
+                inter_bbox = seg_nnodes == 0 or (
+                    seg_bounds[0] <= sol0 and sol0 <= seg_bounds[1]
+                    and seg_bounds[2] <= sol1 and sol1 <= seg_bounds[3])
+                if inter_bbox:
+                    inter_bbox = is_point_in_path(nvert, lpolyx, lpolyy,
+                                                  sol0, sol1)
                 if inter_bbox:
                     # Check PIn (POut not possible for limited torus)
                     sca = ray_vdir[0]*ephi_in0 + ray_vdir[1]*ephi_in1
@@ -1492,7 +1985,8 @@ cdef inline void compute_inout_tot(const int num_los,
                                    double[::1] coeff_inter_out,
                                    double[::1] coeff_inter_in,
                                    double[::1] vperp_out,
-                                   int[::1] ind_inter_out) :
+                                   int[::1] ind_inter_out,
+                                   dict dbvh) :
     cdef int ii, jj, kk
     cdef int ind_struct = 0
     cdef int len_lim
@@ -1504,14 +1998,19 @@ cdef inline void compute_inout_tot(const int num_los,
     cdef double rmin = rmin_org
     cdef double rmin2 = 0.
     cdef bint forbidbis, forbid0
-    cdef double *lbounds = <double *>malloc(nstruct_tot * 6 * sizeof(double))
-    cdef double *langles = <double *>malloc(nstruct_tot * 2 * sizeof(double))
-    cdef int *llimits = NULL
-    cdef long *lsz_lim = NULL
     cdef int[1] llim_ves
     cdef double[2] lbounds_ves
-    cdef double[2] lim_ves
     cdef long[::1] lstruct_nlim
+    cdef long[::1] lsz_lim
+    cdef double[::1] langles
+    cdef int[::1] llimits
+    cdef double[::1] bvh_bounds
+    cdef int[::1] bvh_skip
+    cdef int[::1] bvh_struct
+    cdef int[::1] seg_start
+    cdef double[::1] seg_bounds
+    cdef int[::1] seg_skip
+    cdef int[::1] seg_range
     # ==========================================================================
     if ves_type == 'tor':
         # .. if there are, we get the limits for the vessel ....................
@@ -1541,11 +2040,13 @@ cdef inline void compute_inout_tot(const int num_los,
         # -- Computing intersection between LOS and Vessel ---------------------
         raytracing_inout_struct_tor(num_los, ray_vdir, ray_orig,
                                     coeff_inter_out, coeff_inter_in,
-                                    vperp_out, None, ind_inter_out,
+                                    vperp_out, ind_inter_out,
                                     forbid0, forbidbis,
                                     rmin, rmin2, crit2_base,
-                                    npts_poly,  NULL, lbounds_ves,
+                                    npts_poly, lbounds_ves,
                                     llim_ves, NULL, NULL,
+                                    0, NULL, NULL, NULL,
+                                    NULL, NULL, NULL, NULL,
                                     &ves_poly[0][0],
                                     &ves_poly[1][0],
                                     &ves_norm[0][0],
@@ -1554,66 +2055,36 @@ cdef inline void compute_inout_tot(const int num_los,
                                     num_threads, False) # structure is in
         # -- Treating the structures (if any) ----------------------------------
         if nstruct_tot > 0:
-            ind_struct = 0
-            llimits = <int *>malloc(nstruct_tot * sizeof(int))
-            lsz_lim = <long *>malloc(nstruct_lim * sizeof(long))
-            lstruct_nlim = lstruct_nlim_org.copy()
-            for ii in range(nstruct_lim):
-                # For fast accessing
-                len_lim = lstruct_nlim[ii]
-                # We get the limits if any
-                if len_lim == 0:
-                    lslim = [None]
-                    lstruct_nlim[ii] = lstruct_nlim[ii] + 1
-                elif len_lim == 1:
-                    lslim = [[lstruct_lims[ii][0, 0], lstruct_lims[ii][0, 1]]]
-                else:
-                    lslim = lstruct_lims[ii]
-                # We get the number of vertices and limits of the struct's poly
-                if ii == 0:
-                    lsz_lim[0] = 0
-                    nvert = lnvert[0]
-                    ind_min = 0
-                else:
-                    nvert = lnvert[ii] - lnvert[ii - 1]
-                    lsz_lim[ii] = lstruct_nlim[ii-1] + lsz_lim[ii-1]
-                    ind_min = lnvert[ii-1]
-                # and loop over the limits (one continous structure)
-                for jj in range(max(len_lim,1)):
-                    # We compute the structure's bounding box:
-                    if lslim[jj] is not None:
-                        lim_ves[0] = lslim[jj][0]
-                        lim_ves[1] = lslim[jj][1]
-                        llimits[ind_struct] = 0 # False : struct is limited
-                        lim_min = Catan2(Csin(lim_ves[0]), Ccos(lim_ves[0]))
-                        lim_max = Catan2(Csin(lim_ves[1]), Ccos(lim_ves[1]))
-                        comp_bbox_poly_tor_lim(nvert,
-                                               &lstruct_polyx[ind_min],
-                                               &lstruct_polyy[ind_min],
-                                               &lbounds[ind_struct*6],
-                                               lim_min, lim_max)
-                    else:
-                        llimits[ind_struct] = 1 # True : is continous
-                        comp_bbox_poly_tor(nvert,
-                                           &lstruct_polyx[ind_min],
-                                           &lstruct_polyy[ind_min],
-                                           &lbounds[ind_struct*6])
-                        lim_min = 0.
-                        lim_max = 0.
-                    langles[ind_struct*2] = lim_min
-                    langles[ind_struct*2 + 1] = lim_max
-                    ind_struct = 1 + ind_struct
-            # end loops over structures
+            # The bounding boxes of the structures and their hierarchy do not
+            # depend on the LOS, they can be provided if already computed
+            if dbvh is None:
+                dbvh = comp_struct_bvh_tor(lstruct_nlim_org,
+                                           lstruct_polyx, lstruct_polyy,
+                                           lstruct_lims, lnvert,
+                                           nstruct_tot, nstruct_lim)
+            lsz_lim = dbvh['lsz_lim']
+            langles = dbvh['langles']
+            llimits = dbvh['llimits']
+            bvh_bounds = dbvh['bvh_bounds']
+            bvh_skip = dbvh['bvh_skip']
+            bvh_struct = dbvh['bvh_struct']
+            seg_start = dbvh['seg_start']
+            seg_bounds = dbvh['seg_bounds']
+            seg_skip = dbvh['seg_skip']
+            seg_range = dbvh['seg_range']
             # -- Computing intersection between structures and LOS -------------
             raytracing_inout_struct_tor(num_los, ray_vdir, ray_orig,
                                         coeff_inter_out, coeff_inter_in,
-                                        vperp_out, lstruct_nlim,
-                                        ind_inter_out,
+                                        vperp_out, ind_inter_out,
                                         forbid0, forbidbis,
                                         rmin, rmin2, crit2_base,
                                         nstruct_lim,
-                                        lbounds, langles, llimits,
-                                        &lnvert[0], lsz_lim,
+                                        &langles[0], &llimits[0],
+                                        &lnvert[0], &lsz_lim[0],
+                                        dbvh['nnodes'], &bvh_bounds[0],
+                                        &bvh_skip[0], &bvh_struct[0],
+                                        &seg_start[0], &seg_bounds[0],
+                                        &seg_skip[0], &seg_range[0],
                                         &lstruct_polyx[0],
                                         &lstruct_polyy[0],
                                         &lstruct_normx[0],
@@ -1622,8 +2093,6 @@ cdef inline void compute_inout_tot(const int num_los,
                                         eps_b, eps_plane,
                                         num_threads,
                                         True) # the structure is "OUT"
-            free(lsz_lim)
-            free(llimits)
     else:
         # -- Cylindrical case --------------------------------------------------
         # .. if there are, we get the limits for the vessel ....................
@@ -1681,8 +2150,323 @@ cdef inline void compute_inout_tot(const int num_los,
                                                 coeff_inter_out,
                                                 vperp_out, ind_inter_out,
                                                 eps_plane, ii+1, jj)
-    free(lbounds)
-    free(langles)
+    return
+
+
+# ==============================================================================
+# =  Multiple reflections on a Torus
+# ==============================================================================
+cdef inline double rand_uniform_counter(const unsigned long long seed,
+                                        const unsigned long long counter) nogil:
+    """
+    Returns a pseudo-random double in [0, 1) that only depends on the seed and
+    on the counter (splitmix64 hash), so that each (LOS, reflection) pair has
+    its own reproducible draw, whatever the number of threads.
+    """
+    cdef unsigned long long zz
+    zz = seed + 0x9E3779B97F4A7C15ULL * (counter + 1ULL)
+    zz = (zz ^ (zz >> 30)) * 0xBF58476D1CE4E5B9ULL
+    zz = (zz ^ (zz >> 27)) * 0x94D049BB133111EBULL
+    zz = zz ^ (zz >> 31)
+    return (zz >> 11) * (1. / 9007199254740992.)
+
+
+cdef inline void reflect_ray(const double* u, const double* vperp,
+                             const int rtype, const double rand,
+                             double* u2) nogil:
+    """
+    Computes the reflected unit vector u2 of the unit vector u on a surface of
+    normal vector vperp for the type of reflection rtype:
+        - 0: specular
+        - 1: diffusive (with rand a random number in [0, 1))
+        - 2: ccube (corner cube, the ray goes back its way)
+    Same as Struct._get_reflections_ufromTypes() for a single ray.
+    """
+    cdef double[3] vpar
+    cdef double[3] vtmp
+    cdef double norm
+    cdef double sca, sca2
+    if rtype == 2:
+        u2[0] = -u[0]
+        u2[1] = -u[1]
+        u2[2] = -u[2]
+        return
+    # vpar = (vperp x u) x vperp, normalized
+    vtmp[0] = vperp[1] * u[2] - vperp[2] * u[1]
+    vtmp[1] = vperp[2] * u[0] - vperp[0] * u[2]
+    vtmp[2] = vperp[0] * u[1] - vperp[1] * u[0]
+    vpar[0] = vtmp[1] * vperp[2] - vtmp[2] * vperp[1]
+    vpar[1] = vtmp[2] * vperp[0] - vtmp[0] * vperp[2]
+    vpar[2] = vtmp[0] * vperp[1] - vtmp[1] * vperp[0]
+    norm = Csqrt(vpar[0]*vpar[0] + vpar[1]*vpar[1] + vpar[2]*vpar[2])
+    vpar[0] = vpar[0] / norm
+    vpar[1] = vpar[1] / norm
+    vpar[2] = vpar[2] / norm
+    if rtype == 0:
+        sca = u[0]*vperp[0] + u[1]*vperp[1] + u[2]*vperp[2]
+        sca2 = u[0]*vpar[0] + u[1]*vpar[1] + u[2]*vpar[2]
+        u2[0] = -sca * vperp[0] + sca2 * vpar[0]
+        u2[1] = -sca * vperp[1] + sca2 * vpar[1]
+        u2[2] = -sca * vperp[2] + sca2 * vpar[2]
+    else:
+        sca = 2. * (rand - 0.5)
+        sca2 = Csqrt(1. - sca * sca)
+        u2[0] = sca2 * vperp[0] + sca * vpar[0]
+        u2[1] = sca2 * vperp[1] + sca * vpar[1]
+        u2[2] = sca2 * vperp[2] + sca * vpar[2]
+    return
+
+
+cdef inline void compute_reflections_tor(const int num_los,
+                                         const int nb,
+                                         const int npts_poly,
+                                         const double[:, ::1] ray_orig,
+                                         const double[:, ::1] ray_vdir,
+                                         const double[::1] coeff_out0,
+                                         const double[:, ::1] vperp0,
+                                         const long[:, ::1] ind_out0,
+                                         const long[::1] ltypes,
+                                         const long[::1] ltypes_ind,
+                                         const long[::1] lind_struct,
+                                         const int rtype,
+                                         const unsigned long long seed,
+                                         const double[:, ::1] ves_poly,
+                                         const double[:, ::1] ves_norm,
+                                         const long[::1] lstruct_nlim_org,
+                                         const double[::1] ves_lims,
+                                         const double[::1] lstruct_polyx,
+                                         const double[::1] lstruct_polyy,
+                                         list lstruct_lims,
+                                         const double[::1] lstruct_normx,
+                                         const double[::1] lstruct_normy,
+                                         const long[::1] lnvert,
+                                         const int nstruct_tot,
+                                         const int nstruct_lim,
+                                         const int sz_ves_lims,
+                                         const double min_poly_r,
+                                         const double rmin_org,
+                                         const double eps_uz,
+                                         const double eps_a,
+                                         const double eps_vz,
+                                         const double eps_b,
+                                         const double eps_plane,
+                                         const bint forbid,
+                                         const int num_threads,
+                                         double[:, :, ::1] ds,
+                                         double[:, :, ::1] us,
+                                         double[:, ::1] kouts,
+                                         double[:, :, ::1] vperps,
+                                         int[:, :, ::1] indouts,
+                                         int[:, ::1] types,
+                                         dict dbvh):
+    """
+    Computes nb successive reflections of all provided LOS in a TORE (vessel
+    and structures), starting from their first impact.
+    All vectors are stored LOS by LOS (last dimension of size 3):
+    ray_orig, ray_vdir, vperp0 and ind_out0 are (num_los, 3) arrays
+    (ind_out0[:, 0] being already converted to the index of the structure in
+    ltypes_ind) and coeff_out0 is the (num_los,) array of kout.
+    For each reflection ib, the origin of the reflected LOS is
+    ds[ilos, ib, :], its direction us[ilos, ib, :] and its new impact is
+    given by kouts[ilos, ib], vperps[ilos, ib, :] and indouts[ilos, ib, :]
+    (indouts[ilos, ib, 0] is converted with lind_struct).
+    The type of reflection (see reflect_ray) is taken from the flattened
+    array ltypes (ltypes[ltypes_ind[ii]:ltypes_ind[ii+1]] being the types
+    of each segment of structure ii), unless rtype >= 0 (forced for all).
+    The diffusive reflections use rand_uniform_counter(seed, ilos*nb + ib).
+    Each reflection is parallelized over the LOS.
+    """
+    cdef int ib, ilos
+    cdef int ii, jj, kk
+    cdef int ntypes
+    cdef int loc_type
+    cdef bint forbid0 = forbid
+    cdef double crit2_base = eps_uz * eps_uz /400.
+    cdef double rmin = rmin_org
+    cdef double rmin2 = 0.
+    cdef double kprev
+    cdef int nnodes = 0
+    cdef int[1] llim_ves
+    cdef double[2] lbounds_ves
+    cdef long[::1] lsz_lim
+    cdef double[::1] langles
+    cdef int[::1] llimits
+    cdef double[::1] bvh_bounds
+    cdef int[::1] bvh_skip
+    cdef int[::1] bvh_struct
+    cdef int[::1] seg_start
+    cdef double[::1] seg_bounds
+    cdef int[::1] seg_skip
+    cdef int[::1] seg_range
+    cdef double* plangles = NULL
+    cdef int* pllimits = NULL
+    cdef long* plnvert = NULL
+    cdef long* plsz_lim = NULL
+    cdef double* pbvh_bounds = NULL
+    cdef int* pbvh_skip = NULL
+    cdef int* pbvh_struct = NULL
+    cdef int* pseg_start = NULL
+    cdef double* pseg_bounds = NULL
+    cdef int* pseg_skip = NULL
+    cdef int* pseg_range = NULL
+    cdef double* ppolyx = NULL
+    cdef double* ppolyy = NULL
+    cdef double* pnormx = NULL
+    cdef double* pnormy = NULL
+    cdef double* kin_loc = NULL
+    cdef double* loc_vp = NULL
+    cdef double* kpin_loc = NULL
+    cdef double* kpout_loc = NULL
+    cdef double* last_pout = NULL
+    cdef double* invr_ray = NULL
+    cdef int* sign_ray = NULL
+    cdef int* ind_loc = NULL
+    # == Limits of the vessel ==================================================
+    if ves_lims is None or sz_ves_lims == 0:
+        lbounds_ves[0] = 0
+        lbounds_ves[1] = 0
+        llim_ves[0] = 1
+    else:
+        lbounds_ves[0] = Catan2(Csin(ves_lims[0]), Ccos(ves_lims[0]))
+        lbounds_ves[1] = Catan2(Csin(ves_lims[1]), Ccos(ves_lims[1]))
+        llim_ves[0] = 0
+    # == Bounding boxes of the structures (if any) =============================
+    if nstruct_tot > 0:
+        if dbvh is None:
+            dbvh = comp_struct_bvh_tor(lstruct_nlim_org,
+                                       lstruct_polyx, lstruct_polyy,
+                                       lstruct_lims, lnvert,
+                                       nstruct_tot, nstruct_lim)
+        lsz_lim = dbvh['lsz_lim']
+        langles = dbvh['langles']
+        llimits = dbvh['llimits']
+        bvh_bounds = dbvh['bvh_bounds']
+        bvh_skip = dbvh['bvh_skip']
+        bvh_struct = dbvh['bvh_struct']
+        nnodes = dbvh['nnodes']
+        plangles = &langles[0]
+        pllimits = &llimits[0]
+        plnvert = <long*>&lnvert[0]
+        plsz_lim = &lsz_lim[0]
+        pbvh_bounds = &bvh_bounds[0]
+        pbvh_skip = &bvh_skip[0]
+        pbvh_struct = &bvh_struct[0]
+        seg_start = dbvh['seg_start']
+        seg_bounds = dbvh['seg_bounds']
+        seg_skip = dbvh['seg_skip']
+        seg_range = dbvh['seg_range']
+        pseg_start = &seg_start[0]
+        pseg_bounds = &seg_bounds[0]
+        pseg_skip = &seg_skip[0]
+        pseg_range = &seg_range[0]
+        ppolyx = <double*>&lstruct_polyx[0]
+        ppolyy = <double*>&lstruct_polyy[0]
+        pnormx = <double*>&lstruct_normx[0]
+        pnormy = <double*>&lstruct_normy[0]
+
+    # == Loop on the successive reflections ====================================
+    for ib in range(nb):
+        # -- Origins, directions and types of the reflected LOS ----------------
+        with nogil:
+            for ilos in prange(num_los, num_threads=num_threads):
+                if ib == 0:
+                    kprev = coeff_out0[ilos] - 1.e-12
+                    for kk in range(3):
+                        ds[ilos, 0, kk] = (ray_orig[ilos, kk]
+                                           + kprev * ray_vdir[ilos, kk])
+                    ii = ind_out0[ilos, 0]
+                    jj = ind_out0[ilos, 2]
+                else:
+                    kprev = kouts[ilos, ib-1] - 1.e-12
+                    for kk in range(3):
+                        ds[ilos, ib, kk] = (ds[ilos, ib-1, kk]
+                                            + kprev * us[ilos, ib-1, kk])
+                    ii = indouts[ilos, ib-1, 0]
+                    jj = indouts[ilos, ib-1, 2]
+                if rtype >= 0:
+                    loc_type = rtype
+                else:
+                    ntypes = ltypes_ind[ii+1] - ltypes_ind[ii]
+                    if jj < 0:
+                        jj = jj + ntypes
+                    loc_type = ltypes[ltypes_ind[ii] + jj]
+                types[ilos, ib] = loc_type
+                if ib == 0:
+                    reflect_ray(&ray_vdir[ilos, 0], &vperp0[ilos, 0],
+                                loc_type,
+                                rand_uniform_counter(seed, ilos*nb + ib),
+                                &us[ilos, 0, 0])
+                else:
+                    reflect_ray(&us[ilos, ib-1, 0], &vperps[ilos, ib-1, 0],
+                                loc_type,
+                                rand_uniform_counter(seed, ilos*nb + ib),
+                                &us[ilos, ib, 0])
+        # -- rmin is necessary to avoid looking on the other side of the tokamak
+        if rmin_org < 0.:
+            rmin = min_poly_r
+            for ilos in range(num_los):
+                rmin = min(rmin, Csqrt(ds[ilos, ib, 0] * ds[ilos, ib, 0]
+                                       + ds[ilos, ib, 1] * ds[ilos, ib, 1]))
+            rmin = 0.95 * rmin
+        rmin2 = rmin * rmin
+        # -- Computing the new impacts -----------------------------------------
+        with nogil, parallel(num_threads=num_threads):
+            kin_loc   = <double *> malloc(sizeof(double) * 1)
+            loc_vp    = <double *> malloc(sizeof(double) * 3)
+            kpin_loc  = <double *> malloc(sizeof(double) * 1)
+            kpout_loc = <double *> malloc(sizeof(double) * 1)
+            last_pout = <double *> malloc(sizeof(double) * 3)
+            invr_ray  = <double *> malloc(sizeof(double) * 3)
+            sign_ray  = <int *> malloc(sizeof(int) * 3)
+            ind_loc   = <int *> malloc(sizeof(int) * 1)
+            for ilos in prange(num_los, schedule='dynamic'):
+                # .. with the vessel ...........................................
+                raytracing_inout_los_tor(&ds[ilos, ib, 0], &us[ilos, ib, 0],
+                                         kin_loc, &kouts[ilos, ib],
+                                         &vperps[ilos, ib, 0],
+                                         &indouts[ilos, ib, 0],
+                                         forbid0, forbid0,
+                                         rmin, rmin2, crit2_base,
+                                         npts_poly, lbounds_ves, llim_ves,
+                                         NULL, NULL,
+                                         0, NULL, NULL, NULL,
+                                         NULL, NULL, NULL, NULL,
+                                         &ves_poly[0][0], &ves_poly[1][0],
+                                         &ves_norm[0][0], &ves_norm[1][0],
+                                         eps_uz, eps_vz, eps_a, eps_b,
+                                         eps_plane, False,
+                                         loc_vp, kpin_loc, kpout_loc, ind_loc,
+                                         last_pout, invr_ray, sign_ray)
+                # .. with the structures .......................................
+                if nstruct_tot > 0:
+                    raytracing_inout_los_tor(&ds[ilos, ib, 0],
+                                             &us[ilos, ib, 0],
+                                             kin_loc, &kouts[ilos, ib],
+                                             &vperps[ilos, ib, 0],
+                                             &indouts[ilos, ib, 0],
+                                             forbid0, forbid0,
+                                             rmin, rmin2, crit2_base,
+                                             nstruct_lim, plangles, pllimits,
+                                             plnvert, plsz_lim,
+                                             nnodes, pbvh_bounds,
+                                             pbvh_skip, pbvh_struct,
+                                             pseg_start, pseg_bounds,
+                                             pseg_skip, pseg_range,
+                                             ppolyx, ppolyy, pnormx, pnormy,
+                                             eps_uz, eps_vz, eps_a, eps_b,
+                                             eps_plane, True,
+                                             loc_vp, kpin_loc, kpout_loc,
+                                             ind_loc,
+                                             last_pout, invr_ray, sign_ray)
+                indouts[ilos, ib, 0] = lind_struct[indouts[ilos, ib, 0]]
+            free(kin_loc)
+            free(loc_vp)
+            free(kpin_loc)
+            free(kpout_loc)
+            free(last_pout)
+            free(invr_ray)
+            free(sign_ray)
+            free(ind_loc)
     return
 
 
@@ -1835,6 +2619,7 @@ cdef inline void raytracing_minmax_struct_tor(const int num_los,
                                                   surf_normx,
                                                   surf_normy,
                                                   npts_poly-1,
+                                                  0, NULL, NULL, NULL,
                                                   not is_limited,
                                                   langles[0], langles[1],
                                                   forbidbis,
@@ -1985,7 +2770,8 @@ cdef inline void is_visible_pt_vec(double pt0, double pt1, double pt2,
                                    double eps_vz, double eps_b,
                                    double eps_plane, str ves_type,
                                    bint forbid,
-                                   bint test, int num_threads):
+                                   bint test, int num_threads,
+                                   dict dbvh):
     cdef array vperp_out = clone(array('d'), npts * 3, True)
     cdef array coeff_inter_in  = clone(array('d'), npts, True)
     cdef array coeff_inter_out = clone(array('d'), npts, True)
@@ -2025,7 +2811,7 @@ cdef inline void is_visible_pt_vec(double pt0, double pt1, double pt2,
                       eps_plane, ves_type,
                       forbid, num_threads,
                       coeff_inter_out, coeff_inter_in, vperp_out,
-                      ind_inter_out)
+                      ind_inter_out, dbvh)
     # --------------------------------------------------------------------------
     # Get ind
     if k == None:
@@ -2066,13 +2852,19 @@ cdef inline void are_visible_vec_vec(double[:, ::1] pts1, int npts1,
                                      double eps_vz, double eps_b,
                                      double eps_plane, str ves_type,
                                      bint forbid,
-                                     bint test, int num_threads):
+                                     bint test, int num_threads,
+                                     dict dbvh):
     cdef np.ndarray[double, ndim=2, mode='c'] ray_orig_arr
     cdef np.ndarray[double, ndim=2, mode='c'] ray_vdir_arr
     cdef np.ndarray[double, ndim=2, mode='c'] dist_arr
     cdef double[:,::1] ray_orig
     cdef double[:,::1] ray_vdir
     cdef int ii
+    # The bounding boxes of the structures are the same for all points
+    if dbvh is None and ves_type == 'tor' and nstruct_tot > 0:
+        dbvh = comp_struct_bvh_tor(lstruct_nlim, lstruct_polyx, lstruct_polyy,
+                                   lstruct_lims, lnvert,
+                                   nstruct_tot, nstruct_lim)
     # We compute for each point in the polygon
     for ii in range(npts1):
         is_visible_pt_vec(pts1[0,ii], pts1[1,ii], pts1[2,ii],
@@ -2086,5 +2878,5 @@ cdef inline void are_visible_vec_vec(double[:, ::1] pts1, int npts1,
                           lnvert, nstruct_tot, nstruct_lim,
                           rmin, eps_uz, eps_a, eps_vz, eps_b,
                           eps_plane, ves_type,
-                          forbid, test, num_threads)
+                          forbid, test, num_threads, dbvh)
     return
@@ -116,6 +116,15 @@ cdef void los_get_sample_core_var_res(int nlos,
                                      long* los_ind,
                                      int num_threads) nogil
 
+cdef void los_get_sample_core_nb_var_res(int nlos,
+                                        double* los_lim_min,
+                                        double* los_lim_max,
+                                        int n_dmode, int n_imode,
+                                        double* resol,
+                                        double* eff_res,
+                                        long* los_ind,
+                                        int num_threads) nogil
+
 cdef void los_get_sample_pts(int nlos,
                              double* ptx,
                              double* pty,
@@ -128,3 +137,18 @@ cdef void los_get_sample_pts(int nlos,
                              double* coeff_ptr,
                              long* los_ind,
                              int num_threads) nogil
+
+# ==============================================================================
+# == LOS integration of sampled values
+# ==============================================================================
+cdef double simps_single(double* val, long npts, double loc_resol) nogil
+
+cdef double romb_single(double* val, long npts, double loc_resol) nogil
+
+cdef void los_integrate_values(int nlos, int nt, long npts,
+                               int n_imode,
+                               double* val,
+                               long* los_ind,
+                               double* eff_res,
+                               double* sig,
+                               int num_threads) nogil
@@ -381,10 +381,10 @@ cdef inline void middle_rule_rel(int nlos, int num_raf,
     # Now for the rest:
     with nogil, parallel(num_threads=num_threads):
         for ii in prange(1, nlos):
-            los_ind[ii] = num_raf + los_ind[ii-1]
+            first_index = ii*num_raf
+            los_ind[ii] = num_raf + first_index
             loc_resol = (los_kmax[ii] - los_kmin[ii])*inv_nraf
             eff_resolution[ii] = loc_resol
-            first_index = ii*num_raf
             middle_rule_single(num_raf, los_kmin[ii],
                                loc_resol, &los_coeffs[first_index])
     return
@@ -1457,6 +1457,57 @@ cdef inline void los_get_sample_core_var_res(int nlos,
     return
 
 
+cdef inline void los_get_sample_core_nb_var_res(int nlos,
+                                                double* los_lim_min,
+                                                double* los_lim_max,
+                                                int n_dmode, int n_imode,
+                                                double* resol,
+                                                double* eff_res,
+                                                long* los_ind,
+                                                int num_threads) nogil:
+    # Same as los_get_sample_core_var_res but only computes the effective
+    # resolutions and the cumulated number of samples per LOS (los_ind),
+    # the coefficients themselves are neither allocated nor computed
+    cdef long* los_nraf
+    # ...
+    los_nraf = <long*> malloc(nlos * sizeof(long))
+    if n_dmode==0: #absolute
+        if n_imode==0: # sum
+            middle_rule_abs_var_s1(nlos,
+                                   los_lim_min, los_lim_max,
+                                   resol, &eff_res[0],
+                                   los_ind, los_nraf,
+                                   num_threads)
+        elif n_imode==1:# simps
+            simps_left_rule_abs_var_s1(nlos, resol,
+                                       los_lim_min, los_lim_max,
+                                       &eff_res[0], los_ind, los_nraf,
+                                       num_threads)
+        else: # romb
+            romb_left_rule_abs_var_s1(nlos, resol,
+                                      los_lim_min, los_lim_max,
+                                      &eff_res[0], los_ind, los_nraf,
+                                      num_threads)
+    else: # relative
+        if n_imode==0: # sum
+            middle_rule_rel_var_s1(nlos, resol,
+                                   los_lim_min, los_lim_max,
+                                   &eff_res[0], los_ind, los_nraf,
+                                   num_threads)
+        elif n_imode==1: # simps
+            simps_left_rule_rel_var_s1(nlos, resol,
+                                       los_lim_min, los_lim_max,
+                                       &eff_res[0], los_ind, los_nraf,
+                                       num_threads)
+        else: # romb
+            romb_left_rule_rel_var_s1(nlos, resol,
+                                      los_lim_min, los_lim_max,
+                                      &eff_res[0], los_ind, los_nraf,
+                                      num_threads)
+    free(los_nraf)
+    return
+
+
 # -- utility for calc signal ---------------------------------------------------
 cdef inline void los_get_sample_pts(int nlos,
                                     double* ptx,
@@ -1470,8 +1521,12 @@ cdef inline void los_get_sample_pts(int nlos,
                                     double* coeff_ptr,
                                     long* los_ind,
                                     int num_threads) nogil:
+    # Computes the sampled points coordinates from the coefficients
+    # If usx is NULL, the repeated direction vectors (only needed for
+    # anisotropic emissivities) are not stored
     cdef double loc_ox, loc_oy, loc_oz
     cdef double loc_vx, loc_vy, loc_vz
+    cdef bint store_us = usx != NULL
     cdef int ii, jj
     # Initialization
     loc_ox = ray_orig[0,0]
@@ -1484,9 +1539,10 @@ cdef inline void los_get_sample_pts(int nlos,
         ptx[ii] = loc_ox + coeff_ptr[ii] * loc_vx
         pty[ii] = loc_oy + coeff_ptr[ii] * loc_vy
         ptz[ii] = loc_oz + coeff_ptr[ii] * loc_vz
-        usx[ii] = loc_vx
-        usy[ii] = loc_vy
-        usz[ii] = loc_vz
+        if store_us:
+            usx[ii] = loc_vx
+            usy[ii] = loc_vy
+            usz[ii] = loc_vz
     # Other lines of sights:
     for jj in range(1, nlos):
         loc_ox = ray_orig[0,jj]
@@ -1499,7 +1555,102 @@ cdef inline void los_get_sample_pts(int nlos,
             ptx[ii] = loc_ox + coeff_ptr[ii] * loc_vx
             pty[ii] = loc_oy + coeff_ptr[ii] * loc_vy
             ptz[ii] = loc_oz + coeff_ptr[ii] * loc_vz
-            usx[ii] = loc_vx
-            usy[ii] = loc_vy
-            usz[ii] = loc_vz
+            if store_us:
+                usx[ii] = loc_vx
+                usy[ii] = loc_vy
+                usz[ii] = loc_vz
+    return
+
+
+# ==============================================================================
+# == LOS integration of sampled values
+# ==============================================================================
+cdef inline double simps_single(double* val, long npts,
+                                double loc_resol) nogil:
+    # Composite Simpson rule on npts (odd) regularly spaced values, as
+    # returned by 'simps' sampling (equivalent to scipy.integrate.simps)
+    # If npts is even (not possible with tofu's sampling), the last interval
+    # is integrated with the trapezoidal rule
+    cdef Py_ssize_t jj
+    cdef long nlast
+    cdef double res = 0.
+    # ...
+    if npts < 2:
+        return 0.
+    nlast = npts - 1 if npts%2==1 else npts - 2
+    for jj in range(1, nlast, 2):
+        res += val[jj-1] + 4.*val[jj] + val[jj+1]
+    res = res * loc_resol / 3.
+    if nlast < npts - 1:
+        res += 0.5 * (val[npts-2] + val[npts-1]) * loc_resol
+    return res
+
+
+cdef inline double romb_single(double* val, long npts,
+                               double loc_resol) nogil:
+    # Romberg integration on npts = 2**k + 1 regularly spaced values, as
+    # returned by 'romb' sampling (equivalent to scipy.integrate.romb)
+    # Only two rows of the Richardson extrapolation table are stored
+    cdef Py_ssize_t ii, jj
+    cdef long ninterv = npts - 1
+    cdef long start, step, kk
+    cdef int nk = 0
+    cdef double hh, loc_sum
+    cdef double[64] rprev
+    cdef double[64] rcurr
+    # ...
+    if npts < 2:
+        return 0.
+    kk = 1
+    while kk < ninterv:
+        kk = kk * 2
+        nk = nk + 1
+    hh = ninterv * loc_resol
+    rprev[0] = 0.5 * (val[0] + val[ninterv]) * hh
+    start = ninterv
+    step = ninterv
+    for ii in range(1, nk + 1):
+        start = start // 2
+        loc_sum = 0.
+        jj = start
+        while jj < ninterv:
+            loc_sum += val[jj]
+            jj = jj + step
+        step = step // 2
+        rcurr[0] = 0.5 * (rprev[0] + hh * loc_sum)
+        for jj in range(1, ii + 1):
+            rcurr[jj] = (rcurr[jj-1]
+                         + (rcurr[jj-1] - rprev[jj-1]) / ((1 << (2*jj)) - 1))
+        for jj in range(ii + 1):
+            rprev[jj] = rcurr[jj]
+        hh = hh * 0.5
+    return rprev[nk]
+
+
+cdef inline void los_integrate_values(int nlos, int nt, long npts,
+                                      int n_imode,
+                                      double* val,
+                                      long* los_ind,
+                                      double* eff_res,
+                                      double* sig,
+                                      int num_threads) nogil:
+    # Integrates the (nt, npts) C-ordered values sampled on nlos LOS, with
+    # the 'simps' (n_imode=1) or 'romb' (n_imode=2) quadrature.
+    # los_ind is of size nlos+1: values of LOS ii are in
+    # val[:, los_ind[ii]:los_ind[ii+1]]
+    # Results are stored in sig, a (nt, nlos) C-ordered array
+    cdef Py_ssize_t ii
+    cdef int jj
+    cdef long nraf
+    # ...
+    with nogil, parallel(num_threads=num_threads):
+        for ii in prange(nlos):
+            nraf = los_ind[ii+1] - los_ind[ii]
+            for jj in range(nt):
+                if n_imode == 1:
+                    sig[jj*nlos + ii] = simps_single(
+                        &val[jj*npts + los_ind[ii]], nraf, eff_res[ii])
+                else:
+                    sig[jj*nlos + ii] = romb_single(
+                        &val[jj*npts + los_ind[ii]], nraf, eff_res[ii])
     return
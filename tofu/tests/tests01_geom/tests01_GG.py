@@ -10,6 +10,7 @@ import matplotlib
 matplotlib.use('agg')
 import matplotlib.pyplot as plt
 from matplotlib.path import Path
+from matplotlib.tri import Triangulation as mplTri
 import matplotlib.gridspec as mplgrid
 from mpl_toolkits.mplot3d import Axes3D
 import tofu as tf
@@ -1836,3 +1837,439 @@ def test24_is_visible():
     assert np.allclose(are_vis.flatten(), [True, True, False,
                                            True, True, False,
                                            False, False, True])
+
+
+def test25_LOS_calc_signal_chunks():
+    nlos = 20
+    ray_orig = np.ascontiguousarray(np.tile([[3.], [0.], [0.]], nlos))
+    ray_vdir = np.ascontiguousarray([-np.ones((nlos,)),
+                                     np.linspace(-0.5, 0.5, nlos),
+                                     np.zeros((nlos,))])
+    ray_vdir = ray_vdir / np.sqrt(np.sum(ray_vdir**2, axis=0))[None, :]
+    lims = np.ascontiguousarray([np.full((nlos,), 0.5),
+                                 np.linspace(1., 2., nlos)])
+    t = np.linspace(0., 1., 5)
+
+    def func(pts, t=None, vect=None):
+        val = np.exp(-(np.hypot(pts[0, :], pts[1, :]) - 2.)**2/0.1)
+        if vect is not None:
+            val = val * vect[0, :]
+        return val[None, :] * (1. + t[:, None])
+
+    for ani in [False, True]:
+        for method in ['sum', 'simps', 'romb']:
+            for dmethod in ['abs', 'rel']:
+                res = 0.01 if dmethod == 'abs' else 0.05
+                sig0 = GG.LOS_calc_signal(func, ray_orig, ray_vdir, res,
+                                          lims, dmethod=dmethod,
+                                          method=method, ani=ani, t=t,
+                                          minimize='calls')
+                # Budget of ~ a few LOS per block, and less than one LOS
+                for max_bytes in [1.e5, 1.e2]:
+                    sig = GG.LOS_calc_signal(func, ray_orig, ray_vdir, res,
+                                             lims, dmethod=dmethod,
+                                             method=method, ani=ani, t=t,
+                                             minimize='chunks',
+                                             max_bytes=max_bytes)
+                    assert sig.shape == (t.size, nlos)
+                    assert np.allclose(sig, sig0)
+
+
+def test26_LOS_calc_signal_simps_romb():
+    import scipy.integrate as scpintg
+    nlos = 7
+    ray_orig = np.ascontiguousarray(np.tile([[3.], [0.], [0.]], nlos))
+    ray_vdir = np.ascontiguousarray(np.tile([[-1.], [0.], [0.]], nlos))
+    lims = np.ascontiguousarray([np.zeros((nlos,)),
+                                 np.linspace(0.1, 2., nlos)])
+    t = np.linspace(0., 1., 3)
+
+    def func(pts, t=None):
+        return np.cos(pts[0, :])[None, :] * (1. + t[:, None])
+
+    # Reference: scipy quadrature per LOS on the same samples
+    for method, fint in [('simps', scpintg.simps), ('romb', scpintg.romb)]:
+        for res in [0.3, np.linspace(0.01, 0.2, nlos)]:
+            k, reseff, ind = GG.LOS_get_sample(nlos, res, lims,
+                                               method=method)
+            lk = np.split(k, ind)
+            sigref = np.array([fint(func(ray_orig[:, ii:ii+1]
+                                         + kk[None, :]*ray_vdir[:, ii:ii+1],
+                                         t=t),
+                                    dx=reseff[ii], axis=-1)
+                               for ii, kk in enumerate(lk)]).T
+            sig = GG.LOS_calc_signal(func, ray_orig, ray_vdir, res, lims,
+                                     method=method, t=t, minimize='calls')
+            assert np.allclose(sig, sigref)
+            # integral of cos(3-k) on [0, kmax]
+            sigth = (np.sin(3.) - np.sin(3.-lims[1, :]))
+            sigth = sigth[None, :] * (1. + t[:, None])
+            assert np.allclose(sig, sigth, rtol=1.e-3)
+
+
+def test27_LOS_sampling_plan():
+    nlos = 10
+    ray_orig = np.ascontiguousarray(np.tile([[3.], [0.], [0.]], nlos))
+    ray_vdir = np.ascontiguousarray([-np.ones((nlos,)),
+                                     np.linspace(-0.5, 0.5, nlos),
+                                     np.zeros((nlos,))])
+    ray_vdir = ray_vdir / np.sqrt(np.sum(ray_vdir**2, axis=0))[None, :]
+    lims = np.ascontiguousarray([np.full((nlos,), 0.5),
+                                 np.linspace(1., 2., nlos)])
+
+    def func(pts, t=None, vect=None):
+        val = np.exp(-(np.hypot(pts[0, :], pts[1, :]) - 2.)**2/0.1)
+        if vect is not None:
+            val = val * vect[0, :]
+        return val[None, :] * (1. + t[:, None])
+
+    for ani in [False, True]:
+        for method in ['sum', 'simps', 'romb']:
+            plan = GG.LOS_get_sampling_plan(ray_orig, ray_vdir, 0.05, lims,
+                                            dmethod='rel', method=method,
+                                            ani=ani)
+            k, reseff, ind = GG.LOS_get_sample(nlos, 0.05, lims,
+                                               dmethod='rel', method=method)
+            assert plan.nlos == nlos and plan.npts == k.size
+            assert np.allclose(plan.reseff, reseff)
+            assert np.all(plan.ind == ind)
+            assert (plan.vect is not None) == ani
+            # The same plan is re-used for several time vectors
+            for t in [np.r_[0.], np.linspace(0., 1., 5)]:
+                sig0 = GG.LOS_calc_signal(func, ray_orig, ray_vdir, 0.05,
+                                          lims, dmethod='rel', method=method,
+                                          ani=ani, t=t)
+                sig = GG.LOS_calc_signal(func, ray_orig, ray_vdir, 0.05,
+                                         lims, dmethod='rel', method=method,
+                                         ani=ani, t=t, plan=plan)
+                assert sig.shape == sig0.shape
+                assert np.allclose(sig, sig0)
+
+
+def test28_LOS_calc_signal_reflections():
+    nlos, nord = 8, 3
+    ray_orig = np.ascontiguousarray(np.tile([[3.], [0.], [0.]], nlos*nord))
+    ray_vdir = np.ascontiguousarray([-np.ones((nlos*nord,)),
+                                     np.linspace(-0.5, 0.5, nlos*nord),
+                                     np.zeros((nlos*nord,))])
+    ray_vdir = ray_vdir / np.sqrt(np.sum(ray_vdir**2, axis=0))[None, :]
+    lims = np.ascontiguousarray([np.full((nlos*nord,), 0.5),
+                                 np.linspace(1., 2., nlos*nord)])
+    coefs = np.r_[1., 0.5, 0.1]
+    t = np.linspace(0., 1., 4)
+    ncalls = [0]
+
+    def func(pts, t=None, vect=None):
+        ncalls[0] += 1
+        val = np.exp(-(np.hypot(pts[0, :], pts[1, :]) - 2.)**2/0.1)
+        if vect is not None:
+            val = val * vect[0, :]
+        return val[None, :] * (1. + t[:, None])
+
+    for ani in [False, True]:
+        for method in ['sum', 'simps', 'romb']:
+            kwd = dict(method=method, ani=ani, t=t)
+            # reference: one call per order
+            sigref = np.zeros((t.size, nlos))
+            for kk in range(nord):
+                ind = slice(kk*nlos, (kk+1)*nlos)
+                sigref += coefs[kk] * GG.LOS_calc_signal(
+                    func, np.ascontiguousarray(ray_orig[:, ind]),
+                    np.ascontiguousarray(ray_vdir[:, ind]), 0.05,
+                    np.ascontiguousarray(lims[:, ind]), **kwd)
+            for minimize in ['calls', 'hybrid', 'chunks']:
+                ncalls[0] = 0
+                sig = GG.LOS_calc_signal(func, ray_orig, ray_vdir, 0.05,
+                                         lims, minimize=minimize,
+                                         coefs_reflect=coefs, **kwd)
+                assert sig.shape == (t.size, nlos)
+                assert np.allclose(sig, sigref)
+                if minimize == 'calls':
+                    assert ncalls[0] == 1
+            plan = GG.LOS_get_sampling_plan(ray_orig, ray_vdir, 0.05, lims,
+                                            method=method, ani=ani)
+            sig = GG.LOS_calc_signal(func, ray_orig, ray_vdir, 0.05, lims,
+                                     plan=plan, coefs_reflect=coefs, **kwd)
+            assert np.allclose(sig, sigref)
+
+
+def test29_LOS_PInOut_struct_bvh():
+    # Vessel and many small limited structures (tiles) all around the torus
+    VP = np.array([[4., 8., 8., 4., 4.], [-3., -3., 3., 3., -3.]])
+    VIn = np.array([[0., -1., 0., 1.], [1., 0., -1., 0.]])
+    ntiles, dphi = 24, 2.*np.pi/24
+    tile = np.array([[7.5, 7.9, 7.9, 7.5, 7.5], [-0.5, -0.5, 0.5, 0.5, -0.5]])
+    tileIn = np.array([[0., -1., 0., 1.], [1., 0., -1., 0.]])
+    lpoly = [tile + np.array([[0.], [-2. + 4.*ii/5.]]) for ii in range(6)]
+    llims = [np.array([[jj*dphi, (jj+0.5)*dphi]
+                       for jj in range(ii % 2, ntiles, 2)])
+             for ii in range(6)]
+    lnvert = np.cumsum([pp.shape[1] for pp in lpoly]).astype(np.int_)
+    dkwd = dict(ves_lims=None, nstruct_lim=len(lpoly),
+                nstruct_tot=int(np.sum([ll.shape[0] for ll in llims])),
+                lnvert=lnvert,
+                lstruct_polyx=np.concatenate([pp[0, :] for pp in lpoly]),
+                lstruct_polyy=np.concatenate([pp[1, :] for pp in lpoly]),
+                lstruct_nlim=np.array([ll.shape[0] for ll in llims],
+                                      dtype=np.int_),
+                lstruct_lims=llims,
+                lstruct_normx=np.concatenate([tileIn[0, :]]*len(lpoly)),
+                lstruct_normy=np.concatenate([tileIn[1, :]]*len(lpoly)),
+                ves_type='Tor', test=True)
+
+    # LOS from the high-field side towards the low-field side
+    nlos = 200
+    phi = np.linspace(0., 2.*np.pi, nlos, endpoint=False)
+    Ds = np.array([5.*np.cos(phi), 5.*np.sin(phi), np.linspace(-2, 2, nlos)])
+    pt = np.array([7.7*np.cos(phi+0.3), 7.7*np.sin(phi+0.3),
+                   np.linspace(2, -2, nlos)])
+    us = (pt - Ds) / np.sqrt(np.sum((pt - Ds)**2, axis=0))[None, :]
+    Ds, us = np.ascontiguousarray(Ds), np.ascontiguousarray(us)
+
+    # The hierarchy
+    dbvh = GG.LOS_get_struct_bvh(dkwd['lstruct_nlim'], dkwd['lstruct_polyx'],
+                                 dkwd['lstruct_polyy'], dkwd['lstruct_lims'],
+                                 dkwd['lnvert'], dkwd['nstruct_tot'],
+                                 dkwd['nstruct_lim'])
+    nnodes = dbvh['nnodes']
+    assert nnodes == 2*dkwd['nstruct_tot'] - 1
+    bounds = dbvh['bvh_bounds'].reshape((nnodes, 6))
+    lbounds = dbvh['lbounds'].reshape((-1, 6))
+    assert np.all(bounds[0, :3] <= np.min(lbounds[:, :3], axis=0))
+    assert np.all(bounds[0, 3:] >= np.max(lbounds[:, 3:], axis=0))
+    leaves = dbvh['bvh_struct'].reshape((nnodes, 2))
+    leaves = leaves[leaves[:, 0] >= 0]
+    assert leaves.shape[0] == dkwd['nstruct_tot']
+    assert np.all(np.diff(dbvh['lsz_lim'][leaves[:, 0]] + leaves[:, 1]) == 1)
+
+    # With or without a pre-computed hierarchy
+    out = GG.LOS_Calc_PInOut_VesStruct(Ds, us, VP, VIn, **dkwd)
+    outbvh = GG.LOS_Calc_PInOut_VesStruct(Ds, us, VP, VIn, dbvh=dbvh, **dkwd)
+    for aa, bb in zip(out, outbvh):
+        assert np.allclose(aa, bb, equal_nan=True)
+    assert np.sum(out[3][0, :] > 0) > 0
+
+    # Against each structure taken separately
+    kout = GG.LOS_Calc_PInOut_VesStruct(Ds, us, VP, VIn, ves_type='Tor')[1]
+    for ii in range(len(lpoly)):
+        kii = GG.LOS_Calc_PInOut_VesStruct(
+            Ds, us, VP, VIn, ves_lims=None, nstruct_lim=1,
+            nstruct_tot=llims[ii].shape[0],
+            lnvert=np.r_[lpoly[ii].shape[1]].astype(np.int_),
+            lstruct_polyx=np.ascontiguousarray(lpoly[ii][0, :]),
+            lstruct_polyy=np.ascontiguousarray(lpoly[ii][1, :]),
+            lstruct_nlim=np.r_[llims[ii].shape[0]].astype(np.int_),
+            lstruct_lims=[llims[ii]],
+            lstruct_normx=np.ascontiguousarray(tileIn[0, :]),
+            lstruct_normy=np.ascontiguousarray(tileIn[1, :]),
+            ves_type='Tor')[1]
+        kout = np.fmin(kout, kii)
+    assert np.allclose(out[1], kout)
+
+
+def test30_LOS_calc_signal_adaptive():
+    nlos = 10
+    ray_orig = np.ascontiguousarray(np.tile([[3.], [0.], [0.]], nlos))
+    ray_vdir = np.ascontiguousarray([-np.ones((nlos,)),
+                                     np.linspace(-0.5, 0.5, nlos),
+                                     np.zeros((nlos,))])
+    ray_vdir = ray_vdir / np.sqrt(np.sum(ray_vdir**2, axis=0))[None, :]
+    lims = np.ascontiguousarray([np.full((nlos,), 0.5),
+                                 np.linspace(1., 2., nlos)])
+    t = np.linspace(0., 1., 3)
+    ncalls = [0]
+
+    def func(pts, t=None, vect=None):
+        # peaked emissivity
+        ncalls[0] += 1
+        val = np.exp(-(np.hypot(pts[0, :], pts[1, :]) - 2.)**2/0.001)
+        if vect is not None:
+            val = val * vect[0, :]
+        return val[None, :] * (1. + t[:, None])
+
+    for ani in [False, True]:
+        sigref = GG.LOS_calc_signal(func, ray_orig, ray_vdir, 1.e-5, lims,
+                                    method='simps', ani=ani, t=t)
+        lneval = []
+        for rtol in [1.e-3, 1.e-7]:
+            ncalls[0] = 0
+            sig, neval = GG.LOS_calc_signal(func, ray_orig, ray_vdir, 0.1,
+                                            lims, method='adaptive', ani=ani,
+                                            t=t, rtol=rtol, return_neval=True)
+            assert sig.shape == (t.size, nlos) and neval.shape == (nlos,)
+            assert np.allclose(sig, sigref, rtol=10.*rtol, atol=1.e-12)
+            assert ncalls[0] <= 21
+            lneval.append(neval)
+        assert np.all(lneval[1] > lneval[0])
+        # Far fewer evaluations than the fixed step of similar accuracy
+        assert np.all(lneval[0] < (lims[1, :] - lims[0, :]) / 1.e-3)
+        # stacked orders
+        sig2 = GG.LOS_calc_signal(func, np.tile(ray_orig, 2),
+                                  np.tile(ray_vdir, 2), 0.1,
+                                  np.tile(lims, 2), method='adaptive',
+                                  ani=ani, t=t, rtol=1.e-7,
+                                  coefs_reflect=[1., 0.5])
+        assert np.allclose(sig2, 1.5*sig, rtol=1.e-6)
+
+    # nan in part of the domain: accepted as is, propagated to the signal
+    def funcnan(pts, t=None, vect=None):
+        val = func(pts, t=t, vect=vect)
+        val[:, np.hypot(pts[0, :], pts[1, :]) < 1.5] = np.nan
+        return val
+
+    sigref = GG.LOS_calc_signal(func, ray_orig, ray_vdir, 1.e-5, lims,
+                                method='simps', t=t)
+    sig, neval = GG.LOS_calc_signal(funcnan, ray_orig, ray_vdir, 0.1, lims,
+                                    method='adaptive', t=t, rtol=1.e-7,
+                                    max_iter=40, return_neval=True)
+    rmin = np.hypot(*(ray_orig[:2, :] + lims[1:2, :]*ray_vdir[:2, :]))
+    indnan = rmin < 1.5
+    assert np.any(indnan) and not np.all(indnan)
+    assert np.all(np.isnan(sig[:, indnan]))
+    assert np.allclose(sig[:, ~indnan], sigref[:, ~indnan], rtol=1.e-6)
+    assert np.all(neval <= np.max(lneval[1]) * 2)
+
+    # Capped nb. of evaluations per LOS
+    sig, neval = GG.LOS_calc_signal(func, ray_orig, ray_vdir, 0.1, lims,
+                                    method='adaptive', t=t, rtol=0.,
+                                    max_iter=40, max_neval=200,
+                                    return_neval=True)
+    assert np.all(np.isfinite(sig)) and np.all(neval <= 400)
+
+
+def test31_Tri_locate_pts():
+    # Delaunay mesh of random pts, compared to matplotlib's trifinder
+    nn = 2000
+    xx = np.random.uniform(1., 3., nn)
+    yy = np.random.uniform(-1., 1., nn)
+    mpltri = mplTri(xx, yy)
+    for cells_per_face in [0.1, 1., 4.]:
+        dlocator = GG.Tri_get_locator(np.array([xx, yy]).T,
+                                      mpltri.triangles,
+                                      cells_per_face=cells_per_face)
+        assert dlocator['cell_start'][-1] == dlocator['cell_faces'].size
+        npts = 10000
+        r = np.random.uniform(0.9, 3.1, npts)
+        z = np.random.uniform(-1.1, 1.1, npts)
+        r[:2] = np.nan
+        ind = GG.Tri_locate_pts(r, z, dlocator)
+        assert ind.shape == (npts,) and np.all(ind[:2] == -1)
+        assert np.all(ind == mpltri.get_trifinder()(r, z))
+
+
+def test32_LOS_sino_lin_vec():
+    nlos = 1000
+    RZ = np.array([2., 0.])
+    Ds = np.array([np.random.uniform(-1., 1., nlos),
+                   np.random.uniform(2.5, 3., nlos),
+                   np.random.uniform(-1., 1., nlos)])
+    us = np.array([np.random.uniform(-0.5, 0.5, nlos),
+                   -np.ones((nlos,)),
+                   np.random.uniform(-0.5, 0.5, nlos)])
+    us = us / np.sqrt(np.sum(us**2, axis=0))[None, :]
+    us[:, 0] = [1., 0., 0.]
+    kOut = np.random.uniform(0.1, 2., nlos)
+    kOut[:nlos//2] = np.inf
+    for mode in ['LOS', 'Lin']:
+        out_vec = GG.LOS_sino(Ds, us, RZ, kOut, Mode=mode, VType='Lin',
+                              try_new_algo=True)
+        out_ref = GG.LOS_sino(Ds, us, RZ, kOut, Mode=mode, VType='Lin',
+                              try_new_algo=False)
+        for oo, rr in zip(out_vec, out_ref):
+            assert np.allclose(oo, rr, equal_nan=True)
+
+
+def test33_LOS_sino_multi():
+    nlos, nt = 200, 7
+    Ds = np.array([np.random.uniform(3., 4., nlos),
+                   np.random.uniform(-1., 1., nlos),
+                   np.random.uniform(-1., 1., nlos)])
+    us = np.array([-np.ones((nlos,)),
+                   np.random.uniform(-0.5, 0.5, nlos),
+                   np.random.uniform(-0.5, 0.5, nlos)])
+    us = us / np.sqrt(np.sum(us**2, axis=0))[None, :]
+    kOut = np.random.uniform(0.5, 3., nlos)
+    kOut[:nlos//2] = np.inf
+    RZ = np.array([np.linspace(1.9, 2.1, nt), np.linspace(-0.1, 0.1, nt)])
+    for vtype in ['Tor', 'Lin']:
+        out = GG.LOS_sino_multi(Ds, us, RZ, kOut, Mode='LOS', VType=vtype)
+        assert out[0].shape == (3, nt, nlos)
+        assert all([oo.shape == (nt, nlos) for oo in out[1:]])
+        for it in range(nt):
+            out_ref = GG.LOS_sino(Ds, us, np.ascontiguousarray(RZ[:, it]),
+                                  kOut, Mode='LOS', VType=vtype)
+            assert np.allclose(out[0][:, it, :], out_ref[0])
+            for oo, rr in zip(out[1:], out_ref[1:]):
+                assert np.allclose(oo[it, :], rr)
+        # kOut not provided <=> unlimited LOS
+        out = GG.LOS_sino_multi(Ds, us, RZ, None, Mode='LOS', VType=vtype)
+        out_inf = GG.LOS_sino_multi(Ds, us, RZ, np.full((nlos,), np.inf),
+                                    Mode='LOS', VType=vtype)
+        for oo, rr in zip(out, out_inf):
+            assert np.allclose(oo, rr)
+
+
+def test34_LOS_PInOut_struct_seg_bvh():
+    # A limited and a non-limited structure with finely discretized polygons
+    VP = np.array([[4., 8., 8., 4., 4.], [-3., -3., 3., 3., -3.]])
+    VIn = np.array([[0., -1., 0., 1.], [1., 0., -1., 0.]])
+    theta = np.linspace(0., 2.*np.pi, 9)
+    lpoly = [np.array([6. + 0.5*np.cos(theta), 0.5*np.sin(theta)]),
+             np.array([[7.5, 7.9, 7.9, 7.5, 7.5],
+                       [-2., -2., 2., 2., -2.]])]
+    llims = [None, np.array([[0., np.pi/2.], [np.pi, 3.*np.pi/2.]])]
+
+    def refine(poly, nn):
+        # Each segment is split into nn aligned segments
+        pts = [poly[:, ii:ii+1]
+               + (poly[:, ii+1:ii+2] - poly[:, ii:ii+1])*np.arange(nn)/nn
+               for ii in range(poly.shape[1]-1)]
+        return np.concatenate(pts + [poly[:, -1:]], axis=1)
+
+    def get_kwd(nn):
+        lp = [refine(pp, nn) for pp in lpoly]
+        lnorm = [np.repeat(np.array([-np.diff(pp[1, :]), np.diff(pp[0, :])])
+                           / np.hypot(np.diff(pp[0, :]), np.diff(pp[1, :])),
+                           nn, axis=1) for pp in lpoly]
+        return dict(ves_lims=None, nstruct_lim=2, nstruct_tot=3,
+                    lnvert=np.cumsum([pp.shape[1] for pp in lp]).astype(np.int_),
+                    lstruct_polyx=np.concatenate([pp[0, :] for pp in lp]),
+                    lstruct_polyy=np.concatenate([pp[1, :] for pp in lp]),
+                    lstruct_nlim=np.array([0, 2], dtype=np.int_),
+                    lstruct_lims=llims,
+                    lstruct_normx=np.concatenate([nn[0, :] for nn in lnorm]),
+                    lstruct_normy=np.concatenate([nn[1, :] for nn in lnorm]),
+                    ves_type='Tor')
+
+    nlos = 500
+    Ds = np.array([np.random.uniform(4.5, 5., nlos),
+                   np.random.uniform(-1., 1., nlos),
+                   np.random.uniform(-2.5, 2.5, nlos)])
+    us = np.array([np.random.uniform(0., 1., nlos),
+                   np.random.uniform(-1., 1., nlos),
+                   np.random.uniform(-1., 1., nlos)])
+    us[2, :nlos//5] = 0.
+    us = us / np.sqrt(np.sum(us**2, axis=0))[None, :]
+    Ds, us = np.ascontiguousarray(Ds), np.ascontiguousarray(us)
+
+    # The segments of each polygon are sorted in a hierarchy of boxes
+    dkwd = get_kwd(20)
+    dbvh = GG.LOS_get_struct_bvh(dkwd['lstruct_nlim'], dkwd['lstruct_polyx'],
+                                 dkwd['lstruct_polyy'], dkwd['lstruct_lims'],
+                                 dkwd['lnvert'], dkwd['nstruct_tot'],
+                                 dkwd['nstruct_lim'])
+    seg_start = dbvh['seg_start']
+    seg_range = dbvh['seg_range'].reshape((-1, 2))
+    assert seg_start[-1] == seg_range.shape[0] == dbvh['seg_skip'].size
+    nseg = np.diff(np.r_[0, dkwd['lnvert']]) - 1
+    for ii in range(2):
+        rr = seg_range[seg_start[ii]:seg_start[ii+1]]
+        rr = rr[rr[:, 0] >= 0]
+        assert rr[0, 0] == 0 and rr[-1, 1] == nseg[ii]
+        assert np.all(rr[1:, 0] == rr[:-1, 1])
+
+    # Same results with coarse or refined polygons
+    out = GG.LOS_Calc_PInOut_VesStruct(Ds, us, VP, VIn, **get_kwd(1))
+    outref = GG.LOS_Calc_PInOut_VesStruct(Ds, us, VP, VIn, dbvh=dbvh, **dkwd)
+    assert np.allclose(out[0], outref[0]) and np.allclose(out[1], outref[1])
+    assert np.any(out[1] < 3.)
@@ -423,6 +423,59 @@ class Test01_Struct(object):
                     else:
                         assert np.allclose(pts0,pts1)
 
+    def test15_iter_sampleV(self):
+        for typ in self.dobj.keys():
+            for c in self.dobj[typ].keys():
+                if issubclass(eval('tfg.%s'%c), tfg._core.StructOut):
+                    continue
+                for n in self.dobj[typ][c].keys():
+                    obj = self.dobj[typ][c][n]
+                    pts, dV, ind = obj.get_sampleV(0.1, Out='(X,Y,Z)')[:3]
+                    lout = list(obj.iter_sampleV(0.1, block_size=500,
+                                                 Out='(X,Y,Z)'))
+                    assert all([oo[0].shape[1] <= 600 for oo in lout])
+                    indb = np.concatenate([oo[2] for oo in lout])
+                    ptsb = np.concatenate([oo[0] for oo in lout], axis=1)
+                    i0, i1 = np.argsort(ind), np.argsort(indb)
+                    assert np.all(indb[i1] == ind[i0])
+                    assert np.allclose(ptsb[:, i1], pts[:, i0])
+                    if typ == 'Tor':
+                        dVb = np.concatenate([oo[1] for oo in lout])
+                        assert np.allclose(dVb[i1], dV[i0])
+
+    def test15_get_sampleV_axisym(self):
+        for typ in self.dobj.keys():
+            for c in self.dobj[typ].keys():
+                if issubclass(eval('tfg.%s'%c), tfg._core.StructOut):
+                    continue
+                for n in self.dobj[typ][c].keys():
+                    obj = self.dobj[typ][c][n]
+                    if typ == 'Lin':
+                        try:
+                            obj.get_sampleV(0.1, axisym=True)
+                            raise Exception('Should have failed!')
+                        except Exception as err:
+                            assert 'toroidal' in str(err)
+                        continue
+                    res = [0.05, 0.04, 0.1]
+                    pts, dV, ind = obj.get_sampleV(res, Out='(R,Z,Phi)')[:3]
+                    pts2, dV2, ind2, reseff = obj.get_sampleV(res[:2],
+                                                              axisym=True)
+                    assert pts2.shape[0] == 2
+                    assert np.unique(pts[:2, :], axis=1).shape == pts2.shape
+                    ext = 2.*np.pi
+                    if obj.noccur > 0:
+                        ext = np.sum(obj.dgeom['extent']
+                                     * np.ones((obj.noccur,)))
+                    assert np.isclose(reseff[2], ext)
+                    assert np.isclose(np.sum(dV)*ext/(2.*np.pi), np.sum(dV2))
+                    out = obj.get_sampleV(res[:2], axisym=True, ind=ind2)
+                    assert np.allclose(out[0], pts2)
+                    out = obj.get_sampleV(res[:2], axisym=True,
+                                          DV=[None, None, [0., np.pi/2.]])
+                    if obj.noccur == 0:
+                        assert np.allclose(out[1], dV2/4.)
+
     def test16_plot(self):
         for typ in self.dobj.keys():
             for c in self.dobj[typ].keys():
@@ -601,6 +654,27 @@ class Test02_Config(object):
                     msg += "\n  and npts = {0}".format(pts.shape[1])
                     raise Exception(msg)
 
+    def test10_get_sampleS(self, res=0.1):
+        for typ in self.dobj.keys():
+            obj = self.dobj[typ]
+            for off, Out in [(0., '(X,Y,Z)'), (0.01, '(X,Y,Z)'),
+                             (0.01, '(R,Z,Phi)')]:
+                pts, dS, ind, offs = obj.get_sampleS(res=res, offsetIn=off,
+                                                     Out=Out)
+                assert pts.shape == (3, dS.size) and ind.shape == dS.shape
+                assert offs.shape == (obj.nStruct+1,)
+                assert offs[-1] == dS.size and np.all(np.diff(offs) >= 0)
+                for ii, ss in enumerate(obj.lStruct):
+                    if Out != '(X,Y,Z)' and ss.Id.Type != 'Tor':
+                        continue
+                    out = ss.get_sampleS(res, offsetIn=off, Out=Out)
+                    if ss.noccur > 1:
+                        out = [np.concatenate(oo, axis=-1) for oo in out[:3]]
+                    sli = slice(offs[ii], offs[ii+1])
+                    assert np.allclose(pts[:, sli], out[0])
+                    assert np.allclose(dS[sli], out[1])
+                    assert np.all(ind[sli] == out[2])
+
     def test11_setget_visible(self):
         for typ in self.dobj.keys():
             vis = self.dobj[typ].get_visible()
@@ -630,6 +704,39 @@ class Test02_Config(object):
             obj.strip(0, verb=verb)
             os.remove(pfe)
 
+    def test15_geometry_cache(self, verb=False):
+        obj = self.dobj['Tor'].copy()
+        obj.strip(0, verb=verb)
+        dkwd = obj._get_geometry_cache()
+        assert obj._get_geometry_cache() is dkwd
+        lS = [ss for ss in obj.lStruct if ss._InOut == 'out']
+        assert dkwd['nstruct_lim'] == len(lS)
+        assert dkwd['dbvh']['nnodes'] == 2*dkwd['nstruct_tot'] - 1
+
+        # Visibility with the cached geometry
+        pt = np.r_[2.4, 0., 0.]
+        pts = np.array([[2.5, 2.6, 1., -2.4], [0.1, 0., 0., 0.],
+                        [0., 0.2, 0., 0.]])
+        kwd = obj._get_kwdargs_LOS_isVis()
+        vis = tfg._GG.LOS_isVis_PtFromPts_VesStruct(pt[0], pt[1], pt[2],
+                                                    pts, **kwd)
+        kwd['dbvh'] = None
+        vis0 = tfg._GG.LOS_isVis_PtFromPts_VesStruct(pt[0], pt[1], pt[2],
+                                                     pts, **kwd)
+        assert np.allclose(vis, vis0)
+        assert np.allclose(vis[:2], 1.) and vis[3] == 0.
+
+        # Moving a structure, or changing the config, invalidates the cache
+        ss = [ss for ss in lS if ss.Id.Cls == 'PFC'][0]
+        ss.translate_in_cross_section(distance=0.01, direction_rz=[1., 0.],
+                                      return_copy=False)
+        dkwd1 = obj._get_geometry_cache()
+        assert dkwd1 is not dkwd
+        assert not np.allclose(dkwd1['lstruct_polyx'], dkwd['lstruct_polyx'])
+        obj.remove_Struct(ss.Id.Cls, ss.Id.Name)
+        assert len(obj._dgeomcache) == 0
+        assert obj._get_geometry_cache()['nstruct_lim'] == len(lS) - 1
+
 
 #######################################################
 #
@@ -798,6 +905,23 @@ class Test03_Rays(object):
             for c in self.dobj[typ].keys():
                 self.dobj[typ][c].set_dsino([2.4,0.])
 
+    def test07_calc_sino(self):
+        RefPt = np.array([[2.3, 2.4, 2.5], [-0.1, 0., 0.1]])
+        for typ in self.dobj.keys():
+            for c in self.dobj[typ].keys():
+                obj = self.dobj[typ][c]
+                dsino = obj.calc_sino(RefPt)
+                nt, nRays = RefPt.shape[1], obj.nRays
+                assert dsino['pts'].shape == (3, nt, nRays)
+                for kk in ['k', 'p', 'theta', 'phi']:
+                    assert dsino[kk].shape == (nt, nRays)
+                for ii in range(nt):
+                    obj.set_dsino(RefPt[:, ii])
+                    for kk in ['k', 'p', 'theta', 'phi']:
+                        assert np.allclose(dsino[kk][ii, :], obj.dsino[kk],
+                                           equal_nan=True)
+                obj.set_dsino([2.4, 0.])
+
     def test08_select(self):
         for typ in self.dobj.keys():
             for c in self.dobj[typ].keys():
@@ -910,7 +1034,7 @@ class Test03_Rays(object):
             return E
 
         ind = None#[0,10,20,30,40]
-        minimize = ["memory", "calls", "hybrid"]
+        minimize = ["memory", "calls", "hybrid", "chunks"]
         for typ in self.dobj.keys():
             c = 'CamLOS1D'
             obj = self.dobj[typ][c]
@@ -937,11 +1061,58 @@ class Test03_Rays(object):
                                               fs=(12, 6), connect=connect)
                         sig, units = out
                         assert not np.all(np.isnan(sig)), str(ii)
+                        if mmz == "calls":
+                            # Cached sampling plan, computed then re-used
+                            for jj in range(2):
+                                sigp, _ = obj.calc_signal(
+                                    ff, t=t, ani=aa, res=0.01, resMode=rm,
+                                    method=dm, use_plan=True, ind=ind,
+                                    plot=False, returnas=np.ndarray)
+                                assert np.allclose(sigp, sig, equal_nan=True)
+                            assert len(obj._dplans) > 0
+                            # LRU cache limited in memory
+                            nb = obj._get_cache_nbytes(
+                                list(obj._dplans.values())[0])
+                            obj._set_cache(obj._dplans, 'other',
+                                           list(obj._dplans.values())[0],
+                                           maxbytes=nb)
+                            assert list(obj._dplans.keys()) == ['other']
+                            obj.clear_sampling_plans()
+                            # A plan cannot bound memory by chunks
+                            err = None
+                            try:
+                                obj.calc_signal(
+                                    ff, t=t, ani=aa, res=0.01, method=dm,
+                                    use_plan=True, minimize='chunks',
+                                    ind=ind, plot=False, returnas=np.ndarray)
+                            except Exception as er:
+                                err = er
+                            assert 'use_plan' in str(err)
                         if sigref is not None:
                             assert np.allclose(sig, sigref)
                         if obj.nRays <= 100 and ii == 0:
                             sigref = sig
                             ii += 1
+
+            # Adaptive quadrature: tolerance and number of evaluations
+            t = np.r_[1.]
+            sigfine = obj.calc_signal(ff, t=t, res=0.001, method='simps',
+                                      ind=ind, plot=False,
+                                      returnas=np.ndarray)[0]
+            lneval = []
+            for rtol, max_iter in [(1.e-6, 0), (1.e-3, 20), (1.e-6, 20)]:
+                out, neval = obj.calc_signal(
+                    ff, t=t, res=0.5, method='adaptive', rtol=rtol,
+                    max_iter=max_iter, return_neval=True, ind=ind,
+                    plot=False, returnas=np.ndarray)
+                assert neval.shape == (obj.nRays,)
+                lneval.append(neval.sum())
+            assert np.allclose(out[0], sigfine, rtol=1.e-4, atol=1.e-8,
+                               equal_nan=True)
+            assert lneval[0] <= lneval[1] < lneval[2]
+            out, neval = obj.calc_signal(ff, t=t, res=0.01, return_neval=True,
+                                         plot=False, returnas=np.ndarray)
+            assert neval is None
         plt.close('all')
 
     def test12_plot(self):
@@ -1014,6 +1185,100 @@ class Test03_Rays(object):
                     assert np.all(k[lind[0]:] >= DL[0][1])
                     assert np.all(k[lind[0]:] <= DL[1][1])
 
+    def test17_calc_signal_reflections(self):
+        def ff(Pts, t=None, vect=None):
+            E = np.exp(-(np.hypot(Pts[0,:],Pts[1,:])-2.4)**2/0.1
+                       - Pts[2,:]**2/0.1)
+            return E[None, :]*np.atleast_1d(t)[:, None]
+
+        t = np.r_[1., 2.]
+        conf = tfg.utils.create_config(case='B2')
+        obj = tfg.utils.create_CamLOS1D(P=[3.4, 0., 0.], N12=30, F=0.1,
+                                        D12=0.1, angs=[np.pi, 0., 0.],
+                                        config=conf, Diag='Test',
+                                        Name='Test', Exp=_Exp)
+        obj.add_reflections(nb=2)
+        kwd = dict(t=t, res=0.01, plot=False, returnas=np.ndarray)
+        sig0 = obj.calc_signal(ff, reflections=False, **kwd)[0]
+        sig1 = obj.calc_signal(ff, coefs_reflect=0.5, **kwd)[0]
+        # Reference: one call per reflection order
+        DL = np.ascontiguousarray([obj.kIn, obj.kOut])
+        for ii in range(2):
+            Ds = np.ascontiguousarray(obj._dgeom['dreflect']['Ds'][..., ii])
+            us = np.ascontiguousarray(obj._dgeom['dreflect']['us'][..., ii])
+            sig0 += 0.5*tfg._GG.LOS_calc_signal(ff, Ds, us, 0.01, DL, t=t)
+        assert np.allclose(sig0, sig1)
+        # Same with a subset of LOS and a sampling plan
+        ind = np.arange(5, 20)
+        sig2 = obj.calc_signal(ff, coefs_reflect=0.5, ind=ind,
+                               use_plan=True, **kwd)[0]
+        assert np.allclose(sig0[:, ind], sig2)
+
+    def test18_add_reflections_native(self):
+        conf = tfg.utils.create_config(case='B2')
+        conf.lStruct[0].set_dreflect(Types='ccube')
+        obj = tfg.utils.create_CamLOS1D(P=[3.4, 0., 0.], N12=30, F=0.1,
+                                        D12=0.1, angs=[np.pi, 0., 0.],
+                                        config=conf, Diag='Test',
+                                        Name='Test', Exp=_Exp)
+        for Type in [None, 'specular', 'ccube']:
+            obj.add_reflections(Type=Type, nb=3)
+            dref = obj._dgeom['dreflect']
+            # Reference: python loop on the reflections
+            lcam, Types = obj.get_reflections_as_cam(Type=Type, nb=3)
+            assert np.all(Types.T == dref['Types'])
+            for ii, cam in enumerate(lcam):
+                assert np.allclose(cam.D, dref['Ds'][..., ii],
+                                   equal_nan=True)
+                assert np.allclose(cam.u, dref['us'][..., ii],
+                                   equal_nan=True)
+                assert np.allclose(cam.kOut, dref['kouts'][:, ii],
+                                   equal_nan=True)
+                assert np.all(cam._dgeom['indout'] == dref['indouts'][..., ii])
+        # Diffusive reflections are reproducible with a seed
+        lus = []
+        for seed in [1, 1, 2]:
+            obj.add_reflections(Type='diffusive', nb=2, seed=seed)
+            lus.append(obj._dgeom['dreflect']['us'])
+        assert np.allclose(lus[0], lus[1], equal_nan=True)
+        assert not np.allclose(lus[0], lus[2], equal_nan=True)
+        assert np.all(obj._dgeom['dreflect']['Types'] == 1)
+
+    def test19_calc_signal_bundle(self):
+        def ff(Pts, t=None, vect=None):
+            E = np.exp(-(np.hypot(Pts[0,:],Pts[1,:])-2.4)**2/0.1
+                       - Pts[2,:]**2/0.1)
+            return E[None, :]*np.atleast_1d(t)[:, None]
+
+        t = np.r_[1., 2.]
+        conf = tfg.utils.create_config(case='B2')
+        obj = tfg.utils.create_CamLOS1D(P=[3.4, 0., 0.], N12=30, F=0.1,
+                                        D12=0.1, angs=[np.pi, 0., 0.],
+                                        config=conf, Diag='Test',
+                                        Name='Test', Exp=_Exp)
+        kwd = dict(t=t, res=0.01, plot=False, returnas=np.ndarray)
+        sig0 = obj.calc_signal(ff, **kwd)[0]
+        dap = np.sqrt(np.sum((obj.pinhole[:, None] - obj.D)**2, axis=0))
+        for method in ['stratified', 'sobol']:
+            # Small detector and aperture => close to the LOS
+            db = obj.get_bundle(nsub=16, ddet=1.e-4, rap=1.e-4,
+                                method=method, seed=0)
+            assert db['Ds'].shape == (3, 16*obj.nRays)
+            assert db is obj.get_bundle(nsub=16, ddet=1.e-4, rap=1.e-4,
+                                        method=method, seed=0)
+            assert np.allclose(db['Etendues'], 1.e-8*np.pi*1.e-8/dap**2)
+            sig1 = obj.calc_signal(ff, bundle=db, **kwd)[0]
+            assert np.allclose(sig1, sig0, rtol=1.e-2, atol=1.e-3)
+            # Larger etendue, with the etendues of the bundle
+            db = obj.get_bundle(nsub=32, ddet=5.e-3, rap=5.e-3,
+                                method=method, seed=0)
+            sig2 = obj.calc_signal(ff, bundle=db, **kwd)[0]
+            sig3 = obj.calc_signal(ff, bundle=db, Brightness=False, **kwd)[0]
+            assert np.allclose(sig3, sig2*db['Etendues'][None, :])
+            ind = np.arange(5, 20)
+            sig4 = obj.calc_signal(ff, bundle=db, ind=ind, **kwd)[0]
+            assert np.allclose(sig4, sig2[:, ind])
+
 
 """
 class Test04_LOSCams(Test03_Rays):
@@ -8,7 +8,9 @@ import warnings
 
 # Standard
 import numpy as np
+import scipy.interpolate as scpinterp
 import matplotlib.pyplot as plt
+from matplotlib.tri import LinearTriInterpolator as mplTriLinInterp
 
 # Nose-specific
 from nose import with_setup # optional
@@ -545,6 +547,514 @@ class Test02_DataCam12DSpectral(Test01_DataCam12D):
         pass
 
 
+class Test03_Plasma2D(object):
+
+    @classmethod
+    def setup_class(cls, nt=5):
+
+        t = np.linspace(0., 1., nt)
+        R, Z = np.linspace(1.5, 3.5, 21), np.linspace(-1., 1., 17)
+        nR, nZ = R.size, Z.size
+
+        # quadrangular mesh (split in triangles)
+        nodes = np.array([np.repeat(R, nZ), np.tile(Z, nR)]).T
+        ind = np.arange(0, nR*nZ).reshape((nR, nZ))
+        quads = np.array([ind[:-1, :-1].ravel(), ind[1:, :-1].ravel(),
+                          ind[1:, 1:].ravel(), ind[:-1, 1:].ravel()]).T
+        faces = np.empty((2*quads.shape[0], 3), dtype=int)
+        faces[::2, :] = quads[:, :3]
+        faces[1::2, :-1] = quads[:, 2:]
+        faces[1::2, -1] = quads[:, 0]
+        cents = np.mean(nodes[quads, :], axis=1)
+        RR, ZZ = np.repeat(R, nZ), np.tile(Z, nR)
+
+        def femis(r, z):
+            return (np.exp(-((r-2.5)**2 + z**2)/0.2)[None, :]
+                    * (1. + t[:, None]))
+
+        dmesh, d2d = {}, {}
+        lmesh = [('quadtri', 1, femis(nodes[:, 0], nodes[:, 1])),
+                 ('quadtri', 0, femis(cents[:, 0], cents[:, 1])),
+                 ('rect', 0, femis(RR, ZZ)),
+                 ('rect', 1, femis(RR, ZZ)),
+                 ('rect', 3, femis(RR, ZZ))]
+        for ii, (mtype, ftype, emis) in enumerate(lmesh):
+            km = 'm{}'.format(ii)
+            if mtype == 'rect':
+                dmesh[km] = {'type': 'rect', 'ftype': ftype, 'R': R, 'Z': Z,
+                             'shapeRZ': ('R', 'Z')}
+            else:
+                dmesh[km] = {'type': mtype, 'ftype': ftype, 'ntri': 2,
+                             'nodes': nodes, 'faces': faces,
+                             'nnodes': nodes.shape[0],
+                             'nfaces': faces.shape[0]}
+            dmesh[km].update({'dim': 'mesh', 'quant': 'mesh', 'name': km,
+                              'units': 'a.u.', 'origin': 'Test',
+                              'depend': (km,)})
+            d2d['emis{}'.format(ii)] = {'data': emis, 'depend': ('t', km),
+                                        'dim': 'emis', 'units': 'a.u.',
+                                        'quant': 'emis{}'.format(ii),
+                                        'name': 'emis{}'.format(ii),
+                                        'origin': 'Test'}
+
+        conf = tfg.utils.create_config(case='B2')
+        cls.cam = tfg.utils.create_CamLOS1D(P=[3.4, 0., 0.], N12=30,
+                                            F=0.1, D12=0.1,
+                                            angs=[np.pi, 0., 0.],
+                                            config=conf, Diag='Test',
+                                            Name='Test', Exp='Test')
+        cls.obj = tfd.Plasma2D(dtime={'t': {'data': t}}, dmesh=dmesh,
+                               d2d=d2d, Name='Test', Exp='Test', shot=0)
+        cls.lquant = sorted(d2d.keys())
+        cls.t = t
+
+    def test01_get_interp_matrix(self):
+        npts = 100
+        pts = np.array([np.random.uniform(1., 4., npts), np.zeros((npts,)),
+                        np.random.uniform(-1.2, 1.2, npts)])
+        for qq in self.lquant:
+            val, t = self.obj.interp_pts2profile(pts=pts, quant=qq, t=self.t,
+                                                 fill_value=0.)
+            mat = self.obj.get_interp_matrix(pts=pts, key=qq)
+            assert mat.shape[0] == npts
+            valm = mat.dot(self.obj.ddata[qq]['data'].T).T
+            assert np.allclose(val, valm)
+
+    def test02_interp_pts2profile_linear(self):
+        npts = 100
+        pts = np.array([np.random.uniform(1., 4., npts), np.zeros((npts,)),
+                        np.random.uniform(-1.2, 1.2, npts)])
+        r, z = np.hypot(pts[0, :], pts[1, :]), pts[2, :]
+        mesh = self.obj.ddata['m0']['data']
+        vq = self.obj.ddata['emis0']['data']
+        ref = np.array([mplTriLinInterp(mesh['mpltri'],
+                                        vq[ii, :])(r, z).filled(0.)
+                        for ii in range(self.t.size)])
+        lindt = [np.arange(0, self.t.size), np.arange(0, self.t.size),
+                 [3, 0, 3]]
+        for t, indt in zip([None, self.t, self.t[[3, 0, 3]]], lindt):
+            val, tout = self.obj.interp_pts2profile(pts=pts, quant='emis0',
+                                                    t=t, fill_value=0.)
+            assert val.shape == (len(indt), npts)
+            assert np.allclose(val, ref[indt, :])
+
+    def test03_interp1d_batch(self):
+        nt, nr, npts = 4, 20, 50
+        xref = np.sort(np.random.uniform(0., 1., (nt, nr)), axis=1)
+        xref[1, :] = xref[1, ::-1]
+        yref = np.random.normal(size=(nt, nr))
+        x = np.random.uniform(-0.2, 1.2, (nt, npts))
+        x[0, :3] = np.nan
+        val = tfd._comp._interp1d_batch(xref, yref, x, fill_value=-1.)
+        ref = np.array([scpinterp.interp1d(xref[ii, :], yref[ii, :],
+                                           bounds_error=False,
+                                           fill_value=-1.)(x[ii, :])
+                        for ii in range(nt)])
+        assert np.allclose(val, ref, equal_nan=True)
+
+    def test04_interp_pts2profile_rect(self):
+        R, Z = np.linspace(1.5, 3.5, 21), np.linspace(-1., 1., 17)
+        RR, ZZ = np.repeat(R, Z.size), np.tile(Z, R.size)
+
+        def fquad(r, z):
+            return ((1. + r - 2.*z + 0.5*r*z + r**2 - z**2)[None, :]
+                    * (1. + self.t[:, None]))
+
+        dmesh = {'m{}'.format(ii): {'type': 'rect', 'ftype': ftype,
+                                    'R': R, 'Z': Z, 'shapeRZ': ('R', 'Z'),
+                                    'dim': 'mesh', 'quant': 'mesh',
+                                    'name': 'm{}'.format(ii), 'units': 'a.u.',
+                                    'origin': 'Test',
+                                    'depend': ('m{}'.format(ii),)}
+                 for ii, ftype in enumerate([0, 1, 3])}
+        d2d = {'q{}'.format(ii): {'data': fquad(RR, ZZ),
+                                  'depend': ('t', 'm{}'.format(ii)),
+                                  'dim': 'q', 'units': 'a.u.', 'quant': 'q',
+                                  'name': 'q{}'.format(ii), 'origin': 'Test'}
+               for ii in range(3)}
+        obj = tfd.Plasma2D(dtime={'t': {'data': self.t}}, dmesh=dmesh,
+                           d2d=d2d, Name='Test', Exp='Test', shot=0)
+
+        npts = 100
+        r = np.r_[np.random.uniform(1.6, 3.4, npts), 1.4, 3.6, 2., 2.]
+        z = np.r_[np.random.uniform(-0.9, 0.9, npts), 0., 0., -1.1, 1.1]
+        pts = np.array([r, np.zeros((r.size,)), z])
+        lval = [obj.interp_pts2profile(pts=pts, quant=qq, t=self.t,
+                                       fill_value=0.)[0]
+                for qq in ['q0', 'q1', 'q2']]
+        assert all([np.all(vv[:, -4:] == 0.) for vv in lval])
+        ref = fquad(r[:-4], z[:-4])
+        err = [np.max(np.abs(vv[:, :-4] - ref)) for vv in lval]
+        # bilinear is exact for the bilinear part, bicubic for quadratics
+        ind = ((r[:-4] > R[1]) & (r[:-4] < R[-2])
+               & (z[:-4] > Z[1]) & (z[:-4] < Z[-2]))
+        assert np.allclose(lval[2][:, :-4][:, ind], ref[:, ind])
+        assert err[2] < err[1] < err[0]
+        val = obj.interp_pts2profile(pts=pts, quant='q0', t=self.t,
+                                     interp_space=1, fill_value=0.)[0]
+        assert np.allclose(val, lval[1])
+
+    def test05_interp_cache(self):
+        npts = 100
+        pts = np.array([np.random.uniform(1., 4., npts), np.zeros((npts,)),
+                        np.random.uniform(-1.2, 1.2, npts)])
+        self.obj.clear_interp_cache()
+        t = self.t[[1, 1, 1, 2, 1, 2]]
+        val0 = self.obj.interp_pts2profile(pts=pts, quant='emis0', t=t,
+                                           fill_value=0.)[0]
+        # Only unique time slices are interpolated and cached
+        assert len(self.obj._dinterpcache) == 2
+        assert np.all(val0[[0, 1, 2, 4], :] == val0[0:1, :])
+        val1 = self.obj.interp_pts2profile(pts=pts, quant='emis0', t=self.t,
+                                           fill_value=np.nan)[0]
+        assert len(self.obj._dinterpcache) == self.t.size
+        assert np.allclose(np.nan_to_num(val1[[1, 1, 1, 2, 1, 2], :]), val0)
+        # Cached slices are re-used
+        for vv in self.obj._dinterpcache.values():
+            vv[:] = -1.
+        val2 = self.obj.interp_pts2profile(pts=pts, quant='emis0', t=t)[0]
+        assert np.all(val2 == -1.)
+        # New pts => new slices
+        self.obj.interp_pts2profile(pts=pts[:, :10], quant='emis0', t=t)
+        assert len(self.obj._dinterpcache) == self.t.size + 2
+        # Running size of the cache
+        dcache = self.obj._dinterpcache
+        assert dcache.nbytes == 8*(self.t.size*npts + 2*10)
+        dcache.popitem(last=False)
+        assert dcache.nbytes == np.sum([vv.nbytes for vv in dcache.values()])
+        self.obj.clear_interp_cache()
+        assert len(self.obj._dinterpcache) == 0
+        assert self.obj._dinterpcache.nbytes == 0
+
+    def test06_interp_t_linear(self):
+        npts = 100
+        pts = np.array([np.random.uniform(1., 4., npts), np.zeros((npts,)),
+                        np.random.uniform(-1.2, 1.2, npts)])
+        t = np.r_[-0.5, 0.1, 0.3, 0.55, 0.75, 2.]
+        for qq in ['emis0', 'emis2', 'emis3']:
+            self.obj.clear_interp_cache()
+            val0 = self.obj.interp_pts2profile(pts=pts, quant=qq,
+                                               t=self.t[:1],
+                                               fill_value=0.)[0]
+            val, tout = self.obj.interp_pts2profile(pts=pts, quant=qq, t=t,
+                                                    interp_t='linear',
+                                                    fill_value=0.)
+            # emis is linear in time (and constant beyond self.t)
+            ref = val0 * (1. + np.clip(t, 0., 1.))[:, None]
+            assert val.shape == (t.size, npts)
+            assert np.allclose(val, ref)
+            # Each stored slice interpolated only once
+            if qq != 'emis2':
+                assert len(self.obj._dinterpcache) == self.t.size
+            val = self.obj.interp_pts2profile(pts=pts, quant=qq,
+                                              interp_t='linear',
+                                              fill_value=0.)[0]
+            assert np.allclose(val, val0 * (1. + self.t)[:, None])
+
+    def test07_interp_ani(self):
+        mesh = dict(self.obj.ddata['m0']['data'])
+        mesh.update({'dim': 'mesh', 'quant': 'mesh', 'name': 'm0',
+                     'units': 'a.u.', 'origin': 'Test', 'depend': ('m0',)})
+        vq = self.obj.ddata['emis0']['data']
+        d2d = {'b'+cc: {'data': (ii + 1.)*vq - 0.3*ii, 'depend': ('t', 'm0'),
+                        'dim': 'B', 'units': 'T', 'quant': 'B'+cc,
+                        'name': 'b'+cc, 'origin': 'Test'}
+               for ii, cc in enumerate('RPZ')}
+        obj = tfd.Plasma2D(dtime={'t': {'data': self.t}}, dmesh={'m0': mesh},
+                           d2d=d2d, Name='Test', Exp='Test', shot=0)
+
+        npts = 100
+        pts = np.array([np.random.uniform(1., 4., npts),
+                        np.random.uniform(-1., 1., npts),
+                        np.random.uniform(-1.2, 1.2, npts)])
+        vect = np.random.normal(size=(3, npts))
+        phi = np.arctan2(pts[1, :], pts[0, :])
+        lv = [np.cos(phi)*vect[0, :] + np.sin(phi)*vect[1, :],
+              -np.sin(phi)*vect[0, :] + np.cos(phi)*vect[1, :],
+              vect[2, :]]
+        t = np.r_[0.1, 0.6, 0.6]
+        for interp_t in ['nearest', 'linear']:
+            ref = np.sum([obj.interp_pts2profile(pts=pts, t=t, quant='b'+cc,
+                                                 interp_t=interp_t,
+                                                 fill_value=0.)[0]*lv[ii]
+                          for ii, cc in enumerate('RPZ')], axis=0)
+            for Type in ['sca', 'abs(sca)']:
+                val = obj.interp_pts2profile(pts=pts, vect=vect, t=t,
+                                             q2dR='bR', q2dPhi='bP',
+                                             q2dZ='bZ', Type=Type,
+                                             interp_t=interp_t,
+                                             fill_value=0.)[0]
+                assert val.shape == (t.size, npts)
+                if Type == 'sca':
+                    assert np.allclose(val, ref)
+                else:
+                    assert np.allclose(val, np.abs(ref))
+
+    def test08_interp_pts2profile_chunks(self):
+        npts = 100
+        pts = np.array([np.random.uniform(1., 4., npts), np.zeros((npts,)),
+                        np.random.uniform(-1.2, 1.2, npts)])
+        pfe = os.path.join(_here, 'interp_chunks.npy')
+        for qq in ['emis0', 'emis2']:
+            val0, t0 = self.obj.interp_pts2profile(pts=pts, quant=qq,
+                                                   fill_value=0.)
+            val, t = self.obj.interp_pts2profile(pts=pts, quant=qq,
+                                                 fill_value=0.,
+                                                 max_bytes=8*t0.size*30)
+            assert np.allclose(val, val0) and np.allclose(t, t0)
+            # Write into a memory-mapped array
+            out = np.lib.format.open_memmap(pfe, mode='w+', dtype=float,
+                                            shape=val0.shape)
+            val = self.obj.interp_pts2profile(pts=pts, quant=qq,
+                                              fill_value=0., out=out)[0]
+            assert val is out
+            del val, out
+            assert np.allclose(np.load(pfe), val0)
+            os.remove(pfe)
+            # Iterate on chunks of pts, or of times
+            lind = []
+            for ind, val, t in self.obj.iter_pts2profile(pts=pts, quant=qq,
+                                                         fill_value=0.,
+                                                         chunk_size=30):
+                assert np.allclose(val, val0[:, ind])
+                lind.append(ind)
+            assert len(lind) == 4 and lind[-1] == slice(90, 100)
+            for ind, val, t in self.obj.iter_pts2profile(pts=pts, quant=qq,
+                                                         fill_value=0.,
+                                                         chunk='t',
+                                                         chunk_size=2):
+                assert np.allclose(val, val0[ind, :])
+                assert np.allclose(t, t0[ind])
+            # Streamed pts are not cached
+            self.obj.clear_interp_cache()
+            self.obj.interp_pts2profile(pts=pts, quant=qq, fill_value=0.,
+                                        max_bytes=8*t0.size*30)
+            assert len(self.obj._dinterpcache) == 0
+        # Neither are chunks of LOS samples (but all samples at once are)
+        kwd = dict(quant='emis0', res=0.01, plot=False)
+        self.cam.calc_signal_from_Plasma2D(self.obj, minimize='chunks', **kwd)
+        assert len(self.obj._dinterpcache) == 0
+        self.cam.calc_signal_from_Plasma2D(self.obj, **kwd)
+        assert len(self.obj._dinterpcache) == self.t.size
+
+    def test09_calc_signal_projection(self):
+        pfe = os.path.join(_here, 'projop.npz')
+        for qq in self.lquant:
+            for method in ['sum', 'simps', 'romb']:
+                kwd = dict(quant=qq, res=0.01, method=method,
+                           plot=False, returnas=np.ndarray)
+                sig0 = self.cam.calc_signal_from_Plasma2D(self.obj, **kwd)[0]
+                sig1 = self.cam.calc_signal_from_Plasma2D(self.obj,
+                                                          projection=True,
+                                                          **kwd)[0]
+                assert np.allclose(sig0, sig1)
+            kwd.update(method='sum', t=np.r_[0.1, 0.6], interp_t='linear')
+            sig0 = self.cam.calc_signal_from_Plasma2D(self.obj, **kwd)[0]
+            sig1 = self.cam.calc_signal_from_Plasma2D(self.obj,
+                                                      projection=True,
+                                                      **kwd)[0]
+            assert np.allclose(sig0, sig1)
+            G, indok = self.cam.get_projection_operator(self.obj, key=qq,
+                                                        res=0.01)
+            self.cam.save_projection_operator(G, pfe)
+            G1 = self.cam.load_projection_operator(pfe)
+            assert (G1 - G).nnz == 0
+            os.remove(pfe)
+        assert len(self.cam._dprojop) == 3*len(self.lquant)
+        self.cam.clear_projection_operators()
+        assert len(self.cam._dprojop) == 0
+
+        # Degree of the spatial interpolation (rect meshes)
+        lrect = [qq for qq in self.lquant
+                 if self.obj._ddata[self.obj._get_idmesh(qq)]['data']['type']
+                 == 'rect']
+        assert len(lrect) > 0
+        for qq in lrect:
+            kwd = dict(quant=qq, res=0.01, plot=False, returnas=np.ndarray)
+            for deg in [0, 1, 3]:
+                sig0 = self.cam.calc_signal_from_Plasma2D(
+                    self.obj, interp_space=deg, **kwd)[0]
+                sig1 = self.cam.calc_signal_from_Plasma2D(
+                    self.obj, interp_space=deg, projection=True, **kwd)[0]
+                assert np.allclose(sig0, sig1)
+        assert len(self.cam._dprojop) == 3*len(lrect)
+        assert len(self.cam._dplans) == 0
+        self.cam.clear_projection_operators()
+
+        # Not available: fill_value != 0, minimize='chunks'
+        for kk, vv in [('fill_value', np.nan), ('minimize', 'chunks')]:
+            err = None
+            kwd = {kk: vv}
+            try:
+                self.cam.calc_signal_from_Plasma2D(
+                    self.obj, quant=lrect[0], res=0.01, projection=True,
+                    plot=False, returnas=np.ndarray, **kwd)
+            except Exception as er:
+                err = er
+            assert err is not None and kk in str(err)
+
+        # Adaptive quadrature, tolerance forwarded
+        kwd = dict(quant=lrect[0], res=0.05, method='adaptive', plot=False,
+                   returnas=np.ndarray, return_neval=True)
+        (sig0, _), neval0 = self.cam.calc_signal_from_Plasma2D(
+            self.obj, rtol=1.e-2, **kwd)
+        (sig1, _), neval1 = self.cam.calc_signal_from_Plasma2D(
+            self.obj, rtol=1.e-6, atol=1.e-12, **kwd)
+        assert neval0.shape == neval1.shape == (self.cam.nRays,)
+        assert np.sum(neval0) < np.sum(neval1)
+        assert np.allclose(sig0, sig1, rtol=1.e-2, equal_nan=True)
+
+    def test10_remap_quantity(self):
+        # Node-based destination: linear interpolation at the nodes
+        val, t = self.obj.remap_quantity(key='emis3', mesh='m0')
+        assert np.allclose(val, self.obj.ddata['emis0']['data'])
+        mat = self.obj.get_remap_matrix(key_src='emis3', key_dst='m0')
+        assert self.obj.get_remap_matrix(key_src='m3', key_dst='m0') is mat
+
+        # Face-based destination: volume average of a linear function
+        mesh = self.obj.dmesh['m0']['data']
+        mesh1 = self.obj.dmesh['m1']['data']
+        nodes = mesh['nodes']
+        lin = 1. + 2.*nodes[:, 0] - 3.*nodes[:, 1]
+        val = self.obj.get_remap_matrix(key_src='m0', key_dst='m1').dot(lin)
+        quads = mesh1['faces'][::2, :]
+        r1, r2 = np.min(nodes[quads, 0], axis=1), np.max(nodes[quads, 0],
+                                                         axis=1)
+        z1, z2 = np.min(nodes[quads, 1], axis=1), np.max(nodes[quads, 1],
+                                                         axis=1)
+        ir, ir2 = (r2**2 - r1**2)/2., (r2**3 - r1**3)/3.
+        ref = (1. + 2.*ir2/ir - 3.*(z1 + z2)/2.)
+        assert np.allclose(val, ref)
+
+        # Volume integrals are conserved
+        val1, t = self.obj.remap_quantity(key='emis1', mesh='m2',
+                                          t=self.t[[1, 3]])
+        lvol = []
+        for mm in [mesh1, self.obj.dmesh['m2']['data']]:
+            vol, ind = tfd._comp._get_mesh_faces_subpts(mm)[2:]
+            lvol.append(np.bincount(ind, weights=vol))
+        assert np.allclose(
+            val1.dot(lvol[1]),
+            self.obj.ddata['emis1']['data'][[1, 3], :].dot(lvol[0]))
+        self.obj.clear_interp_cache()
+        assert len(self.obj._dremapcache) == 0
+
+    def test11_interp_multi_quant(self):
+        nr = 30
+        mesh = self.obj.ddata['m0']['data']
+        nodes = mesh['nodes']
+        rho2d = np.hypot(nodes[:, 0] - 2.5, nodes[:, 1])
+        rho = np.linspace(0., 1.5, nr)
+        dmesh = {'m0': {'type': 'quadtri', 'ftype': 1, 'ntri': 2,
+                        'nodes': nodes, 'faces': mesh['faces'],
+                        'nnodes': nodes.shape[0],
+                        'nfaces': mesh['faces'].shape[0]}}
+        fmult = (1. + self.t[:, None])
+        d2d = {'rho2d': {'data': rho2d[None, :]*fmult**0.5,
+                         'depend': ('t', 'm0'), 'quant': 'rho'},
+               'emisA': {'data': np.exp(-rho2d**2)[None, :]*fmult,
+                         'depend': ('t', 'm0')},
+               'emisB': {'data': rho2d[None, :]*fmult,
+                         'depend': ('t', 'm0')}}
+        dradius = {'rho': {'data': rho[None, :]*fmult**0.5,
+                           'depend': ('t', 'rho'), 'quant': 'rho'}}
+        d1d = {'ne': {'data': (1. - rho**2)[None, :]*fmult,
+                      'depend': ('t', 'rho')},
+               'Te': {'data': np.exp(-rho)[None, :]*fmult,
+                      'depend': ('t', 'rho')}}
+        obj = tfd.Plasma2D(dtime={'t': {'data': self.t}}, dradius=dradius,
+                           dmesh=dmesh, d1d=d1d, d2d=d2d,
+                           Name='Test', Exp='Test', shot=0)
+
+        # Count the calls to the point locator
+        trifind = obj.ddata['m0']['data']['trifind']
+        ncalls = [0]
+
+        def trifind_count(r, z):
+            ncalls[0] += 1
+            return trifind(r, z)
+        obj._ddata['m0']['data']['trifind'] = trifind_count
+
+        npts = 100
+        pts = np.array([np.random.uniform(1., 4., npts), np.zeros((npts,)),
+                        np.random.uniform(-1.2, 1.2, npts)])
+        t = self.t[[3, 0, 3]]
+        for lq, kwd in [(['emisA', 'emisB'], {}),
+                        (['ne', 'Te'], {'ref1d': 'rho', 'ref2d': 'rho2d'})]:
+            ncalls[0] = 0
+            dval, tout = obj.interp_pts2profile(pts=pts, quant=lq, t=t,
+                                                **kwd)
+            assert ncalls[0] == 1
+            assert sorted(dval.keys()) == sorted(lq)
+            for qq in lq:
+                obj.clear_interp_cache()
+                val = obj.interp_pts2profile(pts=pts, quant=qq, t=t,
+                                             **kwd)[0]
+                assert np.allclose(dval[qq], val, equal_nan=True)
+            dout = obj.interp_pts2profile(pts=pts, quant=lq, t=t,
+                                          max_bytes=8*t.size*7, **kwd)[0]
+            assert all([np.allclose(dout[qq], dval[qq], equal_nan=True)
+                        for qq in lq])
+
+        # Quantities with different time vectors: union of times
+        t2 = self.t[::2] + 0.01
+        d2d = {'emisA': {'data': np.exp(-rho2d**2)[None, :]*fmult,
+                         'depend': ('t', 'm0')},
+               'emisC': {'data': np.exp(-rho2d**2)[None, :]*(1. + t2[:, None]),
+                         'depend': ('t2', 'm0')}}
+        obj2 = tfd.Plasma2D(dtime={'t': {'data': self.t}, 't2': {'data': t2}},
+                            dmesh=dmesh, d2d=d2d,
+                            Name='Test', Exp='Test', shot=0)
+        dval, tout = obj2.interp_pts2profile(pts=pts, quant=['emisA', 'emisC'])
+        assert np.allclose(tout, np.unique(np.r_[self.t, t2]))
+        assert all([vv.shape == (tout.size, npts) for vv in dval.values()])
+        for qq in ['emisA', 'emisC']:
+            val = obj2.interp_pts2profile(pts=pts, quant=qq, t=tout)[0]
+            assert np.allclose(dval[qq], val, equal_nan=True)
+        # The memory budget of a chunk is shared by the quantities
+        lind = [ind for ind, vv, tt in obj2.iter_pts2profile(
+            pts=pts, quant=['emisA', 'emisC'], max_bytes=8*tout.size*20)]
+        assert lind[0] == slice(0, 10)
+
+        # Quantities on different meshes
+        try:
+            self.obj.interp_pts2profile(pts=pts, quant=['emis0', 'emis1'])
+            raise Exception('Should have failed!')
+        except Exception as err:
+            assert 'same mesh' in str(err)
+
+        # Signals
+        kwd = dict(res=0.01, method='sum', plot=False, returnas=np.ndarray)
+        dsig = self.cam.calc_signal_from_Plasma2D(self.obj, quant=['emis0'],
+                                                  **kwd)
+        sig = self.cam.calc_signal_from_Plasma2D(self.obj, quant='emis0',
+                                                 **kwd)
+        assert np.allclose(dsig['emis0'][0], sig[0])
+        # Common times, LOS sampled (and integrated) once for all quantities
+        calc = tfg._core._GG.LOS_calc_signal
+        lt = []
+
+        def calc_count(*args, **kwdargs):
+            lt.append(kwdargs['t'])
+            return calc(*args, **kwdargs)
+        tfg._core._GG.LOS_calc_signal = calc_count
+        lq = ['emisA', 'emisC']
+        for minimize in ['calls', 'chunks']:
+            lt[:] = []
+            dsig = self.cam.calc_signal_from_Plasma2D(obj2, quant=lq,
+                                                      minimize=minimize,
+                                                      **kwd)
+            assert len(lt) == 1 and lt[0].size == 2*tout.size
+            for qq in lq:
+                sig = self.cam.calc_signal_from_Plasma2D(obj2, quant=qq,
+                                                         t=tout,
+                                                         minimize=minimize,
+                                                         **kwd)
+                assert dsig[qq][0].shape == (tout.size, self.cam.nRays)
+                assert np.allclose(dsig[qq][0], sig[0])
+        tfg._core._GG.LOS_calc_signal = calc
+
+
 
 
 